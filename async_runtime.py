@@ -0,0 +1,441 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# The asyncio runtime, selected with --runtime asyncio.
+# The radio receive, the display, the bluetooth server and the position logging run as tasks on one event loop instead
+# of four threads.  The calls that block, the spi radio, the i2c display and the file flushes, run in two one thread
+# executors, one for the radio so the receive and the ack never overlap on the spi bus, and one for everything else.
+# Shutdown cancels the tasks and wakes the radio wait, so it does not wait for a sleep or a bluetooth accept to end.
+# The thread classes in rfm69_sr, bluetooth_thread and position_logging are still the default runtime.
+# The bluetooth task only sends the text protocol to the phones, each phone has its own task so nothing is queued.
+# The stream clients, the on change protocols and the keepalive need the stream server of bluetooth_thread, so with them
+# the bluetooth thread serves the phones and the clients beside the tracker, it only reads the position table.
+
+import asyncio
+import concurrent.futures
+import signal
+import socket
+import threading
+import time
+
+import bluetooth_thread
+import display_renderer
+import metrics
+import packet_decoder
+import packet_dedup
+import position_fix
+import position_logging
+import radio_backend
+import radio_interrupt
+import stream_protocol
+import transmit_scheduler
+
+
+def needs_stream_server(settings: dict) -> bool:
+    """
+    :param settings: the kwargs of the bluetooth thread
+    :return: True if the settings ask for something the bluetooth task cannot serve, the stream listen addresses,
+             a protocol other than text or a keepalive, so bluetooth_thread.BluetoothTransmitThread must serve them
+    """
+    return (bool(settings.get('StreamListen')) or settings.get('KeepAlive') is not None
+            or settings.get('StreamProtocol', stream_protocol.PROTOCOL_TEXT) != stream_protocol.PROTOCOL_TEXT)
+
+
+class AsyncTracker:  # pylint: disable=R0902
+    """
+    Run the tracker on an asyncio event loop
+    """
+
+    def __init__(self, name: str, *args: list, **kwargs: dict):
+        """
+        The init class for the runtime
+
+        :param name: the name used in the log
+        :param args: the args, position_table, event, network, log.log, args.sleep_time, position log file name
+                     setting the event from another thread stops the runtime
+        :param kwargs: a dictionary of the settings, the keys are the ones used by the threads
+                        ReceiveMode, InterruptPin, RadioBackend, CaptureFile, DedupWindow, DedupMaxAge, AckMaxDefer, CarrierSense for the radio
+                        DisplaySource, PageInterval, DisplayFactory, DrawFix for the display, there is no display if DisplayFactory is None
+                        MacAddress, RfcommPort for bluetooth, there is no bluetooth server if MacAddress is None,
+                        the stream settings are not taken, see needs_stream_server
+                        and the PositionLoggingThread settings for the position log, there is no position log if PositionLog is False
+                        Metrics for a metrics.MetricsRegistry
+        """
+        if args is None:
+            raise ValueError('Args cannot be None')
+        if needs_stream_server(kwargs):
+            raise ValueError('the stream listen addresses, the on change protocols and the keepalive are served by '
+                             'bluetooth_thread.BluetoothTransmitThread, run it beside the tracker')
+        self.name = name
+        self.args = args
+        self.kwargs = kwargs
+        (self.lock_location_class, self.event, self.network, self.logger,   # pylint: disable=W0632
+         self.sleep_time_in_sec, self.log_file_name) = self.args  # pylint: disable=W0632
+        self.decoder = packet_decoder.PacketDecoder()
+        self.dedup = packet_dedup.make_deduplicator(self.kwargs)
+        self.metrics = metrics.registry_from(self.kwargs)
+        # one radio, labeled like the first radio of the threads runtime
+        self.packets_received = self.metrics.counter('rfm69_packets_received_total', 'Packets read from the radio', radio='0')
+        self.packets_rejected = self.metrics.counter('rfm69_packets_rejected_total', 'Packets the decoder rejected', radio='0')
+        self.packets_duplicate = self.metrics.counter('rfm69_packets_duplicate_total', 'Resent packets that were not decoded again',
+                                                      radio='0')
+        self.publish_latency = self.metrics.histogram('rfm69_stage_latency_seconds', 'The time from receiving a packet to each stage',
+                                                      stage='publish', radio='0')
+        self.loops = self.metrics.counter('rfm69_loop_iterations_total', 'The passes through the loop of each thread', thread='radio',
+                                          radio='0')
+        self.radio_executor = None
+        self.io_executor = None
+        self.shutdown_time = None
+        self.__loop = None
+        self.__stop = None
+        self.__update = None
+        # set to end the wait of the radio executor
+        self.__radio_stop = threading.Event()
+        self.__interrupt = None
+
+    def run(self) -> None:
+        """
+        run the event loop until stop is called, the exit button is pushed or the event is set
+
+        :return: None
+        """
+        asyncio.run(self.main())
+
+    def stop(self) -> None:
+        """
+        stop the runtime, this can be called from any thread
+
+        :return: None
+        """
+        self.event.set()
+        if self.__loop is not None and not self.__loop.is_closed():
+            self.__loop.call_soon_threadsafe(self.__stop_now)
+
+    def __stop_now(self) -> None:
+        """
+        stop the runtime, this runs on the event loop
+
+        :return: None
+        """
+        if self.__stop.is_set():
+            return
+        self.shutdown_time = time.monotonic()
+        self.__stop.set()
+        # the event_task and any thread waiting on the event see it too
+        self.event.set()
+        # end the radio wait in the executor now instead of at the end of its timeout
+        self.__radio_stop.set()
+        if self.__interrupt is not None:
+            self.__interrupt.fire()
+        self.lock_location_class.close()
+
+    def publish(self, fix) -> None:
+        """
+        put a fix in the position table and wake the tasks waiting for it
+
+        :param fix: the position_fix.PositionFix
+        :return: None
+        """
+        self.lock_location_class.insert(fix)
+        update, self.__update = self.__update, asyncio.Event()
+        update.set()
+
+    async def wait_for_update(self, version: int, timeout: float) -> None:
+        """
+        wait until the position table is newer than a version or the timeout expires
+
+        :param version: the version the caller last saw
+        :param timeout: the longest time to wait in seconds
+        :return: None
+        """
+        if self.lock_location_class.version > version:
+            return
+        try:
+            await asyncio.wait_for(self.__update.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def main(self) -> None:
+        """
+        start the tasks and wait for the stop
+
+        :return: None
+        """
+        self.__loop = asyncio.get_running_loop()
+        self.__stop = asyncio.Event()
+        self.__update = asyncio.Event()
+        self.radio_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='radio')
+        self.io_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix='io')
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self.__loop.add_signal_handler(signal_number, self.__stop_now)
+            except (NotImplementedError, RuntimeError, ValueError):
+                # not the main thread, or not a unix event loop
+                pass
+        tasks = [asyncio.create_task(self.radio_task(), name='radio'),
+                 asyncio.create_task(self.event_task(), name='event')]
+        # the program ends when the radio task ends, for example when it cannot open the radio
+        tasks[0].add_done_callback(lambda _: self.__stop_now())
+        if self.kwargs.get('PositionLog', True):
+            tasks.append(asyncio.create_task(self.logging_task(), name='position logging'))
+        if self.kwargs.get('DisplayFactory') is not None:
+            tasks.append(asyncio.create_task(self.display_task(), name='display'))
+        if self.kwargs.get('MacAddress'):
+            tasks.append(asyncio.create_task(self.bluetooth_task(), name='bluetooth'))
+        try:
+            await self.__stop.wait()
+        finally:
+            self.__stop_now()
+            for task in tasks:
+                task.cancel()
+            for result in await asyncio.gather(*tasks, return_exceptions=True):
+                if isinstance(result, Exception):
+                    self.logger.error('%s task failed %r', self.name, result)
+            self.radio_executor.shutdown(wait=True)
+            self.io_executor.shutdown(wait=True)
+            self.logger.info('%s stopped in %.3f seconds', self.name, time.monotonic() - self.shutdown_time)
+
+    async def event_task(self) -> None:
+        """
+        stop the runtime when the threading event is set by another thread
+
+        :return: None
+        """
+        await self.__loop.run_in_executor(None, self.event.wait)
+        self.__stop_now()
+
+    async def radio_task(self) -> None:
+        """
+        receive the packets, decode them on the loop, and send the queued acks from the radio executor
+
+        :return: None
+        """
+        loop = self.__loop
+        rfm69 = await loop.run_in_executor(self.radio_executor, radio_backend.open_backend, self.network,
+                                           self.kwargs.get('RadioBackend'), self.kwargs.get('CaptureFile'), self.kwargs)
+        scheduler = transmit_scheduler.make_scheduler(rfm69, self.kwargs)
+        self.metrics.gauge('rfm69_transmit_queue_depth', 'The acks and frames waiting to be sent', lambda: scheduler.pending, radio='0')
+        self.metrics.counter('rfm69_acks_sent_total', 'The acks sent', lambda: scheduler.acks_sent, radio='0')
+        interrupt = None
+        try:
+            interrupt = await self.attach_interrupt(rfm69)
+            packet_waiter = radio_interrupt.PacketWaiter(rfm69, interrupt, self.__radio_stop)
+            self.logger.info('radio receive mode = %s', packet_waiter.mode)
+            while not self.__radio_stop.is_set():
+                # button a on the bonnet, or the end of a replay
+                if await loop.run_in_executor(self.radio_executor, rfm69.shutdown_requested):
+                    self.__stop_now()
+                    return
+                self.loops.inc()
+                packets = await loop.run_in_executor(self.radio_executor, self.receive_packets, packet_waiter, scheduler)
+                for packet in packets:
+                    self.process_packet(scheduler, packet)
+                if scheduler.pending:
+                    await loop.run_in_executor(self.radio_executor, scheduler.transmit)
+        finally:
+            self.__interrupt = None
+            if interrupt is not None:
+                interrupt.detach()
+            # the executor is still running, it is shut down after the tasks end
+            self.radio_executor.submit(rfm69.close)
+            if self.dedup is not None:
+                self.logger.info('duplicate packets %s', self.dedup.statistics())
+            self.logger.info('transmit %s', scheduler.statistics())
+
+    async def attach_interrupt(self, rfm69: radio_backend.RadioBackend):
+        """
+        connect the payload ready signal of the radio in the interrupt receive mode
+
+        :param rfm69: the radio backend
+        :return: the radio_interrupt.PayloadReadyInterrupt, or None if the radio is polled
+        """
+        if self.kwargs.get('ReceiveMode', radio_interrupt.RECEIVE_MODE_INTERRUPT) != radio_interrupt.RECEIVE_MODE_INTERRUPT:
+            return None
+        interrupt = radio_interrupt.PayloadReadyInterrupt()
+        if not await self.__loop.run_in_executor(self.radio_executor, rfm69.attach_interrupt, interrupt,
+                                                 self.kwargs.get('InterruptPin', 22), self.logger):
+            return None
+        # fired by a stop so the wait in the radio executor ends at once
+        self.__interrupt = interrupt
+        return interrupt
+
+    def process_packet(self, scheduler: transmit_scheduler.TransmitScheduler, packet: bytes) -> None:
+        """
+        decode a packet, publish the fix and queue an ack if the position is valid, this runs on the loop
+
+        :param scheduler: the transmit scheduler that sends the ack
+        :param packet: the packet with the 4 byte header
+        :return: None
+        """
+        self.packets_received.inc()
+        # a resent packet is acked again if the first one was, it is not decoded or published again
+        if self.dedup is not None and self.dedup.check_packet(packet) == packet_dedup.PACKET_DUPLICATE:
+            self.packets_duplicate.inc()
+            self.logger.debug('duplicate packet=%s', bytes(packet))
+            if self.dedup.was_acked(packet[1], packet[2]):
+                scheduler.queue_ack(packet[1], packet[0], packet[2])
+            return
+        fix = self.decoder.decode(packet)
+        if fix is None:
+            self.packets_rejected.inc()
+            self.logger.info('rejected packet=%s, rejected counts=%s', bytes(packet), dict(self.decoder.rejected))
+            return
+        self.logger.info('thread_name=%s, fix=%s', self.name, fix)
+        self.publish(fix)
+        if self.metrics.enabled:
+            self.publish_latency.observe(time.time() - fix.received)
+        if fix.valid:
+            self.logger.info('got a valid packet send ack')
+            scheduler.queue_ack(fix.source, fix.destination, fix.identifier)
+            if self.dedup is not None:
+                self.dedup.mark_acked(fix.source, fix.identifier)
+
+    def receive_packets(self, packet_waiter: radio_interrupt.PacketWaiter, scheduler: transmit_scheduler.TransmitScheduler) -> list:
+        """
+        wait for packets, this runs in the radio executor
+
+        :param packet_waiter: the packet waiter
+        :param scheduler: the transmit scheduler, the wait is shorter while an ack is waiting for the channel
+        :return: the list of packets received
+        """
+        return list(packet_waiter.packets(scheduler.wait_time(self.sleep_time_in_sec)))
+
+    async def display_task(self) -> None:
+        """
+        draw the fix on the display when it changes
+
+        :return: None
+        """
+        draw_fix = self.kwargs['DrawFix']
+        display_source = self.kwargs.get('DisplaySource')
+        pager = display_renderer.SourcePager(self.kwargs.get('PageInterval', 5.0))
+        display = await self.__loop.run_in_executor(self.io_executor, self.kwargs['DisplayFactory'])
+        counter = 0
+        # False so the first pass draws even when there is no fix yet
+        last_fix = False
+        last_title = None
+        while True:
+            version = self.lock_location_class.version
+            fix, title, next_page = display_renderer.page_fix(self.lock_location_class, pager, display_source)
+            if fix is not last_fix or title != last_title:
+                last_fix, last_title = fix, title
+                counter = await self.__loop.run_in_executor(self.io_executor, draw_fix, display, fix, counter, title)
+            timeout = self.sleep_time_in_sec if next_page is None else min(self.sleep_time_in_sec, next_page)
+            await self.wait_for_update(version, timeout)
+
+    async def logging_task(self) -> None:
+        """
+        give the fixes that moved to the text log and the track store, the flushes run in the io executor
+
+        :return: None
+        """
+        writer, store = await self.__loop.run_in_executor(self.io_executor, position_logging.make_sinks, self.log_file_name,
+                                                          self.kwargs)
+        sinks = [sink for sink in (writer, store) if sink is not None]
+        log_format = self.kwargs.get('LogFormat', position_fix.LOG_FORMAT_LEGACY)
+        last_version = 0
+        previous_fixes = {}
+        try:
+            while True:
+                timeout = min([self.sleep_time_in_sec] + [due for due in (sink.time_to_flush() for sink in sinks) if due is not None])
+                await self.wait_for_update(last_version, timeout)
+                last_version, fixes = self.lock_location_class.changed_since(last_version)
+                moved = []
+                for fix in fixes:
+                    if fix.valid and not fix.same_position(previous_fixes.get(fix.source)):
+                        previous_fixes[fix.source] = fix
+                        moved.append(fix)
+                # a write can flush and fsync, so the writes and the flushes run in the io executor
+                if moved:
+                    await self.__loop.run_in_executor(self.io_executor, self.write_fixes, writer, store, moved, log_format)
+                for sink in sinks:
+                    if sink.flush_due():
+                        await self.__loop.run_in_executor(self.io_executor, sink.flush)
+        finally:
+            for sink in sinks:
+                self.io_executor.submit(sink.close)
+
+    @staticmethod
+    def write_fixes(writer, store, fixes: list, log_format: int = position_fix.LOG_FORMAT_LEGACY) -> None:
+        """
+        give fixes to the text log and the track store, this runs in the io executor
+
+        :param writer: the position_writer.PositionWriter or None
+        :param store: the track_store.TrackStore or None
+        :param fixes: the fixes
+        :param log_format: one of the position_fix.LOG_FORMATS
+        :return: None
+        """
+        for fix in fixes:
+            if writer is not None:
+                writer.write(fix.log_text(log_format))
+            if store is not None:
+                store.append(fix)
+
+    async def bluetooth_task(self) -> None:
+        """
+        accept the phone on one listening rfcomm socket, each phone is served by its own task
+
+        :return: None
+        """
+        clients = set()
+        server = None
+        try:
+            while server is None:
+                try:
+                    server = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_STREAM, socket.BTPROTO_RFCOMM)  # pylint: disable=E1101
+                    server.bind((self.kwargs['MacAddress'], self.kwargs.get('RfcommPort', 4)))
+                    server.listen(1)
+                    server.setblocking(False)
+                except OSError as error:
+                    self.logger.info('bluetooth bind socket failed error = %s', error)
+                    if server is not None:
+                        server.close()
+                        server = None
+                    await asyncio.sleep(self.sleep_time_in_sec)
+            while True:
+                client, address = await self.__loop.sock_accept(server)
+                self.logger.info('Paired with %s', address)
+                task = asyncio.create_task(self.serve_phone(client))
+                clients.add(task)
+                task.add_done_callback(clients.discard)
+        finally:
+            for task in list(clients):
+                task.cancel()
+            await asyncio.gather(*clients, return_exceptions=True)
+            if server is not None:
+                server.close()
+
+    async def serve_phone(self, client: socket.socket) -> None:
+        """
+        send the latest fix of every source to a phone when a new fix arrives, and at least every sleep time
+
+        :param client: the connected socket
+        :return: None
+        """
+        client.setblocking(False)
+        counter = 0
+        process_packet = bluetooth_thread.BluetoothTransmitThread.text_function(self.lock_location_class)
+        try:
+            while True:
+                version = self.lock_location_class.version
+                fixes = self.lock_location_class.all_latest() or [None]
+                data = ''.join(f'{process_packet(fix, counter)}\r\n\n' for fix in fixes)
+                await self.__loop.sock_sendall(client, data.encode('utf-8'))
+                counter = counter + 1 if counter < 16 else 0
+                await self.wait_for_update(version, self.sleep_time_in_sec)
+        except OSError as error:
+            self.logger.info('bluetooth send failed error = %s', error)
+        finally:
+            client.close()
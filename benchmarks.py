@@ -0,0 +1,482 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Benchmarks that run without the radio hardware, the board, busio, digitalio, RPi.GPIO, display and radio modules
+# are replaced by fake_hardware, so the threads in rfm69_sr.py run as they do on the pi.
+# The suites are
+#       decode          packets decoded per second
+#       lock            LockAndData with N readers and 1 writer, publishes per second and the wake up latency
+#       bluetooth       the text for the phone and the stream server fan out to many clients
+#       log             lines per second through the position writer and records per second into the track store
+#       geofence        point lookups per second with the grid index and with a scan, for 10, 100 and 1000 fences
+#       end_to_end      packets injected into the fake radio at a rate, the latency to the position table and each thread
+# The results are written as json so two commits can be compared
+#
+# run it with python benchmarks.py --output before.json, change something, then
+#             python benchmarks.py --output after.json --compare before.json
+
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import geofence
+import lock_and_data
+import packet_decoder
+import position_writer
+import radio_constants
+import stream_protocol
+import stream_server
+import track_store
+
+SUITES = ['decode', 'lock', 'bluetooth', 'log', 'geofence', 'end_to_end']
+
+SAMPLE_PACKET = bytes([2, 1, 7, 0]) + b'KF4WBK,171207.000,A,3557.3377,N,07901.1607,W,120923'
+
+
+def moving_packets(count: int = 1000) -> list:
+    """
+    make packets from a transmitter that moves a little and sends once a second, so no two positions are the same
+
+    :param count: the number of packets
+    :return: the list of packets
+    """
+    return [bytes([2, 1, second & 0xff, 0]) +
+            (f'KF4WBK,17{second // 60 % 60:02d}{second % 60:02d}.000,A,3557.{3377 + second:04d},N,'
+             f'07901.{1607 + second:04d},W,120923').encode('ascii')
+            for second in range(count)]
+
+
+def legacy_decode(packet: bytes) -> list:
+    """
+    the packet decode that used to be inline in ReceiveRFM69Data.run, kept to compare against
+
+    :param packet: the packet with the 4 byte header
+    :return: the packet list
+    """
+    processed_packet = packet[4:]
+    packet_text = str(processed_packet, "utf-8")
+    packet_list = packet_text.split(',')
+    time_of_fix = packet_list[radio_constants.TIME_OF_FIX]
+    packet_list[radio_constants.TIME_OF_FIX] = time_of_fix[0:2] + ":" + time_of_fix[2:4] + ":" + time_of_fix[4:]
+    date_of_fix = packet_list[radio_constants.FIX_DATE]
+    packet_list[radio_constants.FIX_DATE] = date_of_fix[0:2] + ":" + date_of_fix[2:4] + ':' + date_of_fix[4:]
+    latitude_unprocessed = packet_list[radio_constants.LATITUDE]
+    longitude_unprocessed = packet_list[radio_constants.LONGITUDE]
+    latitude = f'{float(latitude_unprocessed[:2]) + float(latitude_unprocessed[2:]) / 60:2.7f}'.zfill(9)
+    longitude = f"{float(longitude_unprocessed[:3]) + float(longitude_unprocessed[3:]) / 60:3.7f}".zfill(10)
+    north_south = '' if packet_list[radio_constants.LATITUDE_NS] == 'N' else '-'
+    east_west = '' if packet_list[radio_constants.LONGITUDE_EW] == 'E' else '-'
+    packet_list[radio_constants.LATITUDE] = north_south + latitude
+    packet_list[radio_constants.LONGITUDE] = east_west + longitude
+    return packet_list
+
+
+def legacy_render(packet_list: list) -> tuple:
+    """
+    the text each consumer used to build from the packet list, the display, the bluetooth thread and the position log
+
+    :param packet_list: the packet list from legacy_decode
+    :return: a tuple of the texts
+    """
+    bluetooth_text = packet_list[radio_constants.LONGITUDE] + ', ' + packet_list[radio_constants.LATITUDE] + ' ' + \
+        packet_list[radio_constants.POSITION_VALID] + ' 1'
+    lat_long = packet_list[radio_constants.LONGITUDE] + " " + packet_list[radio_constants.LATITUDE] + '\n'
+    log_line = packet_list[radio_constants.TIME_OF_FIX] + ' ' + packet_list[radio_constants.FIX_DATE] + ' ' + lat_long
+    return packet_list[radio_constants.LATITUDE], packet_list[radio_constants.LONGITUDE], bluetooth_text, log_line
+
+
+def fix_render(fix) -> tuple:
+    """
+    the text each consumer takes from a position fix
+
+    :param fix: the position_fix.PositionFix
+    :return: a tuple of the texts
+    """
+    return fix.latitude_text, fix.longitude_text, f'{fix.bluetooth_text} 1', fix.log_line
+
+
+def packets_per_second(function, packets: list, count: int, repeat: int = 5) -> float:
+    """
+    time a decode function, the best of several runs is used so a busy machine does not hide the result
+
+    :param function: the function to call with each packet
+    :param packets: the packets, they are used in turn
+    :param count: the number of times to call the function in each run
+    :param repeat: the number of runs
+    :return: the number of packets decoded per second
+    """
+    packets = (packets * (count // len(packets) + 1))[:count]
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for packet in packets:
+            function(packet)
+        best = min(best, time.perf_counter() - start)
+    return count / best if best else float('inf')
+
+
+def bench_decoder(count: int = 100000) -> dict:
+    """
+    compare the packet decoder against the legacy inline decode
+
+    :param count: the number of packets to decode
+    :return: a dictionary with the packets per second of each decoder
+    """
+    decoder = packet_decoder.PacketDecoder()
+    stationary = [SAMPLE_PACKET]
+    moving = moving_packets()
+    return {
+        'legacy_inline': packets_per_second(legacy_decode, stationary, count),
+        'packet_decoder': packets_per_second(decoder.decode, stationary, count),
+        'packet_decoder_bytearray': packets_per_second(decoder.decode, [bytearray(SAMPLE_PACKET)], count),
+        'legacy_inline_moving': packets_per_second(legacy_decode, moving, count),
+        'packet_decoder_moving': packets_per_second(decoder.decode, moving, count),
+        'legacy_decode_and_render': packets_per_second(lambda packet: legacy_render(legacy_decode(packet)), moving, count),
+        'fix_decode_and_render': packets_per_second(lambda packet: fix_render(decoder.decode(packet)), moving, count),
+    }
+
+
+def percentile(values: list, fraction: float) -> float:
+    """
+    :param values: the values
+    :param fraction: the fraction below the result, 0.99 for the 99th percentile
+    :return: the value at the fraction of the sorted values, None if there are none
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def latency_summary(latencies: list) -> dict:
+    """
+    :param latencies: the latencies in seconds
+    :return: a dictionary with the count, the median, the 99th percentile and the maximum
+    """
+    return {'count': len(latencies), 'median': statistics.median(latencies) if latencies else None,
+            'p99': percentile(latencies, 0.99), 'max': max(latencies) if latencies else None}
+
+
+def bench_lock(readers: int = 4, duration: float = 1.0, interval: float = 0.001) -> dict:
+    """
+    one writer publishes to a LockAndData that readers wait on, first as fast as it can and then once every interval
+
+    :param readers: the number of reader threads
+    :param duration: the seconds each part runs
+    :param interval: the time between publishes for the latency part
+    :return: a dictionary with the publishes per second, the reader wake ups per second and the wake up latency
+    """
+    def run(pause: float) -> tuple:
+        shared = lock_and_data.LockAndData()
+        latencies = [[] for _ in range(readers)]
+        wakeups = [0] * readers
+
+        def reader(number: int) -> None:
+            version = 0
+            while not shared.closed:
+                version, data = shared.wait_for_update(version, 0.1)
+                if data is not None:
+                    wakeups[number] += 1
+                    latencies[number].append(time.perf_counter() - data)
+
+        threads = [threading.Thread(target=reader, args=(number,), name=f'reader {number}') for number in range(readers)]
+        for thread in threads:
+            thread.start()
+        publishes = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < duration:
+            shared.publish(time.perf_counter())
+            publishes += 1
+            if pause:
+                time.sleep(pause)
+        elapsed = time.perf_counter() - start
+        shared.close()
+        for thread in threads:
+            thread.join()
+        return publishes / elapsed, sum(wakeups) / elapsed, [latency for values in latencies for latency in values]
+
+    publish_rate, wakeup_rate, _ = run(0.0)
+    _, _, latencies = run(interval)
+    return {'readers': readers, 'publishes_per_second': publish_rate, 'wakeups_per_second': wakeup_rate,
+            'wakeup_latency': latency_summary(latencies)}
+
+
+def bench_bluetooth(count: int = 10000, clients: int = 4, messages: int = 2000) -> dict:
+    """
+    the text sent to the phones, and the stream server sending to many clients
+
+    :param count: the number of fixes to format
+    :param clients: the number of stream clients
+    :param messages: the number of messages sent to the clients
+    :return: a dictionary with the fixes formatted per second for each protocol and the fan out results
+    """
+    import bluetooth_thread  # pylint: disable=C0415
+    decoder = packet_decoder.PacketDecoder()
+    fixes = [decoder.decode(packet) for packet in moving_packets(1000)]
+    results = {'process_packet': packets_per_second(lambda fix: bluetooth_thread.BluetoothTransmitThread.process_packet(fix, 1),
+                                                    fixes, count)}
+    for protocol in stream_protocol.PROTOCOLS:
+        encoder = stream_protocol.encoder_factory(protocol, bluetooth_thread.BluetoothTransmitThread.process_packet)()
+        results[f'encode_{protocol}'] = packets_per_second(lambda fix, encode=encoder.encode: encode([fix]), fixes, count)
+    results['fan_out'] = stream_server.measure_fan_out(clients, messages)
+    return results
+
+
+def bench_log(count: int = 20000) -> dict:
+    """
+    write the log lines of moving fixes to the text position log and the track store
+
+    :param count: the number of fixes
+    :return: a dictionary with the lines per second for each fsync policy and the records per second of the track store
+    """
+    decoder = packet_decoder.PacketDecoder()
+    fixes = [decoder.decode(packet) for packet in moving_packets(count)]
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for policy in (position_writer.FSYNC_NONE, position_writer.FSYNC_BATCH):
+            writer = position_writer.PositionWriter(os.path.join(directory, f'{policy}.log'), fsync_policy=policy)
+            start = time.perf_counter()
+            for fix in fixes:
+                writer.write(fix.log_line)
+            writer.close()
+            results[f'writer_{policy}_lines_per_second'] = count / (time.perf_counter() - start)
+        store = track_store.TrackStore(os.path.join(directory, 'track'))
+        start = time.perf_counter()
+        for fix in fixes:
+            store.append(fix)
+        store.close()
+        results['track_store_records_per_second'] = count / (time.perf_counter() - start)
+    return results
+
+
+def bench_end_to_end(rate: float = 20.0, duration: float = 5.0, sleep_time: float = 0.2) -> dict:  # pylint: disable=R0914
+    """
+    run the radio, display, bluetooth, logging and uplink threads of rfm69_sr.py on the fake hardware, with the uplink sending to
+    a local collector, and inject packets into the fake radio at a rate, the latency from the inject to the position table is
+    measured by a subscriber, and the latency to the other threads is read from their metrics
+
+    :param rate: the packets per second
+    :param duration: the seconds to send packets
+    :param sleep_time: the sleep time of the threads, the same as --sleep_time
+    :return: a dictionary with the loss and the latencies
+    """
+    import fake_hardware  # pylint: disable=C0415
+    fake_hardware.install()
+    import bluetooth_thread  # pylint: disable=C0415
+    import metrics  # pylint: disable=C0415
+    import position_logging  # pylint: disable=C0415
+    import position_table  # pylint: disable=C0415
+    import rfm69_sr  # pylint: disable=C0415
+    import uplink  # pylint: disable=C0415
+
+    logger = logging.getLogger('benchmarks')
+    logger.propagate = False
+    logger.addHandler(logging.NullHandler())
+    logger.setLevel(logging.INFO)
+    registry = metrics.MetricsRegistry()
+    table = position_table.PositionTable()
+    event = threading.Event()
+    network = b'\x2D\xD4'
+    packets = moving_packets(int(rate * duration))
+    inject_times = {}
+    publish_latencies = []
+
+    def subscriber() -> None:
+        version = 0
+        while not table.closed:
+            version, fixes = table.changed_since(version)
+            now = time.perf_counter()
+            for fix in fixes:
+                sent = inject_times.pop(fix.identifier, None)
+                if sent is not None:
+                    publish_latencies.append(now - sent)
+            table.wait_for_update(version, sleep_time)
+
+    collector = uplink.Collector()
+    collector_host, collector_port = collector.add_listener('tcp:127.0.0.1:0')
+    collector_stop = threading.Event()
+    collector_thread = threading.Thread(target=collector.serve, args=(collector_stop,), name='collector')
+    collector_thread.start()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.symlink(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'font5x8.bin'), os.path.join(directory, 'font5x8.bin'))
+        args = (table, event, network, logger, sleep_time)
+        threads = [
+            rfm69_sr.ReceiveRFM69Data('rfm_radio', *args, Metrics=registry),
+            rfm69_sr.DisplayLocation('display data', *args, Metrics=registry),
+            bluetooth_thread.BluetoothTransmitThread('bluetooth', *args, StreamListen=[f'unix:{directory}/stream.sock'], Metrics=registry),
+            position_logging.PositionLoggingThread('position logging', *args, os.path.join(directory, 'position.log'), Metrics=registry),
+            uplink.UplinkThread('uplink', *args, UplinkAddress=f'tcp:{collector_host}:{collector_port}', BatchAge=sleep_time, Metrics=registry),
+            threading.Thread(target=subscriber, name='subscriber'),
+        ]
+        # the display thread opens the font from the current directory
+        current_directory = os.getcwd()
+        os.chdir(directory)
+        try:
+            for thread in threads:
+                thread.start()
+            while not fake_hardware.RADIOS:
+                time.sleep(0.01)
+            radio = fake_hardware.RADIOS[-1]
+            inject_at_rate(radio, packets, rate, inject_times)
+            time.sleep(2 * sleep_time)
+        finally:
+            event.set()
+            table.close()
+            for thread in threads:
+                thread.join()
+            collector_stop.set()
+            collector_thread.join()
+            os.chdir(current_directory)
+    return {'rate': rate, 'packets': len(packets), 'published': len(publish_latencies), 'dropped': radio.dropped,
+            'loss_rate': 1 - len(publish_latencies) / len(packets) if packets else 0.0,
+            'inject_to_publish': latency_summary(publish_latencies),
+            'stage_mean_latency': stage_mean_latency(registry.render()),
+            'display_bytes': fake_hardware.DISPLAYS[-1].bytes_sent if fake_hardware.DISPLAYS else None,
+            'uplink_fixes': len(collector.fixes)}
+
+
+def inject_at_rate(radio, packets: list, rate: float, inject_times: dict) -> None:
+    """
+    inject packets into the fake radio at a rate
+
+    :param radio: the fake_hardware radio
+    :param packets: the packets
+    :param rate: the packets per second
+    :param inject_times: the perf_counter time of each inject is put here by identifier
+    :return: None
+    """
+    start = time.perf_counter()
+    for number, packet in enumerate(packets):
+        # the identifier wraps, but one is never waiting that long
+        inject_times[packet[2]] = time.perf_counter()
+        radio.inject(packet)
+        time.sleep(max(0.0, start + (number + 1) / rate - time.perf_counter()))
+
+
+def stage_mean_latency(text: str) -> dict:
+    """
+    :param text: the metrics in the prometheus text format
+    :return: a dictionary of the mean latency in seconds to each stage
+    """
+    stages = {}
+    for line in text.splitlines():
+        if line.startswith('rfm69_stage_latency_seconds_sum') or line.startswith('rfm69_stage_latency_seconds_count'):
+            name, value = line.split(' ')
+            stage = name.split('stage="')[1].split('"')[0]
+            # the publish stage has a histogram for each radio
+            totals = stages.setdefault(stage, {})
+            kind = name.split('{')[0].rsplit('_', 1)[1]
+            totals[kind] = totals.get(kind, 0.0) + float(value)
+    return {stage: values['sum'] / values['count'] for stage, values in stages.items() if values.get('count')}
+
+
+def run_suites(suites: list, arguments) -> dict:
+    """
+    :param suites: the names of the suites to run
+    :param arguments: the parsed command line
+    :return: a dictionary with the results of each suite and where they were run
+    """
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    results = {'commit': commit, 'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+               'machine': platform.machine(), 'suites': {}}
+    for suite in suites:
+        print(f'running {suite}', file=sys.stderr)
+        if suite == 'decode':
+            results['suites'][suite] = bench_decoder(arguments.count)
+        elif suite == 'lock':
+            results['suites'][suite] = bench_lock(arguments.readers, arguments.duration)
+        elif suite == 'bluetooth':
+            results['suites'][suite] = bench_bluetooth(arguments.count // 10, arguments.clients)
+        elif suite == 'log':
+            results['suites'][suite] = bench_log(arguments.count // 5)
+        elif suite == 'geofence':
+            results['suites'][suite] = geofence.measure_lookups(lookups=arguments.count // 10)
+        elif suite == 'end_to_end':
+            results['suites'][suite] = bench_end_to_end(arguments.rate, arguments.duration * 5, arguments.sleep_time)
+    return results
+
+
+def flatten(results: dict, prefix: str = '') -> dict:
+    """
+    :param results: nested dictionaries of results
+    :param prefix: the names of the dictionaries above
+    :return: a dictionary of dotted names to the numbers
+    """
+    flat = {}
+    for name, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{name}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f'{prefix}{name}'] = value
+    return flat
+
+
+def compare(old: dict, new: dict) -> list:
+    """
+    :param old: the results of the earlier run
+    :param new: the results of this run
+    :return: a list of (name, old value, new value, change in percent) for the numbers in both
+    """
+    old_values = flatten(old.get('suites', {}))
+    new_values = flatten(new.get('suites', {}))
+    return [(name, old_values[name], value, 100.0 * (value - old_values[name]) / old_values[name] if old_values[name] else None)
+            for name, value in new_values.items() if name in old_values]
+
+
+def main() -> None:
+    """
+    run the suites given on the command line, print the results or compare them with an earlier run
+
+    :return: None
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--suite', action='append', choices=SUITES, help='a suite to run, more than one can be given, default is all')
+    parser.add_argument('--count', type=int, default=100000, help='the number of iterations default = %(default)s)')
+    parser.add_argument('--readers', type=int, default=4, help='the reader threads for the lock suite default = %(default)s')
+    parser.add_argument('--clients', type=int, default=4, help='the stream clients for the bluetooth suite default = %(default)s')
+    parser.add_argument('--duration', type=float, default=1.0,
+                        help='the seconds for the lock suite, the end to end suite runs 5 times longer default = %(default)s')
+    parser.add_argument('--rate', type=float, default=20.0, help='the packets per second for the end to end suite default = %(default)s')
+    parser.add_argument('--sleep_time', type=float, default=0.2, help='the thread sleep time for the end to end suite default = %(default)s')
+    parser.add_argument('--output', type=str, default=None, help='write the results to this json file default = %(default)s')
+    parser.add_argument('--compare', type=str, default=None, help='compare with the results in this json file default = %(default)s')
+    arguments = parser.parse_args()
+    results = run_suites(arguments.suite or SUITES, arguments)
+    if arguments.output:
+        with open(arguments.output, 'w', encoding='utf-8') as output_file:
+            json.dump(results, output_file, indent=2)
+    if arguments.compare:
+        with open(arguments.compare, encoding='utf-8') as compare_file:
+            earlier = json.load(compare_file)
+        print(f'compared with {earlier.get("commit")} from {earlier.get("time")}')
+        for name, old_value, new_value, change in compare(earlier, results):
+            print(f'{name:60s} {old_value:14.6g} {new_value:14.6g} {"" if change is None else f"{change:+8.1f}%"}')
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
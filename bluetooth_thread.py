@@ -16,16 +16,20 @@
 
 import threading
 import time
-import socket
-import radio_constants
+
+import metrics
+import stream_protocol
+import stream_server
 
 
 class BluetoothTransmitThread(threading.Thread):
     """
     this is a thread class for the bluetooth radio
     When establishing a bluetooth socket, one uses the local bluetooth mac address
+    The phones are served by a stream_server.StreamServer, so many phones can connect and a slow one does not stall the others
     """
-    __slots__ = ['args', 'kwargs', 'lock_location_class', 'event', 'mac_address', 'timeout']
+    __slots__ = ['args', 'kwargs', 'lock_location_class', 'event', 'mac_address', 'port', 'listen_addresses', 'max_queue',
+                 'protocol', 'keepalive', 'keyframe_interval', 'not_listening', 'metrics']
 
     def __init__(self, name: str, *args: list, **kwargs: dict) -> None:
         """
@@ -33,9 +37,13 @@ class BluetoothTransmitThread(threading.Thread):
 
         :param name: The name of the thread
         :param args: The args, it must be a tuple consisting of
-                                (gps_lock_and_location, event, network, log.log, args.sleep_time)
-        :param kwargs: a dictionary that must contain the mac address and the timeout
-                        example {'mac_address': xx:xx:xx:xx:xx, 'timeout':10}  the timeout is optional but the mac address is not
+                                (position_table, event, network, log.log, args.sleep_time)
+        :param kwargs: a dictionary with the mac address, the rfcomm port, more listen addresses and the queue length
+                        example {'MacAddress': xx:xx:xx:xx:xx, 'RfcommPort': 4, 'StreamListen': ['tcp:0.0.0.0:5000'], 'MaxQueue': 64}
+                        if the mac address is None there is no bluetooth listener, only the stream listen addresses
+                        and the optional stream protocol settings, example {'StreamProtocol': 'binary', 'KeepAlive': 10, 'KeyframeInterval': 16}
+                        the protocol is one of stream_protocol.PROTOCOLS, the keepalive defaults to the sleep time
+                        and an optional metrics.MetricsRegistry, example {'Metrics': registry}
         """
         super().__init__(name=name, args=args, kwargs=kwargs)
 
@@ -46,90 +54,78 @@ class BluetoothTransmitThread(threading.Thread):
         self.kwargs = kwargs
         self.lock_location_class, self.event, self.network, self.logger, self.sleep_time_in_sec = self.args  # pylint: disable=W0632
         self.thread_name = name
-        self.mac_address = self.kwargs['MacAddress']
-        self.timeout = self.kwargs.get('TimeOut', 30)
+        self.mac_address = self.kwargs.get('MacAddress')
         self.port = self.kwargs.get('RfcommPort', 4)
-
-    def bluetooth_connect(self, mac_address: str, bluetooth_port: int = 4, timeout: int = 30):
-        """
-        connect to bluetooth client
-
-        :param mac_address: the mac address of the client to which we will connect
-        :param bluetooth_port: the rfcomm bluetooth port, However, it must match the bluetooth_port used by the client.
-        :param timeout: the length of time in seconds to wait for an accept
-        :return: at tuple with the local_socket, client_socket, and remote bluetooth mac if successful, False, false if it fails
-                note the client socket is used to write
-        """
-
-        self.logger.info(f'bluetooth_port = {bluetooth_port}, mac_address = {mac_address}, len={len(mac_address)}')
-        backlog = 1
-        # size = 1024
-        #
-        local_socket = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_STREAM, socket.BTPROTO_RFCOMM)
-        self.logger.info(f'local_socket={local_socket}  mac address = {mac_address}, type ={type(mac_address)}')
-        try:  # pylint: disable=R1705
-            local_socket.bind((mac_address, bluetooth_port))
-        except OSError as error:
-            local_socket.close()
-            if str(error) == 'bad bluetooth address':
-                raise OSError from error
-            self.logger.info(f'bluetooth bind socket failed error = {error}')
-            return False, False, False
-        else:       # pylint: disable=R1705
-            self.logger.info("bind worked ok")
-        local_socket.listen(backlog)
-        local_socket.settimeout(timeout)
-
-        try:
-            client_socket, remote_bluetooth_mac = local_socket.accept()
-        except OSError as error:
-            self.logger.info(f'bluetooth accept failed error = {error}')
-            return False, False, False
-        self.logger.info(f'bluetooth accept passed client_socket = {client_socket}, remote_bluetootk mac address = {mac_address}')
-        # the client socket is the socket to which the writes/reads will go
-        # the address the remote bluetooth mac address and the rfcomm port
-        return local_socket, client_socket, remote_bluetooth_mac
-
-    @staticmethod
-    def send_data(write_socket, data):
-        """
-        send the data to the bluetooth client
-
-        :param write_socket: the client remote_bluetooth_mac to which to send the data
-        :param data: the data to send,should be a string
-        :return True if the send is successful or False if not
-        """
-        try:
-            byte_data_array = bytearray((f'{data}\n'.encode('utf-8')))
-            write_socket.send(byte_data_array)
-        except OSError:
-            return False
-        return True
+        self.listen_addresses = list(self.kwargs.get('StreamListen') or [])
+        if self.mac_address:
+            self.listen_addresses.insert(0, f'{stream_server.RFCOMM_PREFIX}{self.mac_address}:{self.port}')
+        self.max_queue = self.kwargs.get('MaxQueue', 64)
+        self.protocol = self.kwargs.get('StreamProtocol', stream_protocol.PROTOCOL_TEXT)
+        self.keepalive = self.kwargs.get('KeepAlive') or self.sleep_time_in_sec
+        self.keyframe_interval = self.kwargs.get('KeyframeInterval', 16)
+        self.not_listening = []
+        self.metrics = metrics.registry_from(self.kwargs)
+        self.latency = self.metrics.histogram('rfm69_stage_latency_seconds', 'The time from receiving a packet to each stage',
+                                              stage='stream')
+        self.loops = self.metrics.counter('rfm69_loop_iterations_total', 'The passes through the loop of each thread', thread='bluetooth')
 
     @staticmethod
-    def process_packet(packet_list, counter):
+    def process_packet(fix, counter, state=None, events=None):
         """
         process the packet
 
-        :param packet_list: a list that is either a packet or none
+        :param fix: a position_fix.PositionFix or None
         :param counter a counter ot show movement on phone
+        :param state: the track_analytics.TrackState of the source, its speed, heading and distance are added, may be None
+        :param events: the geofence.GeofenceEvent made by the fix, they are added, may be None
         :return: a string with the packet in it
         """
         # short circuit will prevent the exception in the second half
         # see if the position is not valid
-        if packet_list is None or packet_list[radio_constants.POSITION_VALID] == radio_constants.POSITION_NOT_VALID_VALUE:
+        if fix is None or not fix.valid:
             lat_long = 'No valid location'
         else:
-            # latitude has the form of Latitude (DDmm.mm)
-            latitude = packet_list[radio_constants.LATITUDE]
+            # the text is rendered once by the fix and shared with the other threads
+            lat_long = fix.bluetooth_text if counter is None else f'{fix.bluetooth_text} {counter}'
+            if state is not None:
+                lat_long = f'{lat_long} {state.bluetooth_text}'
+            if events:
+                lat_long = f'{lat_long} {" ".join(event.text for event in events)}'
+        return lat_long
 
-            # longitude has the form Longitude (DDDmm.mm)
-            longitude = packet_list[radio_constants.LONGITUDE]
+    @classmethod
+    def text_function(cls, table):
+        """
+        :param table: the position_table.PositionTable
+        :return: the function that makes the text for a fix, process_packet with the track of the source and the geofence
+                 events of the fix when the table has them
+        """
+        analytics = getattr(table, 'analytics', None)
+        geofence = getattr(table, 'geofence', None)
+        if analytics is None and geofence is None:
+            return cls.process_packet
+
+        def process_packet(fix, counter):
+            if fix is None:
+                return cls.process_packet(fix, counter)
+            return cls.process_packet(fix, counter, None if analytics is None else analytics.state(fix.source),
+                                      None if geofence is None else geofence.events_for(fix))
+        return process_packet
+
+    def listen(self, server: stream_server.StreamServer, address: str) -> bool:
+        """
+        listen on an address
 
-            # send the position fix indicator
-            counter = '' if counter is None else f' {counter}'
-            lat_long = longitude + ', ' + latitude + ' ' + packet_list[radio_constants.POSITION_VALID] + counter
-        return lat_long
+        :param server: the stream server
+        :param address: the listen address
+        :return: True if the server is listening, False if the bind failed and should be tried again later
+        """
+        try:
+            server.add_listener(address)
+        except OSError as error:
+            self.logger.info('bluetooth bind socket failed address = %s error = %s', address, error)
+            return False
+        return True
 
     def run(self) -> None:
         """
@@ -137,30 +133,93 @@ class BluetoothTransmitThread(threading.Thread):
 
         :return: None
         """
-        connected = False
-        counter = 0
+        encoder_factory = stream_protocol.encoder_factory(self.protocol, self.text_function(self.lock_location_class), self.keyframe_interval)
+        server = stream_server.StreamServer(max_queue=self.max_queue, logger=self.logger, encoder_factory=encoder_factory)
+        self.metrics.gauge('rfm69_stream_clients', 'The phones and socket clients connected', lambda: server.client_count)
+        self.metrics.gauge('rfm69_stream_queue_depth', 'The messages queued for all the clients', lambda: server.queued)
+        self.metrics.counter('rfm69_stream_messages_total', 'The messages published to the clients', lambda: server.messages)
+        self.metrics.counter('rfm69_stream_dropped_total', 'The messages dropped because a client queue was full', lambda: server.dropped)
+        server_stop = threading.Event()
+        server_thread = threading.Thread(target=server.serve, args=(server_stop, self.sleep_time_in_sec), name=f'{self.thread_name} server')
+        server_thread.start()
+        self.not_listening = self.listen_addresses
+        try:
+            if self.protocol == stream_protocol.PROTOCOL_TEXT:
+                self.send_every_time(server)
+            else:
+                self.send_on_change(server)
+        finally:
+            server_stop.set()
+            server.wake()
+            server_thread.join()
+            server.close()
+
+    def listen_again(self, server: stream_server.StreamServer) -> None:
+        """
+        the bluetooth adapter may not be up yet, keep trying the addresses that did not bind
+
+        :param server: the stream server
+        :return: None
+        """
+        if self.not_listening:
+            self.not_listening = [address for address in self.not_listening if not self.listen(server, address)]
 
+    def send_every_time(self, server: stream_server.StreamServer) -> None:
+        """
+        the text protocol, send the latest fix of every source when a fix arrives and every sleep time
+
+        :param server: the stream server
+        :return: None
+        """
+        last_fix = None
+        while True:
+            if self.event.is_set() or self.lock_location_class.closed:
+                return
+            self.loops.inc()
+            self.listen_again(server)
+            version = self.lock_location_class.version
+            if server.client_count:
+                # send the latest fix from every source to every phone
+                server.publish(self.lock_location_class.all_latest() or [None])
+                if self.metrics.enabled:
+                    fix = self.lock_location_class.latest()
+                    if fix is not last_fix and fix is not None:
+                        last_fix = fix
+                        self.latency.observe(time.time() - fix.received)
+            # send again as soon as a new fix is published, the sleep time is the longest the phone goes without a line
+            self.lock_location_class.wait_for_update(version, self.sleep_time_in_sec)
+
+    def send_on_change(self, server: stream_server.StreamServer) -> None:
+        """
+        the on change protocols, send only the fixes that changed, and a keepalive when nothing changed for the keepalive time.
+        A new client is sent the latest fix of every source.
+
+        :param server: the stream server
+        :return: None
+        """
+        last_version = 0
+        accepted = 0
+        last_sent = time.monotonic()
         while True:
-            if self.event.is_set():
+            if self.event.is_set() or self.lock_location_class.closed:
                 return
-            time.sleep(.5)
-            if not connected:
-                local_socket, bluetooth_write_socket, address_pair = self.bluetooth_connect(mac_address=self.mac_address)
-                if local_socket:
-                    connected = True
-                    self.logger.info(f"Paired with {address_pair}")
-            elif connected:
-                # ok we are connected.
-                packet_list = self.lock_location_class.data
-                lat_long = self.process_packet(packet_list, counter)
-                counter = counter + 1 if counter < 16 else 0
-                lat_long = lat_long + "\r\n"
-
-                return_code = self.send_data(bluetooth_write_socket, lat_long)
-                if not return_code:
-                    connected = False
-                    bluetooth_write_socket.close()
-                    local_socket.close()
-                    continue
-            # only delay if we are connected
-            time.sleep(self.sleep_time_in_sec)
+            self.loops.inc()
+            self.listen_again(server)
+            if server.accepted != accepted:
+                # the new client needs the whole picture, the others only get a delta for the sources that did not move
+                accepted = server.accepted
+                last_version, fixes = self.lock_location_class.version, self.lock_location_class.all_latest()
+            else:
+                last_version, fixes = self.lock_location_class.changed_since(last_version)
+            now = time.monotonic()
+            if fixes:
+                server.publish(fixes)
+                last_sent = now
+                if self.metrics.enabled:
+                    received = time.time()
+                    for fix in fixes:
+                        self.latency.observe(received - fix.received)
+            elif now - last_sent >= self.keepalive:
+                server.publish(self.lock_location_class.all_latest() or [None], keepalive=True)
+                last_sent = now
+            self.lock_location_class.wait_for_update(last_version, min(self.sleep_time_in_sec, max(0.0, last_sent + self.keepalive - now)))
@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Draw text on the 128x32 ssd1306 without sending the whole frame buffer over i2c for every change.
+# The display memory is 4 pages of 8 rows, each byte is one column of 8 pixels in a page, and a text line of the 5x8 font
+# is exactly one page.  So each line is rendered to 128 column bytes from the cached glyphs, compared with what the
+# display already shows, and only the columns that changed are sent, after setting the column and page address.
+#
+# font5x8.bin is 2 bytes with the width and height followed by 5 column bytes for each of the 256 characters,
+# the same file the adafruit framebuf text method uses, the characters are 6 columns apart.
+#
+# run it with python display_renderer.py to compare the i2c bytes with a full refresh
+
+import argparse
+import time
+from typing import Final
+
+WIDTH: Final[int] = 128
+HEIGHT: Final[int] = 32
+PAGES: Final[int] = HEIGHT // 8
+# the ssd1306 commands
+SET_COLUMN_ADDRESS: Final[int] = 0x21
+SET_PAGE_ADDRESS: Final[int] = 0x22
+# the i2c control byte in front of a command and in front of display data
+CONTROL_COMMAND: Final[int] = 0x80
+CONTROL_DATA: Final[int] = 0x40
+# the bytes adafruit_ssd1306 show sends, 6 commands of 2 bytes and the control byte and the whole frame buffer
+FULL_REFRESH_BYTES: Final[int] = 6 * 2 + 1 + WIDTH * PAGES
+
+
+class Font:
+    """
+    The 5x8 font with a cache of the rendered glyphs
+    """
+
+    def __init__(self, file_name: str = 'font5x8.bin'):
+        """
+        The init class for the font
+
+        :param file_name: the font file
+        """
+        with open(file_name, 'rb') as file:
+            self.width, self.height = file.read(2)
+            self.__data = file.read()
+        if self.height != 8:
+            raise ValueError(f'the font height must be 8 not {self.height}')
+        self.advance = self.width + 1
+        self.__glyphs = {}
+
+    def glyph(self, character: str) -> bytes:
+        """
+        :param character: the character
+        :return: the column bytes of the character including the blank column after it
+        """
+        glyph = self.__glyphs.get(character)
+        if glyph is None:
+            code = ord(character)
+            if code > 255:
+                code = ord('?')
+            glyph = self.__glyphs[character] = self.__data[code * self.width:(code + 1) * self.width] + b'\0'
+        return glyph
+
+    def render(self, text: str, width: int = WIDTH) -> bytes:
+        """
+        :param text: one line of text, it is cut off at the edge of the display
+        :param width: the width of the display
+        :return: the page bytes for the line, one byte for each column
+        """
+        line = b''.join([self.glyph(character) for character in text[:width // self.advance + 1]])[:width]
+        return line + bytes(width - len(line))
+
+
+class SSD1306Device:
+    """
+    The i2c writes to a real adafruit_ssd1306.SSD1306_I2C, only the methods the renderer needs
+    """
+
+    def __init__(self, display):
+        """
+        The init class for the device
+
+        :param display: the adafruit_ssd1306.SSD1306_I2C display
+        """
+        self.display = display
+        self.bytes_sent = 0
+
+    def write_command(self, command: int) -> None:
+        """
+        :param command: a command byte
+        :return: None
+        """
+        self.display.write_cmd(command)
+        self.bytes_sent += 2
+
+    def write_data(self, data: bytes) -> None:
+        """
+        :param data: display data, it goes to the columns and page set by the last address commands
+        :return: None
+        """
+        with self.display.i2c_device:
+            self.display.i2c_device.write(bytes([CONTROL_DATA]) + data)
+        self.bytes_sent += len(data) + 1
+
+
+class FakeSSD1306:
+    """
+    A stand in for the display that keeps the display memory and counts the i2c bytes, so the renderer can be measured
+    """
+
+    def __init__(self):
+        """
+        The init class for the fake display
+        """
+        self.memory = bytearray(WIDTH * PAGES)
+        self.bytes_sent = 0
+        self.__command = []
+        self.__columns = (0, WIDTH - 1)
+        self.__pages = (0, PAGES - 1)
+
+    def write_command(self, command: int) -> None:
+        """
+        :param command: a command byte
+        :return: None
+        """
+        self.bytes_sent += 2
+        self.__command.append(command)
+        if self.__command[0] in (SET_COLUMN_ADDRESS, SET_PAGE_ADDRESS) and len(self.__command) == 3:
+            if self.__command[0] == SET_COLUMN_ADDRESS:
+                self.__columns = (self.__command[1], self.__command[2])
+            else:
+                self.__pages = (self.__command[1], self.__command[2])
+            self.__command = []
+        elif self.__command[0] not in (SET_COLUMN_ADDRESS, SET_PAGE_ADDRESS):
+            self.__command = []
+
+    def write_data(self, data: bytes) -> None:
+        """
+        :param data: display data for the address window set by the last commands
+        :return: None
+        """
+        self.bytes_sent += len(data) + 1
+        offset = 0
+        for page in range(self.__pages[0], self.__pages[1] + 1):
+            for column in range(self.__columns[0], self.__columns[1] + 1):
+                if offset == len(data):
+                    return
+                self.memory[page * WIDTH + column] = data[offset]
+                offset += 1
+
+    def page_text(self, font: Font, page: int) -> str:
+        """
+        read a line back from the display memory, for checking the renderer
+
+        :param font: the font the line was drawn with
+        :param page: the page
+        :return: the text
+        """
+        columns = bytes(self.memory[page * WIDTH:(page + 1) * WIDTH])
+        glyphs = {font.glyph(chr(code)): chr(code) for code in range(126, 31, -1)}
+        return ''.join(glyphs.get(columns[offset:offset + font.advance], '?')
+                       for offset in range(0, WIDTH - font.advance + 1, font.advance)).rstrip()
+
+
+class DisplayRenderer:
+    """
+    Keep the text of each line of the display and send only the columns that changed
+    """
+
+    def __init__(self, device, font: Font = None):
+        """
+        The init class for the renderer
+
+        :param device: a SSD1306Device or FakeSSD1306
+        :param font: the font, font5x8.bin in the current directory if None
+        """
+        self.device = device
+        self.font = Font() if font is None else font
+        self.__texts = [None] * PAGES
+        self.__pages = [None] * PAGES
+        self.refreshes = 0
+        self.lines_drawn = 0
+
+    def render(self, lines: list) -> int:
+        """
+        show lines of text, a line that has not changed is not rendered or sent
+
+        :param lines: up to 4 lines of text, a missing line is blank
+        :return: the number of i2c bytes sent
+        """
+        start = self.device.bytes_sent
+        self.refreshes += 1
+        for page in range(PAGES):
+            text = lines[page] if page < len(lines) else ''
+            if text == self.__texts[page]:
+                continue
+            self.__texts[page] = text
+            new = self.font.render(text)
+            old = self.__pages[page]
+            self.__pages[page] = new
+            if old is None:
+                first, last = 0, WIDTH - 1
+            else:
+                first = next((column for column in range(WIDTH) if new[column] != old[column]), None)
+                if first is None:
+                    continue
+                last = next(column for column in range(WIDTH - 1, first - 1, -1) if new[column] != old[column])
+            self.lines_drawn += 1
+            for command in (SET_COLUMN_ADDRESS, first, last, SET_PAGE_ADDRESS, page, page):
+                self.device.write_command(command)
+            self.device.write_data(new[first:last + 1])
+        return self.device.bytes_sent - start
+
+    def invalidate(self) -> None:
+        """
+        forget what the display shows, so the next render sends every line
+
+        :return: None
+        """
+        self.__texts = [None] * PAGES
+        self.__pages = [None] * PAGES
+
+
+class SourcePager:  # pylint: disable=R0903
+    """
+    Choose the transmitter to show when there is more than one, each one is shown for the page time
+    """
+
+    def __init__(self, page_time: float = 5.0):
+        """
+        The init class for the pager
+
+        :param page_time: the seconds each transmitter is shown
+        """
+        self.page_time = page_time
+        self.__source = None
+        self.__shown_at = 0.0
+
+    def current(self, sources: list, now: float = None) -> tuple:
+        """
+        :param sources: the source addresses in the position table
+        :param now: the monotonic time, now if None
+        :return: a tuple of the source to show, its page number from 1, and the seconds until the next page
+        """
+        now = time.monotonic() if now is None else now
+        if not sources:
+            self.__source = None
+            return None, 0, self.page_time
+        sources = sorted(sources)
+        if self.__source not in sources:
+            self.__source = sources[0]
+            self.__shown_at = now
+        elif len(sources) > 1 and now - self.__shown_at >= self.page_time:
+            self.__source = sources[(sources.index(self.__source) + 1) % len(sources)]
+            self.__shown_at = now
+        return self.__source, sources.index(self.__source) + 1, max(0.0, self.__shown_at + self.page_time - now)
+
+
+def page_fix(table, pager: SourcePager, display_source: int = None, title: str = 'Remote Location') -> tuple:
+    """
+    choose the fix to display, a fixed source if display_source is set, else the sources in the table take turns
+
+    :param table: the position_table.PositionTable
+    :param pager: the pager that keeps the turn
+    :param display_source: the source address to display, None to page through all of them
+    :param title: the title line
+    :return: a tuple of the fix or None, the title with the page number when there is more than one source,
+             and the seconds until the next page or None if the display does not page,
+             when the table has track analytics the title is the speed, heading and distance of the source,
+             and a recent geofence event of the source is shown instead of either
+    """
+    if display_source is not None:
+        fix = table.latest(display_source)
+        return fix, fix_title(table, fix, title), None
+    sources = table.sources()
+    if len(sources) < 2:
+        fix = table.latest(None)
+        return fix, fix_title(table, fix, title), None
+    source, number, next_page = pager.current(sources)
+    fix = table.latest(source)
+    return fix, f'{fix_title(table, fix, title)} {number}/{len(sources)}', next_page
+
+
+def fix_title(table, fix, title: str) -> str:
+    """
+    :param table: the position_table.PositionTable
+    :param fix: the fix displayed, or None
+    :param title: the title line
+    :return: the last geofence event of the source if it is recent, else the speed, heading and distance of the source
+             if the table has track analytics, else the title
+    """
+    if fix is None:
+        return title
+    geofence = getattr(table, 'geofence', None)
+    if geofence is not None:
+        event = geofence.last_event(fix.source, time.time())
+        if event is not None:
+            return event.text
+    analytics = getattr(table, 'analytics', None)
+    if analytics is None:
+        return title
+    state = analytics.state(fix.source)
+    return title if state is None else state.display_text
+
+
+def compare_refresh(count: int = 100) -> dict:
+    """
+    count the i2c bytes to show a moving transmitter with full refreshes and with the renderer
+
+    :param count: the number of fixes
+    :return: a dictionary of the bytes for each
+    """
+    import benchmarks  # pylint: disable=C0415
+    import packet_decoder  # pylint: disable=C0415
+    decoder = packet_decoder.PacketDecoder()
+    renderer = DisplayRenderer(FakeSSD1306())
+    for counter, packet in enumerate(benchmarks.moving_packets(count)):
+        fix = decoder.decode(packet)
+        renderer.render(['Remote Location', fix.latitude_text, fix.longitude_text, f'pv=A, {fix.callsign} {counter & 0xf:01x}'])
+    return {'fixes': count, 'full_refresh_bytes': count * FULL_REFRESH_BYTES, 'renderer_bytes': renderer.device.bytes_sent}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=100, help='the number of fixes default = %(default)s')
+    arguments = parser.parse_args()
+    print(compare_refresh(arguments.count))
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Stand ins for the board, busio, digitalio, RPi.GPIO, adafruit_ssd1306 and adafruit_rfm69 modules, so rfm69_sr.py and its
+# threads run on a machine without the radio bonnet, for the benchmarks.  install() puts them in sys.modules,
+# it must be called before rfm69_sr is imported, and a module that is really installed is left alone.
+#
+# The radio is a radio_simulator.SimulatedRFM69, a packet injected into it raises the DIO0 edge on the fake gpio,
+# and the display counts the i2c bytes like display_renderer.FakeSSD1306.
+# The radios and displays made are kept in RADIOS and DISPLAYS so the benchmark can reach them.
+
+import importlib.util
+import sys
+import types
+
+import display_renderer
+import radio_simulator
+
+RADIOS = []
+DISPLAYS = []
+# bcm pin -> edge callback
+_EDGE_CALLBACKS = {}
+# DIO0 on the radio bonnet
+DIO0_PIN = 22
+# chip select -> the DIO0 pin of that radio, for a gateway with more than one radio
+DIO0_PINS = {'CE1': DIO0_PIN}
+
+
+class DigitalInOut:  # pylint: disable=R0903
+    """
+    A gpio pin, an input reads high so button a is never pushed
+    """
+
+    def __init__(self, pin):
+        """
+        The init class for the pin
+
+        :param pin: the board pin
+        """
+        self.pin = pin
+        self.direction = None
+        self.pull = None
+        self.value = True
+
+
+class I2CDevice:
+    """
+    The i2c device of the display, it counts the bytes written
+    """
+
+    def __init__(self, display):
+        """
+        The init class for the i2c device
+
+        :param display: the display that counts the bytes
+        """
+        self.display = display
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        return False
+
+    def write(self, data: bytes) -> None:
+        """
+        :param data: the bytes written
+        :return: None
+        """
+        self.display.bytes_sent += len(data)
+
+
+class SSD1306I2C:
+    """
+    The adafruit_ssd1306.SSD1306_I2C display, it draws nothing and counts the i2c bytes
+    """
+
+    def __init__(self, width: int, height: int, i2c, addr: int = 0x3c):  # pylint: disable=W0613
+        """
+        The init class for the display
+
+        :param width: the width in pixels
+        :param height: the height in pixels
+        :param i2c: the i2c bus
+        :param addr: the i2c address
+        """
+        self.width = width
+        self.height = height
+        self.bytes_sent = 0
+        self.shows = 0
+        self.i2c_device = I2CDevice(self)
+        DISPLAYS.append(self)
+
+    def fill(self, color: int) -> None:
+        """
+        :param color: not used
+        :return: None
+        """
+
+    def text(self, text: str, x: int, y: int, color: int) -> None:
+        """
+        :param text: not used
+        :param x: not used
+        :param y: not used
+        :param color: not used
+        :return: None
+        """
+
+    def show(self) -> None:
+        """
+        count a full refresh
+
+        :return: None
+        """
+        self.shows += 1
+        self.bytes_sent += display_renderer.FULL_REFRESH_BYTES
+
+    def write_cmd(self, command: int) -> None:  # pylint: disable=W0613
+        """
+        :param command: the command byte
+        :return: None
+        """
+        self.bytes_sent += 2
+
+
+class RFM69(radio_simulator.SimulatedRFM69):
+    """
+    The adafruit_rfm69.RFM69 radio, a simulated radio that raises DIO0 on the fake gpio when a packet arrives
+    """
+
+    def __init__(self, spi, chip_select, reset, frequency: float, *, sync_word: bytes = b'\x2D\xD4', **kwargs):  # pylint: disable=W0613
+        """
+        The init class for the radio
+
+        :param spi: not used
+        :param chip_select: not used
+        :param reset: not used
+        :param frequency: the frequency in MHz
+        :param sync_word: the sync word
+        """
+        super().__init__()
+        self.frequency = frequency
+        self.sync_word = sync_word
+        self.dio0_pin = DIO0_PINS.get(getattr(chip_select, 'pin', None), DIO0_PIN)
+        RADIOS.append(self)
+
+    def inject(self, packet: bytes) -> bool:
+        """
+        simulate a packet arriving and raise DIO0
+
+        :param packet: the packet including the 4 byte header
+        :return: True if the packet was put in the fifo
+        """
+        ready = super().inject(packet)
+        callback = _EDGE_CALLBACKS.get(self.dio0_pin)
+        if ready and callback is not None:
+            callback(self.dio0_pin)
+        return ready
+
+    def _read_u8(self, address: int) -> int:
+        """
+        read a register, only RegIrqFlags1 is known
+
+        :param address: the register address
+        :return: the register
+        """
+        return int(self.channel_busy()) if address == 0x27 else 0
+
+
+def _add_event_detect(pin: int, edge, callback=None, **kwargs) -> None:  # pylint: disable=W0613
+    _EDGE_CALLBACKS[pin] = callback
+
+
+def _remove_event_detect(pin: int) -> None:
+    _EDGE_CALLBACKS.pop(pin, None)
+
+
+def _pin(name: str) -> str:
+    """
+    any board pin, the pin is its name
+
+    :param name: the pin name
+    :return: the name
+    """
+    if name.startswith('__'):
+        raise AttributeError(name)
+    return name
+
+
+def _module(name: str, **attributes) -> types.ModuleType:
+    """
+    :param name: the module name
+    :param attributes: the names in the module
+    :return: the module
+    """
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    return module
+
+
+def install() -> list:
+    """
+    put the fake modules in sys.modules, a module that can be imported for real is not replaced
+
+    :return: the names of the modules that were faked
+    """
+    pins = {name: name for name in ('SCL', 'SDA', 'SCK', 'MOSI', 'MISO', 'CE0', 'CE1', 'D5', 'D6', 'D25', 'D27')}
+    gpio = _module('RPi.GPIO', BCM='BCM', IN='IN', OUT='OUT', PUD_UP='PUD_UP', PUD_DOWN='PUD_DOWN', RISING='RISING',
+                   FALLING='FALLING', setmode=lambda mode: None, setup=lambda *args, **kwargs: None,
+                   add_event_detect=_add_event_detect, remove_event_detect=_remove_event_detect)
+    modules = {
+        'board': _module('board', __getattr__=_pin, **pins),
+        'busio': _module('busio', I2C=lambda *args, **kwargs: ('i2c', args), SPI=lambda *args, **kwargs: ('spi', args)),
+        'digitalio': _module('digitalio', DigitalInOut=DigitalInOut, Direction=types.SimpleNamespace(INPUT='input', OUTPUT='output'),
+                             Pull=types.SimpleNamespace(UP='up', DOWN='down')),
+        'adafruit_ssd1306': _module('adafruit_ssd1306', SSD1306_I2C=SSD1306I2C),
+        'adafruit_rfm69': _module('adafruit_rfm69', RFM69=RFM69),
+        'RPi': _module('RPi', GPIO=gpio),
+        'RPi.GPIO': gpio,
+    }
+    faked = []
+    for name, module in modules.items():
+        if name in sys.modules:
+            continue
+        top_level = name.split('.')[0]
+        if top_level not in faked and importlib.util.find_spec(top_level) is not None:
+            continue
+        sys.modules[name] = module
+        faked.append(name)
+    return faked
@@ -0,0 +1,431 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Enter and exit alerts for areas, checked on every valid fix.
+#
+# The fences are read from a geojson FeatureCollection, a Polygon or MultiPolygon feature is a polygon fence, holes and all,
+# and a Point feature with a radius property in metres is a circle fence.  The name property names the fence, and an
+# optional callsigns property is a list of the callsigns the fence is for, without it the fence is for every transmitter.
+#
+# The fences are put in a grid of cells of a fixed size in degrees, each cell has the fences whose bounding box touches it,
+# so a fix only looks at the few fences of its cell instead of all of them.  The grid is a dictionary so only the cells
+# with fences use memory.  For each source the fences it is in are kept, and a fix that changes them makes an enter or
+# exit event, which is logged, shown on the display for hold_time seconds and added to the phone text of the fix.
+# The engine is updated by PositionTable.insert, so the threads and the asyncio runtime both check every fix.
+#
+# run it with python geofence.py to measure the lookups each second against the number of fences
+
+import argparse
+import collections
+import json
+import math
+import random
+import threading
+import time
+from typing import Final
+
+import track_analytics
+
+EVENT_ENTER: Final[str] = 'ENTER'
+EVENT_EXIT: Final[str] = 'EXIT'
+# the metres in a degree of latitude
+METRES_PER_DEGREE: Final[float] = math.radians(1.0) * track_analytics.EARTH_RADIUS
+
+
+class PolygonFence:
+    """
+    A polygon, the rings are lists of (longitude, latitude) like geojson, the first is the outside and the rest are holes
+    """
+    __slots__ = ['name', 'callsigns', 'rings', 'bounds']
+
+    def __init__(self, name: str, rings: list, callsigns: frozenset = None):
+        """
+        The init class for the fence
+
+        :param name: the fence name
+        :param rings: the rings of the polygon, a list of lists of (longitude, latitude)
+        :param callsigns: the callsigns the fence is for, None for every callsign
+        """
+        if not rings or len(rings[0]) < 3:
+            raise ValueError(f'fence {name} needs a ring of at least 3 points')
+        self.name = name
+        self.callsigns = callsigns
+        self.rings = [[(float(point[0]), float(point[1])) for point in ring] for ring in rings]
+        longitudes = [point[0] for point in self.rings[0]]
+        latitudes = [point[1] for point in self.rings[0]]
+        # minimum latitude, minimum longitude, maximum latitude, maximum longitude
+        self.bounds = (min(latitudes), min(longitudes), max(latitudes), max(longitudes))
+
+    @staticmethod
+    def in_ring(ring: list, latitude: float, longitude: float) -> bool:
+        """
+        the even odd ray casting test
+
+        :param ring: a list of (longitude, latitude)
+        :param latitude: the latitude in degrees
+        :param longitude: the longitude in degrees
+        :return: True if the point is inside the ring
+        """
+        inside = False
+        x_1, y_1 = ring[-1]
+        for x_2, y_2 in ring:
+            if (y_2 > latitude) != (y_1 > latitude) and longitude < (x_1 - x_2) * (latitude - y_2) / (y_1 - y_2) + x_2:
+                inside = not inside
+            x_1, y_1 = x_2, y_2
+        return inside
+
+    def contains(self, latitude: float, longitude: float) -> bool:
+        """
+        :param latitude: the latitude in degrees
+        :param longitude: the longitude in degrees
+        :return: True if the point is inside the polygon and not in a hole
+        """
+        south, west, north, east = self.bounds
+        if not (south <= latitude <= north and west <= longitude <= east):
+            return False
+        if not self.in_ring(self.rings[0], latitude, longitude):
+            return False
+        return not any(self.in_ring(hole, latitude, longitude) for hole in self.rings[1:])
+
+
+class CircleFence:
+    """
+    A circle around a point
+    """
+    __slots__ = ['name', 'callsigns', 'latitude', 'longitude', 'radius', 'bounds']
+
+    def __init__(self, name: str, latitude: float, longitude: float, radius: float, callsigns: frozenset = None):  # pylint: disable=R0913
+        """
+        The init class for the fence
+
+        :param name: the fence name
+        :param latitude: the latitude of the centre in degrees
+        :param longitude: the longitude of the centre in degrees
+        :param radius: the radius in metres
+        :param callsigns: the callsigns the fence is for, None for every callsign
+        """
+        if radius <= 0:
+            raise ValueError(f'fence {name} needs a radius above 0')
+        self.name = name
+        self.callsigns = callsigns
+        self.latitude = float(latitude)
+        self.longitude = float(longitude)
+        self.radius = float(radius)
+        half_height = radius / METRES_PER_DEGREE
+        half_width = half_height / max(math.cos(math.radians(latitude)), 1e-6)
+        self.bounds = (latitude - half_height, longitude - half_width, latitude + half_height, longitude + half_width)
+
+    def contains(self, latitude: float, longitude: float) -> bool:
+        """
+        :param latitude: the latitude in degrees
+        :param longitude: the longitude in degrees
+        :return: True if the point is inside the circle
+        """
+        south, west, north, east = self.bounds
+        if not (south <= latitude <= north and west <= longitude <= east):
+            return False
+        return track_analytics.haversine(self.latitude, self.longitude, latitude, longitude) <= self.radius
+
+
+def load_fences(file_name: str) -> list:
+    """
+    :param file_name: a geojson file with a FeatureCollection
+    :return: a list of the PolygonFence and CircleFence
+    """
+    with open(file_name, encoding='utf-8') as file:
+        collection = json.load(file)
+    if collection.get('type') != 'FeatureCollection':
+        raise ValueError(f'{file_name} is not a geojson FeatureCollection')
+    fences = []
+    for number, feature in enumerate(collection.get('features', [])):
+        properties = feature.get('properties') or {}
+        geometry = feature.get('geometry') or {}
+        name = str(properties.get('name', feature.get('id', f'fence {number}')))
+        callsigns = properties.get('callsigns')
+        callsigns = None if callsigns is None else frozenset(callsigns)
+        kind = geometry.get('type')
+        if kind == 'Polygon':
+            fences.append(PolygonFence(name, geometry['coordinates'], callsigns))
+        elif kind == 'MultiPolygon':
+            # each part is its own fence with the same name, a point in any part is in the fence
+            fences.extend(PolygonFence(name, rings, callsigns) for rings in geometry['coordinates'])
+        elif kind == 'Point':
+            if 'radius' not in properties:
+                raise ValueError(f'the point fence {name} in {file_name} needs a radius property in metres')
+            longitude, latitude = geometry['coordinates'][:2]
+            fences.append(CircleFence(name, latitude, longitude, properties['radius'], callsigns))
+        else:
+            raise ValueError(f'fence {name} in {file_name} is a {kind}, only Polygon, MultiPolygon and Point are used')
+    return fences
+
+
+class GridIndex:
+    """
+    The fences by the grid cells their bounding boxes touch
+    """
+
+    def __init__(self, fences: list, cell_size: float = None):
+        """
+        The init class for the index
+
+        :param fences: the fences
+        :param cell_size: the size of a cell in degrees, None picks the median size of the fences
+        """
+        if cell_size is None:
+            sizes = sorted(max(fence.bounds[2] - fence.bounds[0], fence.bounds[3] - fence.bounds[1]) for fence in fences)
+            cell_size = max(sizes[len(sizes) // 2], 1e-4) if sizes else 1.0
+        self.cell_size = cell_size
+        self.__cells = {}
+        for fence in fences:
+            south, west, north, east = fence.bounds
+            for row in range(self.cell(south), self.cell(north) + 1):
+                for column in range(self.cell(west), self.cell(east) + 1):
+                    self.__cells.setdefault((row, column), []).append(fence)
+
+    def cell(self, degrees: float) -> int:
+        """
+        :param degrees: a latitude or longitude
+        :return: the row or column of the cell
+        """
+        return math.floor(degrees / self.cell_size)
+
+    def candidates(self, latitude: float, longitude: float) -> list:
+        """
+        :param latitude: the latitude in degrees
+        :param longitude: the longitude in degrees
+        :return: the fences whose bounding box touches the cell of the point
+        """
+        return self.__cells.get((self.cell(latitude), self.cell(longitude)), [])
+
+    def lookup(self, latitude: float, longitude: float) -> list:
+        """
+        :param latitude: the latitude in degrees
+        :param longitude: the longitude in degrees
+        :return: the fences the point is in
+        """
+        return [fence for fence in self.candidates(latitude, longitude) if fence.contains(latitude, longitude)]
+
+    @property
+    def cells(self) -> int:
+        """
+        :return: the number of cells with fences
+        """
+        return len(self.__cells)
+
+
+class GeofenceEvent(tuple):
+    """
+    A source entering or leaving a fence, read only so it can be shared between threads
+    """
+    __slots__ = ()
+
+    def __new__(cls, kind: str, fence: str, source: int, callsign: str, fix):  # pylint: disable=R0913
+        return tuple.__new__(cls, (kind, fence, source, callsign, fix))
+
+    kind = property(lambda self: self[0], doc='EVENT_ENTER or EVENT_EXIT')
+    fence = property(lambda self: self[1], doc='the fence name')
+    source = property(lambda self: self[2], doc='the address of the transmitter')
+    callsign = property(lambda self: self[3], doc='the callsign of the transmitter')
+    fix = property(lambda self: self[4], doc='the position_fix.PositionFix that crossed the fence')
+
+    @property
+    def text(self) -> str:
+        """
+        :return: the event for the display and the phone, for example ENTER depot
+        """
+        return f'{self.kind} {self.fence}'
+
+    def __repr__(self) -> str:
+        return f'GeofenceEvent(kind={self.kind}, fence={self.fence!r}, source={self.source}, callsign={self.callsign!r})'
+
+
+class GeofenceEngine:
+    """
+    The fences each source is in, updated with each fix
+    """
+
+    def __init__(self, fences: list, cell_size: float = None, logger=None, hold_time: float = 60.0, max_events: int = 256):  # pylint: disable=R0913
+        """
+        The init class for the engine
+
+        :param fences: the fences
+        :param cell_size: the size of a grid cell in degrees, None picks one from the fences
+        :param logger: the events are logged at info, may be None
+        :param hold_time: the seconds an event is shown on the display
+        :param max_events: the recent events kept
+        """
+        self.fences = fences
+        self.index = GridIndex(fences, cell_size)
+        self.logger = logger
+        self.hold_time = hold_time
+        self.__lock = threading.Lock()
+        # source -> the names of the fences it is in
+        self.__inside = {}
+        # source -> its last event
+        self.__last_event = {}
+        self.events = collections.deque(maxlen=max_events)
+        self.event_count = 0
+        self.lookups = 0
+
+    def fences_at(self, latitude: float, longitude: float, callsign: str = None) -> frozenset:
+        """
+        :param latitude: the latitude in degrees
+        :param longitude: the longitude in degrees
+        :param callsign: the callsign, fences for other callsigns are left out, None leaves none out
+        :return: the names of the fences the point is in
+        """
+        return frozenset(fence.name for fence in self.index.lookup(latitude, longitude)
+                         if fence.callsigns is None or callsign is None or callsign in fence.callsigns)
+
+    def update(self, fix) -> list:
+        """
+        check a fix against the fences, a fix without a position does not change anything
+
+        :param fix: the position_fix.PositionFix
+        :return: the list of GeofenceEvent the fix made, exits first
+        """
+        if not fix.valid:
+            return []
+        inside = self.fences_at(fix.latitude, fix.longitude, fix.callsign)
+        with self.__lock:
+            self.lookups += 1
+            before = self.__inside.get(fix.source, frozenset())
+            if inside == before:
+                return []
+            self.__inside[fix.source] = inside
+            events = [GeofenceEvent(EVENT_EXIT, name, fix.source, fix.callsign, fix) for name in sorted(before - inside)]
+            events.extend(GeofenceEvent(EVENT_ENTER, name, fix.source, fix.callsign, fix) for name in sorted(inside - before))
+            self.events.extend(events)
+            self.event_count += len(events)
+            self.__last_event[fix.source] = events[-1]
+        if self.logger is not None:
+            for event in events:
+                self.logger.info('geofence %s %s source=%d callsign=%s', event.kind, event.fence, event.source, event.callsign)
+        return events
+
+    def prime(self, fix) -> None:
+        """
+        set the fences a source is in from a fix restored after a restart, without making events
+
+        :param fix: the position_fix.PositionFix
+        :return: None
+        """
+        if fix.valid:
+            inside = self.fences_at(fix.latitude, fix.longitude, fix.callsign)
+            with self.__lock:
+                self.__inside[fix.source] = inside
+
+    def inside(self, source: int) -> frozenset:
+        """
+        :param source: the source address
+        :return: the names of the fences the source is in
+        """
+        with self.__lock:
+            return self.__inside.get(source, frozenset())
+
+    def last_event(self, source: int, now: float = None):
+        """
+        :param source: the source address
+        :param now: the time in seconds since the epoch, an event older than hold_time is not returned, None returns any age
+        :return: the last GeofenceEvent of the source, or None
+        """
+        with self.__lock:
+            event = self.__last_event.get(source)
+        if event is None or (now is not None and now - event.fix.received > self.hold_time):
+            return None
+        return event
+
+    def events_for(self, fix) -> list:
+        """
+        :param fix: the position_fix.PositionFix
+        :return: the events made by this fix
+        """
+        with self.__lock:
+            last = self.__last_event.get(fix.source)
+            if last is None or last.fix is not fix:
+                return []
+            return [event for event in self.events if event.fix is fix]
+
+    def forget(self, source: int) -> None:
+        """
+        :param source: the source address, for a source the position table evicted
+        :return: None
+        """
+        with self.__lock:
+            self.__inside.pop(source, None)
+            self.__last_event.pop(source, None)
+
+
+def random_fences(count: int, latitude: float = 35.9, longitude: float = -79.0, spread: float = 0.5, seed: int = 1) -> list:
+    """
+    make fences scattered over an area, half squares with 8 points and half circles, from 100 m to 2 km across
+
+    :param count: the number of fences
+    :param latitude: the latitude of the middle of the area
+    :param longitude: the longitude of the middle of the area
+    :param spread: the half width of the area in degrees
+    :param seed: the random seed
+    :return: the list of fences
+    """
+    chooser = random.Random(seed)
+    fences = []
+    for number in range(count):
+        centre_latitude = latitude + chooser.uniform(-spread, spread)
+        centre_longitude = longitude + chooser.uniform(-spread, spread)
+        size = chooser.uniform(100.0, 2000.0) / METRES_PER_DEGREE
+        if number % 2:
+            fences.append(CircleFence(f'circle {number}', centre_latitude, centre_longitude, size * METRES_PER_DEGREE / 2))
+        else:
+            ring = [(centre_longitude + size / 2 * math.cos(math.tau * step / 8), centre_latitude + size / 2 * math.sin(math.tau * step / 8))
+                    for step in range(8)]
+            fences.append(PolygonFence(f'polygon {number}', [ring]))
+    return fences
+
+
+def measure_lookups(fence_counts: tuple = (10, 100, 1000), lookups: int = 10000, spread: float = 0.5) -> dict:
+    """
+    look up random points with the grid and with a scan of every fence
+
+    :param fence_counts: the numbers of fences to try
+    :param lookups: the points looked up for each
+    :param spread: the half width of the area in degrees
+    :return: a dictionary for each number of fences with the lookups each second of the grid and the scan
+    """
+    chooser = random.Random(2)
+    points = [(35.9 + chooser.uniform(-spread, spread), -79.0 + chooser.uniform(-spread, spread)) for _ in range(lookups)]
+    results = {}
+    for count in fence_counts:
+        fences = random_fences(count, spread=spread)
+        index = GridIndex(fences)
+        start = time.perf_counter()
+        found = sum(len(index.lookup(latitude, longitude)) for latitude, longitude in points)
+        grid_time = time.perf_counter() - start
+        scan_points = points[:max(lookups * 10 // max(count, 10), 100)]
+        start = time.perf_counter()
+        for latitude, longitude in scan_points:
+            [fence for fence in fences if fence.contains(latitude, longitude)]  # pylint: disable=W0106
+        scan_time = time.perf_counter() - start
+        results[str(count)] = {'grid_lookups_per_second': lookups / grid_time, 'scan_lookups_per_second': len(scan_points) / scan_time,
+                               'cells': index.cells, 'found': found}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--fences', type=int, action='append', default=None,
+                        help='a number of fences, more than one can be given default = 10 100 1000')
+    parser.add_argument('--lookups', type=int, default=10000, help='the points looked up default = %(default)s')
+    arguments = parser.parse_args()
+    for fence_count, result in measure_lookups(tuple(arguments.fences or (10, 100, 1000)), arguments.lookups).items():
+        print(fence_count, result)
@@ -15,29 +15,33 @@
 import threading
 
 
-class LockAndData:  # pylint: disable=R0903
+class LockAndData:
     """
     A class to contain common data amd access with a lock.  ?This is thread safe
+
+    It is also a versioned publish and subscribe point.  Every time the data is set the version goes up by one and
+    the threads waiting in wait_for_update are woken, so a consumer does not have to poll the data on a timer.
     """
 
     def __init__(self, data=None):
         """
         The init class for the lock and location
         """
-        self.__lock = threading.Lock()
-        self.__data = data
+        # the condition holds the lock, subclasses use it to guard their own state
+        self._condition = threading.Condition(threading.Lock())
+        self._data = data
+        self._version = 0
+        self._closed = False
 
     @property
-    def data(self) -> str:
+    def data(self):
         """
         A function to lock the data, read it unlock the data and return with the location
 
-        :return: a string with the gps location
+        :return: the data
         """
-        self.__lock.acquire()   # pylint: disable=R1732
-        __location = self.__data
-        self.__lock.release()
-        return __location
+        with self._condition:
+            return self._data
 
     @data.setter
     def data(self, data) -> None:
@@ -47,6 +51,63 @@ class LockAndData:  # pylint: disable=R0903
         :param data: The to be saved in the class
         :return: None
         """
-        self.__lock.acquire()  # pylint: disable=R1732
-        self.__data = data
-        self.__lock.release()
+        self.publish(data)
+
+    @property
+    def version(self) -> int:
+        """
+        :return: the version of the data, it goes up by one every time the data is published
+        """
+        with self._condition:
+            return self._version
+
+    @property
+    def closed(self) -> bool:
+        """
+        :return: True if close has been called
+        """
+        with self._condition:
+            return self._closed
+
+    def publish(self, data) -> int:
+        """
+        save the data and wake the subscribers
+
+        :param data: The to be saved in the class
+        :return: the new version
+        """
+        with self._condition:
+            self._data = data
+            return self._notify()
+
+    def _notify(self) -> int:
+        """
+        bump the version and wake the subscribers, the lock must be held
+
+        :return: the new version
+        """
+        self._version += 1
+        self._condition.notify_all()
+        return self._version
+
+    def wait_for_update(self, version: int, timeout: float = None) -> tuple:
+        """
+        block until the data is newer than a version, the timeout expires, or close is called
+
+        :param version: the version the caller last saw
+        :param timeout: the maximum time to wait in seconds, None waits forever
+        :return: a tuple of the current version and the data, the version is unchanged if the wait timed out
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._version > version or self._closed, timeout)
+            return self._version, self._data
+
+    def close(self) -> None:
+        """
+        wake every subscriber for shutdown, wait_for_update no longer blocks after this
+
+        :return: None
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
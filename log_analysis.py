@@ -0,0 +1,661 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# The fixes each day, the gaps, the distance travelled and the bounding box of each callsign in a position log.
+#
+# The log is memory mapped and cut into chunks on line boundaries, each chunk is parsed into columns of time, latitude
+# and longitude for each callsign, and the columns are summed up with numpy when it is installed and with plain python
+# when it is not.  With numpy the fields of every line in a chunk are cut out and converted together, a line in a
+# layout it does not know is checked in python, and if it is a fix the chunk is parsed in python.  The lines of
+# --log_format 1 have no callsign, they are counted as the callsign unknown.  A big log is parsed by a pool of processes,
+# each one maps the file and parses its own chunks, and the summaries are joined in file order, the segment between
+# the last fix of a chunk and the first of the next is added when they are joined, so the answer is the same for any
+# number of chunks.
+#
+# The summary is kept in log.analysis.json next to the log, with the offset of the end of the last whole line parsed
+# and a hash of the start of the file.  The next run only parses the lines added after the offset, if the file is
+# shorter or its start changed, it was rotated, and it is parsed again from the start.
+#
+# run it with python log_analysis.py --position_log_file /tmp/rfm_radio.log
+
+import argparse
+import calendar
+import concurrent.futures
+import hashlib
+import json
+import mmap
+import os
+import time
+from typing import Final
+
+import track_analytics
+import track_export
+
+# numpy is optional, without it the lines are parsed and the columns summed up in python
+try:
+    import numpy
+except ModuleNotFoundError:
+    numpy = None
+
+CACHE_SUFFIX: Final[str] = '.analysis.json'
+CACHE_VERSION: Final[int] = 2
+# the bytes of the start of the log that are hashed to see if it was rotated
+HEAD_BYTES: Final[int] = 4096
+DEFAULT_CHUNK_SIZE: Final[int] = 8 << 20
+DEFAULT_GAP: Final[float] = 300.0
+# the index of the items of a day, [fixes, metres, south, west, north, east]
+_FIXES, _DISTANCE, _SOUTH, _WEST, _NORTH, _EAST = range(6)
+# the callsign of the lines of an old position log that have none
+LOG_CALLSIGN: Final[bytes] = track_export.UNKNOWN_CALLSIGN.encode()
+NEWLINE, SPACE, COLON, DOT, ZERO, MINUS, PLUS = b'\n :.0-+'
+# the longest field numpy parses, a line with a longer one is parsed in python
+FIELD_WIDTH: Final[int] = 16
+if numpy is not None:
+    DIGITS = numpy.zeros(256, dtype=bool)
+    DIGITS[list(b'0123456789')] = True
+    # the bytes of a decimal field, the 0 that pads a field is allowed
+    DECIMAL = DIGITS.copy()
+    DECIMAL[list(b'.\0')] = True
+    POWERS_OF_TEN = 10.0 ** numpy.arange(16)
+    VISIBLE = numpy.zeros(256, dtype=bool)
+    VISIBLE[0x21:0x7f] = True
+else:
+    DIGITS = DECIMAL = POWERS_OF_TEN = VISIBLE = None
+
+
+class CallsignSummary:
+    """
+    The fixes, distance, bounding box and gaps of one callsign, by day
+    """
+
+    def __init__(self):
+        """
+        The init class for the summary
+        """
+        # day as YYYY-MM-DD -> [fixes, metres, south, west, north, east]
+        self.days = {}
+        # [start, end] of each gap longer than the gap time
+        self.gaps = []
+        # [time, latitude, longitude] of the first and last fix
+        self.first = None
+        self.last = None
+
+    def add_day(self, day: str, fixes: int, distance: float, bounds: tuple) -> None:
+        """
+        :param day: the day as YYYY-MM-DD
+        :param fixes: the fixes to add
+        :param distance: the metres to add
+        :param bounds: the south, west, north and east of the fixes added
+        :return: None
+        """
+        entry = self.days.get(day)
+        if entry is None:
+            self.days[day] = [fixes, distance, *bounds]
+            return
+        entry[_FIXES] += fixes
+        entry[_DISTANCE] += distance
+        entry[_SOUTH] = min(entry[_SOUTH], bounds[0])
+        entry[_WEST] = min(entry[_WEST], bounds[1])
+        entry[_NORTH] = max(entry[_NORTH], bounds[2])
+        entry[_EAST] = max(entry[_EAST], bounds[3])
+
+    def extend(self, later, gap: float) -> None:
+        """
+        add the summary of the fixes that come after these, with the segment between the two
+
+        :param later: the CallsignSummary of the later fixes
+        :param gap: a time between fixes longer than this is a gap
+        :return: None
+        """
+        if self.last is not None and later.first is not None:
+            step = track_analytics.haversine(self.last[1], self.last[2], later.first[1], later.first[2])
+            # the segment is counted on the day of the later fix
+            day = day_of(later.first[0])
+            self.add_day(day, 0, step, (later.first[1], later.first[2], later.first[1], later.first[2]))
+            if later.first[0] - self.last[0] > gap:
+                self.gaps.append([self.last[0], later.first[0]])
+        for day, entry in later.days.items():
+            self.add_day(day, entry[_FIXES], entry[_DISTANCE], tuple(entry[_SOUTH:]))
+        self.gaps.extend(later.gaps)
+        if self.first is None:
+            self.first = later.first
+        if later.last is not None:
+            self.last = later.last
+
+    @property
+    def fixes(self) -> int:
+        """
+        :return: the fixes of every day
+        """
+        return sum(entry[_FIXES] for entry in self.days.values())
+
+    @property
+    def distance(self) -> float:
+        """
+        :return: the metres of every day
+        """
+        return sum(entry[_DISTANCE] for entry in self.days.values())
+
+    @property
+    def bounds(self) -> tuple:
+        """
+        :return: the south, west, north and east of every day, or None if there are no fixes
+        """
+        if not self.days:
+            return None
+        entries = self.days.values()
+        return (min(entry[_SOUTH] for entry in entries), min(entry[_WEST] for entry in entries),
+                max(entry[_NORTH] for entry in entries), max(entry[_EAST] for entry in entries))
+
+    def as_dict(self) -> dict:
+        """
+        :return: the summary for json
+        """
+        return {'days': self.days, 'gaps': self.gaps, 'first': self.first, 'last': self.last}
+
+    @classmethod
+    def from_dict(cls, values: dict):
+        """
+        :param values: a dictionary made by as_dict
+        :return: the CallsignSummary
+        """
+        summary = cls()
+        summary.days = values['days']
+        summary.gaps = values['gaps']
+        summary.first = values['first']
+        summary.last = values['last']
+        return summary
+
+
+class LogSummary:
+    """
+    The summary of each callsign in a part of a log, and the lines read and skipped
+    """
+
+    def __init__(self, gap: float = DEFAULT_GAP):
+        """
+        The init class for the summary
+
+        :param gap: a time between fixes longer than this is a gap
+        """
+        self.gap = gap
+        self.callsigns = {}
+        self.lines = 0
+        self.skipped = 0
+
+    def extend(self, later) -> None:
+        """
+        add the summary of a later part of the log
+
+        :param later: the LogSummary of the lines after these
+        :return: None
+        """
+        for callsign, summary in later.callsigns.items():
+            self.callsigns.setdefault(callsign, CallsignSummary()).extend(summary, self.gap)
+        self.lines += later.lines
+        self.skipped += later.skipped
+
+    def as_dict(self) -> dict:
+        """
+        :return: the summary for json
+        """
+        return {'gap': self.gap, 'lines': self.lines, 'skipped': self.skipped,
+                'callsigns': {callsign: summary.as_dict() for callsign, summary in self.callsigns.items()}}
+
+    @classmethod
+    def from_dict(cls, values: dict):
+        """
+        :param values: a dictionary made by as_dict
+        :return: the LogSummary
+        """
+        summary = cls(values['gap'])
+        summary.lines = values['lines']
+        summary.skipped = values['skipped']
+        summary.callsigns = {callsign: CallsignSummary.from_dict(value) for callsign, value in values['callsigns'].items()}
+        return summary
+
+
+def day_of(timestamp: float) -> str:
+    """
+    :param timestamp: the seconds since the epoch
+    :return: the utc day as YYYY-MM-DD
+    """
+    return time.strftime('%Y-%m-%d', time.gmtime(timestamp))
+
+
+def parse_line(line: bytes, dates: dict, days: list) -> tuple:
+    """
+    parse one position log line, time date longitude latitude and the callsign, log format 1 has no callsign
+
+    :param line: the bytes of the line
+    :param dates: DD:MM:YY -> (the seconds at the start of the day, the day number), added to
+    :param days: the days as YYYY-MM-DD that the day numbers index, added to
+    :return: a tuple of the callsign, time, latitude, longitude and day number, ValueError if it is not a fix
+    """
+    parts = line.split(None, 4)
+    if len(parts) == 4:
+        parts.append(LOG_CALLSIGN)
+    time_text, date_text, longitude, latitude, callsign = parts
+    date = dates.get(date_text)
+    if date is None:
+        day_of_month, month, year = date_text.split(b':')
+        start = calendar.timegm((2000 + int(year), int(month), int(day_of_month), 0, 0, 0))
+        date = dates[date_text] = (start, len(days))
+        days.append(day_of(start))
+    hours, minutes, seconds = time_text.split(b':')
+    timestamp = date[0] + int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    return callsign, timestamp, float(latitude), float(longitude), date[1]
+
+
+def parse_lines_python(buffer) -> tuple:
+    """
+    parse position log lines into columns one line at a time
+
+    :param buffer: the bytes of whole lines
+    :return: the same tuple as parse_lines
+    """
+    columns = {}
+    dates = {}
+    days = []
+    lines = 0
+    skipped = 0
+    for line in bytes(buffer).split(b'\n'):
+        if not line:
+            continue
+        lines += 1
+        try:
+            callsign, timestamp, latitude, longitude, day_number = parse_line(line, dates, days)
+        except ValueError:
+            # a fix without a time, or a line cut short when the power went
+            skipped += 1
+            continue
+        column = columns.get(callsign)
+        if column is None:
+            column = columns[callsign] = ([], [], [], [])
+        column[0].append(timestamp)
+        column[1].append(latitude)
+        column[2].append(longitude)
+        column[3].append(day_number)
+    return {callsign.decode('utf-8', 'replace').rstrip(): column for callsign, column in columns.items()}, days, lines, skipped
+
+
+def field_bytes(windows, starts, ends, width: int) -> tuple:
+    """
+    :param windows: the sliding windows of FIELD_WIDTH bytes over the chunk
+    :param starts: the offset of the field in each line
+    :param ends: the offset after the field in each line
+    :param width: the longest field kept
+    :return: a tuple of the bytes of each field padded with 0 to width, as a line x width array, and the field lengths
+    """
+    lengths = ends - starts
+    chars = windows[numpy.minimum(starts, windows.shape[0] - 1), :width]
+    chars[numpy.arange(width) >= lengths[:, None]] = 0
+    return chars, lengths
+
+
+def decimal_values(chars, lengths, signed: bool) -> tuple:
+    """
+    convert decimal fields without an exponent, the digits are summed into an integer and divided by a power of ten,
+    which gives the same float as float() when there are no more than 15 digits
+
+    :param chars: the bytes of each field padded with 0, as a line x width array
+    :param lengths: the length of each field
+    :param signed: True allows a sign before the digits
+    :return: a tuple of the values and True for each field that is such a decimal
+    """
+    chars = chars[:, :max(0, min(int(lengths.max(initial=0)), chars.shape[1]))]
+    dots = chars == DOT
+    has_dot = dots.any(axis=1)
+    allowed = DECIMAL[chars]
+    signs = numpy.zeros(chars.shape[0], dtype=bool)
+    if signed and chars.shape[1]:
+        signs = (chars[:, 0] == MINUS) | (chars[:, 0] == PLUS)
+        allowed[:, 0] |= signs
+    # only digits follow the dot, so the places are the bytes after it
+    digits = lengths - has_dot - signs
+    places = numpy.where(has_dot, lengths - 1 - dots.argmax(axis=1), 0)
+    valid = allowed.all(axis=1) & (dots.sum(axis=1) <= 1) & (digits > 0) & (digits <= 15)
+    mantissas = numpy.zeros(chars.shape[0], dtype=numpy.int64)
+    for column in numpy.ascontiguousarray(chars.T):
+        # the bytes wrap below the 0, so only the digits are less than 10
+        value = column - ZERO
+        mantissas = numpy.where(value < 10, mantissas * 10 + value, mantissas)
+    values = mantissas / POWERS_OF_TEN[numpy.clip(places, 0, 15)]
+    return numpy.where(signs & (chars[:, 0] == MINUS), -values, values), valid
+
+
+def parse_lines_numpy(buffer) -> tuple:  # pylint: disable=R0914,R0915
+    """
+    parse position log lines into columns with numpy, the fields are cut out of the whole chunk at once and the
+    numbers converted a column at a time
+
+    :param buffer: the bytes of whole lines, a memoryview of the mapped log is read without making bytes of it
+    :return: the same tuple as parse_lines, or None if a line in a layout numpy does not parse is a fix
+    """
+    data = numpy.frombuffer(buffer, dtype=numpy.uint8)
+    # the 0 bytes a power cut leaves would be taken for the padding of a field
+    if (data == 0).any():
+        return None
+    ends = numpy.flatnonzero(data == NEWLINE)
+    if not ends.size or ends[-1] != data.size - 1:
+        ends = numpy.append(ends, data.size)
+    starts = numpy.concatenate(([0], ends[:-1] + 1))
+    whole = ends > starts
+    starts = starts[whole]
+    ends = ends[whole]
+    if not starts.size:
+        return {}, [], 0, 0
+    # the first four spaces of each line, padded so a line with fewer still indexes the array
+    spaces = numpy.flatnonzero(data == SPACE)
+    first = numpy.searchsorted(spaces, starts)
+    count = numpy.searchsorted(spaces, ends) - first
+    spaces = numpy.append(spaces, numpy.full(4, data.size))
+    # the fields are copied out a row at a time, so the chunk is padded for a field at its end
+    padded = numpy.zeros(data.size + FIELD_WIDTH, dtype=numpy.uint8)
+    padded[:data.size] = data
+    windows = numpy.lib.stride_tricks.sliding_window_view(padded, FIELD_WIDTH)
+    time_end, date_end, longitude_end, latitude_end = (spaces[first + number] for number in range(4))
+    has_callsign = count >= 4
+    latitude_end = numpy.where(has_callsign, latitude_end, ends)
+    valid = count >= 3
+
+    time_chars, lengths = field_bytes(windows, starts, time_end, FIELD_WIDTH)
+    seconds, valid_seconds = decimal_values(time_chars[:, 6:], lengths - 6, False)
+    valid &= (lengths >= 8) & (lengths <= FIELD_WIDTH) & (time_chars[:, 2] == COLON) & (time_chars[:, 5] == COLON)
+    valid &= DIGITS[time_chars[:, [0, 1, 3, 4]]].all(axis=1) & valid_seconds
+    date_chars, lengths = field_bytes(windows, time_end + 1, date_end, 8)
+    valid &= (lengths == 8) & (date_chars[:, 2] == COLON) & (date_chars[:, 5] == COLON)
+    valid &= DIGITS[date_chars[:, [0, 1, 3, 4, 6, 7]]].all(axis=1)
+    longitude_chars, lengths = field_bytes(windows, date_end + 1, longitude_end, FIELD_WIDTH)
+    longitudes, valid_longitudes = decimal_values(longitude_chars, lengths, True)
+    valid &= (lengths > 0) & (lengths <= FIELD_WIDTH) & valid_longitudes
+    latitude_chars, lengths = field_bytes(windows, longitude_end + 1, latitude_end, FIELD_WIDTH)
+    latitudes, valid_latitudes = decimal_values(latitude_chars, lengths, True)
+    valid &= (lengths > 0) & (lengths <= FIELD_WIDTH) & valid_latitudes
+    callsign_chars, lengths = field_bytes(windows, latitude_end + 1, ends, FIELD_WIDTH)
+    # split() drops the spaces around the callsign, so one that starts or ends with a space is left to python
+    rows = numpy.arange(starts.size)
+    valid &= ~has_callsign | ((lengths > 0) & (lengths <= FIELD_WIDTH) & VISIBLE[callsign_chars[:, 0]]
+                              & VISIBLE[callsign_chars[rows, numpy.clip(lengths - 1, 0, FIELD_WIDTH - 1)]])
+
+    # a line that is not in the usual layout is skipped unless python can parse it, then the whole chunk is
+    skipped = 0
+    for start, end in zip(starts[~valid], ends[~valid]):
+        try:
+            parse_line(bytes(data[start:end]), {}, [])
+        except ValueError:
+            skipped += 1
+            continue
+        return None
+
+    if skipped:
+        has_callsign = has_callsign[valid]
+        seconds = seconds[valid]
+        latitudes = latitudes[valid]
+        longitudes = longitudes[valid]
+        time_chars = time_chars[valid]
+        date_chars = date_chars[valid]
+        callsign_chars = callsign_chars[valid]
+    time_chars = time_chars[:, [0, 1, 3, 4]].astype(numpy.int64) - ZERO
+    date_chars = date_chars[:, [0, 1, 3, 4, 6, 7]].astype(numpy.int64) - ZERO
+    # the dates and callsigns are numbered in the order they are first seen, as python does
+    codes = date_chars @ numpy.array([100000, 10000, 1000, 100, 10, 1])
+    unique_codes, first_seen, day_numbers = numpy.unique(codes, return_index=True, return_inverse=True)
+    order = numpy.argsort(first_seen)
+    renumber = numpy.empty_like(order)
+    renumber[order] = numpy.arange(order.size)
+    day_numbers = renumber[day_numbers.ravel()]
+    day_starts = []
+    days = []
+    for code in unique_codes[order].tolist():
+        start = calendar.timegm((2000 + code % 100, code // 100 % 100, code // 10000, 0, 0, 0))
+        day_starts.append(start)
+        days.append(day_of(start))
+    times = numpy.array(day_starts, dtype=numpy.int64)[day_numbers] + time_chars @ numpy.array([36000, 3600, 600, 60]) + seconds
+    callsign_chars[~has_callsign] = numpy.frombuffer(LOG_CALLSIGN.ljust(FIELD_WIDTH, b'\0'), dtype=numpy.uint8)
+    callsigns, first_seen, numbers = numpy.unique(callsign_chars.view(f'S{FIELD_WIDTH}').ravel(), return_index=True, return_inverse=True)
+    numbers = numbers.ravel()
+    by_callsign = numpy.argsort(numbers, kind='stable')
+    bounds = numpy.searchsorted(numbers[by_callsign], numpy.arange(callsigns.size + 1))
+    columns = {}
+    for number in numpy.argsort(first_seen).tolist():
+        picked = by_callsign[bounds[number]:bounds[number + 1]]
+        columns[callsigns[number].decode('utf-8', 'replace').rstrip()] = \
+            (times[picked], latitudes[picked], longitudes[picked], day_numbers[picked])
+    return columns, days, int(starts.size), skipped
+
+
+def parse_lines(buffer) -> tuple:
+    """
+    parse position log lines into columns, with numpy when it is installed
+
+    :param buffer: the bytes of whole lines, time date longitude latitude and the callsign, log format 1 has no callsign
+    :return: a tuple of callsign -> (times, latitudes, longitudes, day numbers), the list of days as YYYY-MM-DD that the
+             day numbers index, the lines and the lines skipped
+    """
+    if numpy is not None:
+        columns = parse_lines_numpy(buffer)
+        if columns is not None:
+            return columns
+    return parse_lines_python(buffer)
+
+
+def summarize_columns(times, latitudes, longitudes, day_numbers, days: list, gap: float) -> CallsignSummary:  # pylint: disable=R0913,R0914
+    """
+    sum up the fixes of one callsign in one chunk
+
+    :param times: the times of the fixes in file order
+    :param latitudes: the latitudes
+    :param longitudes: the longitudes
+    :param day_numbers: the index in days of the day of each fix
+    :param days: the days as YYYY-MM-DD
+    :param gap: a time between fixes longer than this is a gap
+    :return: the CallsignSummary
+    """
+    summary = CallsignSummary()
+    summary.first = [times[0], latitudes[0], longitudes[0]]
+    summary.last = [times[-1], latitudes[-1], longitudes[-1]]
+    if numpy is not None:
+        times = numpy.asarray(times)
+        latitudes = numpy.asarray(latitudes)
+        longitudes = numpy.asarray(longitudes)
+        day_numbers = numpy.asarray(day_numbers)
+        steps = track_analytics.haversine(latitudes[:-1], longitudes[:-1], latitudes[1:], longitudes[1:])
+        # a step is counted on the day of the fix it ends at
+        fixes = numpy.bincount(day_numbers, minlength=len(days))
+        distances = numpy.bincount(day_numbers[1:], weights=steps, minlength=len(days))
+        for number in numpy.flatnonzero(fixes):
+            on_day = day_numbers == number
+            day_latitudes = latitudes[on_day]
+            day_longitudes = longitudes[on_day]
+            summary.add_day(days[number], int(fixes[number]), float(distances[number]),
+                            (float(day_latitudes.min()), float(day_longitudes.min()), float(day_latitudes.max()), float(day_longitudes.max())))
+        elapsed = numpy.diff(times)
+        summary.gaps = [[float(times[index]), float(times[index + 1])] for index in numpy.flatnonzero(elapsed > gap)]
+        return summary
+    for index, (latitude, longitude, number) in enumerate(zip(latitudes, longitudes, day_numbers)):
+        step = 0.0
+        if index:
+            step = track_analytics.haversine(latitudes[index - 1], longitudes[index - 1], latitude, longitude)
+            if times[index] - times[index - 1] > gap:
+                summary.gaps.append([times[index - 1], times[index]])
+        summary.add_day(days[number], 1, step, (latitude, longitude, latitude, longitude))
+    return summary
+
+
+def parse_range(file_name: str, start: int, end: int, gap: float = DEFAULT_GAP) -> LogSummary:
+    """
+    parse a range of the log, this runs in the pool processes so it opens and maps the file itself
+
+    :param file_name: the position log
+    :param start: the offset of the first line
+    :param end: the offset after the last line
+    :param gap: a time between fixes longer than this is a gap
+    :return: the LogSummary of the range
+    """
+    summary = LogSummary(gap)
+    if end <= start:
+        return summary
+    with open(file_name, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as log:
+        columns, days, summary.lines, summary.skipped = parse_lines(memoryview(log)[start:end])
+    for callsign, (times, latitudes, longitudes, day_numbers) in columns.items():
+        summary.callsigns[callsign] = summarize_columns(times, latitudes, longitudes, day_numbers, days, gap)
+    return summary
+
+
+def split_lines(log, start: int, end: int, chunk_size: int) -> list:
+    """
+    cut a range of the log into chunks that end at the end of a line
+
+    :param log: the memory mapped log
+    :param start: the offset of the first line
+    :param end: the offset after the last whole line
+    :param chunk_size: the bytes in a chunk
+    :return: a list of (start, end) offsets
+    """
+    ranges = []
+    while start < end:
+        stop = min(start + chunk_size, end)
+        if stop < end:
+            newline = log.find(b'\n', stop - 1, end)
+            stop = end if newline < 0 else newline + 1
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def head_hash(log, length: int = HEAD_BYTES) -> str:
+    """
+    :param log: the memory mapped log
+    :param length: the bytes hashed
+    :return: the hash of the start of the log, to see if it was rotated
+    """
+    return hashlib.sha1(log[:length]).hexdigest()
+
+
+def analyze(file_name: str, gap: float = DEFAULT_GAP, workers: int = None, chunk_size: int = DEFAULT_CHUNK_SIZE,  # pylint: disable=R0913,R0914
+            use_cache: bool = True) -> tuple:
+    """
+    summarize a position log, only the lines added since the cached summary are parsed
+
+    :param file_name: the position log
+    :param gap: a time between fixes longer than this is a gap
+    :param workers: the processes in the pool, 1 parses in this process, None uses every cpu
+    :param chunk_size: the bytes in a chunk
+    :param use_cache: False parses the whole log and does not read the cache, it is still written
+    :return: a tuple of the LogSummary and a dictionary of the bytes parsed, the chunks and the seconds taken
+    """
+    started = time.perf_counter()
+    cache_name = file_name + CACHE_SUFFIX
+    summary = LogSummary(gap)
+    offset = 0
+    if use_cache:
+        try:
+            with open(cache_name, encoding='utf-8') as file:
+                cache = json.load(file)
+        except (OSError, ValueError):
+            cache = None
+    else:
+        cache = None
+    with open(file_name, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if not size:
+            return summary, {'bytes': 0, 'chunks': 0, 'seconds': time.perf_counter() - started}
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as log:
+            # the same bytes are hashed as last time, so a short log that grew is not taken for a new one
+            if cache is not None and cache.get('version') == CACHE_VERSION and cache.get('gap') == gap \
+                    and cache.get('offset', 0) <= size and cache.get('head') == head_hash(log, cache.get('head_bytes', 0)):
+                summary = LogSummary.from_dict(cache['summary'])
+                offset = cache['offset']
+            head_bytes = min(size, HEAD_BYTES)
+            head = head_hash(log, head_bytes)
+            # a line still being written is left for the next run
+            end = log.rfind(b'\n', offset) + 1
+            ranges = split_lines(log, offset, max(end, offset), chunk_size)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers > 1 and len(ranges) > 1:
+        with concurrent.futures.ProcessPoolExecutor(min(workers, len(ranges))) as pool:
+            parts = list(pool.map(parse_range, *zip(*((file_name, first, stop, gap) for first, stop in ranges))))
+    else:
+        parts = [parse_range(file_name, first, stop, gap) for first, stop in ranges]
+    for part in parts:
+        summary.extend(part)
+    if ranges:
+        offset = ranges[-1][1]
+    temporary_name = f'{cache_name}.tmp'
+    with open(temporary_name, 'w', encoding='utf-8') as file:
+        json.dump({'version': CACHE_VERSION, 'head': head, 'head_bytes': head_bytes, 'gap': gap, 'offset': offset,
+                   'summary': summary.as_dict()}, file)
+    os.replace(temporary_name, cache_name)
+    return summary, {'bytes': sum(stop - first for first, stop in ranges), 'chunks': len(ranges), 'seconds': time.perf_counter() - started}
+
+
+def report(summary: LogSummary, top_gaps: int = 5) -> dict:
+    """
+    :param summary: the LogSummary
+    :param top_gaps: the longest gaps listed for each callsign
+    :return: a dictionary for each callsign of its totals, each day and its longest gaps, with the times in utc
+    """
+    result = {}
+    for callsign, callsign_summary in sorted(summary.callsigns.items()):
+        gaps = sorted(callsign_summary.gaps, key=lambda gap: gap[0] - gap[1])[:top_gaps]
+        result[callsign] = {
+            'fixes': callsign_summary.fixes,
+            'distance_km': round(callsign_summary.distance / 1000, 3),
+            'bounds': callsign_summary.bounds,
+            'gaps': len(callsign_summary.gaps),
+            'longest_gaps': [{'start': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(start)), 'seconds': round(end - start, 3)}
+                             for start, end in gaps],
+            'days': {day: {'fixes': entry[_FIXES], 'distance_km': round(entry[_DISTANCE] / 1000, 3), 'bounds': entry[_SOUTH:]}
+                     for day, entry in sorted(callsign_summary.days.items())}}
+    return result
+
+
+def print_report(summary: LogSummary, top_gaps: int = 5) -> None:
+    """
+    print the report as a table
+
+    :param summary: the LogSummary
+    :param top_gaps: the longest gaps listed for each callsign
+    :return: None
+    """
+    print(f'{summary.lines} lines, {summary.skipped} skipped, a gap is more than {summary.gap:g} seconds')
+    for callsign, values in report(summary, top_gaps).items():
+        print(f'\n{callsign}  fixes={values["fixes"]}  distance={values["distance_km"]:.3f}km  gaps={values["gaps"]}  '
+              f'bounds={",".join(f"{value:.7f}" for value in values["bounds"])}')
+        print(f'    {"day":10s} {"fixes":>8s} {"km":>10s}  south,west,north,east')
+        for day, entry in values['days'].items():
+            print(f'    {day:10s} {entry["fixes"]:8d} {entry["distance_km"]:10.3f}  {",".join(f"{value:.7f}" for value in entry["bounds"])}')
+        for gap in values['longest_gaps']:
+            print(f'    gap at {gap["start"]} of {gap["seconds"]:g} seconds')
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--position_log_file', type=str, default='/tmp/rfm_radio.log', help='the position log default = %(default)s')
+    parser.add_argument('--gap', type=float, default=DEFAULT_GAP, help='seconds without a fix that are a gap default = %(default)s')
+    parser.add_argument('--workers', type=int, default=None, help='the processes that parse the log default = the number of cpus')
+    parser.add_argument('--chunk_size', type=int, default=DEFAULT_CHUNK_SIZE, help='the bytes parsed at a time default = %(default)s')
+    parser.add_argument('--top_gaps', type=int, default=5, help='the longest gaps shown for each callsign default = %(default)s')
+    parser.add_argument('--no_cache', action='store_true', default=False, help='parse the whole log again default = %(default)s')
+    parser.add_argument('--json', action='store_true', default=False, help='print the report as json default = %(default)s')
+    arguments = parser.parse_args()
+    log_summary, cost = analyze(arguments.position_log_file, arguments.gap, arguments.workers, arguments.chunk_size, not arguments.no_cache)
+    if arguments.json:
+        print(json.dumps({'parsed': cost, 'lines': log_summary.lines, 'skipped': log_summary.skipped,
+                          'callsigns': report(log_summary, arguments.top_gaps)}, indent=2))
+    else:
+        print_report(log_summary, arguments.top_gaps)
+        print(f'\nparsed {cost["bytes"]} bytes in {cost["chunks"]} chunks in {cost["seconds"]:.3f} seconds')
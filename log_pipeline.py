@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# The pieces of the program log that keep the cost of a log call on the radio, display and logging threads small and fixed.
+#
+# The threads log with a format string and arguments, logger.info('fix=%s', fix), never an f-string, so nothing is
+# formatted when the level is off.  BoundedQueueHandler puts the record on a queue of a fixed size without formatting it,
+# the message is only made by the listener thread, and when the queue is full the record is dropped and counted instead
+# of the queue growing while the sd card is slow.  RateLimitFilter lets each format string through burst times in
+# each interval, after that only every sample'th one, and the next record that gets through says how many were skipped.
+# JsonLinesHandler writes one json object for each record with the format string and the arguments kept apart, so a
+# program can read the log without parsing the text.
+#
+# run it with python log_pipeline.py to compare the cost of a log call on a busy thread
+
+import argparse
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from typing import Final
+
+DEFAULT_QUEUE_SIZE: Final[int] = 1024
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """
+    A queue handler with a queue of a fixed size that drops records when it is full, the records are not formatted here
+    """
+
+    def __init__(self, size: int = DEFAULT_QUEUE_SIZE):
+        """
+        The init class for the handler
+
+        :param size: the most records waiting for the listener
+        """
+        super().__init__(queue.Queue(size))
+        self.dropped = 0
+        self.queued = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        the listener is a thread in this process, so the record is passed as it is and formatted by the listener
+
+        :param record: the log record
+        :return: the record
+        """
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        """
+        :param record: the log record
+        :return: None
+        """
+        try:
+            self.queue.put_nowait(record)
+            self.queued += 1
+        except queue.Full:
+            self.dropped += 1
+
+    def statistics(self) -> dict:
+        """
+        :return: a dictionary of the records queued, dropped and waiting
+        """
+        return {'queued': self.queued, 'dropped': self.dropped, 'waiting': self.queue.qsize()}
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Limit the records for each format string, the arguments are not looked at so every fix= record has the same key
+    """
+
+    def __init__(self, burst: int = 20, interval: float = 1.0, sample: int = 0, min_level: int = logging.WARNING):
+        """
+        The init class for the filter
+
+        :param burst: the records of one format string let through in each interval
+        :param interval: the seconds of an interval
+        :param sample: after the burst let every sample'th record through, 0 lets none through
+        :param min_level: records at this level and above are never limited
+        """
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.sample = sample
+        self.min_level = min_level
+        self.__lock = threading.Lock()
+        # key -> [interval start, records in the interval, records suppressed since the last one let through]
+        self.__keys = {}
+        self.suppressed = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        """
+        :param record: the log record
+        :return: True to log the record
+        """
+        if record.levelno >= self.min_level:
+            return True
+        key = (record.levelno, record.msg)
+        now = record.created
+        with self.__lock:
+            state = self.__keys.get(key)
+            if state is None:
+                state = self.__keys[key] = [now, 0, 0]
+            elif now - state[0] >= self.interval:
+                state[0] = now
+                state[1] = 0
+            state[1] += 1
+            over = state[1] - self.burst
+            if over > 0 and (not self.sample or over % self.sample):
+                state[2] += 1
+                self.suppressed += 1
+                return False
+            skipped = state[2]
+            state[2] = 0
+        if skipped and isinstance(record.args, tuple) and isinstance(record.msg, str):
+            # without arguments the message is not a format string, so a % in it must be escaped
+            message = record.msg if record.args else record.msg.replace('%', '%%')
+            record.msg = f'{message} (%d like this suppressed)'
+            record.args = record.args + (skipped,)
+        return True
+
+
+class JsonLinesHandler(logging.Handler):
+    """
+    Write each record as a line of json with the time, level, thread, format string and arguments
+    """
+
+    def __init__(self, file_name: str, mode: str = 'a'):
+        """
+        The init class for the handler
+
+        :param file_name: the file name
+        :param mode: the file mode
+        """
+        super().__init__()
+        self.file = open(file_name, mode, encoding='utf-8')  # pylint: disable=R1732
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """
+        :param record: the log record
+        :return: None
+        """
+        try:
+            entry = {'time': record.created, 'level': record.levelname, 'logger': record.name, 'thread': record.threadName,
+                     'msg': record.msg if isinstance(record.msg, str) else str(record.msg)}
+            if record.args:
+                entry['args'] = record.args
+            if record.exc_info:
+                entry['exception'] = logging.Formatter().formatException(record.exc_info)
+            self.file.write(json.dumps(entry, default=str, separators=(',', ':')) + '\n')
+            # this runs on the listener thread, like the stream handler the line is flushed so the file is current
+            self.file.flush()
+        except Exception:  # pylint: disable=W0703
+            self.handleError(record)
+
+    def flush(self) -> None:
+        """
+        :return: None
+        """
+        with self.lock:
+            self.file.flush()
+
+    def close(self) -> None:
+        """
+        :return: None
+        """
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
+        super().close()
+
+
+def find_handler(logger: logging.Logger):
+    """
+    :param logger: the logger set up by setup_logging
+    :return: the BoundedQueueHandler of the logger, or None
+    """
+    return next((handler for handler in logger.handlers if isinstance(handler, BoundedQueueHandler)), None)
+
+
+def measure_log_cost(count: int = 20000, queue_size: int = DEFAULT_QUEUE_SIZE, burst: int = 20) -> dict:
+    """
+    log a fix count times from a busy thread, eagerly with an f-string to an unbounded queue, then lazily to a bounded queue
+    with and without the rate limit, the listener writes to a null handler
+
+    :param count: the number of log calls
+    :param queue_size: the size of the bounded queue
+    :param burst: the records let through each second by the rate limit
+    :return: a dictionary of microseconds for each log call and the records dropped or suppressed
+    """
+    import benchmarks  # pylint: disable=C0415
+    import packet_decoder  # pylint: disable=C0415
+    decoder = packet_decoder.PacketDecoder()
+    fixes = [decoder.decode(packet) for packet in benchmarks.moving_packets(count)]
+    results = {}
+    for name in ('eager', 'lazy', 'rate_limited'):
+        logger = logging.getLogger(f'measure {name}')
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        if name == 'eager':
+            handler = logging.handlers.QueueHandler(queue.Queue(-1))
+        else:
+            handler = BoundedQueueHandler(queue_size)
+        if name == 'rate_limited':
+            handler.addFilter(RateLimitFilter(burst))
+        logger.addHandler(handler)
+        listener = logging.handlers.QueueListener(handler.queue, logging.NullHandler())
+        listener.start()
+        start = time.perf_counter()
+        if name == 'eager':
+            for fix in fixes:
+                logger.info(f'thread_name = radio {fix.log_line}')
+        else:
+            for fix in fixes:
+                logger.info('thread_name = %s %s', 'radio', fix)
+        elapsed = time.perf_counter() - start
+        listener.stop()
+        logger.removeHandler(handler)
+        results[name] = {'microseconds': 1e6 * elapsed / count,
+                         'dropped': getattr(handler, 'dropped', 0),
+                         'suppressed': sum(getattr(log_filter, 'suppressed', 0) for log_filter in handler.filters)}
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=20000, help='the number of log calls default = %(default)s')
+    parser.add_argument('--queue_size', type=int, default=DEFAULT_QUEUE_SIZE, help='the bounded queue size default = %(default)s')
+    parser.add_argument('--burst', type=int, default=20, help='the records of one kind each second default = %(default)s')
+    arguments = parser.parse_args()
+    for kind, result in measure_log_cost(arguments.count, arguments.queue_size, arguments.burst).items():
+        print(kind, result)
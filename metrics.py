@@ -0,0 +1,375 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Counters, gauges and fixed bucket latency histograms for the threads, written out in the prometheus text format.
+# Each instrument is updated by one thread, so a plain integer add is enough and there is no lock on the hot path,
+# the exporter only reads them.  A gauge or counter can also be a function that is called when the metrics are written,
+# for values another class already counts, like the stream server queue depth.
+#
+# When metrics are off the threads are given NULL_REGISTRY, every instrument it makes is the same object with empty
+# methods, and the threads only read the clock for a latency when registry.enabled is True.
+#
+# The exporter writes the text to a file, for the node_exporter textfile collector, and or serves it on a local
+# http port, curl http://127.0.0.1:9101/metrics
+
+import bisect
+import http.server
+import os
+import threading
+from typing import Final
+
+# seconds, from 100 microseconds to 10 seconds
+LATENCY_BUCKETS: Final[tuple] = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+COUNTER: Final[str] = 'counter'
+GAUGE: Final[str] = 'gauge'
+HISTOGRAM: Final[str] = 'histogram'
+
+
+def format_labels(labels: dict, extra: str = None) -> str:
+    """
+    :param labels: the label names and values
+    :param extra: a label already formatted as name="value" added at the end, may be None
+    :return: the labels in braces, or an empty string if there are none
+    """
+    parts = [f'{name}="{value}"' for name, value in sorted(labels.items())]
+    if extra is not None:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class Counter:
+    """
+    A count that only goes up
+    """
+    __slots__ = ['labels', 'value', 'function']
+
+    def __init__(self, labels: dict, function=None):
+        """
+        The init class for the counter
+
+        :param labels: the labels of this counter
+        :param function: if not None it is called for the value instead of counting with inc
+        """
+        self.labels = labels
+        self.value = 0
+        self.function = function
+
+    def inc(self, amount: int = 1) -> None:
+        """
+        :param amount: the amount to add
+        :return: None
+        """
+        self.value += amount
+
+    def samples(self, name: str) -> list:
+        """
+        :param name: the metric name
+        :return: the text lines of the samples
+        """
+        return [f'{name}{format_labels(self.labels)} {self.value if self.function is None else self.function()}']
+
+
+class Gauge(Counter):
+    """
+    A value that goes up and down
+    """
+    __slots__ = []
+
+    def set(self, value) -> None:
+        """
+        :param value: the new value
+        :return: None
+        """
+        self.value = value
+
+
+class Histogram:
+    """
+    A latency histogram with fixed buckets
+    """
+    __slots__ = ['labels', 'bounds', 'counts', 'sum', 'count']
+
+    def __init__(self, labels: dict, bounds: tuple = LATENCY_BUCKETS):
+        """
+        The init class for the histogram
+
+        :param labels: the labels of this histogram
+        :param bounds: the upper bounds of the buckets, in increasing order
+        """
+        self.labels = labels
+        self.bounds = bounds
+        # the last count is the values above the last bound
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """
+        :param value: the value, normally seconds
+        :return: None
+        """
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self, name: str) -> list:
+        """
+        :param name: the metric name
+        :return: the text lines of the samples, the buckets are cumulative
+        """
+        lines = []
+        total = 0
+        labels = format_labels(self.labels)
+        for bound, count in zip(self.bounds + ('+Inf',), self.counts):
+            total += count
+            bucket_labels = format_labels(self.labels, 'le="' + str(bound) + '"')
+            lines.append(f'{name}_bucket{bucket_labels} {total}')
+        lines.append(f'{name}_sum{labels} {self.sum}')
+        lines.append(f'{name}_count{labels} {self.count}')
+        return lines
+
+
+class NullInstrument:
+    """
+    The instrument used when metrics are off, it does nothing
+    """
+    __slots__ = []
+
+    def inc(self, amount: int = 1) -> None:
+        """
+        :param amount: not used
+        :return: None
+        """
+
+    def set(self, value) -> None:
+        """
+        :param value: not used
+        :return: None
+        """
+
+    def observe(self, value: float) -> None:
+        """
+        :param value: not used
+        :return: None
+        """
+
+
+NULL_INSTRUMENT: Final[NullInstrument] = NullInstrument()
+
+
+class MetricsRegistry:
+    """
+    The instruments of every thread by name, the same name with other labels is another instrument of the same metric
+    """
+    enabled = True
+
+    def __init__(self):
+        """
+        The init class for the registry
+        """
+        self.__lock = threading.Lock()
+        # name -> (type, help, list of instruments)
+        self.__metrics = {}
+
+    def __add(self, name: str, kind: str, help_text: str, instrument):
+        """
+        :param name: the metric name
+        :param kind: COUNTER, GAUGE or HISTOGRAM
+        :param help_text: the help line
+        :param instrument: the instrument
+        :return: the instrument
+        """
+        with self.__lock:
+            metric = self.__metrics.setdefault(name, (kind, help_text, []))
+            if metric[0] != kind:
+                raise ValueError(f'{name} is a {metric[0]} not a {kind}')
+            metric[2].append(instrument)
+        return instrument
+
+    def counter(self, name: str, help_text: str, function=None, **labels) -> Counter:
+        """
+        :param name: the metric name, it should end in _total
+        :param help_text: the help line
+        :param function: if not None it is called for the value when the metrics are written
+        :param labels: the labels, for example thread='radio'
+        :return: the counter
+        """
+        return self.__add(name, COUNTER, help_text, Counter(labels, function))
+
+    def gauge(self, name: str, help_text: str, function=None, **labels) -> Gauge:
+        """
+        :param name: the metric name
+        :param help_text: the help line
+        :param function: if not None it is called for the value when the metrics are written
+        :param labels: the labels
+        :return: the gauge
+        """
+        return self.__add(name, GAUGE, help_text, Gauge(labels, function))
+
+    def histogram(self, name: str, help_text: str, bounds: tuple = LATENCY_BUCKETS, **labels) -> Histogram:
+        """
+        :param name: the metric name, it should end in _seconds for a latency
+        :param help_text: the help line
+        :param bounds: the upper bounds of the buckets
+        :param labels: the labels
+        :return: the histogram
+        """
+        return self.__add(name, HISTOGRAM, help_text, Histogram(labels, bounds))
+
+    def render(self) -> str:
+        """
+        :return: every metric in the prometheus text exposition format
+        """
+        with self.__lock:
+            metrics = [(name, kind, help_text, list(instruments)) for name, (kind, help_text, instruments) in sorted(self.__metrics.items())]
+        lines = []
+        for name, kind, help_text, instruments in metrics:
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for instrument in instruments:
+                lines.extend(instrument.samples(name))
+        return '\n'.join(lines) + '\n'
+
+
+class NullRegistry:
+    """
+    The registry used when metrics are off, every instrument is NULL_INSTRUMENT
+    """
+    enabled = False
+
+    def counter(self, name: str, help_text: str, function=None, **labels) -> NullInstrument:  # pylint: disable=W0613
+        """
+        :return: NULL_INSTRUMENT
+        """
+        return NULL_INSTRUMENT
+
+    def gauge(self, name: str, help_text: str, function=None, **labels) -> NullInstrument:  # pylint: disable=W0613
+        """
+        :return: NULL_INSTRUMENT
+        """
+        return NULL_INSTRUMENT
+
+    def histogram(self, name: str, help_text: str, bounds: tuple = LATENCY_BUCKETS, **labels) -> NullInstrument:  # pylint: disable=W0613
+        """
+        :return: NULL_INSTRUMENT
+        """
+        return NULL_INSTRUMENT
+
+    def render(self) -> str:
+        """
+        :return: an empty string
+        """
+        return ''
+
+
+NULL_REGISTRY: Final[NullRegistry] = NullRegistry()
+
+
+def registry_from(settings: dict):
+    """
+    :param settings: the kwargs of a thread, the registry is under Metrics
+    :return: the MetricsRegistry, or NULL_REGISTRY if metrics are off
+    """
+    return settings.get('Metrics') or NULL_REGISTRY
+
+
+def write_file(registry: MetricsRegistry, file_name: str) -> None:
+    """
+    write the metrics to a file, the file is replaced so a reader never sees half of it
+
+    :param registry: the registry
+    :param file_name: the file name
+    :return: None
+    """
+    temporary_name = f'{file_name}.tmp'
+    with open(temporary_name, 'w', encoding='utf-8') as file:
+        file.write(registry.render())
+    os.replace(temporary_name, file_name)
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Answer every GET with the metrics
+    """
+    registry = NULL_REGISTRY
+
+    def do_GET(self):  # pylint: disable=C0103
+        """
+        send the metrics
+        """
+        body = self.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=W0622
+        """
+        the requests are not logged
+        """
+
+
+class MetricsExporter(threading.Thread):
+    """
+    this is a thread class that writes the metrics to a file every interval and serves them on a local port
+    """
+    __slots__ = ['args', 'kwargs', 'registry', 'event', 'file_name', 'port', 'interval']
+
+    def __init__(self, name: str, *args: list, **kwargs: dict):
+        """
+        this is the init class for the thread
+
+        :param name: The name of the thread
+        :param args: The args, (registry, event, log.log)
+        :param kwargs: a dictionary with the file, the port and the interval, example
+                        {'MetricsFile': '/var/lib/node_exporter/rfm69.prom', 'MetricsPort': 9101, 'MetricsInterval': 15.0}
+                        there is no file if MetricsFile is None and no http server if MetricsPort is None
+        """
+        super().__init__(name=name, args=args, kwargs=kwargs)
+        self.args = args
+        self.kwargs = kwargs
+        self.registry, self.event, self.logger = self.args  # pylint: disable=W0632
+        self.file_name = self.kwargs.get('MetricsFile')
+        self.port = self.kwargs.get('MetricsPort')
+        self.interval = self.kwargs.get('MetricsInterval', 15.0)
+
+    def run(self) -> None:
+        """
+        This overrides run on the threading class
+
+        :return: None
+        """
+        server = None
+        if self.port is not None:
+            handler = type('RegistryHandler', (MetricsHandler,), {'registry': self.registry})
+            try:
+                server = http.server.ThreadingHTTPServer(('127.0.0.1', self.port), handler)
+            except OSError as error:
+                self.logger.info('metrics port %s not served, error=%s', self.port, error)
+            else:
+                threading.Thread(target=server.serve_forever, name=f'{self.name} http', daemon=True).start()
+        try:
+            while True:
+                if self.file_name is not None:
+                    write_file(self.registry, self.file_name)
+                if self.event.wait(self.interval):
+                    return
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+            if self.file_name is not None:
+                write_file(self.registry, self.file_name)
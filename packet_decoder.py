@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Decode the packets sent by the gps transmitter.
+# The packet is a 4 byte header followed by comma separated fields
+#                   utc time   val  latitude   n/s    longitude    e/w  date
+#       b'KF4WBK,171207.000,A,3557.3377,N,07901.1607,W,120923'
+# or, when the transmitter has no fix
+#       b'KF4WBK,V'
+# The fields are matched with one compiled regular expression straight from the packet buffer, starting after the header,
+# so the payload is never sliced, decoded to a str or split into a list of strings.
+# A packet that does not have this form is rejected and the reason is counted, it does not raise an exception.
+
+import calendar
+import collections
+import functools
+import re
+import time
+from typing import Final
+
+import position_fix
+import radio_constants
+
+HEADER_LENGTH: Final[int] = 4
+FIELD_COUNT: Final[int] = 8
+
+REJECT_TOO_SHORT: Final[str] = 'too_short'
+REJECT_FIELD_COUNT: Final[str] = 'field_count'
+REJECT_BAD_VALID_FLAG: Final[str] = 'bad_valid_flag'
+REJECT_BAD_HEMISPHERE: Final[str] = 'bad_hemisphere'
+REJECT_BAD_NUMBER: Final[str] = 'bad_number'
+REJECT_BAD_TEXT: Final[str] = 'bad_text'
+
+# callsign, time HHMM and SS.sss, valid flag, latitude DD and mm.mmmm, n/s, longitude DDD and mm.mmmm, e/w, date DDMMYY.
+# The fields are split into the parts the decoder converts, so it does not slice them again.
+# The position fields are empty in some transmitters when the fix is not valid
+_FIX_PATTERN = re.compile(rb'([^,]{1,16}),(\d{4})(\d\d(?:\.\d{1,3})?),([AV]),(?:(\d\d)(\d\d\.\d+))?,([NS]?),'
+                          rb'(?:(\d{3})(\d\d\.\d+))?,([EW]?),(\d{6})\Z')
+# the short form sent when there is no fix
+_NO_FIX_PATTERN = re.compile(rb'([^,]{1,16}),V\Z')
+# one pattern per field, in radio_constants order, used to find out why a packet was rejected
+_FIELD_PATTERNS = (rb'[^,]{1,16}\Z', rb'\d{6}(?:\.\d{1,3})?\Z', rb'[AV]\Z', rb'(\d{4}\.\d+)?\Z', rb'[NS]?\Z',
+                   rb'(\d{5}\.\d+)?\Z', rb'[EW]?\Z', rb'\d{6}\Z')
+
+
+@functools.lru_cache(maxsize=64)
+def minute_epoch(date: bytes, hours_minutes: bytes) -> int:
+    """
+    the utc time at the start of the minute of a fix, a transmitter sends many fixes a minute so the result is cached
+
+    :param date: the DDMMYY date from the packet
+    :param hours_minutes: the HHMM part of the time from the packet
+    :return: the seconds since the epoch
+    :raises ValueError: if the date or time is not real
+    """
+    year, month, day = 2000 + int(date[4:6]), int(date[2:4]), int(date[0:2])
+    hours, minutes = int(hours_minutes[0:2]), int(hours_minutes[2:4])
+    if not (1 <= month <= 12 and 1 <= day <= calendar.monthrange(year, month)[1] and hours < 24 and minutes < 60):
+        raise ValueError(f'the date {date!r} or the time {hours_minutes!r} is not real')
+    return calendar.timegm((year, month, day, hours, minutes, 0))
+
+
+class PacketDecoder:
+    """
+    A decoder for the gps packets, it counts the packets decoded and the packets rejected by reason
+    """
+
+    def __init__(self, radio: int = 0):
+        """
+        The init class for the decoder
+
+        :param radio: the number of the radio the packets come from, it is put in each fix
+        """
+        self.radio = radio
+        self.decoded = 0
+        self.rejected = collections.Counter()
+        # the last position fields and their conversion for each source address.
+        # A stationary transmitter sends the same fields over and over, so most packets skip the conversion
+        self.__positions = {}
+        # the last date and HHMM fields, their minute_epoch and their HH:MM: and DD:MM:YY texts.
+        # The transmitters send many fixes a minute, so the texts are shared by the fixes of a minute
+        self.__minute = (None, None, 0, '', '')
+
+    def reject(self, reason: str) -> None:
+        """
+        count a rejected packet
+
+        :param reason: one of the REJECT_ constants
+        :return: None
+        """
+        self.rejected[reason] += 1
+
+    def __new_minute(self, fix_date: bytes, hours_minutes: bytes) -> tuple:
+        """
+        convert the date and the HHMM fields of a packet from a new minute and keep them for the next packets
+
+        :param fix_date: the DDMMYY field
+        :param hours_minutes: the HHMM part of the time field
+        :return: the fields, the minute_epoch, the HH:MM: text and the DD:MM:YY text, or None if they are not a real time
+        """
+        try:
+            epoch = minute_epoch(fix_date, hours_minutes)
+        except ValueError:
+            return None
+        time_text = hours_minutes.decode('ascii')
+        date_text = fix_date.decode('ascii')
+        self.__minute = (fix_date, hours_minutes, epoch, f'{time_text[0:2]}:{time_text[2:4]}:',
+                         f'{date_text[0:2]}:{date_text[2:4]}:{date_text[4:6]}')
+        return self.__minute
+
+    def __decode_no_fix(self, packet, received: float) -> position_fix.PositionFix:
+        """
+        decode the short form sent when there is no fix, or count why the packet was rejected
+
+        :param packet: the packet including the 4 byte header
+        :param received: the time the packet was received
+        :return: the position fix or None if the packet was rejected
+        """
+        match = _NO_FIX_PATTERN.match(packet, HEADER_LENGTH)
+        if match is None:
+            self.reject(self.classify(packet))
+            return None
+        self.decoded += 1
+        return position_fix.PositionFix(packet[1], packet[0], packet[2], match[1].decode('ascii', 'replace'), False,
+                                        received=received, radio=self.radio)
+
+    def decode(self, packet) -> position_fix.PositionFix:
+        """
+        decode a packet
+
+        :param packet: the packet including the 4 byte header, bytes, bytearray or memoryview
+        :return: the position fix or None if the packet was rejected
+        """
+        if len(packet) < HEADER_LENGTH + 2:
+            self.reject(REJECT_TOO_SHORT)
+            return None
+        received = time.time()
+        match = _FIX_PATTERN.match(packet, HEADER_LENGTH)
+        if match is None:
+            return self.__decode_no_fix(packet, received)
+
+        (callsign, hours_minutes, seconds, valid_flag, latitude_degrees, latitude_minutes, north_south,
+         longitude_degrees, longitude_minutes, east_west, fix_date) = match.groups()
+        # the time and date are only digits, the pattern checked that
+        minute = self.__minute
+        if minute[0] != fix_date or minute[1] != hours_minutes:
+            minute = self.__new_minute(fix_date, hours_minutes)
+            if minute is None:
+                self.reject(REJECT_BAD_NUMBER)
+                return None
+        timestamp = minute[2] + float(seconds)
+        # the header is destination, source, identifier and flags
+        source = packet[1]
+        # the other texts are rendered by the first consumer that asks
+        texts = [None, None, None, minute[4], None, None, None, minute[3], seconds]
+        if valid_flag != b'A':
+            self.decoded += 1
+            return position_fix.make_fix((source, packet[0], packet[2], callsign.decode('ascii', 'replace'), False, timestamp,
+                                          None, None, received, texts, self.radio))
+        if latitude_degrees is None or longitude_degrees is None or not north_south or not east_west:
+            self.reject(REJECT_BAD_NUMBER)
+            return None
+
+        fields = (latitude_degrees, latitude_minutes, north_south, longitude_degrees, longitude_minutes, east_west)
+        position = self.__positions.get(source)
+        if position is None or position[0] != fields:
+            latitude = int(latitude_degrees) + float(latitude_minutes) / 60
+            longitude = int(longitude_degrees) + float(longitude_minutes) / 60
+            if north_south != b'N':
+                latitude = -latitude
+            if east_west != b'E':
+                longitude = -longitude
+            position = self.__positions[source] = (fields, latitude, longitude)
+        self.decoded += 1
+        return position_fix.make_fix((source, packet[0], packet[2], callsign.decode('ascii', 'replace'), True, timestamp,
+                                      position[1], position[2], received, texts, self.radio))
+
+    @staticmethod
+    def classify(packet) -> str:
+        """
+        find out why a packet did not match, this is only called for rejected packets so it does not need to be fast
+
+        :param packet: the packet including the 4 byte header
+        :return: one of the REJECT_ constants
+        """
+        fields = bytes(packet[HEADER_LENGTH:]).split(b',')
+        if len(fields) != FIELD_COUNT:
+            return REJECT_FIELD_COUNT
+        offset = next((offset for offset, field in enumerate(fields) if re.match(_FIELD_PATTERNS[offset], field) is None), None)
+        if offset is None:
+            return REJECT_BAD_TEXT
+        if offset == radio_constants.POSITION_VALID:
+            return REJECT_BAD_VALID_FLAG
+        if offset in (radio_constants.LATITUDE_NS, radio_constants.LONGITUDE_EW):
+            return REJECT_BAD_HEMISPHERE
+        if offset == radio_constants.CALLSIGN:
+            return REJECT_BAD_TEXT
+        return REJECT_BAD_NUMBER
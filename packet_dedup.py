@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Find the packets the transmitter sent again because it did not hear the ack.
+# The transmitter puts a sequence number in header byte 2, it counts up and wraps at 256.
+# For each source address the highest identifier seen and two bit masks are kept, bit N of a mask is the identifier N
+# before the highest, like the anti replay window of ipsec.  One mask says the identifier was seen and the other
+# says it was acked, so a duplicate of a valid packet can be acked again without decoding, logging and publishing it.
+# A source that has been quiet for max_age seconds starts a new window, the transmitter may have restarted at 0.
+# The crc of the payload is kept for each identifier in the window, a resent packet has the same payload, so an identifier
+# that was seen with another payload is from a transmitter that restarted its count within max_age, and it starts a new
+# window instead of being dropped and acked as a duplicate, which would lose the fix because the transmitter stops sending it.
+
+import time
+import zlib
+from typing import Final
+
+import packet_decoder
+
+PACKET_NEW: Final[str] = 'new'
+PACKET_OUT_OF_ORDER: Final[str] = 'out_of_order'
+PACKET_DUPLICATE: Final[str] = 'duplicate'
+
+# the identifier is one byte
+IDENTIFIER_MODULUS: Final[int] = 256
+
+
+class SequenceWindow:  # pylint: disable=R0903
+    """
+    The identifiers recently heard from one source
+    """
+    __slots__ = ['highest', 'seen', 'acked', 'last_heard', 'payloads']
+
+    def __init__(self, identifier: int, now: float, size: int, payload: int = None):
+        """
+        The init class for the window
+
+        :param identifier: the first identifier heard
+        :param now: the monotonic time it was heard
+        :param size: the number of identifiers in the window
+        :param payload: the crc of the payload of the first packet, None if it is not known
+        """
+        self.highest = identifier
+        self.seen = 1
+        self.acked = 0
+        self.last_heard = now
+        # the crc of the payload for each identifier in the window, at the identifier modulo the size,
+        # the identifiers in the window follow each other so they never share a slot
+        self.payloads = [None] * size
+        self.payloads[identifier % size] = payload
+
+
+class PacketDeduplicator:
+    """
+    A sliding window for each source address that sorts packets into new, out of order and duplicate
+    """
+
+    def __init__(self, window: int = 32, max_age: float = 60.0):
+        """
+        The init class for the deduplicator
+
+        :param window: the number of identifiers remembered for each source, at most 128 so ahead and behind can be told apart
+        :param max_age: the seconds a source can be quiet before its window is forgotten
+        """
+        if not 0 < window <= IDENTIFIER_MODULUS // 2:
+            raise ValueError(f'the window must be between 1 and {IDENTIFIER_MODULUS // 2} not {window}')
+        self.window = window
+        self.max_age = max_age
+        self.__mask = (1 << window) - 1
+        self.__windows = {}
+        self.accepted = 0
+        self.duplicates = 0
+        self.out_of_order = 0
+        self.windows_reset = 0
+
+    def check(self, source: int, identifier: int, now: float = None, payload: int = None) -> str:
+        """
+        sort a packet and remember it
+
+        :param source: the source address from header byte 1
+        :param identifier: the sequence number from header byte 2
+        :param now: the monotonic time, now if None
+        :param payload: the crc of the payload, None if it is not known, then an identifier seen before is always a duplicate
+        :return: PACKET_NEW, PACKET_OUT_OF_ORDER, or PACKET_DUPLICATE
+        """
+        now = time.monotonic() if now is None else now
+        window = self.__windows.get(source)
+        if window is None or now - window.last_heard > self.max_age:
+            if window is not None:
+                self.windows_reset += 1
+            self.__windows[source] = SequenceWindow(identifier, now, self.window, payload)
+            self.accepted += 1
+            return PACKET_NEW
+        window.last_heard = now
+        ahead = (identifier - window.highest) % IDENTIFIER_MODULUS
+        if 0 < ahead < IDENTIFIER_MODULUS // 2:
+            # slide the window forward, the identifiers that were skipped are not marked as seen
+            window.seen = ((window.seen << ahead) | 1) & self.__mask
+            window.acked = (window.acked << ahead) & self.__mask
+            window.highest = identifier
+            window.payloads[identifier % self.window] = payload
+            self.accepted += 1
+            return PACKET_NEW
+        behind = (IDENTIFIER_MODULUS - ahead) % IDENTIFIER_MODULUS
+        bit = 1 << behind
+        slot = identifier % self.window
+        restarted = (behind < self.window and window.seen & bit and payload is not None
+                     and window.payloads[slot] is not None and payload != window.payloads[slot])
+        if behind >= self.window or restarted:
+            # too old to tell, or the same identifier with another payload,
+            # the transmitter most likely restarted its count so start again from this packet
+            self.windows_reset += 1
+            self.__windows[source] = SequenceWindow(identifier, now, self.window, payload)
+            self.accepted += 1
+            return PACKET_NEW
+        if window.seen & bit:
+            self.duplicates += 1
+            return PACKET_DUPLICATE
+        window.seen |= bit
+        window.payloads[slot] = payload
+        self.accepted += 1
+        self.out_of_order += 1
+        return PACKET_OUT_OF_ORDER
+
+    def check_packet(self, packet, now: float = None) -> str:
+        """
+        sort a packet by its header
+
+        :param packet: the packet including the 4 byte header
+        :param now: the monotonic time, now if None
+        :return: PACKET_NEW, PACKET_OUT_OF_ORDER, or PACKET_DUPLICATE, a packet too short to have a header is PACKET_NEW
+                 so the decoder can count it as rejected
+        """
+        if len(packet) < packet_decoder.HEADER_LENGTH:
+            return PACKET_NEW
+        return self.check(packet[1], packet[2], now, zlib.crc32(packet[packet_decoder.HEADER_LENGTH:]))
+
+    def mark_acked(self, source: int, identifier: int) -> None:
+        """
+        remember that a packet was acked, so its duplicates are acked again
+
+        :param source: the source address
+        :param identifier: the sequence number
+        :return: None
+        """
+        window = self.__windows.get(source)
+        if window is None:
+            return
+        behind = (window.highest - identifier) % IDENTIFIER_MODULUS
+        if behind < self.window:
+            window.acked |= 1 << behind
+
+    def was_acked(self, source: int, identifier: int) -> bool:
+        """
+        :param source: the source address
+        :param identifier: the sequence number
+        :return: True if the packet is in the window and was acked
+        """
+        window = self.__windows.get(source)
+        if window is None:
+            return False
+        behind = (window.highest - identifier) % IDENTIFIER_MODULUS
+        return behind < self.window and bool(window.acked & (1 << behind))
+
+    def statistics(self) -> dict:
+        """
+        :return: a dictionary of the counters
+        """
+        return {'accepted': self.accepted, 'duplicates': self.duplicates, 'out_of_order': self.out_of_order,
+                'windows_reset': self.windows_reset, 'sources': len(self.__windows)}
+
+
+def make_deduplicator(settings: dict):
+    """
+    make the deduplicator from the thread settings
+
+    :param settings: the kwargs of the radio thread, DedupWindow and DedupMaxAge are used
+    :return: the PacketDeduplicator, or None if DedupWindow is 0
+    """
+    window = settings.get('DedupWindow', 32)
+    if not window:
+        return None
+    return PacketDeduplicator(window, settings.get('DedupMaxAge', 60.0))
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# The stages of the receiver that are run, and the settings for them, from a json file and the command line.
+# The radio is always run, it is the source, it reads the rfm69 or replays a capture file with --replay_file.
+# The display, the bluetooth phone server and the position log are sinks, a sink that is off starts no thread and
+# imports no modules for its hardware, so a headless gateway needs no display, no bluetooth and no hcitool.
+# The stream clients of --stream_listen are served by the bluetooth thread, it is started for them even with bluetooth off.
+# The uplink is a sink too, it only starts when --uplink_address names a collector.
+#
+# The config file looks like
+# {
+#     "options": {"sleep_time": 1, "stream_listen": ["tcp:0.0.0.0:5000"], "replay_file": null},
+#     "stages": {"display": {"enabled": false}, "bluetooth": {"enabled": false}, "position_log": {"sleep_time": 5}}
+# }
+# the options are the command line options by their long name without the dashes, an option given on the command line
+# wins over the file, and each stage can have its own sleep time, which is the longest time between the passes of its loop.
+
+import argparse
+import json
+from typing import Final
+
+STAGE_RADIO: Final[str] = 'radio'
+STAGE_DISPLAY: Final[str] = 'display'
+STAGE_BLUETOOTH: Final[str] = 'bluetooth'
+STAGE_POSITION_LOG: Final[str] = 'position_log'
+STAGE_UPLINK: Final[str] = 'uplink'
+STAGES: Final[tuple] = (STAGE_RADIO, STAGE_DISPLAY, STAGE_BLUETOOTH, STAGE_POSITION_LOG, STAGE_UPLINK)
+# the stages --headless turns off
+HEADLESS_STAGES: Final[tuple] = (STAGE_DISPLAY, STAGE_BLUETOOTH)
+
+
+class PipelineConfig:
+    """
+    The stages to run and the sleep time of each one
+    """
+
+    def __init__(self, stages: dict = None, options: dict = None):
+        """
+        The init class for the config
+
+        :param stages: stage name -> a dictionary with enabled and sleep_time, a missing stage is enabled
+        :param options: command line option name -> value, the defaults for the command line
+        """
+        self.options = dict(options or {})
+        self.__stages = {stage: {'enabled': True, 'sleep_time': None} for stage in STAGES}
+        for stage, settings in (stages or {}).items():
+            if stage not in self.__stages:
+                raise ValueError(f'unknown stage {stage}, the stages are {", ".join(STAGES)}')
+            unknown = set(settings) - {'enabled', 'sleep_time'}
+            if unknown:
+                raise ValueError(f'unknown settings {sorted(unknown)} for stage {stage}')
+            self.__stages[stage].update(settings)
+        if not self.__stages[STAGE_RADIO]['enabled']:
+            raise ValueError('the radio stage cannot be turned off')
+
+    def enabled(self, stage: str) -> bool:
+        """
+        :param stage: the stage name
+        :return: True if the stage is run
+        """
+        return bool(self.__stages[stage]['enabled'])
+
+    def disable(self, stage: str) -> None:
+        """
+        :param stage: the stage name, the radio cannot be turned off
+        :return: None
+        """
+        if stage == STAGE_RADIO:
+            raise ValueError('the radio stage cannot be turned off')
+        self.__stages[stage]['enabled'] = False
+
+    def sleep_time(self, stage: str, default: float) -> float:
+        """
+        :param stage: the stage name
+        :param default: the sleep time from the command line
+        :return: the sleep time of the stage, the default if the config does not set one
+        """
+        sleep_time = self.__stages[stage]['sleep_time']
+        return default if sleep_time is None else sleep_time
+
+    def enabled_stages(self) -> list:
+        """
+        :return: the names of the stages that are run
+        """
+        return [stage for stage in STAGES if self.enabled(stage)]
+
+
+def load_config(file_name: str) -> PipelineConfig:
+    """
+    :param file_name: the json config file
+    :return: the PipelineConfig
+    """
+    with open(file_name, encoding='utf-8') as file:
+        settings = json.load(file)
+    unknown = set(settings) - {'options', 'stages'}
+    if unknown:
+        raise ValueError(f'unknown sections {sorted(unknown)} in {file_name}')
+    return PipelineConfig(settings.get('stages'), settings.get('options'))
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """
+    add the options that choose the stages
+
+    :param parser: the command line parser
+    :return: None
+    """
+    parser.add_argument('--config', type=str, default=None,
+                        help='A json file with the command line options and the stages to run, default = %(default)s')
+    parser.add_argument('--disable', action='append', default=None, choices=STAGES[1:],
+                        help='Do not run a stage, it can be repeated, default = %(default)s')
+    parser.add_argument('--headless', action='store_true', default=False,
+                        help='Run without the display and bluetooth, default = %(default)s')
+
+
+def parse_command_line(parser: argparse.ArgumentParser, argv: list = None) -> tuple:
+    """
+    read the config file named by --config, use its options as the defaults of the parser, and parse the command line once
+
+    :param parser: the command line parser, add_arguments must have been called
+    :param argv: the command line, sys.argv if None
+    :return: a tuple of the parsed arguments and the PipelineConfig
+    """
+    config_parser = argparse.ArgumentParser(add_help=False)
+    config_parser.add_argument('--config', type=str, default=None)
+    config_file = config_parser.parse_known_args(argv)[0].config
+    config = PipelineConfig() if config_file is None else load_config(config_file)
+    if config.options:
+        known = {action.dest for action in parser._actions}  # pylint: disable=W0212
+        unknown = set(config.options) - known
+        if unknown:
+            raise ValueError(f'unknown options {sorted(unknown)} in {config_file}')
+        parser.set_defaults(**config.options)
+    args = parser.parse_args(argv)
+    for stage in (HEADLESS_STAGES if args.headless else ()) + tuple(args.disable or ()):
+        config.disable(stage)
+    return args, config
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# The position fix record.  It is made once by the radio thread and then shared read only by the display,
+# the bluetooth and the position logging threads.  The text forms are rendered the first time they are asked for and
+# then kept with the fix, so the same fix is never formatted twice.
+
+import functools
+import operator
+import time
+from typing import Final
+
+import radio_constants
+
+# the forms of the position log line.  The first is the one the receiver has always written, time date longitude latitude,
+# the second adds the callsign so the fixes of several transmitters in one log can be told apart
+LOG_FORMAT_LEGACY: Final[int] = 1
+LOG_FORMAT_CALLSIGN: Final[int] = 2
+LOG_FORMATS: Final[tuple] = (LOG_FORMAT_LEGACY, LOG_FORMAT_CALLSIGN)
+
+# the offsets of the text forms in the text list
+_LATITUDE_TEXT = 0
+_LONGITUDE_TEXT = 1
+_TIME_TEXT = 2
+_DATE_TEXT = 3
+_BLUETOOTH_TEXT = 4
+_LOG_LINE = 5
+_CALLSIGN_LOG_LINE = 6
+# the HH:MM: text and the SS.sss field from the packet, they are only set by the packet decoder and never changed
+_MINUTE_TEXT = 7
+_PACKET_SECONDS = 8
+
+
+def format_latitude(latitude: float) -> str:
+    """
+    :param latitude: the latitude in signed decimal degrees or None
+    :return: the latitude as text, for example 35.9556283 or -5.1234567
+    """
+    if latitude is None:
+        return ''
+    # adding 0.0 turns -0.0 into 0.0, % is a little faster than an f-string for floats
+    return '%.7f' % (latitude + 0.0)  # pylint: disable=C0209
+
+
+def format_longitude(longitude: float) -> str:
+    """
+    :param longitude: the longitude in signed decimal degrees or None
+    :return: the longitude as text, for example -79.0193450 or 05.1234567
+    """
+    if longitude is None:
+        return ''
+    # at least 2 degree digits, the sign goes in front of the padding
+    longitude += 0.0
+    return '%010.7f' % longitude if longitude >= 0 else '-%010.7f' % -longitude  # pylint: disable=C0209
+
+
+def format_time(timestamp: float) -> tuple:
+    """
+    :param timestamp: the utc time of a fix in seconds since the epoch or None
+    :return: a tuple of the time as HH:MM:SS.sss and the date as DD:MM:YY
+    """
+    if timestamp is None:
+        return '', ''
+    fix_time = time.gmtime(timestamp)
+    milliseconds = int(round((timestamp % 1) * 1000)) % 1000
+    return (f'{fix_time.tm_hour:02d}:{fix_time.tm_min:02d}:{fix_time.tm_sec:02d}.{milliseconds:03d}',
+            f'{fix_time.tm_mday:02d}:{fix_time.tm_mon:02d}:{fix_time.tm_year % 100:02d}')
+
+
+def _render(fix) -> list:
+    """
+    render all the text forms of a fix the first time one of them is asked for, the display, the bluetooth and the
+    logging threads each want most of them.
+    Rendering twice from two threads gives the same texts, so no lock is needed, each text is set once and the
+    latitude is set last
+
+    :param fix: the PositionFix
+    :return: the list of text forms
+    """
+    texts = fix[9]
+    if texts[_LATITUDE_TEXT] is None:
+        minute_text = texts[_MINUTE_TEXT]
+        if minute_text is None:
+            time_text, date_text = format_time(fix[5])
+        else:
+            time_text = minute_text + texts[_PACKET_SECONDS].decode('ascii')
+            date_text = texts[_DATE_TEXT]
+        longitude_text = format_longitude(fix[7])
+        latitude_text = format_latitude(fix[6])
+        texts[_TIME_TEXT] = time_text
+        texts[_DATE_TEXT] = date_text
+        texts[_LONGITUDE_TEXT] = longitude_text
+        texts[_BLUETOOTH_TEXT] = f'{longitude_text}, {latitude_text} {radio_constants.POSITION_VALID_VALUE}'
+        texts[_LOG_LINE] = f'{time_text} {date_text} {longitude_text} {latitude_text}\n'
+        texts[_LATITUDE_TEXT] = latitude_text
+    return texts
+
+
+def _text_property(offset: int, doc: str) -> property:
+    """
+    :param offset: the offset of the text in the text list
+    :param doc: the doc string of the property
+    :return: a property that renders the texts if this one is not there yet
+    """
+    def text(fix) -> str:
+        value = fix[9][offset]
+        if value is None:
+            value = _render(fix)[offset]
+        return value
+    return property(text, doc=doc)
+
+
+class PositionFix(tuple):
+    """
+    An immutable position fix from one transmitter.
+    The latitude and longitude are signed decimal degrees, they are None when the fix is not valid.
+    The timestamp is the utc time of the fix in seconds since the epoch, it is None if the packet did not have one.
+
+    The fix is a tuple so it is cheap to make on the radio thread and cannot be changed by the other threads.
+    Item 9 is the list of text forms, they are rendered by the first thread that asks for one of them, so the radio
+    thread only makes numbers.  A fix from the packet decoder comes with the date text and the HH:MM: text, the decoder
+    makes them once a minute, and the seconds field of the packet, so the time text is cut from the packet like the
+    legacy receive loop did.  The last item is the number of the
+    radio that received the packet, when the gateway listens on more than one network.
+    """
+    __slots__ = ()
+
+    source = property(operator.itemgetter(0), doc='the address of the transmitter, header byte 1')
+    destination = property(operator.itemgetter(1), doc='the address of this receiver, header byte 0')
+    identifier = property(operator.itemgetter(2), doc='the sequence id set by the transmitter, header byte 2')
+    callsign = property(operator.itemgetter(3), doc='the callsign of the transmitter')
+    valid = property(operator.itemgetter(4), doc='True if the gps had a fix')
+    timestamp = property(operator.itemgetter(5), doc='the utc time of the fix in seconds since the epoch')
+    latitude = property(operator.itemgetter(6), doc='the latitude in signed decimal degrees')
+    longitude = property(operator.itemgetter(7), doc='the longitude in signed decimal degrees')
+    received = property(operator.itemgetter(8), doc='the time the packet was received in seconds since the epoch')
+    radio = property(operator.itemgetter(10), doc='the number of the radio that received the packet, 0 for the first')
+
+    # a fix is only equal to itself, use same_position to compare positions
+    __eq__ = object.__eq__
+    __ne__ = object.__ne__
+    __hash__ = object.__hash__
+
+    def __new__(cls, source: int, destination: int, identifier: int, callsign: str, valid: bool,  # pylint: disable=R0913
+                timestamp: float = None, latitude: float = None, longitude: float = None, received: float = None, radio: int = 0):
+        """
+        make a fix
+
+        :param source: the address of the transmitter, header byte 1
+        :param destination: the address of this receiver, header byte 0
+        :param identifier: the sequence id set by the transmitter, header byte 2
+        :param callsign: the callsign of the transmitter
+        :param valid: True if the gps had a fix
+        :param timestamp: the utc time of the fix in seconds since the epoch
+        :param latitude: the latitude in signed decimal degrees
+        :param longitude: the longitude in signed decimal degrees
+        :param received: the time the packet was received in seconds since the epoch, defaults to now
+        :param radio: the number of the radio that received the packet
+        """
+        return tuple.__new__(cls, (source, destination, identifier, callsign, valid, timestamp, latitude, longitude,
+                                   time.time() if received is None else received,
+                                   [None] * 9, radio))
+
+    def __getnewargs__(self):
+        return (*self[:9], self[10])
+
+    def __repr__(self):
+        return (f'{type(self).__name__}(source={self.source}, identifier={self.identifier}, callsign={self.callsign!r}, '
+                f'valid={self.valid}, timestamp={self.timestamp}, latitude={self.latitude}, longitude={self.longitude}, radio={self.radio})')
+
+    def same_position(self, other) -> bool:
+        """
+        :param other: another fix or None
+        :return: True if the other fix is from the same source and has the same position
+        """
+        return (other is not None and self.source == other.source and self.latitude == other.latitude
+                and self.longitude == other.longitude)
+
+    latitude_text = _text_property(_LATITUDE_TEXT, 'the latitude as text, for example 35.9556283')
+    longitude_text = _text_property(_LONGITUDE_TEXT, 'the longitude as text, for example -79.0193450')
+    time_text = _text_property(_TIME_TEXT, 'the utc time of the fix as HH:MM:SS.sss')
+    date_text = _text_property(_DATE_TEXT, 'the utc date of the fix as DD:MM:YY')
+    bluetooth_text = _text_property(_BLUETOOTH_TEXT, 'the text sent to the phone without the counter, for example -79.0193450, 35.9556283 A')
+    log_line = _text_property(_LOG_LINE, 'the position log line of LOG_FORMAT_LEGACY, time date longitude latitude and a new line')
+
+    @property
+    def callsign_log_line(self) -> str:
+        """
+        :return: the position log line of LOG_FORMAT_CALLSIGN, time date longitude latitude callsign and a new line
+        """
+        texts = self[9]
+        text = texts[_CALLSIGN_LOG_LINE]
+        if text is None:
+            text = texts[_CALLSIGN_LOG_LINE] = f'{_render(self)[_LOG_LINE][:-1]} {self[3]}\n'
+        return text
+
+    def log_text(self, log_format: int) -> str:
+        """
+        :param log_format: one of the LOG_FORMATS
+        :return: the position log line in that format
+        """
+        return self.callsign_log_line if log_format == LOG_FORMAT_CALLSIGN else self.log_line
+
+
+# make a fix straight from the tuple of its items without the argument handling of PositionFix.__new__,
+# this is for the packet decoder on the radio thread.
+# Item 9 must be a new list of the seven texts, Nones except the DD:MM:YY date text, followed by the HH:MM: text and the SS.sss
+# field of the packet, and the last item is the radio
+make_fix = functools.partial(tuple.__new__, PositionFix)
@@ -14,14 +14,44 @@
 
 import threading
 import time
+
+import metrics
+import position_fix
+import position_writer
 import radio_constants
+import track_store
+
+
+def make_sinks(log_file_name: str, settings: dict) -> tuple:
+    """
+    make the text log writer and the track store
+
+    :param log_file_name: the name of the text position log
+    :param settings: the settings dictionary described in PositionLoggingThread
+    :return: a tuple of the position_writer.PositionWriter and the track_store.TrackStore, either may be None
+    """
+    writer = None
+    store = None
+    # the log is appended to, so a restart does not lose the track
+    if settings.get('TextLog', True):
+        writer = position_writer.PositionWriter(log_file_name,
+                                                batch_size=settings.get('BatchSize', 4096),
+                                                batch_age=settings.get('BatchAge', 5.0),
+                                                fsync_policy=settings.get('FsyncPolicy', position_writer.FSYNC_BATCH),
+                                                fsync_interval=settings.get('FsyncInterval', 30.0),
+                                                max_bytes=settings.get('MaxBytes', 0),
+                                                rotate_interval=settings.get('RotateInterval', 0),
+                                                backup_count=settings.get('BackupCount', 5))
+    if settings.get('TrackDirectory'):
+        store = track_store.TrackStore(settings['TrackDirectory'], batch_age=settings.get('BatchAge', 5.0))
+    return writer, store
 
 
 class PositionLoggingThread(threading.Thread):
     """
     this is a thread class logs the position from the remote radio to a file
     """
-    __slots__ = ['args', 'kwargs', 'lock_location_class', 'event', 'mac_address', 'timeout']
+    __slots__ = ['args', 'kwargs', 'lock_location_class', 'event', 'log_file_name', 'writer', 'track_store', 'metrics']
 
     def __init__(self, name, *args, **kwargs):
         """
@@ -29,9 +59,14 @@ class PositionLoggingThread(threading.Thread):
 
         :param name: The name of the thread
         :param args: The args, it must be a tuple consisting of
-                                (gps_lock_and_location, event, network, log.log, args.sleep_time, log file name)
-        :param kwargs: a dictionary that must contain the mac address and the timeout
-                        example {'mac_address': xx:xx:xx:xx:xx, 'timeout':10}  the timeout is optional but the mac address is not
+                                (position_table, event, network, log.log, args.sleep_time, log file name)
+        :param kwargs: an optional dictionary with the position_writer.PositionWriter settings
+                        example {'BatchSize': 4096, 'BatchAge': 5.0, 'FsyncPolicy': 'batch', 'FsyncInterval': 30.0,
+                                 'MaxBytes': 0, 'RotateInterval': 0, 'BackupCount': 5}
+                        and the track store settings, example {'TrackDirectory': '/var/lib/rfm69/track', 'TextLog': True}
+                        and the position_fix.LOG_FORMATS form of the text log lines, example {'LogFormat': 1}
+                        if the track directory is None there is no track store, if the text log is False there is no text log
+                        and an optional metrics.MetricsRegistry, example {'Metrics': registry}
         """
         super().__init__(name=name, args=args, kwargs=kwargs)
 
@@ -43,6 +78,9 @@ class PositionLoggingThread(threading.Thread):
         (self.lock_location_class, self.event, self.network, self.logger,   # pylint: disable=W0632
          self.sleep_time_in_sec, self.log_file_name) = self.args  # pylint: disable=W0632
         self.name = name
+        self.writer = None
+        self.track_store = None
+        self.metrics = metrics.registry_from(self.kwargs)
 
     def run(self):
         """
@@ -50,37 +88,68 @@ class PositionLoggingThread(threading.Thread):
 
         :return:
         """
-        log_file_object = open(self.log_file_name, "w+", encoding='utf-8')   # pylint: disable=R1732
-        log_file_object.truncate()
-        log_file_object.close()
-        self.logger.info(f'logging thread {self.args}')
+        self.writer, self.track_store = make_sinks(self.log_file_name, self.kwargs)
+        self.logger.info('logging thread %s', self.args)
+        try:
+            self.log_positions()
+        finally:
+            if self.writer is not None:
+                self.writer.close()
+                self.logger.info('position writer %s', self.writer.statistics())
+            if self.track_store is not None:
+                self.track_store.close()
+                self.logger.info('track store records written %d', self.track_store.records_written)
+
+    def log_positions(self) -> None:
+        """
+        wait for new fixes and give the ones that moved to the text log and the track store until the event is set
+
+        :return: None
+        """
         counter = 0
-        previous_lat_long = ""
+        batches_written = 0
+        log_format = self.kwargs.get('LogFormat', position_fix.LOG_FORMAT_LEGACY)
+        sinks = [sink for sink in (self.writer, self.track_store) if sink is not None]
+        latency = self.metrics.histogram('rfm69_stage_latency_seconds', 'The time from receiving a packet to each stage', stage='log')
+        loops = self.metrics.counter('rfm69_loop_iterations_total', 'The passes through the loop of each thread', thread='logging')
+        positions_logged = self.metrics.counter('rfm69_positions_logged_total', 'The fixes that moved and were logged')
+        if self.writer is not None:
+            self.metrics.counter('rfm69_log_fsyncs_total', 'The fsyncs of the text position log', lambda: self.writer.fsyncs)
+        # the last version of the position table seen and the last fix logged for each source
+        last_version = 0
+        previous_fixes = {}
         while True:
 
-            if self.event.is_set():
+            if self.event.is_set() or self.lock_location_class.closed:
                 return
-            packet_list = self.lock_location_class.data
-            if not packet_list:
-                continue
-            # callsign = packet_list[radio_constants.CALLSIGN]
-            if packet_list[radio_constants.POSITION_VALID] == 'V':
-                # the packet does not have a valid gps location
-                self.logger.info(f'Position indicator ={(packet_list[radio_constants.POSITION_VALID])}')
-                continue
-
-            # latitude has the form of Latitude (DDmm.mm)
-            latitude = packet_list[radio_constants.LATITUDE]
-            longitude = packet_list[radio_constants.LONGITUDE]
-            lat_long = longitude + " " + latitude + '\n'
-            if lat_long != previous_lat_long:
-                self.logger.info(f'{self.name} {latitude}, {longitude} {counter}\r\n')
-                previous_lat_long = lat_long
-                counter += 1
-                with open(self.log_file_name, "a", encoding='utf-8') as file:
-                    complete_log_string = packet_list[radio_constants.TIME_OF_FIX] + ' ' + \
-                                          packet_list[radio_constants.FIX_DATE] + ' ' + lat_long
-                    self.logger.info(f'thread_name = {self.name} {complete_log_string}')
-                    file.write(complete_log_string)
-
-            time.sleep(self.sleep_time_in_sec)
+            loops.inc()
+            # block until the radio thread publishes a new fix or a buffer is old enough to write,
+            # the sleep time is only the deadline to look at the event
+            timeout = min([self.sleep_time_in_sec] + [due for due in (sink.time_to_flush() for sink in sinks) if due is not None])
+            self.lock_location_class.wait_for_update(last_version, timeout)
+            last_version, fixes = self.lock_location_class.changed_since(last_version)
+            for fix in fixes:
+                if not fix.valid:
+                    # the packet does not have a valid gps location
+                    self.logger.info('Position indicator =%s %s', radio_constants.POSITION_NOT_VALID_VALUE, fix.callsign)
+                    continue
+
+                if not fix.same_position(previous_fixes.get(fix.source)):
+                    self.logger.info('%s %s %s, %s %d', self.name, fix.callsign, fix.latitude_text, fix.longitude_text, counter)
+                    previous_fixes[fix.source] = fix
+                    counter += 1
+                    positions_logged.inc()
+                    if self.metrics.enabled:
+                        latency.observe(time.time() - fix.received)
+                    if self.writer is not None:
+                        complete_log_string = fix.log_text(log_format)
+                        self.logger.info('thread_name = %s %s', self.name, complete_log_string)
+                        self.writer.write(complete_log_string)
+                    if self.track_store is not None:
+                        self.track_store.append(fix)
+            for sink in sinks:
+                if sink.flush_due():
+                    sink.flush()
+            if self.writer is not None and self.writer.batches_written != batches_written:
+                batches_written = self.writer.batches_written
+                self.logger.debug('position writer %s', self.writer.statistics())
@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# The table of position fixes for every transmitter on the network, keyed by the source address in header byte 1.
+# The entries are kept in the order they were last updated, so the most recent source is at the end,
+# a silent source drifts to the front where it is evicted, and "changed since version N" only walks the changed entries.
+# The track analytics and the geofence have their own locks, they are updated before the table lock is taken and told
+# about the evicted sources after it is released, so a reader of the table never waits for them or for the geofence log.
+
+import collections
+import threading
+import time
+
+import lock_and_data
+
+
+class SourceEntry:  # pylint: disable=R0903
+    """
+    The state of one transmitter, the latest fix, a ring buffer of its recent valid fixes and the number of fixes from it
+    """
+    __slots__ = ['source', 'latest', 'history', 'version', 'last_seen', 'count']
+
+    def __init__(self, source: int, history_length: int):
+        """
+        The init class for the entry
+
+        :param source: the source address of the transmitter
+        :param history_length: the number of valid fixes to keep
+        """
+        self.source = source
+        self.latest = None
+        self.history = collections.deque(maxlen=history_length)
+        self.version = 0
+        self.last_seen = 0.0
+        self.count = 0
+
+
+class PositionTable(lock_and_data.LockAndData):
+    """
+    A thread safe table of the position fixes for each source.
+    The data is the most recent fix from any source, and every insert publishes a new version to the subscribers.
+    """
+
+    def __init__(self, history_length: int = 32, max_sources: int = 64, silent_timeout: float = 3600.0, analytics=None,  # pylint: disable=R0913
+                 geofence=None):
+        """
+        The init class for the table
+
+        :param history_length: the number of valid fixes kept for each source
+        :param max_sources: the most sources kept, the one silent the longest is evicted first
+        :param silent_timeout: a source that has not been heard for this many seconds is evicted, 0 never evicts
+        :param analytics: a track_analytics.TrackAnalytics updated with every fix, or None
+        :param geofence: a geofence.GeofenceEngine that checks every fix, or None
+        """
+        super().__init__()
+        self.__entries = collections.OrderedDict()
+        self.history_length = history_length
+        self.max_sources = max_sources
+        self.silent_timeout = silent_timeout
+        self.analytics = analytics
+        self.geofence = geofence
+        # held by the writers of the table, outside the table lock, so the analytics and the geofence see the fixes
+        # and the evictions in the order of the table
+        self.__insert_lock = threading.Lock()
+
+    def insert(self, fix) -> int:
+        """
+        add a fix to the table
+
+        :param fix: the position_fix.PositionFix
+        :return: the new version of the table
+        """
+        with self.__insert_lock:
+            # before the fix is published, so a thread woken by it sees the track and the fences with it
+            if self.analytics is not None:
+                self.analytics.update(fix)
+            if self.geofence is not None:
+                self.geofence.update(fix)
+            with self._condition:
+                entry = self.__entries.get(fix.source)
+                if entry is None:
+                    entry = self.__entries[fix.source] = SourceEntry(fix.source, self.history_length)
+                else:
+                    self.__entries.move_to_end(fix.source)
+                entry.latest = fix
+                entry.count += 1
+                if fix.valid:
+                    entry.history.append(fix)
+                self._data = fix
+                entry.version = self._notify()
+                entry.last_seen = fix.received
+                evicted = self.__evict(fix.received)
+            self.__forget(evicted)
+            return entry.version
+
+    def __evict(self, now: float) -> list:
+        """
+        evict the sources that have been silent too long, the lock must be held
+
+        :param now: the current time in seconds since the epoch
+        :return: the evicted sources, give them to __forget after the lock is released
+        """
+        evicted = []
+        while len(self.__entries) > self.max_sources:
+            evicted.append(self.__remove_oldest())
+        if self.silent_timeout:
+            while self.__entries:
+                oldest = next(iter(self.__entries.values()))
+                if now - oldest.last_seen < self.silent_timeout:
+                    break
+                evicted.append(self.__remove_oldest())
+        return evicted
+
+    def __remove_oldest(self) -> int:
+        """
+        remove the source silent the longest, the lock must be held.
+        If it was the latest fix of the table the latest fix of the most recent source left takes its place
+
+        :return: the source removed
+        """
+        source, entry = self.__entries.popitem(last=False)
+        if self._data is entry.latest:
+            self._data = self.__entries[next(reversed(self.__entries))].latest if self.__entries else None
+        return source
+
+    def __forget(self, sources: list) -> None:
+        """
+        remove the tracks and the fences of evicted sources, the insert lock must be held and the table lock must not
+
+        :param sources: the evicted sources
+        :return: None
+        """
+        for source in sources:
+            if self.analytics is not None:
+                self.analytics.forget(source)
+            if self.geofence is not None:
+                self.geofence.forget(source)
+
+    def snapshot(self) -> list:
+        """
+        copy the state of every source for a snapshot file, only references are copied so the lock is held for a short time
+
+        :return: a list of (source, count, latest fix, list of the history fixes), the source silent the longest first
+        """
+        with self._condition:
+            return [(entry.source, entry.count, entry.latest, list(entry.history)) for entry in self.__entries.values()]
+
+    def restore(self, sources: list, now: float = None) -> int:
+        """
+        put back the sources of a snapshot before the threads start.  The restored entries have version 0, so the
+        display and the phone show them at once but changed_since(0) does not return them and they are not logged again.
+        A source already in the table is not replaced, and a source that would be evicted now is left out.
+
+        :param sources: a list of (source, count, latest fix, list of the history fixes), the source silent the longest first
+        :param now: the time in seconds since the epoch, None for now
+        :return: the number of sources restored
+        """
+        now = time.time() if now is None else now
+        entries = []
+        with self.__insert_lock:
+            with self._condition:
+                for source, count, latest, history in sources:
+                    if source in self.__entries or (self.silent_timeout and now - latest.received >= self.silent_timeout):
+                        continue
+                    entry = SourceEntry(source, self.history_length)
+                    entry.latest = latest
+                    entry.count = count
+                    entry.history.extend(history)
+                    entry.last_seen = latest.received
+                    self.__entries[source] = entry
+                    entries.append(entry)
+                    if self._data is None or latest.received > self._data.received:
+                        self._data = latest
+                # the order is the order of the snapshot, in front of any source heard since the start
+                for source, _, _, _ in reversed(sources):
+                    if source in self.__entries and self.__entries[source].version == 0:
+                        self.__entries.move_to_end(source, last=False)
+                evicted = []
+                while len(self.__entries) > self.max_sources:
+                    evicted.append(self.__remove_oldest())
+            for entry in entries:
+                if self.analytics is not None:
+                    for fix in entry.history:
+                        self.analytics.update(fix)
+                if self.geofence is not None:
+                    self.geofence.prime(entry.latest)
+            self.__forget(evicted)
+        return len(entries)
+
+    def count(self, source: int) -> int:
+        """
+        :param source: the source address
+        :return: the number of fixes from the source, including the ones before a restart, 0 if it is not in the table
+        """
+        with self._condition:
+            entry = self.__entries.get(source)
+            return 0 if entry is None else entry.count
+
+    def evict_silent(self) -> None:
+        """
+        evict the sources that have been silent too long, for callers that want to evict when no fixes arrive
+
+        :return: None
+        """
+        with self.__insert_lock:
+            with self._condition:
+                evicted = self.__evict(time.time())
+            self.__forget(evicted)
+
+    def publish(self, data) -> int:
+        """
+        add a fix, the same as insert, so setting data works like it does for LockAndData
+
+        :param data: the position_fix.PositionFix
+        :return: the new version
+        """
+        return self.insert(data)
+
+    def latest(self, source: int = None):
+        """
+        :param source: the source address, or None for the most recent source
+        :return: the latest fix from the source, or None if the source is not in the table
+        """
+        with self._condition:
+            if source is None:
+                return self._data
+            entry = self.__entries.get(source)
+            return None if entry is None else entry.latest
+
+    def all_latest(self) -> list:
+        """
+        :return: the latest fix from every source, the most recent last
+        """
+        with self._condition:
+            return [entry.latest for entry in self.__entries.values()]
+
+    def sources(self) -> list:
+        """
+        :return: the source addresses in the table, the most recent last
+        """
+        with self._condition:
+            return list(self.__entries)
+
+    def history(self, source: int, count: int = None) -> list:
+        """
+        :param source: the source address
+        :param count: the number of fixes wanted, None for the whole history
+        :return: the most recent valid fixes from the source, oldest first
+        """
+        with self._condition:
+            entry = self.__entries.get(source)
+            if entry is None:
+                return []
+            history = entry.history
+            if count is None or count >= len(history):
+                return list(history)
+            # only copy the tail that was asked for
+            return [history[index] for index in range(len(history) - count, len(history))]
+
+    def changed_since(self, version: int) -> tuple:
+        """
+        find the sources that changed after a version, only the changed entries are looked at
+
+        :param version: the version the caller last saw, 0 for everything
+        :return: a tuple of the current version and the latest fix of each changed source, the most recent last
+        """
+        with self._condition:
+            changed = []
+            for entry in reversed(self.__entries.values()):
+                if entry.version <= version:
+                    break
+                changed.append(entry.latest)
+            changed.reverse()
+            return self._version, changed
@@ -0,0 +1,230 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# The writer for the position log.  The lines are kept in a buffer and written with one system call when the buffer is
+# big enough or old enough, so a high fix rate does not open, write and close the file on the sd card for every fix.
+# The file is opened once for append, so a restart adds to the track instead of destroying it.
+# fsync policy
+#       none        leave it to the operating system
+#       batch       fsync after every batch is written
+#       interval    fsync at most once every fsync interval seconds
+# The file is rotated to file.1, file.2 ... when it gets too big or too old.  Like logging.handlers.RotatingFileHandler
+# it is never rotated when no backups are kept, the track is never deleted to make room.
+
+import os
+import time
+from typing import Final
+
+FSYNC_NONE: Final[str] = 'none'
+FSYNC_BATCH: Final[str] = 'batch'
+FSYNC_INTERVAL: Final[str] = 'interval'
+FSYNC_POLICIES: Final[tuple] = (FSYNC_NONE, FSYNC_BATCH, FSYNC_INTERVAL)
+
+
+class PositionWriter:  # pylint: disable=R0902
+    """
+    A batching append only writer for the position log with rotation
+    """
+
+    def __init__(self, file_name: str, batch_size: int = 4096, batch_age: float = 5.0,  # pylint: disable=R0913
+                 fsync_policy: str = FSYNC_BATCH, fsync_interval: float = 30.0, max_bytes: int = 0,
+                 rotate_interval: float = 0.0, backup_count: int = 5):
+        """
+        The init class for the writer
+
+        :param file_name: the name of the position log
+        :param batch_size: write the buffer when it has this many bytes
+        :param batch_age: write the buffer when the oldest line in it is this many seconds old
+        :param fsync_policy: one of FSYNC_POLICIES
+        :param fsync_interval: the least time in seconds between fsyncs for FSYNC_INTERVAL
+        :param max_bytes: rotate the file when it is this big, 0 never rotates on size
+        :param rotate_interval: rotate the file when it has been open this many seconds, 0 never rotates on time
+        :param backup_count: the number of rotated files kept, 0 never rotates
+        """
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f'fsync policy must be one of {FSYNC_POLICIES} not {fsync_policy}')
+        if backup_count < 0:
+            raise ValueError(f'backup count must not be negative, it is {backup_count}')
+        self.file_name = file_name
+        self.batch_size = batch_size
+        self.batch_age = batch_age
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backup_count = backup_count
+        self.__buffer = bytearray()
+        self.__buffered_lines = 0
+        self.__oldest = None
+        self.__last_fsync = time.monotonic()
+        self.__file_descriptor = None
+        self.__file_size = 0
+        self.__opened = 0.0
+        # the statistics
+        self.lines_written = 0
+        self.bytes_written = 0
+        self.batches_written = 0
+        self.fsyncs = 0
+        self.rotations = 0
+        self.total_write_latency = 0.0
+        self.max_write_latency = 0.0
+        self.__open()
+
+    def __open(self) -> None:
+        """
+        open the file for append, the file is made if it does not exist
+
+        :return: None
+        """
+        self.__file_descriptor = os.open(self.file_name, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self.__file_size = os.fstat(self.__file_descriptor).st_size
+        self.__opened = time.monotonic()
+
+    def write(self, line: str) -> None:
+        """
+        add a line to the buffer, the buffer is written if it is full or old enough
+
+        :param line: the line including the new line
+        :return: None
+        """
+        if self.__oldest is None:
+            self.__oldest = time.monotonic()
+        self.__buffer += line.encode('utf-8')
+        self.__buffered_lines += 1
+        if len(self.__buffer) >= self.batch_size or self.flush_due():
+            self.flush()
+
+    def flush_due(self) -> bool:
+        """
+        :return: True if there is a line in the buffer older than the batch age
+        """
+        return self.__oldest is not None and time.monotonic() - self.__oldest >= self.batch_age
+
+    def time_to_flush(self) -> float:
+        """
+        :return: the time in seconds until the buffer is old enough to be written, None if the buffer is empty
+        """
+        if self.__oldest is None:
+            return None
+        return max(0.0, self.batch_age - (time.monotonic() - self.__oldest))
+
+    def flush(self, fsync: bool = False) -> None:
+        """
+        write the buffer to the file with one system call
+
+        :param fsync: if True fsync whatever the policy
+        :return: None
+        """
+        if self.__file_descriptor is None:
+            raise ValueError('the position writer is closed')
+        if self.__buffer:
+            start = time.perf_counter()
+            if self.__rotate_due(len(self.__buffer)):
+                self.rotate()
+            view = memoryview(self.__buffer)
+            while view:
+                # a write to a regular file is normally complete, but it does not have to be
+                view = view[os.write(self.__file_descriptor, view):]
+            view.release()
+            self.__file_size += len(self.__buffer)
+            self.bytes_written += len(self.__buffer)
+            self.batches_written += 1
+            self.lines_written += self.__buffered_lines
+            self.__buffered_lines = 0
+            self.__buffer.clear()
+            self.__oldest = None
+            now = time.monotonic()
+            if fsync or self.fsync_policy == FSYNC_BATCH or \
+                    (self.fsync_policy == FSYNC_INTERVAL and now - self.__last_fsync >= self.fsync_interval):
+                self.__fsync(now)
+            latency = time.perf_counter() - start
+            self.total_write_latency += latency
+            self.max_write_latency = max(self.max_write_latency, latency)
+        elif fsync:
+            self.__fsync(time.monotonic())
+
+    def __fsync(self, now: float) -> None:
+        """
+        fsync the file
+
+        :param now: the monotonic time
+        :return: None
+        """
+        os.fsync(self.__file_descriptor)
+        self.__last_fsync = now
+        self.fsyncs += 1
+
+    def __rotate_due(self, length: int) -> bool:
+        """
+        :param length: the number of bytes about to be written
+        :return: True if the file should be rotated before the bytes are written
+        """
+        if not self.backup_count:
+            return False
+        if self.max_bytes and self.__file_size and self.__file_size + length > self.max_bytes:
+            return True
+        return bool(self.rotate_interval and time.monotonic() - self.__opened >= self.rotate_interval)
+
+    def rotate(self) -> None:
+        """
+        close the file, rename it to file.1, file.1 to file.2 and so on, and open a new file.
+        Without backups it does nothing, the file is not deleted.
+
+        :return: None
+        """
+        if not self.backup_count:
+            return
+        if self.fsync_policy != FSYNC_NONE:
+            os.fsync(self.__file_descriptor)
+        os.close(self.__file_descriptor)
+        self.__file_descriptor = None
+        for number in range(self.backup_count - 1, 0, -1):
+            older = f'{self.file_name}.{number}'
+            if os.path.exists(older):
+                os.replace(older, f'{self.file_name}.{number + 1}')
+        os.replace(self.file_name, f'{self.file_name}.1')
+        self.rotations += 1
+        self.__open()
+
+    def statistics(self) -> dict:
+        """
+        :return: a dictionary of the lines, bytes, batches, fsyncs, rotations and the write latency in seconds
+        """
+        return {
+            'lines_written': self.lines_written,
+            'bytes_written': self.bytes_written,
+            'batches_written': self.batches_written,
+            'fsyncs': self.fsyncs,
+            'rotations': self.rotations,
+            'mean_write_latency': self.total_write_latency / self.batches_written if self.batches_written else 0.0,
+            'max_write_latency': self.max_write_latency,
+        }
+
+    def close(self) -> None:
+        """
+        write the buffer, fsync unless the policy is none, and close the file
+
+        :return: None
+        """
+        if self.__file_descriptor is None:
+            return
+        self.flush(fsync=self.fsync_policy != FSYNC_NONE)
+        os.close(self.__file_descriptor)
+        self.__file_descriptor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
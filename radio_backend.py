@@ -0,0 +1,413 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# The radio backends that ReceiveRFM69Data talks to.
+# RFM69Backend is the real radio on the bonnet, CaptureBackend records every packet received by another backend to a file,
+# and ReplayBackend plays a capture file back so the program can be run without a radio.
+# More than one RFM69Backend can be made, each with its own chip select, reset pin, frequency and sync word, they share
+# one busio.SPI so the adafruit SPIDevice lock keeps their transfers apart, and each one counts the time it spends
+# on the bus so the receiver can tell when the bus is the bottleneck.
+#
+# The capture file starts with the 8 byte magic b'RFM69CAP' followed by one record per packet.
+# Each record is a little endian double with the receive time in seconds since the epoch, an unsigned short with the
+# length of the packet, and then the packet including the 4 byte header.
+
+import abc
+import queue
+import struct
+import threading
+import time
+from typing import Final
+
+CAPTURE_MAGIC: Final[bytes] = b'RFM69CAP'
+CAPTURE_RECORD: Final[struct.Struct] = struct.Struct('<dH')
+
+# the pins of the rfm69 on the radio bonnet
+DEFAULT_CHIP_SELECT: Final[str] = 'CE1'
+DEFAULT_RESET_PIN: Final[str] = 'D25'
+DEFAULT_FREQUENCY: Final[float] = 433.0
+
+# the spi bus shared by the radios, made by the first radio
+_SPI_LOCK = threading.Lock()
+_SPI_BUS = None
+
+
+class RadioBackend(abc.ABC):
+    """
+    The interface to a radio, the methods match the parts of adafruit_rfm69.RFM69 that this program uses,
+    a backend must have receive and send, the other methods default to a radio without those features
+    """
+    # the seconds spent on the spi bus, a backend without a bus leaves it at 0
+    bus_seconds = 0.0
+
+    @abc.abstractmethod
+    def receive(self, *, keep_listening: bool = True, with_header: bool = False, timeout: float = 0.5):
+        """
+        receive a packet
+
+        :param keep_listening: if True stay in receive mode after the packet is read
+        :param with_header: if True return the 4 byte header with the packet
+        :param timeout: the time in seconds to wait for a packet
+        :return: the packet, or None if no packet arrived before the timeout
+        """
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def send(self, data: bytes, *, keep_listening: bool = False, destination: int = 255, node: int = 255,  # pylint: disable=R0913
+             identifier: int = 0, flags: int = 0) -> bool:
+        """
+        send a packet
+
+        :param data: the payload
+        :param keep_listening: if True go back to receive mode after the send
+        :param destination: header byte 0, the address of the receiver
+        :param node: header byte 1, the address of the sender
+        :param identifier: header byte 2, the sequence number
+        :param flags: header byte 3, 0x80 is an ack
+        :return: True if the packet was sent
+        """
+        raise NotImplementedError
+
+    def listen(self) -> None:
+        """
+        put the radio in receive mode
+
+        :return: None
+        """
+
+    def attach_interrupt(self, interrupt, pin: int = None, logger=None) -> bool:  # pylint: disable=W0613
+        """
+        connect the payload ready signal to a radio_interrupt.PayloadReadyInterrupt
+
+        :param interrupt: the PayloadReadyInterrupt to fire when a packet is ready
+        :param pin: the gpio pin connected to DIO0, only used by a real radio
+        :param logger: the logger, may be None
+        :return: True if the interrupt is attached, False if the backend must be polled
+        """
+        return False
+
+    def channel_busy(self) -> bool:
+        """
+        :return: True if a packet is being received or is waiting in the fifo, sending now would lose it
+        """
+        return False
+
+    def shutdown_requested(self) -> bool:
+        """
+        :return: True if the backend wants the program to exit, for example the exit button was pushed
+        """
+        return False
+
+    def close(self) -> None:
+        """
+        release the radio
+
+        :return: None
+        """
+
+
+class RFM69Backend(RadioBackend):
+    """
+    The rfm69 radio on the adafruit radio bonnet
+    """
+
+    def __init__(self, network: bytes, frequency: float = DEFAULT_FREQUENCY, chip_select: str = DEFAULT_CHIP_SELECT,  # pylint: disable=R0913
+                 reset_pin: str = DEFAULT_RESET_PIN, watch_button: bool = True):
+        """
+        The init class for the radio, this creates the adafruit objects so it must be called where the radio is used
+
+        :param network: the 2 byte sync word
+        :param frequency: the radio frequency in MHz
+        :param chip_select: the board pin name of the chip select, CE1 on the bonnet
+        :param reset_pin: the board pin name of the reset line, D25 on the bonnet
+        :param watch_button: True to read button a on the bonnet for shutdown_requested, only one radio should
+        """
+        global _SPI_BUS  # pylint: disable=W0603
+        # Import the RFM69 radio module.
+        try:
+            import adafruit_rfm69  # pylint: disable=C0415
+        except ModuleNotFoundError as import_error:
+            print('adafruit_rfm69 not found, use the command')
+            print('use the command pip3 install adafruit-circuitpython-rfm69  [--break-system-packages] to load package')
+            raise import_error
+        # import the adafruit board io libraries.
+        try:
+            import busio  # pylint: disable=C0415
+            import board  # pylint: disable=C0415
+            from digitalio import DigitalInOut  # pylint: disable=C0415
+            from digitalio import Direction  # pylint: disable=C0415
+            from digitalio import Pull  # pylint: disable=C0415
+        except ModuleNotFoundError as import_error:
+            print('one of the above modules not found')
+            print('sudo apt-get install -y i2c-tools libgpiod-dev python3-libgpiod')
+            print('pip3 install --upgrade RPi.GPIO [--break-system-packages]')
+            print('pip3 install --upgrade adafruit-blinka [--break-system-packages]')
+            print(f'module not found error {import_error}')
+            raise import_error
+
+        self.button_a = None
+        if watch_button:
+            self.button_a = DigitalInOut(board.D5)
+            self.button_a.direction = Direction.INPUT
+            self.button_a.pull = Pull.UP
+
+        # Configure Packet Radio
+        chip_select = DigitalInOut(getattr(board, chip_select))
+        reset_radio = DigitalInOut(getattr(board, reset_pin))
+        with _SPI_LOCK:
+            if _SPI_BUS is None:
+                _SPI_BUS = busio.SPI(board.SCK, MOSI=board.MOSI, MISO=board.MISO)
+            spi = _SPI_BUS
+        # rfm69 = adafruit_rfm69.RFM69(spi, chip_select, reset_radio, 433.0, sync_word=b'\x2D\xD4')
+        self.rfm69 = adafruit_rfm69.RFM69(spi, chip_select, reset_radio, frequency, sync_word=network)
+        # the time spent in receive and send with a packet, this is the time on the spi bus including waiting for it
+        self.bus_seconds = 0.0
+
+    def receive(self, *, keep_listening: bool = True, with_header: bool = False, timeout: float = 0.5):
+        if timeout:
+            # a wait for a packet is not time on the bus
+            return self.rfm69.receive(keep_listening=keep_listening, with_header=with_header, timeout=timeout)
+        start = time.perf_counter()
+        packet = self.rfm69.receive(keep_listening=keep_listening, with_header=with_header, timeout=timeout)
+        self.bus_seconds += time.perf_counter() - start
+        return packet
+
+    def send(self, data: bytes, *, keep_listening: bool = False, destination: int = 255, node: int = 255,  # pylint: disable=R0913
+             identifier: int = 0, flags: int = 0) -> bool:
+        start = time.perf_counter()
+        sent = self.rfm69.send(data, keep_listening=keep_listening, destination=destination, node=node,
+                               identifier=identifier, flags=flags)
+        self.bus_seconds += time.perf_counter() - start
+        return sent
+
+    def listen(self) -> None:
+        self.rfm69.listen()
+
+    def attach_interrupt(self, interrupt, pin: int = None, logger=None) -> bool:
+        return interrupt.attach_gpio(pin, logger)
+
+    def channel_busy(self) -> bool:
+        # RegIrqFlags1 bit 0 is SyncAddressMatch, it is set from the sync word of a packet until the packet is read.
+        # adafruit_rfm69 has no property for it, payload_ready only covers a packet that is already in the fifo,
+        # so the register is read with the driver's private _read_u8, which takes the SPIDevice lock like the
+        # public properties do.  0x27 is the register address from the rfm69 data sheet, check it if the driver changes.
+        return bool(self.rfm69._read_u8(0x27) & 0x01) or self.rfm69.payload_ready()  # pylint: disable=W0212
+
+    def shutdown_requested(self) -> bool:
+        # button a pulls the line low when pushed
+        return self.button_a is not None and not self.button_a.value
+
+
+class CaptureBackend(RadioBackend):
+    """
+    A backend that passes everything through to another backend and records every received packet to a capture file
+    """
+
+    def __init__(self, backend: RadioBackend, file_name: str):
+        """
+        The init class for the capture backend
+
+        :param backend: the backend that does the real work
+        :param file_name: the name of the capture file, it is appended to if it exists
+        """
+        self.backend = backend
+        self.file_name = file_name
+        self.packet_count = 0
+        self.__file = open(file_name, 'ab')  # pylint: disable=R1732
+        if self.__file.tell() == 0:
+            self.__file.write(CAPTURE_MAGIC)
+
+    def receive(self, *, keep_listening: bool = True, with_header: bool = False, timeout: float = 0.5):
+        # always ask for the header so the capture is complete
+        packet = self.backend.receive(keep_listening=keep_listening, with_header=True, timeout=timeout)
+        if packet is None:
+            return None
+        self.__file.write(CAPTURE_RECORD.pack(time.time(), len(packet)))
+        self.__file.write(packet)
+        # one packet at a time, so a crash in the field loses at most the packet being written
+        self.__file.flush()
+        self.packet_count += 1
+        return packet if with_header else packet[4:]
+
+    def send(self, data: bytes, *, keep_listening: bool = False, destination: int = 255, node: int = 255,  # pylint: disable=R0913
+             identifier: int = 0, flags: int = 0) -> bool:
+        return self.backend.send(data, keep_listening=keep_listening, destination=destination, node=node,
+                                 identifier=identifier, flags=flags)
+
+    def listen(self) -> None:
+        self.backend.listen()
+
+    def attach_interrupt(self, interrupt, pin: int = None, logger=None) -> bool:
+        return self.backend.attach_interrupt(interrupt, pin, logger)
+
+    def channel_busy(self) -> bool:
+        return self.backend.channel_busy()
+
+    @property
+    def bus_seconds(self) -> float:
+        """
+        :return: the seconds the radio that does the real work spent on the spi bus
+        """
+        return self.backend.bus_seconds
+
+    def shutdown_requested(self) -> bool:
+        return self.backend.shutdown_requested()
+
+    def close(self) -> None:
+        self.__file.close()
+        self.backend.close()
+
+
+def open_backend(network: bytes, backend: RadioBackend = None, capture_file: str = None, settings: dict = None) -> RadioBackend:
+    """
+    make the backend used by the receive loop
+
+    :param network: the 2 byte sync word
+    :param backend: the backend to use, None for an rfm69
+    :param capture_file: if not None record every packet received to this file
+    :param settings: the kwargs of the radio thread, Frequency, ChipSelect, ResetPin and RadioNumber choose the rfm69,
+                     None for the one on the bonnet
+    :return: the backend
+    """
+    if backend is None:
+        settings = settings or {}
+        backend = RFM69Backend(network, settings.get('Frequency', DEFAULT_FREQUENCY), settings.get('ChipSelect', DEFAULT_CHIP_SELECT),
+                               settings.get('ResetPin', DEFAULT_RESET_PIN), watch_button=not settings.get('RadioNumber'))
+    if capture_file:
+        backend = CaptureBackend(backend, capture_file)
+    return backend
+
+
+def parse_radio(text: str, number: int, sync_word: int, interrupt_pin: int = None) -> dict:
+    """
+    read the settings of one radio from the command line, chip_select:reset_pin:frequency[:sync_word[:interrupt_pin]]
+    for example CE0:D24:915.0:0x2dd5:23, the sync word and interrupt pin default to the ones of the first radio
+
+    :param text: the radio settings
+    :param number: the number of the radio, 0 for the first
+    :param sync_word: the sync word used when the text does not have one
+    :param interrupt_pin: the DIO0 pin used when the text does not have one, None polls the radio
+    :return: a dictionary with RadioNumber, ChipSelect, ResetPin, Frequency, SyncWord and InterruptPin
+    """
+    fields = text.split(':')
+    if not 3 <= len(fields) <= 5:
+        raise ValueError(f'the radio {text} is not chip_select:reset_pin:frequency[:sync_word[:interrupt_pin]]')
+    return {'RadioNumber': number, 'ChipSelect': fields[0], 'ResetPin': fields[1], 'Frequency': float(fields[2]),
+            'SyncWord': int(fields[3], 0) if len(fields) > 3 and fields[3] else sync_word,
+            'InterruptPin': int(fields[4]) if len(fields) > 4 and fields[4] else interrupt_pin}
+
+
+def read_capture(file_name: str):
+    """
+    a generator that reads a capture file
+
+    :param file_name: the name of the capture file
+    :return: a generator of (receive time, packet) tuples
+    """
+    with open(file_name, 'rb') as capture_file:
+        if capture_file.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError(f'{file_name} is not a capture file')
+        while True:
+            record = capture_file.read(CAPTURE_RECORD.size)
+            if len(record) < CAPTURE_RECORD.size:
+                return
+            receive_time, length = CAPTURE_RECORD.unpack(record)
+            packet = capture_file.read(length)
+            if len(packet) < length:
+                # the last record was cut short when the capture was stopped
+                return
+            yield receive_time, packet
+
+
+class ReplayBackend(RadioBackend):
+    """
+    A backend that plays back a capture file, at the original rate, faster, or as fast as the receiver can take it
+    """
+
+    def __init__(self, file_name: str, speed: float = 1.0):
+        """
+        The init class for the replay backend
+
+        :param file_name: the name of the capture file
+        :param speed: 1.0 is real time, 10.0 is ten times faster, 0 is as fast as possible
+        """
+        self.file_name = file_name
+        self.speed = speed
+        self.ack_count = 0
+        self.packet_count = 0
+        # one packet deep like the radio fifo, the feeder waits for the receiver instead of dropping packets
+        self.__fifo = queue.Queue(maxsize=1)
+        self.__interrupt = None
+        self.__finished = threading.Event()
+        self.__stop = threading.Event()
+        self.__feeder = None
+
+    def __feed(self) -> None:
+        """
+        the feeder thread, it puts each packet in the fifo when it is due and fires the interrupt
+
+        :return: None
+        """
+        start = time.monotonic()
+        first_receive_time = None
+        for receive_time, packet in read_capture(self.file_name):
+            if first_receive_time is None:
+                first_receive_time = receive_time
+            if self.speed > 0:
+                due = start + (receive_time - first_receive_time) / self.speed
+                delay = due - time.monotonic()
+                if delay > 0 and self.__stop.wait(delay):
+                    return
+            while not self.__stop.is_set():
+                try:
+                    self.__fifo.put(packet, timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            if self.__interrupt is not None:
+                self.__interrupt.fire()
+        self.__finished.set()
+
+    def listen(self) -> None:
+        if self.__feeder is None:
+            self.__feeder = threading.Thread(target=self.__feed, name='replay feeder', daemon=True)
+            self.__feeder.start()
+
+    def receive(self, *, keep_listening: bool = True, with_header: bool = False, timeout: float = 0.5):
+        self.listen()
+        try:
+            packet = self.__fifo.get(timeout=timeout) if timeout else self.__fifo.get_nowait()
+        except queue.Empty:
+            return None
+        self.packet_count += 1
+        return packet if with_header else packet[4:]
+
+    def send(self, data: bytes, *, keep_listening: bool = False, destination: int = 255, node: int = 255,  # pylint: disable=R0913
+             identifier: int = 0, flags: int = 0) -> bool:
+        # nobody is listening for the acks, just count them
+        self.ack_count += 1
+        return True
+
+    def attach_interrupt(self, interrupt, pin: int = None, logger=None) -> bool:
+        self.__interrupt = interrupt
+        return True
+
+    def shutdown_requested(self) -> bool:
+        # stop when the whole capture has been received
+        return self.__finished.is_set() and self.__fifo.empty()
+
+    def close(self) -> None:
+        self.__stop.set()
+        if self.__feeder is not None:
+            self.__feeder.join()
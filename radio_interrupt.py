@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# When the rfm69 is in receive mode the library maps DIO0 to PayloadReady.  On the radio bonnet DIO0 is wired to gpio 22,
+# so a rising edge on gpio 22 means there is a packet waiting in the fifo.
+# The blinka DigitalInOut class cannot deliver edge events, so RPi.GPIO is used directly for the interrupt.
+
+import threading
+import time
+
+RECEIVE_MODE_INTERRUPT = 'interrupt'
+RECEIVE_MODE_POLL = 'poll'
+
+
+class PayloadReadyInterrupt:
+    """
+    A class that turns the payload ready edge on DIO0 into a thread safe wake up
+    """
+
+    def __init__(self):
+        """
+        The init class for the interrupt, it is not attached to a pin until attach_gpio is called
+        """
+        self.__event = threading.Event()
+        self.__pin = None
+        self.__gpio = None
+        self.count = 0
+
+    def fire(self, channel=None) -> None:  # pylint: disable=W0613
+        """
+        The interrupt callback, this is called from the RPi.GPIO event thread or the simulator
+
+        :param channel: the gpio channel that caused the interrupt, not used
+        :return: None
+        """
+        self.count += 1
+        self.__event.set()
+
+    def wait(self, timeout: float) -> bool:
+        """
+        wait for the interrupt to fire
+
+        :param timeout: the maximum time in seconds to wait
+        :return: True if the interrupt fired, False if the wait timed out
+        """
+        fired = self.__event.wait(timeout)
+        # clear before the caller drains the radio, so an edge that arrives while draining is not lost
+        self.__event.clear()
+        return fired
+
+    def attach_gpio(self, pin: int, logger=None) -> bool:
+        """
+        attach the interrupt to a broadcom gpio pin
+
+        :param pin: the bcm gpio number connected to DIO0
+        :param logger: the logger, may be None
+        :return: True if the interrupt is attached, False if RPi.GPIO is not usable and the caller must poll
+        """
+        try:
+            import RPi.GPIO as GPIO  # pylint: disable=C0415
+        except (ModuleNotFoundError, RuntimeError) as import_error:
+            if logger:
+                logger.info('RPi.GPIO is not usable, error=%s, falling back to polling', import_error)
+            return False
+        try:
+            GPIO.setmode(GPIO.BCM)
+            # DIO0 is active high
+            GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
+            GPIO.add_event_detect(pin, GPIO.RISING, callback=self.fire)
+        except (RuntimeError, ValueError) as error:
+            if logger:
+                logger.info('could not add edge detect on gpio %s, error=%s, falling back to polling', pin, error)
+            return False
+        self.__pin = pin
+        self.__gpio = GPIO
+        return True
+
+    def detach(self) -> None:
+        """
+        remove the edge detect from the gpio pin if one was attached
+
+        :return: None
+        """
+        if self.__gpio is not None:
+            self.__gpio.remove_event_detect(self.__pin)
+            self.__gpio = None
+            self.__pin = None
+
+
+class PacketWaiter:
+    """
+    Wait for packets from the radio, either by waiting for the payload ready interrupt or by polling
+    """
+
+    def __init__(self, radio, interrupt: PayloadReadyInterrupt = None, stop_event: threading.Event = None):
+        """
+        The init class for the packet waiter
+
+        :param radio: the radio, it must have the receive and listen methods of adafruit_rfm69.RFM69
+        :param interrupt: the payload ready interrupt, if None the radio is polled
+        :param stop_event: an event that ends the polling sleep early, may be None
+        """
+        self.radio = radio
+        self.interrupt = interrupt
+        self.stop_event = stop_event
+
+    @property
+    def mode(self) -> str:
+        """
+        the receive mode in use
+
+        :return: RECEIVE_MODE_INTERRUPT or RECEIVE_MODE_POLL
+        """
+        return RECEIVE_MODE_POLL if self.interrupt is None else RECEIVE_MODE_INTERRUPT
+
+    def packets(self, timeout: float):
+        """
+        a generator that yields the packets received within one wait
+
+        In interrupt mode it blocks until the interrupt fires or the timeout expires, then drains the radio.
+        In poll mode it does one receive and then sleeps for the timeout, which is the original behavior.
+
+        :param timeout: the maximum time to wait in seconds
+        :return: a generator of packets with the 4 byte header
+        """
+        if self.interrupt is None:
+            packet = self.radio.receive(with_header=True)
+            if packet is not None:
+                yield packet
+            if self.stop_event is None:
+                time.sleep(timeout)
+            else:
+                self.stop_event.wait(timeout)
+            return
+
+        # make sure the radio is in receive mode, DIO0 is only mapped to payload ready in receive mode
+        self.radio.listen()
+        if not self.interrupt.wait(timeout):
+            return
+        while True:
+            packet = self.radio.receive(with_header=True, timeout=0)
+            if packet is None:
+                return
+            yield packet
@@ -0,0 +1,353 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# A stand in for the rfm69 radio and the DIO0 interrupt line so the receive path can be measured without hardware.
+# Like the real radio the simulated radio has room for one packet.  A packet that arrives while the fifo is full is lost.
+# With an air time a packet takes that long to arrive, and it is lost if the radio sends during it or is not listening
+# when it starts, and with a send time the radio is deaf while it sends, so the cost of sending acks can be measured.
+# Several simulated radios can share a SimulatedSPIBus, reading a packet holds the bus for a time for each byte,
+# so a gateway with many radios can be measured to see when the shared bus limits the packets received.
+#
+# run it with python radio_simulator.py --mode interrupt --count 200 --interval 0.05
+# or python radio_simulator.py --radios 4 --count 200 --interval 0.01 --byte_time 0.0001
+
+import argparse
+import statistics
+import threading
+import time
+
+import packet_decoder
+import position_table
+import radio_backend
+import radio_interrupt
+
+
+class SimulatedSPIBus:  # pylint: disable=R0903
+    """
+    The spi bus shared by simulated radios, one transfer at a time
+    """
+
+    def __init__(self, byte_time: float = 0.0):
+        """
+        The init class for the bus
+
+        :param byte_time: the seconds to move one byte, the rfm69 fifo is read with one transfer for each byte plus the address
+        """
+        self.byte_time = byte_time
+        self.lock = threading.Lock()
+        self.busy_seconds = 0.0
+
+    def transfer(self, length: int) -> float:
+        """
+        hold the bus for a transfer
+
+        :param length: the bytes moved
+        :return: the seconds from asking for the bus to the end of the transfer
+        """
+        start = time.perf_counter()
+        with self.lock:
+            if self.byte_time:
+                time.sleep(length * self.byte_time)
+            self.busy_seconds += length * self.byte_time
+        return time.perf_counter() - start
+
+
+class SimulatedRFM69(radio_backend.RadioBackend):
+    """
+    A simulated rfm69 radio that has the receive, send and listen methods used by this program
+    """
+
+    def __init__(self, air_time: float = 0.0, send_time: float = 0.0, bus: SimulatedSPIBus = None):
+        """
+        The init class for the simulated radio
+
+        :param air_time: the seconds a packet takes to arrive, 0 puts it in the fifo at once
+        :param send_time: the seconds a send keeps the radio out of receive mode
+        :param bus: the spi bus shared with other radios, None for a radio that does not wait for a bus
+        """
+        self.bus = bus
+        self.bus_seconds = 0.0
+        self.__condition = threading.Condition()
+        self.__fifo = None
+        self.__interrupt = None
+        self.__receiving_until = 0.0
+        self.__corrupted = False
+        self.air_time = air_time
+        self.send_time = send_time
+        self.listening = False
+        self.sent = []
+        self.injected = 0
+        self.dropped = 0
+        self.received = 0
+        # packets lost because the radio sent while they were arriving
+        self.collisions = 0
+
+    def attach_interrupt(self, interrupt, pin: int = None, logger=None) -> bool:
+        """
+        connect the simulated DIO0 line to a PayloadReadyInterrupt
+
+        :param interrupt: the PayloadReadyInterrupt to fire when a packet is ready
+        :param pin: not used
+        :param logger: not used
+        :return: True
+        """
+        self.__interrupt = interrupt
+        return True
+
+    def inject(self, packet: bytes) -> bool:
+        """
+        simulate a packet arriving over the air, with an air time this blocks the caller for the air time
+
+        :param packet: the packet including the 4 byte header
+        :return: True if the packet was put in the fifo, False if it was lost
+        """
+        if self.air_time:
+            with self.__condition:
+                now = time.monotonic()
+                if not self.listening or now < self.__receiving_until:
+                    # sending, or another packet is on the air and the two collide
+                    self.injected += 1
+                    self.dropped += 1
+                    return False
+                self.__receiving_until = now + self.air_time
+                self.__corrupted = False
+            time.sleep(self.air_time)
+        with self.__condition:
+            self.injected += 1
+            if self.__corrupted:
+                self.__corrupted = False
+                self.collisions += 1
+                self.dropped += 1
+                return False
+            if self.__fifo is not None or not self.listening:
+                self.dropped += 1
+                return False
+            self.__fifo = bytes(packet)
+            self.__condition.notify_all()
+        if self.__interrupt is not None:
+            self.__interrupt.fire()
+        return True
+
+    def listen(self) -> None:
+        """
+        put the radio in receive mode
+
+        :return: None
+        """
+        self.listening = True
+
+    def idle(self) -> None:
+        """
+        put the radio in idle mode, packets that arrive are lost
+
+        :return: None
+        """
+        self.listening = False
+
+    def payload_ready(self) -> bool:
+        """
+        :return: True if there is a packet in the fifo
+        """
+        return self.__fifo is not None
+
+    def channel_busy(self) -> bool:
+        """
+        :return: True if a packet is arriving or is waiting in the fifo
+        """
+        return self.__fifo is not None or time.monotonic() < self.__receiving_until
+
+    def receive(self, *, keep_listening: bool = True, with_header: bool = False, timeout: float = 0.5):
+        """
+        receive a packet, this has the same signature as adafruit_rfm69.RFM69.receive
+
+        :param keep_listening: if True stay in receive mode after the packet is read
+        :param with_header: if True return the 4 byte header with the packet
+        :param timeout: the time in seconds to wait for a packet
+        :return: the packet, or None if the receive timed out
+        """
+        self.listening = True
+        with self.__condition:
+            if self.__fifo is None and timeout:
+                self.__condition.wait_for(self.payload_ready, timeout)
+            packet = self.__fifo
+            self.__fifo = None
+        self.listening = keep_listening
+        if packet is None:
+            return None
+        if self.bus is not None:
+            # the fifo address byte and the packet
+            self.bus_seconds += self.bus.transfer(len(packet) + 1)
+        self.received += 1
+        return packet if with_header else packet[4:]
+
+    def send(self, data: bytes, *, keep_listening: bool = False, destination: int = 255, node: int = 255,  # pylint: disable=R0913
+             identifier: int = 0, flags: int = 0) -> bool:
+        """
+        record a packet sent by the receiver, normally an ack
+
+        :return: True
+        """
+        if self.send_time:
+            with self.__condition:
+                self.listening = False
+                if time.monotonic() < self.__receiving_until:
+                    self.__corrupted = True
+            time.sleep(self.send_time)
+        self.sent.append((bytes([destination, node, identifier, flags]) + bytes(data)))
+        self.listening = keep_listening
+        return True
+
+
+def make_packet(identifier: int, source: int = 1, destination: int = 2,
+                payload: bytes = b'KF4WBK,171207.000,A,3557.3377,N,07901.1607,W,120923') -> bytes:
+    """
+    make a packet like the one sent by the gps transmitter
+
+    :param identifier: the sequence number put in header byte 2
+    :param source: the address of the transmitter
+    :param destination: the address of this receiver
+    :param payload: the payload after the header
+    :return: the packet
+    """
+    return bytes([destination, source, identifier & 0xff, 0]) + payload
+
+
+def measure_receive_latency(mode: str = radio_interrupt.RECEIVE_MODE_INTERRUPT, count: int = 100,
+                            interval: float = 0.05, sleep_time: float = 1.0) -> dict:
+    """
+    send packets through the simulated radio and measure the time from arrival to publish and the missed packet rate
+
+    :param mode: RECEIVE_MODE_INTERRUPT or RECEIVE_MODE_POLL
+    :param count: the number of packets to send
+    :param interval: the time in seconds between packets
+    :param sleep_time: the receive loop sleep time, the same as --sleep_time
+    :return: a dictionary with the latency statistics in seconds and the missed packet rate
+    """
+    radio = SimulatedRFM69()
+    stop_event = threading.Event()
+    interrupt = None
+    if mode == radio_interrupt.RECEIVE_MODE_INTERRUPT:
+        interrupt = radio_interrupt.PayloadReadyInterrupt()
+        radio.attach_interrupt(interrupt)
+    waiter = radio_interrupt.PacketWaiter(radio, interrupt, stop_event)
+    radio.listen()
+
+    arrival_times = {}
+    latencies = []
+
+    def receive_loop():
+        while not stop_event.is_set():
+            for packet in waiter.packets(sleep_time):
+                latencies.append(time.monotonic() - arrival_times[packet[2]])
+
+    receive_thread = threading.Thread(target=receive_loop, name='simulated receive')
+    receive_thread.start()
+    for identifier in range(count):
+        arrival_times[identifier & 0xff] = time.monotonic()
+        radio.inject(make_packet(identifier))
+        time.sleep(interval)
+    # give the receiver one more loop to pick up the last packet
+    time.sleep(sleep_time)
+    stop_event.set()
+    receive_thread.join()
+
+    return {
+        'mode': waiter.mode,
+        'sent': count,
+        'published': len(latencies),
+        'missed_rate': (count - len(latencies)) / count if count else 0.0,
+        'median_latency': statistics.median(latencies) if latencies else None,
+        'max_latency': max(latencies) if latencies else None,
+    }
+
+
+def measure_radios(radios: int = 2, count: int = 100, interval: float = 0.05, byte_time: float = 0.0) -> dict:  # pylint: disable=R0914
+    """
+    send packets to several simulated radios on one spi bus at the same time, each radio has its own receive thread,
+    and all of them put their fixes into one position table
+
+    :param radios: the number of radios
+    :param count: the packets sent to each radio
+    :param interval: the time in seconds between packets to each radio
+    :param byte_time: the seconds to move one byte on the bus
+    :return: a dictionary with the packets published from each radio and the fraction of the time the bus was busy
+    """
+    bus = SimulatedSPIBus(byte_time)
+    table = position_table.PositionTable()
+    stop_event = threading.Event()
+    simulated = [SimulatedRFM69(bus=bus) for _ in range(radios)]
+    published = [0] * radios
+
+    def receive_loop(number: int):
+        radio = simulated[number]
+        interrupt = radio_interrupt.PayloadReadyInterrupt()
+        radio.attach_interrupt(interrupt)
+        waiter = radio_interrupt.PacketWaiter(radio, interrupt, stop_event)
+        decoder = packet_decoder.PacketDecoder(number)
+        while not stop_event.is_set():
+            for packet in waiter.packets(0.1):
+                fix = decoder.decode(packet)
+                if fix is not None:
+                    table.insert(fix)
+                    published[number] += 1
+
+    def transmit_loop(number: int):
+        for identifier in range(count):
+            # a different source on each network
+            simulated[number].inject(make_packet(identifier, source=number + 1))
+            time.sleep(interval)
+
+    receivers = [threading.Thread(target=receive_loop, args=(number,), name=f'simulated radio {number}') for number in range(radios)]
+    transmitters = [threading.Thread(target=transmit_loop, args=(number,), name=f'transmitter {number}') for number in range(radios)]
+    for radio in simulated:
+        radio.listen()
+    for thread in receivers:
+        thread.start()
+    start = time.perf_counter()
+    for thread in transmitters:
+        thread.start()
+    for thread in transmitters:
+        thread.join()
+    time.sleep(0.2)
+    elapsed = time.perf_counter() - start
+    stop_event.set()
+    for thread in receivers:
+        thread.join()
+    return {
+        'radios': radios,
+        'sent': radios * count,
+        'published': sum(published),
+        'bus_utilization': bus.busy_seconds / elapsed,
+        'per_radio': [{'radio': number, 'published': published[number], 'dropped': radio.dropped,
+                       'packets_per_second': published[number] / elapsed, 'bus_seconds': round(radio.bus_seconds, 6)}
+                      for number, radio in enumerate(simulated)],
+        'sources_in_table': len(table.sources()),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--mode', default=radio_interrupt.RECEIVE_MODE_INTERRUPT,
+                        choices=[radio_interrupt.RECEIVE_MODE_INTERRUPT, radio_interrupt.RECEIVE_MODE_POLL],
+                        help='the receive mode default = %(default)s)')
+    parser.add_argument('--count', type=int, default=100, help='the number of packets to send default = %(default)s)')
+    parser.add_argument('--interval', type=float, default=0.05, help='the time between packets default = %(default)s)')
+    parser.add_argument('--sleep_time', type=float, default=1.0, help='the receive loop sleep time default = %(default)s)')
+    parser.add_argument('--radios', type=int, default=1, help='more than 1 measures radios sharing one spi bus default = %(default)s)')
+    parser.add_argument('--byte_time', type=float, default=0.0, help='the seconds to move one byte on the spi bus default = %(default)s)')
+    arguments = parser.parse_args()
+    if arguments.radios > 1:
+        print(measure_radios(arguments.radios, arguments.count, arguments.interval, arguments.byte_time))
+    else:
+        print(measure_receive_latency(arguments.mode, arguments.count, arguments.interval, arguments.sleep_time))
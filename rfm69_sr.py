@@ -49,6 +49,8 @@
 # sudo apt-get install python3-pil
 # pip3 install  adafruit-circuitpython-ssd1306 --break-system-packages
 # pip3 install adafruit-circuitpython-rfm69 --break-system-packages
+# the adafruit modules are imported by the stage that uses them, so a receiver run with --headless or --disable display
+# does not need the display modules, see pipeline_config.py
 # Import Python System Libraries
 
 import argparse
@@ -56,7 +58,6 @@ import atexit
 import logging
 import logging.config
 import logging.handlers
-import queue
 import os
 import re
 import subprocess
@@ -64,58 +65,67 @@ import sys
 import threading
 import time
 
-# import the SSD1306 module.
-try:
-    import adafruit_ssd1306
-except ModuleNotFoundError as import_error:
-    print('adafruit_ssd1306 not found, use the command')
-    print('use the command pip3 install  adafruit-circuitpython-ssd1306 [--break-system-packages] to load package')
-    raise import_error
-
-# Import the RFM69 radio module.
-try:
-    import adafruit_rfm69
-except ModuleNotFoundError as import_error:
-    print('adafruit_rfm69 not found, use the command')
-    print('use the command pip3 install adafruit-circuitpython-rfm69  [--break-system-packages] to load package')
-    raise import_error
-# import the adafruit board io libraries.
-try:
-    import busio
-    import board
-    from digitalio import DigitalInOut
-    from digitalio import Direction
-    from digitalio import Pull
-except ModuleNotFoundError as import_error:
-    print('one of the above modules not found')
-    print('sudo apt-get install -y i2c-tools libgpiod-dev python3-libgpiod')
-    print('pip3 install --upgrade RPi.GPIO [--break-system-packages]')
-    print('pip3 install --upgrade adafruit-blinka [--break-system-packages]')
-    print(f'module not found error {import_error}')
-    raise import_error
-
-# local imports
-import lock_and_data
+# local imports, the modules of the optional stages are imported by the stage that uses them
 import bluetooth_thread
+import metrics
+import packet_decoder
+import packet_dedup
+import pipeline_config
+import position_fix
 import position_logging
+import position_table
+import position_writer
+import radio_backend
 import radio_constants
+import radio_interrupt
+import transmit_scheduler
+
+
+def import_display_modules() -> tuple:
+    """
+    import the adafruit modules for the display, only when the display is used
+    the RFM69 radio module is imported by radio_backend.RFM69Backend
+
+    :return: a tuple of the adafruit_ssd1306, busio and board modules
+    """
+    # import the SSD1306 module.
+    try:
+        import adafruit_ssd1306  # pylint: disable=C0415
+    except ModuleNotFoundError as import_error:
+        print('adafruit_ssd1306 not found, use the command')
+        print('use the command pip3 install  adafruit-circuitpython-ssd1306 [--break-system-packages] to load package')
+        raise import_error
+    # import the adafruit board io libraries.
+    try:
+        import busio  # pylint: disable=C0415
+        import board  # pylint: disable=C0415
+    except ModuleNotFoundError as import_error:
+        print('one of the above modules not found')
+        print('sudo apt-get install -y i2c-tools libgpiod-dev python3-libgpiod')
+        print('pip3 install --upgrade RPi.GPIO [--break-system-packages]')
+        print('pip3 install --upgrade adafruit-blinka [--break-system-packages]')
+        print(f'module not found error {import_error}')
+        raise import_error
+    return adafruit_ssd1306, busio, board
 
 
 class DisplayLocation(threading.Thread):
     """
     this is a thread class for the bluetooth radio
     """
-    __slots__ = ['name', 'args', 'lock_location_class', 'event']
+    __slots__ = ['name', 'args', 'kwargs', 'lock_location_class', 'event', 'display_source', 'page_interval', 'metrics']
 
-    def __init__(self, name: str, *args: list):
+    def __init__(self, name: str, *args: list, **kwargs: dict):
         """
         this is the init class for the thread
 
         :param name: The name of the thread
-        :param args: The args, gps_lock_and_location, event, network, log.log, args.sleep_time
-        :param kwargs: Not used
+        :param args: The args, position_table, event, network, log.log, args.sleep_time
+        :param kwargs: an optional dictionary with the source address to display, example {'DisplaySource': 1}
+                        if the display source is None and more than one source is heard they are shown in turn,
+                        each for PageInterval seconds, and an optional metrics.MetricsRegistry, example {'Metrics': registry}
         """
-        super().__init__(name=name, args=args)
+        super().__init__(name=name, args=args, kwargs=kwargs)
 
         if args is None:
             raise ValueError('Args cannot be None')
@@ -124,11 +134,19 @@ class DisplayLocation(threading.Thread):
             raise ValueError()
         self.args = args
         self.lock_location_class, self.event, self.network, self.logger, self.sleep_time_in_sec = self.args  # pylint: disable=W0632
+        self.kwargs = kwargs
+        self.display_source = self.kwargs.get('DisplaySource')
+        self.page_interval = self.kwargs.get('PageInterval', 5.0)
+        self.metrics = metrics.registry_from(self.kwargs)
 
-    def run(self):
+    @staticmethod
+    def make_display():
         """
-        This overrides run on the threading class
+        create the ssd1306 display on the bonnet, this must be called where the display is used
+
+        :return: the display_renderer.DisplayRenderer that draws on the display
         """
+        adafruit_ssd1306, busio, board = import_display_modules()
         # Create the I2C interface.
         i2c = busio.I2C(board.SCL, board.SDA)
         # this is the degree sign for displaying to the display and is specific to the font5x8
@@ -136,42 +154,66 @@ class DisplayLocation(threading.Thread):
         # minutes_sign = u"\u0027"
         # now display the data
         display = adafruit_ssd1306.SSD1306_I2C(128, 32, i2c, addr=0x3c)
+        # clear what was left on the display, after this only the changed columns are sent
+        display.fill(0)
+        display.show()
+        import display_renderer  # pylint: disable=C0415
+        return display_renderer.DisplayRenderer(display_renderer.SSD1306Device(display))
+
+    @staticmethod
+    def draw_fix(display, fix, counter: int, title: str = 'Remote Location') -> int:
+        """
+        draw a fix on the display
+
+        :param display: the display_renderer.DisplayRenderer from make_display
+        :param fix: the position_fix.PositionFix or None if there is no fix yet
+        :param counter: the counter shown after the callsign so a new fix can be seen
+        :param title: the title line
+        :return: the next counter
+        """
+        if fix is None:
+            lines = [title, 'not valid no_packet']
+        elif not fix.valid:
+            # the packet does not have a valid gps location
+            lines = [title, f'not valid {fix.callsign}']
+        else:
+            lines = [title, fix.latitude_text, fix.longitude_text,
+                     f'pv={radio_constants.POSITION_VALID_VALUE}, {fix.callsign} {counter & 0xf:01x}']
+            counter = counter + 1 if counter < 16 else 0
+        display.render(lines)
+        return counter
+
+    def run(self):
+        """
+        This overrides run on the threading class
+        """
+        import display_renderer  # pylint: disable=C0415
+        display = self.make_display()
+        pager = display_renderer.SourcePager(self.page_interval)
+        latency = self.metrics.histogram('rfm69_stage_latency_seconds', 'The time from receiving a packet to each stage', stage='display')
+        loops = self.metrics.counter('rfm69_loop_iterations_total', 'The passes through the loop of each thread', thread='display')
+        self.metrics.counter('rfm69_display_bytes_total', 'The bytes sent to the display', lambda: display.device.bytes_sent)
         counter = 0
+        # False so the first pass draws even when there is no fix yet
+        last_fix = False
+        last_title = None
         # run around in loop getting data
         while True:
-            display.fill(0)
-            display.text('Remote Location', 0, 0, 1)
-            display.show()
-
-            packet_list = self.lock_location_class.data
-
-            if packet_list is None:
-                display.text('not valid no_packet', 0, 8, 1)
-                display.show()
-                time.sleep(1)
-                continue
-
-            callsign = packet_list[radio_constants.CALLSIGN]
-            # test to see if the position is valid
-            if packet_list[radio_constants.POSITION_VALID] == radio_constants.POSITION_NOT_VALID_VALUE:
-                # the packet does not have a valid gps location
-                display.text(f'not valid {callsign}', 0, 8, 1)
-                display.show()
-                continue
-
-            # latitude has the form of Latitude (DDmm.mm)
-            latitude = packet_list[radio_constants.LATITUDE]
-            longitude = packet_list[radio_constants.LONGITUDE]
-
-            display.text(latitude, 0, 8, 1)
-            display.text(longitude, 0, 16, 1)
-            display.text(f'pv={packet_list[radio_constants.POSITION_VALID]}, {callsign} {counter & 0xf:01x}', 0, 24, 1)
-            display.show()
-            counter = counter + 1 if counter < 16 else 0
             # test to see if is time to exit
-            if self.event.is_set():
+            if self.event.is_set() or self.lock_location_class.closed:
                 return
-            time.sleep(self.sleep_time_in_sec)
+            loops.inc()
+            version = self.lock_location_class.version
+            fix, title, next_page = display_renderer.page_fix(self.lock_location_class, pager, self.display_source)
+            if fix is not last_fix or title != last_title:
+                last_fix, last_title = fix, title
+                counter = self.draw_fix(display, fix, counter, title)
+                if fix is not None and self.metrics.enabled:
+                    latency.observe(time.time() - fix.received)
+            # nothing is redrawn until a new fix is published or it is time for the next transmitter,
+            # the sleep time is only the deadline to look at the event
+            timeout = self.sleep_time_in_sec if next_page is None else min(self.sleep_time_in_sec, next_page)
+            self.lock_location_class.wait_for_update(version, timeout)
 
 
 class ReceiveRFM69Data(threading.Thread):
@@ -179,18 +221,29 @@ class ReceiveRFM69Data(threading.Thread):
     the class to receive from th rfm69 radio module on the feather
     """
     # prevent adding external weak adds
-    __slots__ = ['name', 'args', 'lock_location_class', 'event', 'network']
+    __slots__ = ['name', 'args', 'kwargs', 'lock_location_class', 'event', 'network', 'receive_mode', 'interrupt_pin',
+                 'radio_backend', 'capture_file', 'radio_number', 'decoder', 'dedup', 'metrics', 'packets_received_count', 'bytes_received']
 
-    def __init__(self, name: str, *args: list) -> None:
+    def __init__(self, name: str, *args: list, **kwargs: dict) -> None:
         """
         The init function is empty for now.
 
         :param name: name the name of the thread
         :param args: the list containing the event, network, log_function and the sleep time
+        :param kwargs: an optional dictionary with the receive mode, the interrupt pin, the radio backend, the capture file,
+                        the duplicate window and the ack scheduling
+                        example {'ReceiveMode': 'interrupt', 'InterruptPin': 22, 'RadioBackend': None, 'CaptureFile': None,
+                        'DedupWindow': 32, 'DedupMaxAge': 60.0, 'AckMaxDefer': 0.1, 'CarrierSense': True}
+                        and an optional metrics.MetricsRegistry, example {'Metrics': registry}
+                        if the radio backend is None the rfm69 on the bonnet is used, a DedupWindow of 0 processes every packet
+                        for a gateway with more than one radio, the number of this radio and its pins and frequency
+                        example {'RadioNumber': 1, 'ChipSelect': 'CE0', 'ResetPin': 'D24', 'Frequency': 915.0}
+                        the fixes are tagged with the radio number, an InterruptPin of None polls the radio
         """
-        super().__init__(name=name, args=args)
+        super().__init__(name=name, args=args, kwargs=kwargs)
         self.name = name
         self.args = args
+        self.kwargs = kwargs
 
         if args is None:
             raise ValueError('args cannot be None')
@@ -199,6 +252,28 @@ class ReceiveRFM69Data(threading.Thread):
         self.network = self.args[2]
         self.logger: logging = self.args[3]
         self.sleep_time_in_sec = self.args[4]
+        self.receive_mode = self.kwargs.get('ReceiveMode', radio_interrupt.RECEIVE_MODE_INTERRUPT)
+        self.interrupt_pin = self.kwargs.get('InterruptPin', 22)
+        self.radio_backend = self.kwargs.get('RadioBackend')
+        self.capture_file = self.kwargs.get('CaptureFile')
+        self.radio_number = self.kwargs.get('RadioNumber', 0)
+        if self.interrupt_pin is None:
+            self.receive_mode = radio_interrupt.RECEIVE_MODE_POLL
+        self.decoder = packet_decoder.PacketDecoder(self.radio_number)
+        self.dedup = packet_dedup.make_deduplicator(self.kwargs)
+        self.metrics = metrics.registry_from(self.kwargs)
+        radio = str(self.radio_number)
+        self.packets_received = self.metrics.counter('rfm69_packets_received_total', 'Packets read from the radio', radio=radio)
+        self.packets_rejected = self.metrics.counter('rfm69_packets_rejected_total', 'Packets the decoder rejected', radio=radio)
+        self.packets_duplicate = self.metrics.counter('rfm69_packets_duplicate_total', 'Resent packets that were not decoded again',
+                                                      radio=radio)
+        self.decode_seconds = self.metrics.histogram('rfm69_decode_seconds', 'The time to decode a packet', radio=radio)
+        self.publish_latency = self.metrics.histogram('rfm69_stage_latency_seconds', 'The time from receiving a packet to each stage',
+                                                      stage='publish', radio=radio)
+        self.loops = self.metrics.counter('rfm69_loop_iterations_total', 'The passes through the loop of each thread', thread='radio',
+                                          radio=radio)
+        self.packets_received_count = 0
+        self.bytes_received = 0
 
     def run(self):
         """
@@ -206,79 +281,111 @@ class ReceiveRFM69Data(threading.Thread):
 
         It does not exit and it does not return
         """
-        button_a = DigitalInOut(board.D5)
-        button_a.direction = Direction.INPUT
-        button_a.pull = Pull.UP
-
-        # board interrupt ping gpio 22
-        gpio22 = DigitalInOut(board.D22)
-        gpio22.direction = Direction.INPUT
-        gpio22.pull = Pull.UP
-
-        # Configure Packet Radio
-        chip_select = DigitalInOut(board.CE1)
-        reset_radio = DigitalInOut(board.D25)
-        spi = busio.SPI(board.SCK, MOSI=board.MOSI, MISO=board.MISO)
-        # rfm69 = adafruit_rfm69.RFM69(spi, chip_select, reset_radio, 433.0, sync_word=b'\x2D\xD4')
-        rfm69 = adafruit_rfm69.RFM69(spi, chip_select, reset_radio, 433.0, sync_word=self.network)
-        while True:
-            if not button_a.value:
-                # Send Button A
-                # button_a_data = bytes("Button A!\r\n", "utf-8")
-                self.event.set()
-                time.sleep(1)
-                return
-            # check for packet rx
-            packet = rfm69.receive(with_header=True)
-            if packet is not None:
-                # send the data to data class
-                header = packet[0:4]
-                processed_packet = packet[4:]
-
-                packet_text = str(processed_packet, "utf-8")
-                # self.log(f'packet.txt={packet_text}')
-                packet_list = packet_text.split(',')
-                self.logger.info(f'packet_list={packet_list}')
-                time_of_fix = packet_list[radio_constants.TIME_OF_FIX]
-                packet_list[radio_constants.TIME_OF_FIX] = time_of_fix[0:2] + ":" + time_of_fix[2:4] + ":" + time_of_fix[4:]
-                date_of_fix = packet_list[radio_constants.FIX_DATE]
-                packet_list[radio_constants.FIX_DATE] = date_of_fix[0:2] + ":" + date_of_fix[2:4] + ':' + date_of_fix[4:]
-
-                # from nemas to hours minutes for latitude and longitude
-                latitude_unprocessed = packet_list[radio_constants.LATITUDE]
-                longitude_unprocessed = packet_list[radio_constants.LONGITUDE]
-                lat_degrees = latitude_unprocessed[:2]
-                lat_ms = latitude_unprocessed[2:]
-                latitude = f'{float(lat_degrees) +  float(lat_ms) / 60:2.7f}'.zfill(9)
-
-                long_degrees = longitude_unprocessed[:3]
-                long_ms = longitude_unprocessed[3:]
-                # longitude = "{:3.7f}".format(float(long_degrees) + float(long_ms) / 60).zfill(10)
-                longitude = f"{float(long_degrees) + float(long_ms) / 60:3.7f}".zfill(10)
-
-                north_south = '' if packet_list[radio_constants.LATITUDE_NS] == 'N' else '-'
-                east_west = '' if packet_list[radio_constants.LONGITUDE_EW] == 'E' else '-'
-
-                self.logger.info(f'thread_name={self.name}, position = {north_south}{latitude}, {east_west}{longitude} ')
-
-                packet_list[radio_constants.LATITUDE] = north_south + latitude
-                packet_list[radio_constants.LONGITUDE] = east_west + longitude
-                self.logger.debug(f'radio long={packet_list[radio_constants.LATITUDE]}, {packet_list[radio_constants.LONGITUDE]}')
-
-                self.lock_location_class.data = packet_list
-                # see if the position is not valid
-                if packet_list[radio_constants.POSITION_VALID] == radio_constants.POSITION_NOT_VALID_VALUE:
-                    # the packet does not have a valid gps location
-                    self.lock_location_class.data = 'not valid'
-                    time.sleep(self.sleep_time_in_sec)
-                    continue
-                # longitude has the form Longitude (DDDmm.mm)
-                ack_data = bytes('a', 'utf-8')
-                # create of tuple of to, from, id, status,
-                # ack_tuple = (header[1], header[0], header[2], 0x80)
-                self.logger.info('got a valid packet send ack')
-                rfm69.send(ack_data, destination=header[1], node=header[0], identifier=header[2], flags=0x80)
-            time.sleep(self.sleep_time_in_sec)
+        # the radio is created here so that the adafruit objects belong to the radio thread
+        rfm69 = radio_backend.open_backend(self.network, self.radio_backend, self.capture_file, self.kwargs)
+        started = time.monotonic()
+
+        # board interrupt ping gpio 22, this is DIO0 which is payload ready in receive mode
+        interrupt = None
+        if self.receive_mode == radio_interrupt.RECEIVE_MODE_INTERRUPT:
+            interrupt = radio_interrupt.PayloadReadyInterrupt()
+            if not rfm69.attach_interrupt(interrupt, self.interrupt_pin, self.logger):
+                interrupt = None
+        packet_waiter = radio_interrupt.PacketWaiter(rfm69, interrupt, self.event)
+        self.logger.info('radio %d receive mode = %s', self.radio_number, packet_waiter.mode)
+        # the acks are queued while the packets are drained and sent when the channel is quiet
+        scheduler = transmit_scheduler.make_scheduler(rfm69, self.kwargs)
+        radio = str(self.radio_number)
+        self.metrics.gauge('rfm69_transmit_queue_depth', 'The acks and frames waiting to be sent', lambda: scheduler.pending, radio=radio)
+        self.metrics.counter('rfm69_acks_sent_total', 'The acks sent', lambda: scheduler.acks_sent, radio=radio)
+        self.metrics.counter('rfm69_radio_bytes_total', 'The bytes read from each radio', lambda: self.bytes_received, radio=radio)
+        self.metrics.counter('rfm69_radio_bus_seconds_total', 'The seconds each radio spent on the shared spi bus',
+                             lambda: rfm69.bus_seconds, radio=radio)
+
+        try:
+            while True:
+                # button a on the bonnet, or the end of a replay
+                if rfm69.shutdown_requested():
+                    self.event.set()
+                    # wake the threads waiting for a new fix so they see the event now
+                    self.lock_location_class.close()
+                    time.sleep(1)
+                    return
+                if self.event.is_set():
+                    return
+                self.loops.inc()
+                # check for packet rx, in interrupt mode this wakes up as soon as a packet arrives,
+                # the wait is shorter while an ack is waiting for the channel
+                for packet in packet_waiter.packets(scheduler.wait_time(self.sleep_time_in_sec)):
+                    self.process_packet(scheduler, packet)
+                scheduler.transmit()
+        finally:
+            if interrupt is not None:
+                interrupt.detach()
+            rfm69.close()
+            if self.dedup is not None:
+                self.logger.info('duplicate packets %s', self.dedup.statistics())
+            self.logger.info('transmit %s', scheduler.statistics())
+            self.logger.info('radio %d %s', self.radio_number, self.statistics(rfm69, time.monotonic() - started))
+
+    def statistics(self, rfm69, elapsed: float) -> dict:
+        """
+        the throughput of this radio, when the bus fractions of all the radios add up to nearly 1 the shared spi bus is
+        what limits the gateway
+
+        :param rfm69: the radio backend
+        :param elapsed: the seconds the radio ran
+        :return: a dictionary of the packets and bytes received, the packets each second and the fraction of the time on the bus
+        """
+        return {'packets': self.packets_received_count, 'bytes': self.bytes_received, 'decoded': self.decoder.decoded,
+                'packets_per_second': self.packets_received_count / elapsed if elapsed else 0.0,
+                'bus_seconds': round(rfm69.bus_seconds, 6), 'bus_fraction': rfm69.bus_seconds / elapsed if elapsed else 0.0}
+
+    def process_packet(self, scheduler: transmit_scheduler.TransmitScheduler, packet: bytes) -> None:
+        """
+        decode a packet, save it in the lock and data class and queue an ack if the position is valid
+
+        :param scheduler: the transmit scheduler that sends the ack
+        :param packet: the packet with the 4 byte header
+        :return: None
+        """
+        self.packets_received.inc()
+        self.packets_received_count += 1
+        self.bytes_received += len(packet)
+        # a resent packet is acked again if the first one was, it is not decoded or published again
+        if self.dedup is not None and self.dedup.check_packet(packet) == packet_dedup.PACKET_DUPLICATE:
+            self.packets_duplicate.inc()
+            self.logger.debug('duplicate packet=%s', bytes(packet))
+            if self.dedup.was_acked(packet[1], packet[2]):
+                scheduler.queue_ack(packet[1], packet[0], packet[2])
+            return
+        # a malformed packet is counted by the decoder and dropped, it must not kill the radio thread
+        if self.metrics.enabled:
+            start = time.perf_counter()
+            fix = self.decoder.decode(packet)
+            self.decode_seconds.observe(time.perf_counter() - start)
+        else:
+            fix = self.decoder.decode(packet)
+        if fix is None:
+            self.packets_rejected.inc()
+            self.logger.info('rejected packet=%s, rejected counts=%s', bytes(packet), dict(self.decoder.rejected))
+            return
+        self.logger.info('thread_name=%s, fix=%s', self.name, fix)
+
+        # send the data to the position table, the fix is read only so it is shared with the other threads
+        self.lock_location_class.insert(fix)
+        if self.metrics.enabled:
+            self.publish_latency.observe(time.time() - fix.received)
+        # see if the position is not valid
+        if not fix.valid:
+            # the packet does not have a valid gps location
+            return
+        # create of tuple of to, from, id, status,
+        # ack_tuple = (header[1], header[0], header[2], 0x80)
+        self.logger.info('got a valid packet send ack')
+        scheduler.queue_ack(fix.source, fix.destination, fix.identifier)
+        if self.dedup is not None:
+            self.dedup.mark_acked(fix.source, fix.identifier)
 
 
 class Tracker:
@@ -290,6 +397,9 @@ class Tracker:
         """
         the init class
         """
+        # the log pipeline is set up below, and the names of the stream protocols are the choices of --stream_protocol
+        import log_pipeline  # pylint: disable=C0415
+        import stream_protocol  # pylint: disable=C0415
         self.logger = None
         parser = argparse.ArgumentParser()
         # parser.add_argument('--level', choices=['info', 'debug'], default='debug', help='The debug log level (default: %(default)s)')
@@ -303,7 +413,113 @@ class Tracker:
         parser.add_argument('--log_level', default='info', choices=['info', 'debug', 'warn'], help='the log_level default = %(default)s)')
         parser.add_argument('--log_to_file', action='store_true', default=False, help='if true, log to a file default = %(default)s')
         parser.add_argument('--log_file_name', type=str, default='rfm_69_messages.log', help='The default log file name, default = %(default)s')
-        args = parser.parse_args()
+        parser.add_argument('--receive_mode', default=radio_interrupt.RECEIVE_MODE_INTERRUPT,
+                            choices=[radio_interrupt.RECEIVE_MODE_INTERRUPT, radio_interrupt.RECEIVE_MODE_POLL],
+                            help='wait for the DIO0 payload ready interrupt or poll the radio, default = %(default)s')
+        parser.add_argument('--interrupt_pin', type=int, default=22, help='The bcm gpio connected to DIO0, default = %(default)s')
+        parser.add_argument('--capture_file', type=str, default=None, help='Record every received packet to this file, default = %(default)s')
+        parser.add_argument('--replay_file', type=str, default=None,
+                            help='Replay a capture file instead of using the radio, default = %(default)s')
+        parser.add_argument('--replay_speed', type=float, default=1.0,
+                            help='The replay speed, 1 is real time and 0 is as fast as possible, default = %(default)s')
+        parser.add_argument('--dedup_window', type=int, default=32,
+                            help='The packet identifiers remembered for each transmitter to find resent packets, 0 is off, default = %(default)s')
+        parser.add_argument('--ack_max_defer', type=float, default=0.1,
+                            help='The longest time an ack waits for the channel to be quiet, default = %(default)s')
+        parser.add_argument('--no_carrier_sense', action='store_true', default=False,
+                            help='Send the acks without waiting for the channel to be quiet, default = %(default)s')
+        parser.add_argument('--history_length', type=int, default=32, help='The number of fixes kept for each transmitter, default = %(default)s')
+        parser.add_argument('--silent_timeout', type=float, default=3600.0,
+                            help='Forget a transmitter after this many seconds without a packet, 0 never forgets, default = %(default)s')
+        parser.add_argument('--track_analytics', action='store_true', default=False,
+                            help='Show the speed, heading and distance of each transmitter from a filtered track, default = %(default)s')
+        parser.add_argument('--track_window', type=int, default=32,
+                            help='The recent fixes of each transmitter used for its mean speed, default = %(default)s')
+        parser.add_argument('--snapshot_file', type=str, default=None,
+                            help='Save the last fix of each transmitter to this file and load it at the start, default = %(default)s')
+        parser.add_argument('--snapshot_interval', type=float, default=30.0,
+                            help='The seconds between snapshots when a fix arrived, default = %(default)s')
+        parser.add_argument('--snapshot_history', type=int, default=8,
+                            help='The recent fixes of each transmitter saved in the snapshot, default = %(default)s')
+        parser.add_argument('--uplink_address', type=str, default=None,
+                            help='Forward the fixes to a collector at udp:host:port or tcp:host:port, default = %(default)s')
+        parser.add_argument('--gateway_id', type=str, default=None,
+                            help='The name of this receiver at the collector, None is the host name, default = %(default)s')
+        parser.add_argument('--uplink_batch_size', type=int, default=32,
+                            help='The most fixes in a batch sent to the collector, default = %(default)s')
+        parser.add_argument('--uplink_batch_age', type=float, default=2.0,
+                            help='The longest time in seconds a fix waits for its batch to be sent, default = %(default)s')
+        parser.add_argument('--uplink_timeout', type=float, default=2.0,
+                            help='The seconds to wait for the collector to answer a batch, default = %(default)s')
+        parser.add_argument('--uplink_spool_directory', type=str, default=None,
+                            help='Keep the batches in this directory while the collector is down, None keeps them in memory, default = %(default)s')
+        parser.add_argument('--uplink_spool_bytes', type=int, default=16 << 20,
+                            help='The most bytes in the spool, the oldest batch is dropped after that, default = %(default)s')
+        parser.add_argument('--geofence_file', type=str, default=None,
+                            help='A geojson file of areas, entering or leaving one is logged and shown, default = %(default)s')
+        parser.add_argument('--geofence_cell_size', type=float, default=None,
+                            help='The size of a cell of the geofence grid in degrees, None picks one from the areas, default = %(default)s')
+        parser.add_argument('--geofence_hold_time', type=float, default=60.0,
+                            help='The seconds a geofence event is shown on the display, default = %(default)s')
+        parser.add_argument('--log_format', type=int, default=position_fix.LOG_FORMAT_LEGACY, choices=position_fix.LOG_FORMATS,
+                            help='The position log line, 1 is time date longitude latitude, 2 adds the callsign, default = %(default)s')
+        parser.add_argument('--log_batch_size', type=int, default=4096,
+                            help='Write the position log when this many bytes are waiting, default = %(default)s')
+        parser.add_argument('--log_batch_age', type=float, default=5.0,
+                            help='Write the position log when a line has waited this many seconds, default = %(default)s')
+        parser.add_argument('--log_fsync', default=position_writer.FSYNC_BATCH, choices=position_writer.FSYNC_POLICIES,
+                            help='When to fsync the position log, default = %(default)s')
+        parser.add_argument('--log_fsync_interval', type=float, default=30.0,
+                            help='The least time between fsyncs for the interval policy, default = %(default)s')
+        parser.add_argument('--log_max_bytes', type=int, default=0,
+                            help='Rotate the position log at this size, 0 never rotates on size, default = %(default)s')
+        parser.add_argument('--log_rotate_interval', type=float, default=0,
+                            help='Rotate the position log after this many seconds, 0 never rotates on time, default = %(default)s')
+        parser.add_argument('--log_backup_count', type=int, default=5,
+                            help='The number of rotated position logs kept, 0 never rotates, default = %(default)s')
+        parser.add_argument('--track_directory', type=str, default=None,
+                            help='Also keep the fixes in a binary track store in this directory, default = %(default)s')
+        parser.add_argument('--no_text_log', action='store_true', default=False,
+                            help='Do not write the text position log, use with --track_directory, default = %(default)s')
+        parser.add_argument('--stream_listen', action='append', default=None,
+                            help='Also send the fixes to clients on tcp:host:port or unix:path, it can be repeated, default = %(default)s')
+        parser.add_argument('--stream_max_queue', type=int, default=64,
+                            help='The most messages kept for a client that falls behind, with --runtime asyncio and only the phone '
+                                 'each phone has its own task and nothing is queued, default = %(default)s')
+        parser.add_argument('--stream_protocol', default=stream_protocol.PROTOCOL_TEXT, choices=stream_protocol.PROTOCOLS,
+                            help='text sends every fix every sleep time, the others only send changes, default = %(default)s')
+        parser.add_argument('--keepalive', type=float, default=None,
+                            help='The longest time without a message for the on change protocols, default is the sleep time, default = %(default)s')
+        parser.add_argument('--keyframe_interval', type=int, default=16,
+                            help='Send a full position after this many binary deltas, default = %(default)s')
+        parser.add_argument('--runtime', default='threads', choices=['threads', 'asyncio'],
+                            help='Run the radio, display, bluetooth and logging as threads or as asyncio tasks, default = %(default)s')
+        parser.add_argument('--display_source', type=int, default=None,
+                            help='The source address of the transmitter to display, default is the most recent, default = %(default)s')
+        parser.add_argument('--metrics_file', type=str, default=None,
+                            help='Write the counters and latency histograms to this file in the prometheus format, default = %(default)s')
+        parser.add_argument('--metrics_port', type=int, default=None,
+                            help='Serve the metrics on this port of 127.0.0.1, default = %(default)s')
+        parser.add_argument('--metrics_interval', type=float, default=15.0,
+                            help='The seconds between writes of the metrics file, default = %(default)s')
+        parser.add_argument('--display_page_interval', type=float, default=5.0,
+                            help='The seconds each transmitter is displayed when there is more than one, default = %(default)s')
+        parser.add_argument('--radio', action='append', default=None,
+                            help='A radio as chip_select:reset_pin:frequency[:sync_word[:interrupt_pin]], for example CE0:D24:915.0:0x2dd5:23, '
+                                 'repeat it for each radio, the first one gets --sync_word and --interrupt_pin if it does not set them, '
+                                 'default is the radio on the bonnet, default = %(default)s')
+        parser.add_argument('--log_queue_size', type=int, default=log_pipeline.DEFAULT_QUEUE_SIZE,
+                            help='The most log records waiting to be written, more are dropped and counted, default = %(default)s')
+        parser.add_argument('--log_rate_limit', type=int, default=0,
+                            help='The records of each kind logged each second below warning, 0 is no limit, default = %(default)s')
+        parser.add_argument('--log_sample', type=int, default=0,
+                            help='Over the rate limit log every one of this many records, 0 logs none, default = %(default)s')
+        parser.add_argument('--log_json_file', type=str, default=None,
+                            help='Also write the log as json lines with the arguments kept apart to this file, default = %(default)s')
+        pipeline_config.add_arguments(parser)
+        # the config file gives the defaults, so the command line is parsed once after it is read
+        self.args, self.config = pipeline_config.parse_command_line(parser)
+        args = self.args
         print(f'name = {__name__}')
         if args.log_level == 'info':
             log_level = logging.INFO
@@ -313,28 +529,54 @@ class Tracker:
             log_level = logging.WARNING
         else:
             log_level = logging.INFO
-        self.args = parser.parse_args()
-        logger = self.setup_logging(name=name, log_to_file=args.log_to_file, log_level=log_level, log_file_name=args.log_file_name)
+        logger = self.setup_logging(name=name, log_to_file=args.log_to_file, log_level=log_level, log_file_name=args.log_file_name,
+                                    queue_size=args.log_queue_size, rate_limit=args.log_rate_limit, sample=args.log_sample,
+                                    json_file_name=args.log_json_file)
 
         self.logger = logger
-        self.gps_lock_and_location = lock_and_data.LockAndData()
+        # the latest fix and the recent history of every transmitter
+        analytics = None
+        if self.args.track_analytics:
+            import track_analytics  # pylint: disable=C0415
+            analytics = track_analytics.TrackAnalytics(window=self.args.track_window)
+        fences = None
+        if self.args.geofence_file:
+            import geofence  # pylint: disable=C0415
+            fences = geofence.GeofenceEngine(geofence.load_fences(self.args.geofence_file), self.args.geofence_cell_size, logger,
+                                             self.args.geofence_hold_time)
+            self.logger.info('geofences = %d in %d cells of %s degrees', len(fences.fences), fences.index.cells, fences.index.cell_size)
+        self.gps_lock_and_location = position_table.PositionTable(history_length=self.args.history_length,
+                                                                  silent_timeout=self.args.silent_timeout, analytics=analytics,
+                                                                  geofence=fences)
+        # the display, the phone and the stream clients show the last known fixes until the transmitters are heard again
+        if self.args.snapshot_file:
+            import snapshot  # pylint: disable=C0415
+            snapshot.restore_snapshot(self.gps_lock_and_location, self.args.snapshot_file, self.logger)
 
     @staticmethod
-    def setup_logging(name: str = 'main', log_to_file: bool = False, log_file_name: str = "rfm69_log.log",
-                      log_level: int = logging.INFO) -> logging.getLogger:
+    def setup_logging(name: str = 'main', log_to_file: bool = False, log_file_name: str = "rfm69_log.log",  # pylint: disable=R0913
+                      log_level: int = logging.INFO, queue_size: int = None, rate_limit: int = 0,
+                      sample: int = 0, json_file_name: str = None) -> logging.getLogger:
         """
         Set up the logging for the program, this uses a queue config so the that log IO does not block.  the default logging level is info
+        the queue has a fixed size, when the listener falls behind the records are dropped and counted instead of piling up
 
         :param name: the name of the logger
         :param log_file_name: the name of the log file, the mode is overwrite
         :param log_to_file: if true log to a file
         :param log_level: the debug level of the logger
+        :param queue_size: the most records waiting for the listener, None for log_pipeline.DEFAULT_QUEUE_SIZE
+        :param rate_limit: the records of each format string logged each second below warning, 0 is no limit
+        :param sample: over the rate limit log every sample'th record, 0 logs none
+        :param json_file_name: if not None also write the records as json lines to this file
 
         :return: the logger created
         """
+        import log_pipeline  # pylint: disable=C0415
+        if queue_size is None:
+            queue_size = log_pipeline.DEFAULT_QUEUE_SIZE
         log_format = '%(asctime)s-%(name)s  %(levelname)s %(message)s'
         logging.basicConfig(level=log_level)
-        que = queue.Queue(-1)
         handler_list = []
         logger = logging.getLogger(name)
         formatter = logging.Formatter(log_format)
@@ -350,13 +592,19 @@ class Tracker:
         stream_handler.setLevel(log_level)
         stream_handler.setFormatter(formatter)
         handler_list.append(stream_handler)
+        if json_file_name:
+            json_handler = log_pipeline.JsonLinesHandler(json_file_name)
+            json_handler.setLevel(log_level)
+            handler_list.append(json_handler)
 
         logger.propagate = False
 
         # add the list of handlers to the queue listener
-        queue_handler = logging.handlers.QueueHandler(que)
+        queue_handler = log_pipeline.BoundedQueueHandler(queue_size)
+        if rate_limit:
+            queue_handler.addFilter(log_pipeline.RateLimitFilter(rate_limit, sample=sample))
         logger.addHandler(queue_handler)
-        listener = logging.handlers.QueueListener(que, *handler_list, respect_handler_level=True)
+        listener = logging.handlers.QueueListener(queue_handler.queue, *handler_list, respect_handler_level=True)
 
         listener.start()
         atexit.register(listener.stop)
@@ -368,8 +616,13 @@ class Tracker:
 
         """
         self.logger.info('dir = %s', self.args)
+        self.logger.info('stages = %s', self.config.enabled_stages())
+        display_on = self.config.enabled(pipeline_config.STAGE_DISPLAY)
+        bluetooth_on = self.config.enabled(pipeline_config.STAGE_BLUETOOTH)
+        position_log_on = self.config.enabled(pipeline_config.STAGE_POSITION_LOG)
+        uplink_on = self.config.enabled(pipeline_config.STAGE_UPLINK) and self.args.uplink_address is not None
 
-        if not os.path.exists('font5x8.bin'):
+        if display_on and not os.path.exists('font5x8.bin'):
             self.logger.info('the file font5x8.bin is not present in the current directory.')
             self.logger.info('use the command wget -O font5x8.bin \
                     https://github.com/adafruit/Adafruit_CircuitPython_framebuf/blob/master/examples/font5x8.bin?raw=true to download')
@@ -378,7 +631,10 @@ class Tracker:
             self.logger.info('The file %s is not present', self.args.call_sign)
             self.logger.info('add a file called call_sign with your call sign')
             sys.exit(-1)
-        if self.args.mac_address:
+        if not bluetooth_on:
+            # no phone server, so hcitool is not run
+            mac_address = None
+        elif self.args.mac_address:
             mac_address = self.args.mac_address.upper()
             self.logger.info("mac address = %s ", mac_address)
             mac_reg_expression = r'[A-F0-9]{2}:[A-F0-9]{2}:[A-F0-9]{2}:[A-F0-9]{2}:[A-F0-9]{2}:[A-F0-9]{2}'
@@ -394,7 +650,20 @@ class Tracker:
         # callsign_network = check_file(args.call_sign, radio_constants.CALLSIGN_LENGTH)
         network = self.args.sync_word.to_bytes(length=2, byteorder='big')
 
-        dictionary_args = {'MacAddress': mac_address, 'TimeOut': 30, 'RfcommPort': self.args.rfcomm_port}
+        # the metrics cost nothing on the hot path unless a file or a port asks for them
+        registry = None
+        if self.args.metrics_file or self.args.metrics_port is not None:
+            registry = metrics.MetricsRegistry()
+            import log_pipeline  # pylint: disable=C0415
+            queue_handler = log_pipeline.find_handler(self.logger)
+            if queue_handler is not None:
+                registry.counter('rfm69_log_records_dropped_total', 'Log records dropped because the log queue was full',
+                                 lambda: queue_handler.dropped)
+                registry.counter('rfm69_log_records_suppressed_total', 'Log records over the rate limit',
+                                 lambda: sum(getattr(log_filter, 'suppressed', 0) for log_filter in queue_handler.filters))
+        dictionary_args = {'MacAddress': mac_address, 'RfcommPort': self.args.rfcomm_port, 'StreamListen': self.args.stream_listen,
+                           'MaxQueue': self.args.stream_max_queue, 'StreamProtocol': self.args.stream_protocol,
+                           'KeepAlive': self.args.keepalive, 'KeyframeInterval': self.args.keyframe_interval}
         # set up an event for exit and make sure it is clear
         event = threading.Event()
         event.clear()
@@ -402,25 +671,107 @@ class Tracker:
         # create and run the threads
         radio_args = (self.gps_lock_and_location, event, network, self.logger, self.args.sleep_time)
         # the * in front of the radio_args expands the list into arguments
-        run_radio = ReceiveRFM69Data('rfm_radio', *radio_args)
-        run_display = DisplayLocation('display data', *radio_args)
-
-        bluetooth_args = (self. gps_lock_and_location, event, network, self.logger, self.args.sleep_time)
-        connect_bluetooth = bluetooth_thread.BluetoothTransmitThread('Bluetooth connection', *bluetooth_args, **dictionary_args)
+        radio = None
+        if self.args.replay_file:
+            radio = radio_backend.ReplayBackend(self.args.replay_file, self.args.replay_speed)
+        receive_args = {'ReceiveMode': self.args.receive_mode, 'InterruptPin': self.args.interrupt_pin,
+                        'RadioBackend': radio, 'CaptureFile': self.args.capture_file, 'DedupWindow': self.args.dedup_window,
+                        'AckMaxDefer': self.args.ack_max_defer, 'CarrierSense': not self.args.no_carrier_sense}
+        # every radio feeds the one position table, the first is the one on the bonnet unless --radio names it
+        radios = [radio_backend.parse_radio(text, number, self.args.sync_word, self.args.interrupt_pin if number == 0 else None)
+                  for number, text in enumerate(self.args.radio or [])]
+        if not radios:
+            radios = [{'RadioNumber': 0, 'SyncWord': self.args.sync_word, 'InterruptPin': self.args.interrupt_pin}]
+        if len(radios) > 1 and (radio is not None or self.args.runtime == 'asyncio'):
+            raise ValueError('more than one --radio cannot be used with --replay_file or --runtime asyncio')
+        self.logger.info('radios = %s', radios)
         logging_args = radio_args
         logging_args = list(logging_args)
         logging_args.append(self.args.position_log_file)
-        logging_thread = position_logging.PositionLoggingThread('position logging thread', *logging_args)
-
-        run_radio.start()
-        run_display.start()
-        connect_bluetooth.start()
-        logging_thread.start()
-
-        connect_bluetooth.join()
-        run_radio.join()
-        run_display.join()
-        logging_thread.join()
+        writer_args = {'BatchSize': self.args.log_batch_size, 'BatchAge': self.args.log_batch_age, 'FsyncPolicy': self.args.log_fsync,
+                       'FsyncInterval': self.args.log_fsync_interval, 'MaxBytes': self.args.log_max_bytes,
+                       'RotateInterval': self.args.log_rotate_interval, 'BackupCount': self.args.log_backup_count,
+                       'TrackDirectory': self.args.track_directory, 'TextLog': not self.args.no_text_log,
+                       'LogFormat': self.args.log_format}
+        if registry is not None:
+            exporter = metrics.MetricsExporter('metrics exporter', registry, event, self.logger, MetricsFile=self.args.metrics_file,
+                                               MetricsPort=self.args.metrics_port, MetricsInterval=self.args.metrics_interval)
+            exporter.start()
+        snapshot_thread = None
+        if self.args.snapshot_file:
+            import snapshot  # pylint: disable=C0415
+            snapshot_thread = snapshot.SnapshotThread('snapshot', self.gps_lock_and_location, event, network, self.logger, self.args.sleep_time,
+                                                      SnapshotFile=self.args.snapshot_file, SnapshotInterval=self.args.snapshot_interval,
+                                                      SnapshotHistory=self.args.snapshot_history, Metrics=registry)
+            snapshot_thread.start()
+
+        # each stage can have its own sleep time, a stage that is off starts no thread
+        def stage_args(stage: str, stage_network: bytes = network) -> tuple:
+            return (self.gps_lock_and_location, event, stage_network, self.logger, self.config.sleep_time(stage, self.args.sleep_time))
+
+        # the uplink only reads the position table, so it is a thread with either runtime
+        uplink_thread = None
+        if uplink_on:
+            import uplink  # pylint: disable=C0415
+            uplink_thread = uplink.UplinkThread('uplink', *stage_args(pipeline_config.STAGE_UPLINK), UplinkAddress=self.args.uplink_address,
+                                                GatewayId=self.args.gateway_id, BatchSize=self.args.uplink_batch_size,
+                                                BatchAge=self.args.uplink_batch_age, UplinkTimeout=self.args.uplink_timeout,
+                                                SpoolDirectory=self.args.uplink_spool_directory, SpoolBytes=self.args.uplink_spool_bytes,
+                                                Metrics=registry)
+            uplink_thread.start()
+        if self.args.runtime == 'asyncio':
+            import async_runtime  # pylint: disable=C0415
+            logging_args[2] = radios[0].pop('SyncWord').to_bytes(length=2, byteorder='big')
+            receive_args.update(radios[0])
+            # the tracker only sends the text protocol to the phones, the stream clients, the other protocols and the
+            # keepalive need the stream server, so the bluetooth thread serves the phones and the clients beside it
+            stream_thread = None
+            tracker_args = dictionary_args
+            if async_runtime.needs_stream_server(dictionary_args):
+                stream_thread = bluetooth_thread.BluetoothTransmitThread('Bluetooth connection', *stage_args(pipeline_config.STAGE_BLUETOOTH),
+                                                                         **dictionary_args, Metrics=registry)
+                stream_thread.start()
+                tracker_args = {'MacAddress': None}
+            async_tracker = async_runtime.AsyncTracker('asyncio tracker', *logging_args, **receive_args, **writer_args, **tracker_args,
+                                                       DisplaySource=self.args.display_source,
+                                                       DisplayFactory=DisplayLocation.make_display if display_on else None,
+                                                       DrawFix=DisplayLocation.draw_fix, PageInterval=self.args.display_page_interval,
+                                                       PositionLog=position_log_on, Metrics=registry)
+            async_tracker.run()
+            # the tracker sets the event when it stops, so the last snapshot is being written and the last batch sent
+            for thread in (snapshot_thread, uplink_thread, stream_thread):
+                if thread is not None:
+                    thread.join()
+            return
+
+        threads = []
+        for settings in radios:
+            number = settings['RadioNumber']
+            radio_network = settings.pop('SyncWord').to_bytes(length=2, byteorder='big')
+            radio_kwargs = {**receive_args, **settings}
+            if number and self.args.capture_file:
+                # each radio has its own capture file
+                radio_kwargs['CaptureFile'] = f'{self.args.capture_file}.{number}'
+            threads.append(ReceiveRFM69Data('rfm_radio' if number == 0 else f'rfm_radio {number}',
+                                            *stage_args(pipeline_config.STAGE_RADIO, radio_network), **radio_kwargs, Metrics=registry))
+        if display_on:
+            threads.append(DisplayLocation('display data', *stage_args(pipeline_config.STAGE_DISPLAY), DisplaySource=self.args.display_source,
+                                           PageInterval=self.args.display_page_interval, Metrics=registry))
+        # the bluetooth thread also serves the stream clients
+        if bluetooth_on or self.args.stream_listen:
+            threads.append(bluetooth_thread.BluetoothTransmitThread('Bluetooth connection', *stage_args(pipeline_config.STAGE_BLUETOOTH),
+                                                                    **dictionary_args, Metrics=registry))
+        if position_log_on:
+            threads.append(position_logging.PositionLoggingThread('position logging thread', *stage_args(pipeline_config.STAGE_POSITION_LOG),
+                                                                  self.args.position_log_file, **writer_args, Metrics=registry))
+
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for thread in (snapshot_thread, uplink_thread):
+            if thread is not None:
+                thread.join()
 
     def check_file(self, filename: str, length: int):
         """
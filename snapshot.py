@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# The last known state of every transmitter is saved to a small file, so after a restart the display and the phone
+# show where each one was instead of no valid location until its next packet, which can be minutes for a slow beacon.
+#
+# The snapshot thread wakes every interval, and if the position table changed it copies the references of the entries
+# under the table lock, which is bounded by the most sources times the history length, and writes them out on its own
+# thread, so the radio thread only waits for the copy, never for the file.  The file is written to a temporary name,
+# synced and renamed over the old one, so a power cut leaves the old snapshot or the new one, never half of one.
+# The last snapshot is written when the event is set.
+#
+# The file is compact json, for each source the count of its fixes, its latest fix and the end of its history, each fix
+# is a list of the arguments of PositionFix.  It is loaded by Tracker before the threads start, the restored fixes are not logged again.
+#
+# run it with python snapshot.py to measure the time to save and load a full table
+
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Final
+
+import metrics
+import position_fix
+
+SNAPSHOT_VERSION: Final[int] = 1
+
+
+def encode_fix(fix) -> list:
+    """
+    :param fix: the position_fix.PositionFix
+    :return: the arguments of PositionFix as a list
+    """
+    return list(fix.__getnewargs__())
+
+
+def encode_table(table, history_length: int = None) -> bytes:
+    """
+    :param table: the position_table.PositionTable
+    :param history_length: the most recent fixes of the history kept for each source, None keeps all of it
+    :return: the snapshot of the table as json
+    """
+    sources = []
+    for source, count, latest, history in table.snapshot():
+        if history_length is not None:
+            history = history[-history_length:] if history_length else []
+        # the latest fix is nearly always the last of the history, it is not written twice
+        in_history = bool(history) and history[-1] is latest
+        sources.append([source, count, None if in_history else encode_fix(latest), [encode_fix(fix) for fix in history]])
+    return json.dumps({'version': SNAPSHOT_VERSION, 'time': time.time(), 'sources': sources}, separators=(',', ':')).encode('utf-8')
+
+
+def decode_table(data: bytes) -> list:
+    """
+    :param data: a snapshot made by encode_table
+    :return: a list of (source, count, latest fix, list of the history fixes) for PositionTable.restore
+    """
+    snapshot = json.loads(data)
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f'snapshot version {snapshot.get("version")} is not {SNAPSHOT_VERSION}')
+    sources = []
+    for source, count, latest, history in snapshot['sources']:
+        history = [position_fix.PositionFix(*fix) for fix in history]
+        sources.append((source, count, history[-1] if latest is None else position_fix.PositionFix(*latest), history))
+    return sources
+
+
+def write_snapshot(table, file_name: str, history_length: int = None) -> int:
+    """
+    write a snapshot of the table, a reader sees the old file or the new one
+
+    :param table: the position_table.PositionTable
+    :param file_name: the snapshot file
+    :param history_length: the most recent fixes of the history kept for each source, None keeps all of it
+    :return: the bytes written
+    """
+    data = encode_table(table, history_length)
+    directory = os.path.dirname(os.path.abspath(file_name))
+    descriptor, temporary_name = tempfile.mkstemp(prefix=os.path.basename(file_name), suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary_name, file_name)
+    except BaseException:
+        if os.path.exists(temporary_name):
+            os.remove(temporary_name)
+        raise
+    return len(data)
+
+
+def restore_snapshot(table, file_name: str, logger=None) -> int:
+    """
+    put the sources of a snapshot back in the table, a missing or bad snapshot is logged and the table is left empty
+
+    :param table: the position_table.PositionTable
+    :param file_name: the snapshot file
+    :param logger: the logger, may be None
+    :return: the number of sources restored
+    """
+    start = time.perf_counter()
+    try:
+        with open(file_name, 'rb') as file:
+            sources = decode_table(file.read())
+    except FileNotFoundError:
+        return 0
+    except (OSError, ValueError, TypeError, KeyError) as error:
+        if logger is not None:
+            logger.warning('snapshot %s not restored, error = %s', file_name, error)
+        return 0
+    restored = table.restore(sources)
+    if logger is not None:
+        logger.info('snapshot %s restored %d of %d sources in %.3f ms', file_name, restored, len(sources),
+                    1000 * (time.perf_counter() - start))
+    return restored
+
+
+class SnapshotThread(threading.Thread):
+    """
+    this is a thread class that writes a snapshot of the position table when it changed, at most once each interval
+    """
+    __slots__ = ['args', 'kwargs', 'lock_location_class', 'event', 'file_name', 'interval', 'history_length', 'metrics']
+
+    def __init__(self, name: str, *args: list, **kwargs: dict):
+        """
+        this is the init class for the thread
+
+        :param name: The name of the thread
+        :param args: The args, it must be a tuple consisting of
+                                (position_table, event, network, log.log, args.sleep_time)
+        :param kwargs: a dictionary with the snapshot file, the seconds between snapshots and the history kept for each source
+                        example {'SnapshotFile': '/var/lib/rfm69/snapshot.json', 'SnapshotInterval': 30.0, 'SnapshotHistory': 8}
+                        and an optional metrics.MetricsRegistry, example {'Metrics': registry}
+        """
+        super().__init__(name=name, args=args, kwargs=kwargs)
+        if args is None:
+            raise ValueError('Args cannot be None')
+        self.args = args
+        self.kwargs = kwargs
+        self.lock_location_class, self.event, self.network, self.logger, self.sleep_time_in_sec = self.args  # pylint: disable=W0632
+        self.file_name = self.kwargs['SnapshotFile']
+        self.interval = self.kwargs.get('SnapshotInterval', 30.0)
+        self.history_length = self.kwargs.get('SnapshotHistory', 8)
+        self.metrics = metrics.registry_from(self.kwargs)
+
+    def run(self) -> None:
+        """
+        This overrides run on the threading class
+
+        :return: None
+        """
+        snapshots = self.metrics.counter('rfm69_snapshots_total', 'The snapshots of the position table written')
+        seconds = self.metrics.histogram('rfm69_snapshot_seconds', 'The time to write a snapshot')
+        last_version = self.lock_location_class.version
+        while True:
+            stop = self.event.wait(self.interval)
+            version = self.lock_location_class.version
+            if version != last_version:
+                start = time.perf_counter()
+                try:
+                    size = write_snapshot(self.lock_location_class, self.file_name, self.history_length)
+                except OSError as error:
+                    self.logger.warning('snapshot %s not written, error = %s', self.file_name, error)
+                else:
+                    last_version = version
+                    snapshots.inc()
+                    seconds.observe(time.perf_counter() - start)
+                    self.logger.debug('snapshot %s written, %d bytes', self.file_name, size)
+            if stop:
+                return
+
+
+def measure_snapshot(sources: int = 64, history_length: int = 32, snapshot_history: int = 8) -> dict:
+    """
+    fill a table and time the copy under the lock, the write and the restore
+
+    :param sources: the number of transmitters
+    :param history_length: the fixes kept for each
+    :param snapshot_history: the fixes of the history saved for each
+    :return: a dictionary of milliseconds and the bytes of the file
+    """
+    import position_table  # pylint: disable=C0415
+    table = position_table.PositionTable(history_length=history_length, max_sources=sources)
+    now = time.time()
+    for number in range(history_length):
+        for source in range(sources):
+            table.insert(position_fix.PositionFix(source, 2, number, f'CALL{source}', True, now + number, 35.9 + 0.0001 * number,
+                                                  -79.0 - 0.01 * source, now + number))
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, 'snapshot.json')
+        start = time.perf_counter()
+        table.snapshot()
+        copy_time = time.perf_counter() - start
+        start = time.perf_counter()
+        size = write_snapshot(table, file_name, snapshot_history)
+        write_time = time.perf_counter() - start
+        restored_table = position_table.PositionTable(history_length=history_length, max_sources=sources)
+        start = time.perf_counter()
+        restored = restore_snapshot(restored_table, file_name)
+        restore_time = time.perf_counter() - start
+    return {'sources': restored, 'bytes': size, 'copy_ms': 1000 * copy_time, 'write_ms': 1000 * write_time,
+            'restore_ms': 1000 * restore_time}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sources', type=int, default=64, help='the number of transmitters default = %(default)s')
+    parser.add_argument('--history_length', type=int, default=32, help='the fixes kept for each transmitter default = %(default)s')
+    parser.add_argument('--snapshot_history', type=int, default=8, help='the fixes saved for each transmitter default = %(default)s')
+    arguments = parser.parse_args()
+    print(measure_snapshot(arguments.sources, arguments.history_length, arguments.snapshot_history))
@@ -0,0 +1,332 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# The protocols used to stream the fixes to the phones.
+#       text                the original, every fix as a text line, all of them every sleep time
+#       text_on_change      the same text lines, only for the fixes that changed, with a keepalive
+#       binary              binary frames, only for the fixes that changed, with a keepalive
+#
+# The binary frames start with a one byte type.  The numbers are varints, 7 bits a byte with the high bit set on every
+# byte but the last, and the signed ones are zigzag encoded first so a small negative number is small.
+#       FRAME_KEY           source, flags, latitude, longitude, time
+#       FRAME_DELTA         source, latitude, longitude and time minus the ones last sent for the source
+#       FRAME_NO_FIX        source
+#       FRAME_KEEPALIVE
+# The latitude and longitude are degrees * 10**7 and the time is milliseconds since the epoch.
+# Every client has its own encoder because the deltas are against what that client was sent.  A source gets a key frame
+# the first time it is sent to a client, after it had no fix, and every keyframe_interval frames.
+#
+# run it with python stream_protocol.py to compare the bytes sent by each protocol
+
+import argparse
+from typing import Final
+
+PROTOCOL_TEXT: Final[str] = 'text'
+PROTOCOL_TEXT_ON_CHANGE: Final[str] = 'text_on_change'
+PROTOCOL_BINARY: Final[str] = 'binary'
+PROTOCOLS: Final[tuple] = (PROTOCOL_TEXT, PROTOCOL_TEXT_ON_CHANGE, PROTOCOL_BINARY)
+
+FRAME_KEY: Final[int] = 1
+FRAME_DELTA: Final[int] = 2
+FRAME_NO_FIX: Final[int] = 3
+FRAME_KEEPALIVE: Final[int] = 4
+FLAG_VALID: Final[int] = 0x01
+COORDINATE_SCALE: Final[int] = 10 ** 7
+# the most bytes one fix can take, type, source, flags and three 10 byte varints
+_MAX_FRAME: Final[int] = 40
+
+
+def zigzag(value: int) -> int:
+    """
+    :param value: a signed integer
+    :return: the integer mapped to an unsigned one, 0, -1, 1, -2 ... become 0, 1, 2, 3 ...
+    """
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+
+def unzigzag(value: int) -> int:
+    """
+    :param value: a zigzag encoded integer
+    :return: the signed integer
+    """
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+
+
+def put_varint(buffer: bytearray, offset: int, value: int) -> int:
+    """
+    write an unsigned varint
+
+    :param buffer: the buffer, it must have room
+    :param offset: the offset to write at
+    :param value: the value, it must not be negative
+    :return: the offset after the varint
+    """
+    while value > 0x7f:
+        buffer[offset] = (value & 0x7f) | 0x80
+        value >>= 7
+        offset += 1
+    buffer[offset] = value
+    return offset + 1
+
+
+def get_varint(buffer, offset: int) -> tuple:
+    """
+    read an unsigned varint
+
+    :param buffer: the buffer
+    :param offset: the offset to read at
+    :return: a tuple of the value and the offset after the varint
+    :raises IndexError: if the buffer ends inside the varint
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = buffer[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+
+class TextEncoder:
+    """
+    The text lines sent to the phone, one encoder is shared by every client because the text does not depend on the client
+    """
+    # each message stands alone, so a client that falls behind can lose any of them
+    stateful = False
+
+    def __init__(self, process_packet):
+        """
+        The init class for the encoder
+
+        :param process_packet: the function that makes the text for a fix, BluetoothTransmitThread.process_packet
+        """
+        self.process_packet = process_packet
+        self.counter = 0
+
+    def encode(self, fixes: list, keepalive: bool = False) -> bytes:  # pylint: disable=W0613
+        """
+        :param fixes: the fixes to send, None is sent as no valid location
+        :param keepalive: not used, the text keepalive is the latest fixes again
+        :return: the lines
+        """
+        data = ''.join(f'{self.process_packet(fix, self.counter)}\r\n\n' for fix in fixes).encode('utf-8')
+        self.counter = self.counter + 1 if self.counter < 16 else 0
+        return data
+
+
+class BinaryEncoder:
+    """
+    The binary frames for one client
+    """
+    # a delta frame needs the frame before it, so a client that falls behind loses its whole queue and starts from key frames
+    stateful = True
+
+    def __init__(self, keyframe_interval: int = 16):
+        """
+        The init class for the encoder
+
+        :param keyframe_interval: send a key frame for a source after this many delta frames
+        """
+        self.keyframe_interval = keyframe_interval
+        # the latitude, longitude and time last sent for each source and the number of delta frames since the key frame
+        self.__previous = {}
+        # the frame buffer is kept and reused, it only grows
+        self.__buffer = bytearray(_MAX_FRAME * 8)
+
+    def reset(self) -> None:
+        """
+        forget what was sent, so the next frame for each source is a key frame
+
+        :return: None
+        """
+        self.__previous.clear()
+
+    def encode(self, fixes: list, keepalive: bool = False) -> bytes:
+        """
+        :param fixes: the fixes that changed, None is skipped
+        :param keepalive: if True send a keepalive frame when there are no fixes
+        :return: the frames
+        """
+        buffer = self.__buffer
+        if len(buffer) < _MAX_FRAME * (len(fixes) + 1):
+            buffer.extend(bytes(_MAX_FRAME * (len(fixes) + 1) - len(buffer)))
+        offset = 0
+        if not keepalive:
+            for fix in fixes:
+                if fix is not None:
+                    offset = self.__encode_fix(buffer, offset, fix)
+        if not offset and keepalive:
+            buffer[0] = FRAME_KEEPALIVE
+            offset = 1
+        with memoryview(buffer) as view:
+            return bytes(view[:offset])
+
+    def __encode_fix(self, buffer: bytearray, offset: int, fix) -> int:
+        """
+        write the frame for one fix
+
+        :param buffer: the frame buffer
+        :param offset: the offset to write at
+        :param fix: the position_fix.PositionFix
+        :return: the offset after the frame
+        """
+        source = fix.source
+        if not fix.valid:
+            self.__previous.pop(source, None)
+            buffer[offset] = FRAME_NO_FIX
+            return put_varint(buffer, offset + 1, source)
+        latitude = round(fix.latitude * COORDINATE_SCALE)
+        longitude = round(fix.longitude * COORDINATE_SCALE)
+        milliseconds = round((fix.received if fix.timestamp is None else fix.timestamp) * 1000)
+        previous = self.__previous.get(source)
+        if previous is None or previous[3] >= self.keyframe_interval:
+            self.__previous[source] = [latitude, longitude, milliseconds, 0]
+            buffer[offset] = FRAME_KEY
+            offset = put_varint(buffer, offset + 1, source)
+            buffer[offset] = FLAG_VALID
+            offset = put_varint(buffer, offset + 1, zigzag(latitude))
+            offset = put_varint(buffer, offset, zigzag(longitude))
+            return put_varint(buffer, offset, milliseconds)
+        buffer[offset] = FRAME_DELTA
+        offset = put_varint(buffer, offset + 1, source)
+        offset = put_varint(buffer, offset, zigzag(latitude - previous[0]))
+        offset = put_varint(buffer, offset, zigzag(longitude - previous[1]))
+        offset = put_varint(buffer, offset, zigzag(milliseconds - previous[2]))
+        previous[0] = latitude
+        previous[1] = longitude
+        previous[2] = milliseconds
+        previous[3] += 1
+        return offset
+
+
+class BinaryDecoder:
+    """
+    The decoder for the binary frames, this is what the phone does, it is here to check the encoder
+    """
+
+    def __init__(self):
+        """
+        The init class for the decoder
+        """
+        self.__previous = {}
+        self.__pending = b''
+
+    def feed(self, data: bytes) -> list:
+        """
+        decode the frames in the data, a frame split across two reads is kept until the rest arrives
+
+        :param data: the bytes read from the stream
+        :return: a list of tuples of the frame type, the source, the latitude, the longitude and the time in seconds,
+                 the position is None for FRAME_NO_FIX and the source is None for FRAME_KEEPALIVE
+        """
+        buffer = self.__pending + data
+        offset = 0
+        frames = []
+        while offset < len(buffer):
+            try:
+                frame, next_offset = self.__decode(buffer, offset)
+            except IndexError:
+                break
+            frames.append(frame)
+            offset = next_offset
+        self.__pending = buffer[offset:]
+        return frames
+
+    def __decode(self, buffer: bytes, offset: int) -> tuple:
+        """
+        decode one frame, the state is only changed when the whole frame is there
+
+        :param buffer: the data
+        :param offset: the offset of the frame
+        :return: a tuple of the frame and the offset after it
+        :raises IndexError: if the frame is not complete
+        :raises ValueError: if the frame type is not known
+        """
+        frame_type = buffer[offset]
+        if frame_type == FRAME_KEEPALIVE:
+            return (FRAME_KEEPALIVE, None, None, None, None), offset + 1
+        source, offset = get_varint(buffer, offset + 1)
+        if frame_type == FRAME_NO_FIX:
+            self.__previous.pop(source, None)
+            return (FRAME_NO_FIX, source, None, None, None), offset
+        if frame_type == FRAME_KEY:
+            _ = buffer[offset]
+            latitude, offset = get_varint(buffer, offset + 1)
+            longitude, offset = get_varint(buffer, offset)
+            milliseconds, offset = get_varint(buffer, offset)
+            latitude = unzigzag(latitude)
+            longitude = unzigzag(longitude)
+        elif frame_type == FRAME_DELTA:
+            previous = self.__previous[source]
+            latitude, offset = get_varint(buffer, offset)
+            longitude, offset = get_varint(buffer, offset)
+            milliseconds, offset = get_varint(buffer, offset)
+            latitude = previous[0] + unzigzag(latitude)
+            longitude = previous[1] + unzigzag(longitude)
+            milliseconds = previous[2] + unzigzag(milliseconds)
+        else:
+            raise ValueError(f'unknown frame type {frame_type}')
+        self.__previous[source] = (latitude, longitude, milliseconds)
+        return (frame_type, source, latitude / COORDINATE_SCALE, longitude / COORDINATE_SCALE, milliseconds / 1000), offset
+
+
+def encoder_factory(protocol: str, process_packet, keyframe_interval: int = 16):
+    """
+    :param protocol: one of PROTOCOLS
+    :param process_packet: the function that makes the text for a fix, BluetoothTransmitThread.process_packet
+    :param keyframe_interval: the key frame interval for the binary protocol
+    :return: a function that returns the encoder for a new client
+    """
+    if protocol == PROTOCOL_BINARY:
+        return lambda: BinaryEncoder(keyframe_interval)
+    text_encoder = TextEncoder(process_packet)
+    return lambda: text_encoder
+
+
+def compare_protocols(count: int = 1000, keyframe_interval: int = 16) -> dict:
+    """
+    count the bytes each protocol sends for a transmitter that moves a little every second
+
+    :param count: the number of fixes
+    :param keyframe_interval: the key frame interval for the binary protocol
+    :return: a dictionary of the bytes sent by each protocol
+    """
+    import benchmarks  # pylint: disable=C0415
+    import bluetooth_thread  # pylint: disable=C0415
+    import packet_decoder  # pylint: disable=C0415
+    decoder = packet_decoder.PacketDecoder()
+    fixes = [decoder.decode(packet) for packet in benchmarks.moving_packets(count)]
+    text = TextEncoder(bluetooth_thread.BluetoothTransmitThread.process_packet)
+    binary = BinaryEncoder(keyframe_interval)
+    check = BinaryDecoder()
+    binary_bytes = 0
+    for fix in fixes:
+        frame = binary.encode([fix])
+        binary_bytes += len(frame)
+        _, _, latitude, longitude, _ = check.feed(frame)[0]
+        if round(latitude, 7) != round(fix.latitude, 7) or round(longitude, 7) != round(fix.longitude, 7):
+            raise ValueError(f'the binary frame for {fix} decoded to {latitude} {longitude}')
+    return {'fixes': count,
+            'text_bytes': sum(len(text.encode([fix])) for fix in fixes),
+            'binary_bytes': binary_bytes}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--count', type=int, default=1000, help='the number of fixes default = %(default)s')
+    parser.add_argument('--keyframe_interval', type=int, default=16, help='the key frame interval default = %(default)s')
+    arguments = parser.parse_args()
+    print(compare_protocols(arguments.count, arguments.keyframe_interval))
@@ -0,0 +1,493 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# A stream server that sends the same data to many clients, the phones on bluetooth rfcomm, or tcp and unix socket clients.
+# The listening sockets stay open for the life of the server and every socket is non blocking and driven by one selector,
+# so an accept never blocks and a client that stops reading does not stall the others.
+# Each client has its own bounded queue, when it is full the oldest message is dropped and counted.
+# A client with a binary encoder loses its whole queue instead and its encoder starts again from key frames,
+# because its queued delta frames are no use without the one that was dropped.
+#
+# The listen address is one of
+#       rfcomm:XX:XX:XX:XX:XX:XX:4      the local bluetooth mac address and the rfcomm channel
+#       tcp:0.0.0.0:5000                a host and a port
+#       unix:/tmp/rfm69.sock            a path
+#
+# run it with python stream_server.py --clients 10 --messages 1000 to measure the fan out without bluetooth
+
+import argparse
+import collections
+import os
+import selectors
+import socket
+import statistics
+import struct
+import threading
+import time
+
+RFCOMM_PREFIX = 'rfcomm:'
+TCP_PREFIX = 'tcp:'
+UNIX_PREFIX = 'unix:'
+
+
+def listen_socket(address: str, backlog: int = 5) -> socket.socket:
+    """
+    create a non blocking listening socket
+
+    :param address: the listen address, see the top of the file
+    :param backlog: the listen backlog
+    :return: the socket
+    :raises ValueError: if the address is not understood
+    :raises OSError: if the socket cannot be bound
+    """
+    if address.startswith(RFCOMM_PREFIX):
+        mac_address, _, channel = address[len(RFCOMM_PREFIX):].rpartition(':')
+        server = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_STREAM, socket.BTPROTO_RFCOMM)  # pylint: disable=E1101
+        bind_address = (mac_address, int(channel))
+    elif address.startswith(TCP_PREFIX):
+        host, _, port = address[len(TCP_PREFIX):].rpartition(':')
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        bind_address = (host, int(port))
+    elif address.startswith(UNIX_PREFIX):
+        bind_address = address[len(UNIX_PREFIX):]
+        if os.path.exists(bind_address):
+            os.remove(bind_address)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    else:
+        raise ValueError(f'the listen address {address} does not start with {RFCOMM_PREFIX}, {TCP_PREFIX} or {UNIX_PREFIX}')
+    try:
+        server.bind(bind_address)
+        server.listen(backlog)
+    except OSError:
+        server.close()
+        raise
+    server.setblocking(False)
+    return server
+
+
+class StreamClient:  # pylint: disable=R0903
+    """
+    A connected client and its queue of messages waiting to be sent
+    """
+    __slots__ = ['socket', 'address', 'queue', 'pending', 'dropped', 'bytes_sent', 'messages_sent', 'encoder']
+
+    def __init__(self, client_socket: socket.socket, address, max_queue: int, encoder=None):
+        """
+        The init class for the client
+
+        :param client_socket: the connected socket
+        :param address: the address of the client
+        :param max_queue: the most messages kept for the client
+        :param encoder: the stream_protocol encoder for the client, only used by StreamServer.publish
+        """
+        self.socket = client_socket
+        self.address = address
+        self.queue = collections.deque(maxlen=max_queue)
+        # the part of the message being sent that the socket did not take yet
+        self.pending = None
+        self.dropped = 0
+        self.bytes_sent = 0
+        self.messages_sent = 0
+        self.encoder = encoder
+
+
+class StreamServer:
+    """
+    Send messages to every connected client of one or more listening sockets
+    """
+
+    def __init__(self, max_queue: int = 64, logger=None, encoder_factory=None):
+        """
+        The init class for the server
+
+        :param max_queue: the most messages kept for each client, the oldest is dropped when a client falls behind,
+                          or the whole queue for a client with a binary encoder
+        :param logger: the logger, may be None
+        :param encoder_factory: a function that returns the stream_protocol encoder for a new client, needed for publish
+        """
+        self.max_queue = max_queue
+        self.logger = logger
+        self.encoder_factory = encoder_factory
+        self.accepted = 0
+        self.messages = 0
+        self.dropped = 0
+        self.__lock = threading.Lock()
+        self.__selector = selectors.DefaultSelector()
+        self.__listeners = []
+        self.__clients = {}
+        # a socket pair so broadcast can wake up the select in serve
+        self.__wake_read, self.__wake_write = socket.socketpair()
+        self.__wake_read.setblocking(False)
+        self.__wake_write.setblocking(False)
+        self.__selector.register(self.__wake_read, selectors.EVENT_READ)
+
+    def __log(self, message: str, *args) -> None:
+        if self.logger is not None:
+            self.logger.info(message, *args)
+
+    def add_listener(self, address: str) -> None:
+        """
+        listen on an address
+
+        :param address: the listen address, see the top of the file
+        :return: None
+        :raises OSError: if the socket cannot be bound
+        """
+        server = listen_socket(address)
+        with self.__lock:
+            self.__listeners.append(server)
+            self.__selector.register(server, selectors.EVENT_READ)
+        self.__log('stream server listening on %s', address)
+        self.wake()
+
+    @property
+    def client_count(self) -> int:
+        """
+        :return: the number of connected clients
+        """
+        with self.__lock:
+            return len(self.__clients)
+
+    @property
+    def queued(self) -> int:
+        """
+        :return: the number of messages waiting to be sent to all the clients
+        """
+        with self.__lock:
+            return sum(len(client.queue) + (client.pending is not None) for client in self.__clients.values())
+
+    def wake(self) -> None:
+        """
+        wake up serve so it sees the new messages
+
+        :return: None
+        """
+        try:
+            self.__wake_write.send(b'\0')
+        except BlockingIOError:
+            # the wake socket is full, so serve is going to wake anyway
+            pass
+
+    def broadcast(self, message: bytes) -> int:
+        """
+        queue a message for every client, this can be called from any thread
+
+        :param message: the message
+        :return: the number of clients it was queued for
+        """
+        with self.__lock:
+            self.messages += 1
+            for client in self.__clients.values():
+                self.__queue(client, message)
+            count = len(self.__clients)
+        if count:
+            self.wake()
+        return count
+
+    def publish(self, fixes: list, keepalive: bool = False) -> int:
+        """
+        encode fixes with the encoder of each client and queue them, this can be called from any thread.
+        An encoder shared by many clients is only asked once.
+
+        :param fixes: the fixes
+        :param keepalive: True if this is a keepalive, the encoders decide what to send
+        :return: the number of clients a message was queued for
+        """
+        count = 0
+        with self.__lock:
+            self.messages += 1
+            encoded = {}
+            for client in self.__clients.values():
+                if client.encoder.stateful and len(client.queue) == client.queue.maxlen:
+                    # the message is encoded after the queue is emptied, so it starts from key frames
+                    self.__drop_queue(client)
+                message = encoded.get(id(client.encoder))
+                if message is None:
+                    message = encoded[id(client.encoder)] = client.encoder.encode(fixes, keepalive)
+                if message:
+                    self.__queue(client, message)
+                    count += 1
+        if count:
+            self.wake()
+        return count
+
+    def __queue(self, client: StreamClient, message: bytes) -> None:
+        """
+        queue a message for a client, the lock must be held
+
+        :param client: the client
+        :param message: the message
+        :return: None
+        """
+        if len(client.queue) == client.queue.maxlen:
+            if client.encoder is not None and client.encoder.stateful:
+                self.__drop_queue(client)
+            else:
+                client.dropped += 1
+                self.dropped += 1
+        was_idle = not client.queue and client.pending is None
+        client.queue.append(message)
+        if was_idle:
+            self.__selector.modify(client.socket, selectors.EVENT_READ | selectors.EVENT_WRITE, client)
+
+    def __drop_queue(self, client: StreamClient) -> None:
+        """
+        drop every message waiting for a client whose encoder sends deltas, dropping only the oldest would leave the
+        client applying the deltas after it to the wrong position, the lock must be held
+
+        :param client: the client
+        :return: None
+        """
+        client.dropped += len(client.queue)
+        self.dropped += len(client.queue)
+        client.queue.clear()
+        client.encoder.reset()
+
+    def serve(self, stop_event: threading.Event, timeout: float = 1.0) -> None:
+        """
+        accept clients and send their queued messages until the stop event is set
+
+        :param stop_event: the event that ends the loop, call wake after setting it to end the loop at once
+        :param timeout: the longest time in seconds between looks at the stop event
+        :return: None
+        """
+        while not stop_event.is_set():
+            self.serve_once(timeout)
+
+    def serve_once(self, timeout: float) -> None:
+        """
+        wait for the sockets to be ready once and service them
+
+        :param timeout: the longest time to wait in seconds
+        :return: None
+        """
+        for key, events in self.__selector.select(timeout):
+            if key.fileobj is self.__wake_read:
+                try:
+                    while self.__wake_read.recv(4096):
+                        pass
+                except BlockingIOError:
+                    pass
+            elif key.data is None:
+                self.__accept(key.fileobj)
+            else:
+                client = key.data
+                if events & selectors.EVENT_READ:
+                    self.__read(client)
+                if events & selectors.EVENT_WRITE and client.socket.fileno() >= 0:
+                    self.__send(client)
+
+    def __accept(self, server: socket.socket) -> None:
+        """
+        accept a client
+
+        :param server: the listening socket that is ready
+        :return: None
+        """
+        try:
+            client_socket, address = server.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError as error:
+            self.__log('stream server accept failed error = %s', error)
+            return
+        client_socket.setblocking(False)
+        client = StreamClient(client_socket, address, self.max_queue,
+                              None if self.encoder_factory is None else self.encoder_factory())
+        with self.__lock:
+            self.accepted += 1
+            self.__clients[client_socket] = client
+            self.__selector.register(client_socket, selectors.EVENT_READ, client)
+        self.__log('stream server connected to %s', address)
+
+    def __read(self, client: StreamClient) -> None:
+        """
+        the clients do not send anything, a read is only used to find out that the client has gone
+
+        :param client: the client
+        :return: None
+        """
+        try:
+            data = client.socket.recv(4096)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self.close_client(client)
+
+    def __send(self, client: StreamClient) -> None:
+        """
+        send as much of the queue as the socket takes without blocking
+
+        :param client: the client
+        :return: None
+        """
+        with self.__lock:
+            while True:
+                if client.pending is None:
+                    if not client.queue:
+                        self.__selector.modify(client.socket, selectors.EVENT_READ, client)
+                        return
+                    client.pending = memoryview(client.queue.popleft())
+                try:
+                    sent = client.socket.send(client.pending)
+                except (BlockingIOError, InterruptedError):
+                    return
+                except OSError as error:
+                    self.__log('stream server send to %s failed error = %s', client.address, error)
+                    break
+                client.bytes_sent += sent
+                client.pending = client.pending[sent:]
+                if not client.pending:
+                    client.pending = None
+                    client.messages_sent += 1
+        self.close_client(client)
+
+    def close_client(self, client: StreamClient) -> None:
+        """
+        disconnect a client, the other clients are not affected
+
+        :param client: the client
+        :return: None
+        """
+        with self.__lock:
+            if self.__clients.pop(client.socket, None) is None:
+                return
+            self.__selector.unregister(client.socket)
+        client.socket.close()
+        self.__log('stream server disconnected %s sent %d messages dropped %d', client.address, client.messages_sent, client.dropped)
+
+    def close(self) -> None:
+        """
+        close every socket
+
+        :return: None
+        """
+        with self.__lock:
+            clients = list(self.__clients.values())
+        for client in clients:
+            self.close_client(client)
+        for server in self.__listeners:
+            self.__selector.unregister(server)
+            server.close()
+        self.__listeners = []
+        self.__selector.close()
+        self.__wake_read.close()
+        self.__wake_write.close()
+
+
+def measure_fan_out(clients: int = 10, messages: int = 1000, max_queue: int = 64, slow_clients: int = 0) -> dict:
+    """
+    send time stamped messages through a unix socket server to many clients and measure the throughput and the latency
+
+    :param clients: the number of clients
+    :param messages: the number of messages
+    :param max_queue: the queue length for each client
+    :param slow_clients: the number of clients that connect but never read
+    :return: a dictionary with the messages per second, the messages delivered to the reading clients and dropped for the
+             slow clients and the median and max latency in seconds of the reading clients
+    """
+    path = f'/tmp/stream_server_{os.getpid()}.sock'
+    message_format = struct.Struct('<Id')
+    server = StreamServer(max_queue=max_queue)
+    server.add_listener(UNIX_PREFIX + path)
+    stop_event = threading.Event()
+    server_thread = threading.Thread(target=server.serve, args=(stop_event, 0.1), name='stream server')
+    server_thread.start()
+
+    latencies = []
+    received = []
+    lock = threading.Lock()
+    # the messages each reading client has read, the sender waits on the condition for the slowest reader
+    progress = [0] * clients
+    progress_changed = threading.Condition()
+
+    def read_client(index, client_socket):
+        buffer = b''
+        count = 0
+        client_latencies = []
+        while count < messages:
+            data = client_socket.recv(65536)
+            if not data:
+                break
+            buffer += data
+            while len(buffer) >= message_format.size:
+                _, sent_time = message_format.unpack_from(buffer)
+                client_latencies.append(time.perf_counter() - sent_time)
+                buffer = buffer[message_format.size:]
+                count += 1
+            with progress_changed:
+                progress[index] = count
+                progress_changed.notify()
+        with lock:
+            latencies.extend(client_latencies)
+            received.append(count)
+
+    def has_room(number):
+        return not progress or number - min(progress) < max_queue
+
+    sockets = []
+    for _ in range(clients + slow_clients):
+        client_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client_socket.connect(path)
+        sockets.append(client_socket)
+    while server.client_count < len(sockets):
+        time.sleep(0.01)
+    readers = [threading.Thread(target=read_client, args=(index, client_socket)) for index, client_socket in enumerate(sockets[:clients])]
+    for reader in readers:
+        reader.start()
+    start = time.perf_counter()
+    for number in range(messages):
+        # a reading client has at most number - progress messages queued, so waiting for room means only the slow
+        # clients drop, a sleep(0) here does not make the server thread run and the reading clients dropped too
+        with progress_changed:
+            progress_changed.wait_for(lambda number=number: has_room(number), timeout=1.0)
+        server.broadcast(message_format.pack(number, time.perf_counter()))
+    # the slow clients never drain their queue, so wait for the reading clients to get every message
+    for reader in readers:
+        reader.join(timeout=10.0)
+    elapsed = time.perf_counter() - start
+    stop_event.set()
+    server.wake()
+    server_thread.join()
+    # a reader that is still waiting for a dropped message sees the end of the stream
+    server.close()
+    for reader in readers:
+        reader.join()
+    for client_socket in sockets:
+        client_socket.close()
+    os.remove(path)
+    return {
+        'clients': clients,
+        'slow_clients': slow_clients,
+        'messages': messages,
+        'delivered': sum(received),
+        'dropped': server.dropped,
+        'messages_per_second': messages / elapsed if elapsed else float('inf'),
+        'deliveries_per_second': sum(received) / elapsed if elapsed else float('inf'),
+        'median_latency': statistics.median(latencies) if latencies else None,
+        'max_latency': max(latencies) if latencies else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=10, help='the number of reading clients default = %(default)s')
+    parser.add_argument('--slow_clients', type=int, default=0, help='the number of clients that never read default = %(default)s')
+    parser.add_argument('--messages', type=int, default=1000, help='the number of messages default = %(default)s')
+    parser.add_argument('--max_queue', type=int, default=64, help='the queue length for each client default = %(default)s')
+    arguments = parser.parse_args()
+    print(measure_fan_out(arguments.clients, arguments.messages, arguments.max_queue, arguments.slow_clients))
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+# Tests of the asyncio runtime
+
+import logging
+import threading
+import time
+
+import pytest
+
+import async_runtime
+import position_table
+import radio_interrupt
+import radio_simulator
+import stream_protocol
+
+
+def tracker_args(tmp_path) -> tuple:
+    return (position_table.PositionTable(), threading.Event(), b'\x2d\xd4', logging.getLogger('test'), 0.5,
+            str(tmp_path / 'position.log'))
+
+
+@pytest.mark.parametrize('settings', [{'StreamListen': ['tcp:127.0.0.1:0']}, {'StreamProtocol': stream_protocol.PROTOCOL_BINARY},
+                                      {'StreamProtocol': stream_protocol.PROTOCOL_TEXT_ON_CHANGE}, {'KeepAlive': 10.0}])
+def test_the_stream_settings_are_not_ignored(tmp_path, settings):
+    assert async_runtime.needs_stream_server(settings)
+    with pytest.raises(ValueError):
+        async_runtime.AsyncTracker('asyncio tracker', *tracker_args(tmp_path), MacAddress='AA:BB:CC:DD:EE:FF', **settings)
+
+
+def test_the_phone_with_the_text_protocol_is_served_by_the_tracker(tmp_path):
+    settings = {'MacAddress': 'AA:BB:CC:DD:EE:FF', 'RfcommPort': 4, 'StreamListen': None, 'MaxQueue': 64,
+                'StreamProtocol': stream_protocol.PROTOCOL_TEXT, 'KeepAlive': None, 'KeyframeInterval': 16}
+    assert not async_runtime.needs_stream_server(settings)
+    async_runtime.AsyncTracker('asyncio tracker', *tracker_args(tmp_path), **settings)
+
+
+@pytest.mark.parametrize('mode', [radio_interrupt.RECEIVE_MODE_INTERRUPT, radio_interrupt.RECEIVE_MODE_POLL])
+def test_stop_ends_the_runtime_in_under_100_ms(tmp_path, mode):
+    radio = radio_simulator.SimulatedRFM69()
+    args = list(tracker_args(tmp_path))
+    # a wait that is not ended by the stop would take the whole sleep time
+    args[4] = 5.0
+    tracker = async_runtime.AsyncTracker('asyncio tracker', *args, RadioBackend=radio, ReceiveMode=mode, PositionLog=False)
+    thread = threading.Thread(target=tracker.run)
+    thread.start()
+    deadline = time.monotonic() + 5.0
+    while not radio.listening and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert radio.inject(radio_simulator.make_packet(1))
+    if mode == radio_interrupt.RECEIVE_MODE_INTERRUPT:
+        while tracker.lock_location_class.version == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert tracker.lock_location_class.latest(1) is not None
+    start = time.monotonic()
+    tracker.stop()
+    thread.join(5.0)
+    assert not thread.is_alive()
+    assert time.monotonic() - start < 0.1
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Tests of the incremental display renderer on the fake ssd1306, the text is read back from the display memory
+
+import os
+
+import pytest
+
+import display_renderer
+
+FONT_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'font5x8.bin')
+
+
+@pytest.fixture(name='renderer')
+def fixture_renderer():
+    return display_renderer.DisplayRenderer(display_renderer.FakeSSD1306(), display_renderer.Font(FONT_FILE))
+
+
+def shown(renderer) -> list:
+    return [renderer.device.page_text(renderer.font, page) for page in range(display_renderer.PAGES)]
+
+
+def test_the_lines_are_shown(renderer):
+    lines = ['Remote Location', '35.95563 N', '79.01935 W', 'pv=A, KF4WBK 1']
+    renderer.render(lines)
+    assert shown(renderer) == lines
+
+
+def test_a_line_that_did_not_change_is_not_sent(renderer):
+    lines = ['Remote Location', '35.95563 N', '79.01935 W', 'pv=A, KF4WBK 1']
+    first = renderer.render(lines)
+    assert renderer.render(lines) == 0
+    # one character changes, so only its columns and the address commands are sent
+    changed = renderer.render(lines[:3] + ['pv=A, KF4WBK 2'])
+    assert 0 < changed < first // 4
+    assert shown(renderer)[3] == 'pv=A, KF4WBK 2'
+    assert renderer.lines_drawn == 5
+
+
+def test_a_missing_line_is_blank(renderer):
+    renderer.render(['one', 'two', 'three', 'four'])
+    renderer.render(['one'])
+    assert shown(renderer) == ['one', '', '', '']
+
+
+def test_invalidate_sends_every_line_again(renderer):
+    lines = ['a', 'b', 'c', 'd']
+    renderer.render(lines)
+    renderer.invalidate()
+    sent = renderer.render(lines)
+    assert sent >= display_renderer.WIDTH * display_renderer.PAGES
+
+
+def test_the_renderer_sends_less_than_a_full_refresh():
+    result = display_renderer.compare_refresh(50)
+    assert result['renderer_bytes'] < result['full_refresh_bytes'] / 4
+
+
+def test_the_pager_takes_turns():
+    pager = display_renderer.SourcePager(page_time=5.0)
+    assert pager.current([], now=0.0) == (None, 0, 5.0)
+    assert pager.current([7, 3], now=0.0) == (3, 1, 5.0)
+    assert pager.current([7, 3], now=4.0)[0] == 3
+    assert pager.current([7, 3], now=5.0)[:2] == (7, 2)
+    assert pager.current([7, 3], now=10.0)[:2] == (3, 1)
+    # the source shown is gone, the first one is shown
+    assert pager.current([9], now=11.0)[:2] == (9, 1)
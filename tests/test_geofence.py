@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Tests of the geofences, the point in polygon and circle tests, the grid index and the enter and exit events
+
+import json
+
+import pytest
+
+import geofence
+import position_fix
+
+# a square from 35.0 to 35.1 north and 79.1 to 79.0 west with a hole in the middle
+SQUARE = [[(-79.1, 35.0), (-79.0, 35.0), (-79.0, 35.1), (-79.1, 35.1), (-79.1, 35.0)],
+          [(-79.06, 35.04), (-79.04, 35.04), (-79.04, 35.06), (-79.06, 35.06), (-79.06, 35.04)]]
+
+
+def fix_at(number: int, latitude: float, longitude: float, callsign: str = 'KF4WBK', source: int = 1):
+    return position_fix.PositionFix(source, 2, number, callsign, True, 1700000000.0 + number, latitude, longitude,
+                                     1700000000.0 + number)
+
+
+def test_polygon_with_a_hole():
+    fence = geofence.PolygonFence('square', SQUARE)
+    assert fence.contains(35.02, -79.08)
+    assert not fence.contains(35.05, -79.05)
+    assert not fence.contains(35.2, -79.05)
+
+
+def test_circle():
+    fence = geofence.CircleFence('depot', 35.0, -79.0, 100.0)
+    assert fence.contains(35.0005, -79.0)
+    assert not fence.contains(35.002, -79.0)
+
+
+def test_the_grid_finds_the_same_fences_as_a_scan():
+    fences = geofence.random_fences(200, seed=3)
+    index = geofence.GridIndex(fences)
+    for step in range(200):
+        latitude = 35.4 + step * 0.005
+        longitude = -79.5 + (step * 37 % 200) * 0.005
+        assert {fence.name for fence in index.lookup(latitude, longitude)} == \
+               {fence.name for fence in fences if fence.contains(latitude, longitude)}
+
+
+def test_enter_and_exit_events():
+    engine = geofence.GeofenceEngine([geofence.PolygonFence('square', SQUARE), geofence.CircleFence('depot', 35.2, -79.0, 100.0)])
+    assert engine.update(fix_at(0, 34.9, -79.05)) == []
+    entered = engine.update(fix_at(1, 35.02, -79.08))
+    assert [event.text for event in entered] == ['ENTER square']
+    assert engine.inside(1) == frozenset({'square'})
+    assert engine.update(fix_at(2, 35.03, -79.08)) == []
+    left = engine.update(fix_at(3, 35.2, -79.0))
+    assert [event.text for event in left] == ['EXIT square', 'ENTER depot']
+    assert engine.last_event(1).text == 'ENTER depot'
+    assert engine.event_count == 3
+
+
+def test_a_fence_for_other_callsigns_is_left_out():
+    engine = geofence.GeofenceEngine([geofence.PolygonFence('square', SQUARE, frozenset({'N0CALL'}))])
+    assert engine.update(fix_at(0, 35.02, -79.08, callsign='KF4WBK')) == []
+    assert [event.text for event in engine.update(fix_at(0, 35.02, -79.08, callsign='N0CALL', source=2))] == ['ENTER square']
+
+
+def test_an_old_event_is_not_held_and_prime_makes_no_event():
+    engine = geofence.GeofenceEngine([geofence.PolygonFence('square', SQUARE)], hold_time=60.0)
+    fix = fix_at(0, 35.02, -79.08)
+    engine.update(fix)
+    assert engine.last_event(1, fix.received + 59.0) is not None
+    assert engine.last_event(1, fix.received + 61.0) is None
+    restarted = geofence.GeofenceEngine([geofence.PolygonFence('square', SQUARE)])
+    restarted.prime(fix)
+    assert restarted.update(fix_at(1, 35.03, -79.08)) == []
+
+
+def test_load_fences(tmp_path):
+    file_name = tmp_path / 'fences.geojson'
+    file_name.write_text(json.dumps({'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'properties': {'name': 'square'}, 'geometry': {'type': 'Polygon', 'coordinates': SQUARE}},
+        {'type': 'Feature', 'properties': {'name': 'depot', 'radius': 50, 'callsigns': ['KF4WBK']},
+         'geometry': {'type': 'Point', 'coordinates': [-79.0, 35.2]}},
+    ]}))
+    square, depot = geofence.load_fences(str(file_name))
+    assert square.name == 'square' and square.contains(35.02, -79.08)
+    assert depot.callsigns == frozenset({'KF4WBK'}) and depot.contains(35.2, -79.0)
+
+
+def test_a_point_without_a_radius_is_an_error(tmp_path):
+    file_name = tmp_path / 'fences.geojson'
+    file_name.write_text(json.dumps({'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'properties': {'name': 'depot'}, 'geometry': {'type': 'Point', 'coordinates': [-79.0, 35.2]}}]}))
+    with pytest.raises(ValueError):
+        geofence.load_fences(str(file_name))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Tests of the publish and subscribe point, a consumer waiting with no timeout is woken by an insert and by close
+
+import threading
+import time
+
+import lock_and_data
+import position_fix
+import position_table
+
+
+class Consumer:
+    """
+    A thread blocked in wait_for_update with no timeout, so only a notify can wake it
+    """
+
+    def __init__(self, table: lock_and_data.LockAndData, version: int = 0):
+        self.result = None
+        self.woken = None
+        self.thread = threading.Thread(target=self.wait, args=(table, version))
+        self.thread.start()
+        # give the consumer time to block, it must still be waiting
+        time.sleep(0.05)
+        assert self.thread.is_alive()
+
+    def wait(self, table: lock_and_data.LockAndData, version: int) -> None:
+        self.result = table.wait_for_update(version, None)
+        self.woken = time.monotonic()
+
+    def join(self) -> float:
+        self.thread.join(5.0)
+        assert not self.thread.is_alive()
+        return self.woken
+
+
+def test_an_insert_wakes_a_consumer_at_once():
+    table = position_table.PositionTable()
+    consumers = [Consumer(table) for _ in range(3)]
+    fix = position_fix.PositionFix(1, 2, 1, 'KF4WBK', True, 1000.0, 35.0, -79.0, received=1000.0)
+    inserted = time.monotonic()
+    table.insert(fix)
+    for consumer in consumers:
+        assert consumer.join() - inserted < 0.5
+        assert consumer.result == (1, fix)
+
+
+def test_close_wakes_a_consumer_with_the_version_unchanged():
+    table = position_table.PositionTable()
+    table.insert(position_fix.PositionFix(1, 2, 1, 'KF4WBK', True, 1000.0, 35.0, -79.0, received=1000.0))
+    consumer = Consumer(table, version=1)
+    closed = time.monotonic()
+    table.close()
+    assert consumer.join() - closed < 0.5
+    assert consumer.result[0] == 1
+    assert table.closed
+    # after close a wait returns at once instead of blocking
+    assert table.wait_for_update(1, None)[0] == 1
+
+
+def test_publish_wakes_a_consumer_and_a_timeout_does_not_change_the_version():
+    data = lock_and_data.LockAndData()
+    assert data.wait_for_update(0, 0.01) == (0, None)
+    consumer = Consumer(data)
+    data.data = 'fix'
+    consumer.join()
+    assert consumer.result == (1, 'fix')
+    # a consumer that already saw the version does not wait
+    assert data.wait_for_update(0, None) == (1, 'fix')
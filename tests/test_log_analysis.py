@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Tests of the log analysis, both forms of log line, the numpy parser against the python one, the chunks and the cache
+
+import random
+
+import pytest
+
+import log_analysis
+import track_export
+
+NEW_LINES = ['12:00:00.000 01:06:23 -79.0193500 35.9556300 KF4WBK\n',
+             '12:00:10.500 01:06:23 -79.0190000 35.9560000 KF4WBK\n',
+             '12:00:20.000 02:06:23 -79.1000000 35.8000000 N0CALL\n']
+# the lines written before the callsign was logged
+OLD_LINES = ['11:00:00.000 01:06:23 -79.0100000 35.9500000\n',
+             '11:00:05.000 01:06:23 -79.0110000 35.9510000\n']
+
+
+def write_log(tmp_path, lines: list, mode: str = 'w') -> str:
+    file_name = str(tmp_path / 'position.log')
+    with open(file_name, mode, encoding='utf-8') as file:
+        file.writelines(lines)
+    return file_name
+
+
+def random_lines(count: int, seed: int) -> list:
+    generator = random.Random(seed)
+    lines = []
+    for number in range(count):
+        line = f'{number // 3600 % 24:02d}:{number // 60 % 60:02d}:{generator.uniform(0, 60):06.3f} {1 + number // 20000:02d}:06:23 ' \
+               f'{generator.uniform(-80, -78):.7f} {generator.uniform(35, 36):.7f}'
+        if generator.random() < 0.7:
+            line += ' ' + generator.choice(['KF4WBK', 'N0CALL-9', 'W1AW'])
+        lines.append(line + '\n')
+    return lines
+
+
+def test_both_forms_of_log_line_are_parsed():
+    columns, days, lines, skipped = log_analysis.parse_lines((''.join(OLD_LINES + NEW_LINES) + '12:00 cut short\n').encode())
+    assert list(columns) == [track_export.UNKNOWN_CALLSIGN, 'KF4WBK', 'N0CALL']
+    assert (lines, skipped) == (6, 1)
+    times, latitudes, longitudes, day_numbers = columns['KF4WBK']
+    assert list(times) == [1685620800.0, 1685620810.5]
+    assert list(latitudes) == [35.95563, 35.956]
+    assert list(longitudes) == [-79.01935, -79.019]
+    assert [days[number] for number in columns['N0CALL'][3]] == ['2023-06-02']
+    assert [days[number] for number in day_numbers] == ['2023-06-01'] * 2
+
+
+def test_a_log_without_callsigns_is_not_skipped(tmp_path):
+    file_name = write_log(tmp_path, [' '.join(line.split()[:4]) + '\n' for line in random_lines(2000, 1)])
+    summary, _ = log_analysis.analyze(file_name, workers=1)
+    assert (summary.lines, summary.skipped) == (2000, 0)
+    assert list(summary.callsigns) == [track_export.UNKNOWN_CALLSIGN]
+    assert summary.callsigns[track_export.UNKNOWN_CALLSIGN].fixes == 2000
+
+
+def test_numpy_parses_the_same_as_python():
+    pytest.importorskip('numpy')
+    lines = random_lines(3000, 2)
+    # cut short and no time
+    lines[10] = lines[10][:20] + '\n'
+    lines[11] = 'no fix\n'
+    text = ''.join(lines).encode()
+    expected = log_analysis.parse_lines_python(text)
+    for parsed in (log_analysis.parse_lines_numpy(text), log_analysis.parse_lines(memoryview(text))):
+        assert parsed[2:] == expected[2:] == (3000, 2)
+        assert list(parsed[0]) == list(expected[0])
+        for callsign, columns in parsed[0].items():
+            assert [list(column) for column in columns[:3]] == list(expected[0][callsign][:3])
+            assert [parsed[1][number] for number in columns[3]] == [expected[1][number] for number in expected[0][callsign][3]]
+    # a fix numpy does not parse leaves the chunk to python
+    lines[12] = '12:00:00.000 01:06:23 -7.9e1 35.5 KF4WBK\n'
+    text = ''.join(lines).encode()
+    assert log_analysis.parse_lines_numpy(text) is None
+    assert log_analysis.parse_lines(text) == log_analysis.parse_lines_python(text)
+    assert -79.0 in log_analysis.parse_lines(text)[0]['KF4WBK'][2]
+
+
+def test_the_summary_is_the_same_for_any_chunk_size(tmp_path):
+    file_name = write_log(tmp_path, random_lines(3000, 3))
+    whole, _ = log_analysis.analyze(file_name, workers=1, use_cache=False)
+    chunked, statistics = log_analysis.analyze(file_name, workers=1, chunk_size=4096, use_cache=False)
+    assert statistics['chunks'] > 10
+    assert log_analysis.report(chunked) == log_analysis.report(whole)
+    assert (chunked.lines, chunked.skipped) == (3000, 0)
+
+
+def test_the_cache_parses_only_the_lines_added(tmp_path):
+    lines = random_lines(2000, 4)
+    file_name = write_log(tmp_path, lines[:1500])
+    log_analysis.analyze(file_name, workers=1)
+    size = len(''.join(lines[1500:]))
+    write_log(tmp_path, lines[1500:], 'a')
+    summary, statistics = log_analysis.analyze(file_name, workers=1)
+    assert statistics['bytes'] == size
+    full, _ = log_analysis.analyze(file_name, workers=1, use_cache=False)
+    assert log_analysis.report(summary) == log_analysis.report(full)
+    # a rotated log is parsed from the start
+    write_log(tmp_path, NEW_LINES)
+    summary, statistics = log_analysis.analyze(file_name, workers=1)
+    assert statistics['bytes'] == len(''.join(NEW_LINES))
+    assert summary.lines == 3
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+# Tests of the gps packet decoder, the fixes it makes and the reasons it counts for the packets it rejects
+
+import calendar
+
+import pytest
+
+import packet_decoder
+import radio_simulator
+
+FIX: bytes = b'KF4WBK,171207.250,A,3557.3377,N,07901.1607,W,120923'
+
+
+def decode(payload: bytes, decoder: packet_decoder.PacketDecoder = None):
+    decoder = packet_decoder.PacketDecoder() if decoder is None else decoder
+    return decoder.decode(radio_simulator.make_packet(7, source=3, destination=2, payload=payload))
+
+
+def test_a_valid_fix():
+    fix = decode(FIX)
+    assert (fix.source, fix.destination, fix.identifier, fix.callsign, fix.valid) == (3, 2, 7, 'KF4WBK', True)
+    assert fix.timestamp == calendar.timegm((2023, 9, 12, 17, 12, 7)) + 0.25
+    assert fix.latitude == pytest.approx(35.9556283, abs=1e-7)
+    assert fix.longitude == pytest.approx(-79.0193450, abs=1e-7)
+    assert (fix.time_text, fix.date_text) == ('17:12:07.250', '12:09:23')
+    assert (fix.latitude_text, fix.longitude_text) == ('35.9556283', '-79.0193450')
+
+
+def test_the_time_text_keeps_the_packet_form():
+    # the time text is cut from the packet, a time without milliseconds stays without them
+    fix = decode(b'KF4WBK,171207,A,3557.3377,S,07901.1607,E,120923')
+    assert fix.time_text == '17:12:07'
+    assert (fix.latitude_text, fix.longitude_text) == ('-35.9556283', '79.0193450')
+
+
+def test_buffers_decode_like_bytes():
+    packet = radio_simulator.make_packet(7, source=3, payload=FIX)
+    expected = decode(FIX)
+    decoder = packet_decoder.PacketDecoder(radio=1)
+    for buffer in (packet, bytearray(packet), memoryview(packet)):
+        fix = decoder.decode(buffer)
+        assert (fix.source, fix.callsign, fix.timestamp, fix.radio) == (3, 'KF4WBK', expected.timestamp, 1)
+        assert (fix.latitude, fix.longitude, fix.log_line) == (expected.latitude, expected.longitude, expected.log_line)
+    assert decoder.decoded == 3
+
+
+def test_a_moving_transmitter_gets_new_positions():
+    decoder = packet_decoder.PacketDecoder()
+    first = decode(FIX, decoder)
+    moved = decode(FIX.replace(b'3557.3377', b'3557.3477'), decoder)
+    assert moved.latitude > first.latitude
+    assert decode(FIX, decoder).latitude == first.latitude
+    # a change in the degrees alone is a new position too
+    assert decode(FIX.replace(b'07901.1607', b'07801.1607'), decoder).longitude == pytest.approx(first.longitude + 1)
+
+
+def test_the_minute_changes_with_the_date():
+    decoder = packet_decoder.PacketDecoder()
+    first = decode(FIX, decoder)
+    assert decode(FIX.replace(b'120923', b'130923'), decoder).timestamp == first.timestamp + 86400
+    assert decode(FIX.replace(b'171207.250', b'171307.250'), decoder).timestamp == first.timestamp + 60
+    assert decode(FIX.replace(b'120923', b'130923'), decoder).date_text == '13:09:23'
+
+
+def test_fixes_without_a_position():
+    no_fix = decode(b'KF4WBK,V')
+    assert (no_fix.callsign, no_fix.valid, no_fix.timestamp, no_fix.latitude) == ('KF4WBK', False, None, None)
+    assert (no_fix.latitude_text, no_fix.time_text) == ('', '')
+    empty = decode(b'KF4WBK,171207.000,V,,,,,120923')
+    assert (empty.valid, empty.latitude, empty.longitude, empty.time_text) == (False, None, None, '17:12:07.000')
+
+
+@pytest.mark.parametrize('packet, reason', [
+    (b'', packet_decoder.REJECT_TOO_SHORT),
+    (b'\x02\x01', packet_decoder.REJECT_TOO_SHORT),
+    (b'\x02\x01\x07\x00K', packet_decoder.REJECT_TOO_SHORT),
+    (radio_simulator.make_packet(7, payload=b'KF'), packet_decoder.REJECT_FIELD_COUNT),
+    (radio_simulator.make_packet(7, payload=b'KF4WBK,A'), packet_decoder.REJECT_FIELD_COUNT),
+    (radio_simulator.make_packet(7, payload=FIX + b',extra'), packet_decoder.REJECT_FIELD_COUNT),
+    (radio_simulator.make_packet(7, payload=FIX.replace(b',A,', b',X,')), packet_decoder.REJECT_BAD_VALID_FLAG),
+    (radio_simulator.make_packet(7, payload=FIX.replace(b',N,', b',Q,')), packet_decoder.REJECT_BAD_HEMISPHERE),
+    (radio_simulator.make_packet(7, payload=FIX.replace(b',W,', b',X,')), packet_decoder.REJECT_BAD_HEMISPHERE),
+    (radio_simulator.make_packet(7, payload=FIX.replace(b'3557.3377', b'35x7.3377')), packet_decoder.REJECT_BAD_NUMBER),
+    (radio_simulator.make_packet(7, payload=FIX.replace(b'171207.250', b'1712')), packet_decoder.REJECT_BAD_NUMBER),
+    (radio_simulator.make_packet(7, payload=FIX.replace(b'120923', b'320923')), packet_decoder.REJECT_BAD_NUMBER),
+    (radio_simulator.make_packet(7, payload=FIX.replace(b'120923', b'311323')), packet_decoder.REJECT_BAD_NUMBER),
+    (radio_simulator.make_packet(7, payload=FIX.replace(b'120923', b'290223')), packet_decoder.REJECT_BAD_NUMBER),
+    (radio_simulator.make_packet(7, payload=FIX.replace(b'171207', b'241207')), packet_decoder.REJECT_BAD_NUMBER),
+    (radio_simulator.make_packet(7, payload=FIX.replace(b'3557.3377,N', b'3557.3377,')), packet_decoder.REJECT_BAD_NUMBER),
+    (radio_simulator.make_packet(7, payload=FIX.replace(b'KF4WBK', b'')), packet_decoder.REJECT_BAD_TEXT),
+    (radio_simulator.make_packet(7, payload=FIX.replace(b'KF4WBK', b'K' * 17)), packet_decoder.REJECT_BAD_TEXT),
+])
+def test_each_reject_reason_is_counted(packet, reason):
+    decoder = packet_decoder.PacketDecoder()
+    assert decoder.decode(packet) is None
+    assert decoder.rejected == {reason: 1}
+    assert decoder.decoded == 0
+
+
+def test_a_bad_date_does_not_poison_the_next_packet():
+    decoder = packet_decoder.PacketDecoder()
+    assert decode(FIX.replace(b'120923', b'320923'), decoder) is None
+    assert decode(FIX, decoder).date_text == '12:09:23'
+    assert decoder.decoded == 1
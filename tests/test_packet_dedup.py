@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Tests of the sequence window that finds resent packets and decides which duplicates are acked again
+
+import pytest
+
+import packet_dedup
+import radio_simulator
+
+
+def packet(identifier: int, text: str = 'fix', source: int = 1) -> bytes:
+    return radio_simulator.make_packet(identifier, source=source, payload=f'KF4WBK,{text} {identifier}'.encode())
+
+
+def test_new_duplicate_and_out_of_order():
+    dedup = packet_dedup.PacketDeduplicator(window=32)
+    assert dedup.check_packet(packet(1), now=0.0) == packet_dedup.PACKET_NEW
+    assert dedup.check_packet(packet(3), now=1.0) == packet_dedup.PACKET_NEW
+    assert dedup.check_packet(packet(2), now=2.0) == packet_dedup.PACKET_OUT_OF_ORDER
+    assert dedup.check_packet(packet(3), now=3.0) == packet_dedup.PACKET_DUPLICATE
+    assert dedup.check_packet(packet(2), now=4.0) == packet_dedup.PACKET_DUPLICATE
+    assert dedup.statistics() == {'accepted': 3, 'duplicates': 2, 'out_of_order': 1, 'windows_reset': 0, 'sources': 1}
+
+
+def test_sources_have_their_own_windows():
+    dedup = packet_dedup.PacketDeduplicator()
+    assert dedup.check_packet(packet(5, source=1), now=0.0) == packet_dedup.PACKET_NEW
+    assert dedup.check_packet(packet(5, source=2), now=0.0) == packet_dedup.PACKET_NEW
+
+
+def test_the_identifier_wraps():
+    dedup = packet_dedup.PacketDeduplicator()
+    for number, identifier in enumerate((254, 255, 0, 1)):
+        assert dedup.check_packet(packet(identifier), now=number) == packet_dedup.PACKET_NEW
+    assert dedup.check_packet(packet(255), now=5.0) == packet_dedup.PACKET_DUPLICATE
+
+
+def test_only_an_acked_duplicate_is_acked_again():
+    dedup = packet_dedup.PacketDeduplicator()
+    dedup.check_packet(packet(1), now=0.0)
+    dedup.check_packet(packet(2), now=1.0)
+    dedup.mark_acked(1, 1)
+    assert dedup.check_packet(packet(1), now=2.0) == packet_dedup.PACKET_DUPLICATE
+    assert dedup.was_acked(1, 1)
+    assert dedup.check_packet(packet(2), now=3.0) == packet_dedup.PACKET_DUPLICATE
+    assert not dedup.was_acked(1, 2)
+
+
+def test_a_transmitter_that_restarts_within_max_age_is_not_dropped():
+    dedup = packet_dedup.PacketDeduplicator(window=32, max_age=60.0)
+    for identifier in range(10):
+        assert dedup.check_packet(packet(identifier, 'before'), now=identifier) == packet_dedup.PACKET_NEW
+        dedup.mark_acked(1, identifier)
+    # restarted at 0 with new fixes, the identifiers are still in the window
+    results = [dedup.check_packet(packet(identifier, 'after'), now=12.0 + identifier) for identifier in range(12)]
+    assert results == [packet_dedup.PACKET_NEW] * 12
+    assert dedup.statistics()['windows_reset'] == 1
+    assert not dedup.was_acked(1, 3)
+    # a resend after the restart is still a duplicate
+    assert dedup.check_packet(packet(11, 'after'), now=30.0) == packet_dedup.PACKET_DUPLICATE
+
+
+def test_a_quiet_source_starts_a_new_window():
+    dedup = packet_dedup.PacketDeduplicator(max_age=60.0)
+    dedup.check_packet(packet(1), now=0.0)
+    assert dedup.check_packet(packet(1), now=61.0) == packet_dedup.PACKET_NEW
+    assert dedup.windows_reset == 1
+
+
+def test_the_window_size_is_checked():
+    with pytest.raises(ValueError):
+        packet_dedup.PacketDeduplicator(window=129)
+    assert packet_dedup.make_deduplicator({'DedupWindow': 0}) is None
+    assert packet_dedup.make_deduplicator({'DedupWindow': 16}).window == 16
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+# Tests of the position fix record, its equality and the text forms rendered for the display, the phone and the log
+
+import calendar
+import pickle
+
+import packet_decoder
+import position_fix
+import radio_constants
+import radio_simulator
+import track_export
+
+TIMESTAMP: float = calendar.timegm((2023, 9, 12, 17, 12, 7)) + 0.25
+
+
+def make_fix(latitude: float = 35.9556283, longitude: float = -79.019345, valid: bool = True) -> position_fix.PositionFix:
+    return position_fix.PositionFix(3, 2, 7, 'KF4WBK', valid, TIMESTAMP, latitude, longitude, received=TIMESTAMP + 1.0, radio=1)
+
+
+def test_a_fix_is_only_equal_to_itself():
+    first, second = make_fix(), make_fix()
+    assert first == first  # pylint: disable=R0124
+    assert first != second
+    assert len({first, second}) == 2
+    assert first.__getnewargs__() == second.__getnewargs__()
+
+
+def test_same_position():
+    assert make_fix().same_position(make_fix())
+    assert not make_fix().same_position(make_fix(latitude=35.0))
+    assert not make_fix().same_position(position_fix.PositionFix(4, 2, 7, 'KF4WBK', True, TIMESTAMP, 35.9556283, -79.019345))
+    assert not make_fix().same_position(None)
+
+
+def test_the_items_survive_a_pickle():
+    fix = make_fix()
+    fix.log_line  # pylint: disable=W0104
+    copy = pickle.loads(pickle.dumps(fix))
+    assert copy.__getnewargs__() == fix.__getnewargs__()
+    assert (copy.received, copy.radio, copy.log_line) == (TIMESTAMP + 1.0, 1, fix.log_line)
+
+
+def test_the_texts():
+    fix = make_fix()
+    assert (fix.latitude_text, fix.longitude_text) == ('35.9556283', '-79.0193450')
+    assert (fix.time_text, fix.date_text) == ('17:12:07.250', '12:09:23')
+    assert fix.bluetooth_text == f'-79.0193450, 35.9556283 {radio_constants.POSITION_VALID_VALUE}'
+
+
+def test_the_degrees_are_padded_and_never_negative_zero():
+    fix = make_fix(latitude=-0.0, longitude=5.5)
+    assert (fix.latitude_text, fix.longitude_text) == ('0.0000000', '05.5000000')
+    assert make_fix(latitude=-5.5, longitude=-0.0).longitude_text == '00.0000000'
+    assert make_fix(longitude=-5.5).longitude_text == '-05.5000000'
+    assert make_fix(longitude=179.5).longitude_text == '179.5000000'
+
+
+def test_a_fix_without_a_position_or_time_has_empty_texts():
+    fix = position_fix.PositionFix(3, 2, 7, 'KF4WBK', False)
+    assert (fix.latitude_text, fix.longitude_text, fix.time_text, fix.date_text) == ('', '', '', '')
+
+
+def test_the_log_line_formats():
+    fix = make_fix()
+    assert fix.log_line == '17:12:07.250 12:09:23 -79.0193450 35.9556283\n'
+    assert fix.callsign_log_line == '17:12:07.250 12:09:23 -79.0193450 35.9556283 KF4WBK\n'
+    assert fix.log_text(position_fix.LOG_FORMAT_LEGACY) is fix.log_line
+    assert fix.log_text(position_fix.LOG_FORMAT_CALLSIGN) is fix.callsign_log_line
+
+
+def test_the_texts_are_rendered_once():
+    fix = make_fix()
+    texts = (fix.latitude_text, fix.log_line, fix.callsign_log_line)
+    assert all(first is second for first, second in zip(texts, (fix.latitude_text, fix.log_line, fix.callsign_log_line)))
+
+
+def test_a_decoded_fix_renders_like_a_made_one():
+    payload = b'KF4WBK,171207.250,A,3557.3377,N,07901.1607,W,120923'
+    decoded = packet_decoder.PacketDecoder(radio=1).decode(radio_simulator.make_packet(7, source=3, payload=payload))
+    made = make_fix(decoded.latitude, decoded.longitude)
+    for name in ('latitude_text', 'longitude_text', 'time_text', 'date_text', 'bluetooth_text', 'log_line', 'callsign_log_line'):
+        assert getattr(decoded, name) == getattr(made, name)
+
+
+def test_both_log_formats_are_read_back(tmp_path):
+    file_name = str(tmp_path / 'position.log')
+    fix = make_fix()
+    with open(file_name, 'w', encoding='utf-8') as file:
+        file.write(fix.log_text(position_fix.LOG_FORMAT_LEGACY))
+        file.write(fix.log_text(position_fix.LOG_FORMAT_CALLSIGN))
+    points = list(track_export.read_position_log([file_name], log_callsign='W1AW'))
+    assert [point.callsign for point in points] == ['W1AW', 'KF4WBK']
+    assert {(point.timestamp, point.latitude, point.longitude) for point in points} == {(TIMESTAMP, 35.9556283, -79.019345)}
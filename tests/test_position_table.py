@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+# Tests of the position table, the eviction of silent sources, the changed entries and the history of each source
+
+import threading
+
+import position_fix
+import position_table
+
+
+def make_fix(source: int, number: int, received: float = 1000.0, valid: bool = True) -> position_fix.PositionFix:
+    return position_fix.PositionFix(source, 2, number, f'N{source}CALL', valid, received, 35.0 + number / 1000 if valid else None,
+                                    -79.0 if valid else None, received=received)
+
+
+class Tracker:
+    """
+    A stand in for the track analytics and the geofence, it records its calls and checks the table lock is free
+    """
+
+    def __init__(self, table: position_table.PositionTable = None):
+        self.table = table
+        self.updated = []
+        self.forgotten = []
+        self.lock_was_free = []
+
+    def table_lock_is_free(self) -> bool:
+        reader = threading.Thread(target=self.table.sources)
+        reader.start()
+        reader.join(1.0)
+        return not reader.is_alive()
+
+    def update(self, fix) -> None:
+        self.updated.append(fix)
+        self.lock_was_free.append(self.table_lock_is_free())
+
+    def forget(self, source: int) -> None:
+        self.forgotten.append(source)
+        self.lock_was_free.append(self.table_lock_is_free())
+
+    def prime(self, fix) -> None:
+        self.updated.append(fix)
+
+
+def test_the_source_silent_the_longest_is_evicted_when_the_table_is_full():
+    tracker = Tracker()
+    table = position_table.PositionTable(max_sources=2, silent_timeout=0, analytics=tracker, geofence=tracker)
+    tracker.table = table
+    fixes = [make_fix(source, 1) for source in (1, 2, 1, 3)]
+    for fix in fixes:
+        table.insert(fix)
+    assert table.sources() == [1, 3]
+    assert table.latest(2) is None
+    assert table.latest() is fixes[3]
+    assert tracker.forgotten == [2, 2]
+    # the analytics, the geofence and their logs run without the table lock
+    assert all(tracker.lock_was_free)
+    assert tracker.updated == [fix for fix in fixes for _ in range(2)]
+
+
+def test_silent_sources_are_evicted_and_not_kept_as_the_latest_fix():
+    table = position_table.PositionTable(silent_timeout=60.0)
+    old = make_fix(1, 1, received=1000.0)
+    table.insert(old)
+    table.insert(make_fix(2, 1, received=1030.0))
+    table.insert(make_fix(3, 1, received=1070.0))
+    assert table.sources() == [2, 3]
+    table.evict_silent()
+    assert not table.sources()
+    assert table.latest() is None
+    assert table.data is None
+
+
+def test_a_restored_latest_fix_that_is_evicted_is_replaced():
+    table = position_table.PositionTable(max_sources=1, silent_timeout=0)
+    newest = make_fix(1, 1, received=2000.0)
+    older = make_fix(2, 1, received=1000.0)
+    # the snapshot order puts the newest fix in front, so it is the one evicted
+    assert table.restore([(1, 1, newest, [newest]), (2, 1, older, [older])], now=2000.0) == 2
+    assert table.sources() == [2]
+    assert table.latest() is older
+
+
+def test_changed_since_only_returns_the_sources_changed_after_a_version():
+    table = position_table.PositionTable()
+    first = table.insert(make_fix(1, 1))
+    table.insert(make_fix(2, 1))
+    moved = make_fix(1, 2)
+    last = table.insert(moved)
+    version, changed = table.changed_since(0)
+    assert version == last == 3
+    assert [fix.source for fix in changed] == [2, 1]
+    assert changed[-1] is moved
+    assert table.changed_since(first)[1] == changed
+    assert table.changed_since(last) == (last, [])
+
+
+def test_the_history_keeps_the_last_valid_fixes():
+    table = position_table.PositionTable(history_length=3)
+    fixes = [make_fix(1, number) for number in range(5)]
+    for fix in fixes:
+        table.insert(fix)
+    table.insert(make_fix(1, 5, valid=False))
+    assert table.history(1) == fixes[2:]
+    assert table.history(1, 2) == fixes[3:]
+    assert table.history(1, 10) == fixes[2:]
+    assert not table.history(1, 0)
+    assert not table.history(9)
+    assert table.count(1) == 6
+    assert not table.latest(1).valid
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Tests of the position log writer, the batches, the fsync policies, the rotation and appending after a restart
+
+import os
+import time
+
+import pytest
+
+import position_writer
+
+LINE = '12:00:00.000 01:06:23 -79.0193500 35.9556300 KF4WBK\n'
+
+
+def read(file_name: str) -> str:
+    with open(file_name, encoding='utf-8') as file:
+        return file.read()
+
+
+def test_lines_are_written_in_batches(tmp_path):
+    file_name = str(tmp_path / 'position.log')
+    writer = position_writer.PositionWriter(file_name, batch_size=len(LINE) * 3, batch_age=60.0)
+    writer.write(LINE)
+    writer.write(LINE)
+    assert read(file_name) == ''
+    assert writer.time_to_flush() > 59.0
+    writer.write(LINE)
+    assert read(file_name) == LINE * 3
+    assert (writer.batches_written, writer.lines_written, writer.time_to_flush()) == (1, 3, None)
+    writer.write(LINE)
+    writer.close()
+    assert read(file_name) == LINE * 4
+    assert writer.statistics()['batches_written'] == 2
+    with pytest.raises(ValueError):
+        writer.flush()
+
+
+def test_an_old_line_is_written_without_waiting_for_a_full_batch(tmp_path):
+    file_name = str(tmp_path / 'position.log')
+    with position_writer.PositionWriter(file_name, batch_age=0.05) as writer:
+        writer.write(LINE)
+        assert not writer.flush_due()
+        time.sleep(0.06)
+        assert writer.flush_due()
+        writer.write(LINE)
+        assert read(file_name) == LINE * 2
+
+
+@pytest.mark.parametrize('policy, interval, fsyncs', [(position_writer.FSYNC_NONE, 0.0, 0),
+                                                      (position_writer.FSYNC_BATCH, 0.0, 3),
+                                                      (position_writer.FSYNC_INTERVAL, 0.0, 3),
+                                                      (position_writer.FSYNC_INTERVAL, 3600.0, 0)])
+def test_each_fsync_policy(tmp_path, policy, interval, fsyncs):
+    writer = position_writer.PositionWriter(str(tmp_path / 'position.log'), batch_size=1, fsync_policy=policy, fsync_interval=interval)
+    for _ in range(3):
+        writer.write(LINE)
+    assert writer.fsyncs == fsyncs
+    writer.flush(fsync=True)
+    assert writer.fsyncs == fsyncs + 1
+    writer.close()
+    # close syncs unless the policy is none, the buffer is empty so it is only the forced one
+    assert writer.fsyncs == fsyncs + 1 + (policy != position_writer.FSYNC_NONE)
+
+
+def test_an_unknown_policy_or_negative_backups_are_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        position_writer.PositionWriter(str(tmp_path / 'position.log'), fsync_policy='sometimes')
+    with pytest.raises(ValueError):
+        position_writer.PositionWriter(str(tmp_path / 'position.log'), backup_count=-1)
+
+
+def test_the_log_is_rotated_on_size_and_the_oldest_backup_dropped(tmp_path):
+    file_name = str(tmp_path / 'position.log')
+    with position_writer.PositionWriter(file_name, batch_size=1, max_bytes=len(LINE) * 2, backup_count=2) as writer:
+        for number in range(7):
+            writer.write(LINE.replace('KF4WBK', f'CALL{number}'))
+    assert writer.rotations == 3
+    assert sorted(os.listdir(tmp_path)) == ['position.log', 'position.log.1', 'position.log.2']
+    assert 'CALL6' in read(file_name)
+    assert 'CALL4' in read(file_name + '.1') and 'CALL5' in read(file_name + '.1')
+    assert 'CALL2' in read(file_name + '.2')
+
+
+def test_the_log_is_rotated_on_time(tmp_path):
+    file_name = str(tmp_path / 'position.log')
+    with position_writer.PositionWriter(file_name, batch_size=1, rotate_interval=0.05) as writer:
+        writer.write(LINE)
+        time.sleep(0.06)
+        writer.write(LINE)
+    assert writer.rotations == 1
+    assert read(file_name) == read(file_name + '.1') == LINE
+
+
+def test_without_backups_the_log_is_never_rotated(tmp_path):
+    file_name = str(tmp_path / 'position.log')
+    with position_writer.PositionWriter(file_name, batch_size=1, max_bytes=len(LINE), rotate_interval=0.01, backup_count=0) as writer:
+        for _ in range(3):
+            writer.write(LINE)
+            time.sleep(0.02)
+        writer.rotate()
+    assert writer.rotations == 0
+    assert os.listdir(tmp_path) == ['position.log']
+    assert read(file_name) == LINE * 3
+
+
+def test_a_restart_appends_to_the_log(tmp_path):
+    file_name = str(tmp_path / 'position.log')
+    with position_writer.PositionWriter(file_name) as writer:
+        writer.write(LINE)
+    with position_writer.PositionWriter(file_name, batch_size=1, max_bytes=len(LINE) * 3) as writer:
+        writer.write(LINE)
+        writer.write(LINE)
+        assert writer.rotations == 0
+        # the size of the file from before counts toward the rotation
+        writer.write(LINE)
+        assert writer.rotations == 1
+    assert read(file_name + '.1') == LINE * 3
+    assert read(file_name) == LINE
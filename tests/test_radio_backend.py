@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Tests of the radio backends, a capture of the simulated radio is played back by the replay backend
+
+import pytest
+
+import radio_backend
+import radio_simulator
+
+
+def test_a_backend_must_have_receive_and_send():
+    class ListenOnly(radio_backend.RadioBackend):  # pylint: disable=W0223
+        def receive(self, *, keep_listening: bool = True, with_header: bool = False, timeout: float = 0.5):
+            return None
+
+    with pytest.raises(TypeError):
+        ListenOnly()  # pylint: disable=E0110
+
+
+def test_capture_then_replay_gives_back_the_same_packets(tmp_path):
+    file_name = str(tmp_path / 'radio.cap')
+    packets = [radio_simulator.make_packet(identifier, source=identifier % 3 + 1) for identifier in range(20)]
+    radio = radio_simulator.SimulatedRFM69()
+    capture = radio_backend.open_backend(b'\x2d\xd4', radio, file_name)
+    capture.listen()
+    received = []
+    for packet in packets:
+        assert radio.inject(packet)
+        # the receiver asked for no header, the capture keeps it anyway
+        received.append(capture.receive(with_header=False, timeout=0))
+    capture.close()
+    assert received == [packet[4:] for packet in packets]
+    assert capture.packet_count == len(packets)
+    assert [packet for _, packet in radio_backend.read_capture(file_name)] == packets
+
+    replay = radio_backend.ReplayBackend(file_name, speed=0)
+    try:
+        replayed = []
+        while not replay.shutdown_requested():
+            packet = replay.receive(with_header=True, timeout=1.0)
+            if packet is not None:
+                replayed.append(packet)
+    finally:
+        replay.close()
+    assert replayed == packets
+    assert replay.packet_count == len(packets)
+
+
+def test_capture_appends_and_replay_stops_at_a_cut_record(tmp_path):
+    file_name = str(tmp_path / 'radio.cap')
+    for identifier in range(2):
+        radio = radio_simulator.SimulatedRFM69()
+        capture = radio_backend.CaptureBackend(radio, file_name)
+        radio.listen()
+        radio.inject(radio_simulator.make_packet(identifier))
+        assert capture.receive(timeout=0) is not None
+        capture.close()
+    with open(file_name, 'ab') as capture_file:
+        # a record whose packet was never written, as when the capture is stopped in the middle of a write
+        capture_file.write(radio_backend.CAPTURE_RECORD.pack(0.0, 40) + b'\x02\x01')
+    assert [packet[2] for _, packet in radio_backend.read_capture(file_name)] == [0, 1]
+
+
+def test_read_capture_rejects_a_file_without_the_magic(tmp_path):
+    file_name = tmp_path / 'radio.cap'
+    file_name.write_bytes(b'not a capture')
+    with pytest.raises(ValueError):
+        list(radio_backend.read_capture(str(file_name)))
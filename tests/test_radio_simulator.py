@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Tests of the receive path on the simulated radio, the interrupt mode is woken by DIO0 and polling sleeps between looks
+
+import threading
+
+import radio_interrupt
+import radio_simulator
+
+
+def test_interrupt_mode_misses_no_packets():
+    result = radio_simulator.measure_receive_latency(radio_interrupt.RECEIVE_MODE_INTERRUPT, count=50, interval=0.01, sleep_time=0.2)
+    assert result['mode'] == radio_interrupt.RECEIVE_MODE_INTERRUPT
+    assert result['published'] == 50
+    assert result['missed_rate'] == 0.0
+    # woken by the interrupt, not by the end of the sleep time
+    assert result['max_latency'] < 0.1
+
+
+def test_polling_misses_packets_that_arrive_faster_than_it_looks():
+    result = radio_simulator.measure_receive_latency(radio_interrupt.RECEIVE_MODE_POLL, count=50, interval=0.01, sleep_time=0.2)
+    assert result['mode'] == radio_interrupt.RECEIVE_MODE_POLL
+    assert result['missed_rate'] > 0.5
+
+
+def test_fifo_holds_one_packet():
+    radio = radio_simulator.SimulatedRFM69()
+    radio.listen()
+    assert radio.inject(radio_simulator.make_packet(1))
+    assert not radio.inject(radio_simulator.make_packet(2))
+    assert radio.dropped == 1
+    assert radio.receive(with_header=True, timeout=0)[2] == 1
+    assert radio.receive(timeout=0) is None
+
+
+def test_idle_radio_loses_packets():
+    radio = radio_simulator.SimulatedRFM69()
+    radio.idle()
+    assert not radio.inject(radio_simulator.make_packet(1))
+    assert radio.dropped == 1
+
+
+def test_interrupt_fires_on_inject():
+    radio = radio_simulator.SimulatedRFM69()
+    interrupt = radio_interrupt.PayloadReadyInterrupt()
+    radio.attach_interrupt(interrupt)
+    waiter = radio_interrupt.PacketWaiter(radio, interrupt, threading.Event())
+    radio.listen()
+    radio.inject(radio_simulator.make_packet(7))
+    packets = list(waiter.packets(1.0))
+    assert [packet[2] for packet in packets] == [7]
+
+
+def test_radios_on_one_bus_fill_one_table():
+    result = radio_simulator.measure_radios(radios=3, count=20, interval=0.01)
+    assert result['published'] == result['sent'] == 60
+    assert result['sources_in_table'] == 3
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Tests of the snapshot of the position table, the file round trip, a bad file and the restored fixes not logged again
+
+import logging
+import threading
+import time
+
+import position_fix
+import position_table
+import snapshot
+
+
+def make_fix(source: int, number: int, now: float, valid: bool = True):
+    return position_fix.PositionFix(source, 2, number, f'CALL{source}', valid, now + number, 35.9 + 0.0001 * number,
+                                    -79.0 - 0.01 * source, now + number + 0.001 * source)
+
+
+def fields(fixes: list) -> list:
+    # a PositionFix is only equal to itself, so the restored ones are compared by their arguments
+    return [fix.__getnewargs__() for fix in fixes]
+
+
+def filled_table(now: float, sources: int = 3, fixes: int = 10):
+    table = position_table.PositionTable(history_length=8)
+    for number in range(fixes):
+        for source in range(sources):
+            table.insert(make_fix(source, number, now))
+    return table
+
+
+def test_a_table_survives_a_write_and_restore(tmp_path):
+    now = time.time()
+    table = filled_table(now)
+    # the last fix is not valid, so the latest is not in the history and is written separately
+    table.insert(make_fix(1, 10, now, valid=False))
+    file_name = str(tmp_path / 'snapshot.json')
+    assert snapshot.write_snapshot(table, file_name, history_length=4) > 0
+    restored = position_table.PositionTable(history_length=8)
+    assert snapshot.restore_snapshot(restored, file_name) == 3
+    assert restored.sources() == [0, 2, 1]
+    for source in range(3):
+        assert fields([restored.latest(source)]) == fields([table.latest(source)])
+        assert fields(restored.history(source)) == fields(table.history(source)[-4:])
+        assert restored.count(source) == table.count(source)
+    assert restored.latest(1).valid is False
+    assert restored.count(1) == 11
+
+
+def test_the_restored_fixes_are_not_logged_again(tmp_path):
+    now = time.time()
+    file_name = str(tmp_path / 'snapshot.json')
+    snapshot.write_snapshot(filled_table(now), file_name)
+    restored = position_table.PositionTable(history_length=8)
+    snapshot.restore_snapshot(restored, file_name)
+    assert restored.version == 0
+    assert restored.changed_since(0) == (0, [])
+    assert restored.latest() is restored.latest(2)
+    # a new fix is logged, the restored ones still are not
+    restored.insert(make_fix(0, 20, now))
+    assert [fix.identifier for fix in restored.changed_since(0)[1]] == [20]
+
+
+def test_a_missing_or_bad_snapshot_leaves_the_table_empty(tmp_path, caplog):
+    table = position_table.PositionTable()
+    assert snapshot.restore_snapshot(table, str(tmp_path / 'missing.json'), logging.getLogger('test')) == 0
+    file_name = tmp_path / 'snapshot.json'
+    for data in (b'{"version": 1, "sources": [[1, 2', b'{"version": 99, "sources": []}', b'{"version": 1, "sources": [[1]]}'):
+        file_name.write_bytes(data)
+        with caplog.at_level(logging.WARNING):
+            assert snapshot.restore_snapshot(table, str(file_name), logging.getLogger('test')) == 0
+        assert 'not restored' in caplog.records[-1].getMessage()
+    assert not table.sources()
+
+
+def test_a_silent_source_is_not_restored(tmp_path):
+    file_name = str(tmp_path / 'snapshot.json')
+    snapshot.write_snapshot(filled_table(time.time() - 7200), file_name)
+    assert snapshot.restore_snapshot(position_table.PositionTable(silent_timeout=3600.0), file_name) == 0
+    assert snapshot.restore_snapshot(position_table.PositionTable(silent_timeout=0), file_name) == 3
+
+
+def test_the_thread_writes_only_when_the_table_changed(tmp_path):
+    file_name = tmp_path / 'snapshot.json'
+    table = position_table.PositionTable()
+    event = threading.Event()
+    thread = snapshot.SnapshotThread('snapshot', table, event, None, logging.getLogger('test'), 0.1,
+                                     SnapshotFile=str(file_name), SnapshotInterval=0.05)
+    thread.start()
+    time.sleep(0.2)
+    assert not file_name.exists()
+    table.insert(make_fix(5, 1, time.time()))
+    deadline = time.time() + 5
+    while not file_name.exists() and time.time() < deadline:
+        time.sleep(0.01)
+    event.set()
+    thread.join(5)
+    assert [source for source, _, _, _ in snapshot.decode_table(file_name.read_bytes())] == [5]
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Tests of the binary stream frames, each one is encoded and decoded the way the phone does it
+
+import position_fix
+import stream_protocol
+
+
+def moving_fixes(count: int, source: int = 3, start: float = 1700000000.0) -> list:
+    return [position_fix.PositionFix(source, 2, number, 'KF4WBK', True, start + number, 35.0 + 0.001 * number,
+                                     -79.0 - 0.002 * number, start + number) for number in range(count)]
+
+
+def test_zigzag_round_trip():
+    for value in (0, -1, 1, -2, 2, 12345678, -12345678, 1 << 40, -(1 << 40)):
+        assert stream_protocol.unzigzag(stream_protocol.zigzag(value)) == value
+    assert [stream_protocol.zigzag(value) for value in (0, -1, 1, -2)] == [0, 1, 2, 3]
+
+
+def test_varint_round_trip():
+    buffer = bytearray(32)
+    for value in (0, 1, 127, 128, 300, 1 << 35):
+        end = stream_protocol.put_varint(buffer, 0, value)
+        assert stream_protocol.get_varint(buffer, 0) == (value, end)
+
+
+def test_key_then_delta_frames_decode_to_the_fixes():
+    encoder = stream_protocol.BinaryEncoder(keyframe_interval=4)
+    decoder = stream_protocol.BinaryDecoder()
+    frame_types = []
+    for fix in moving_fixes(10):
+        (frame_type, source, latitude, longitude, seconds), = decoder.feed(encoder.encode([fix]))
+        frame_types.append(frame_type)
+        assert source == fix.source
+        assert round(latitude, 7) == round(fix.latitude, 7)
+        assert round(longitude, 7) == round(fix.longitude, 7)
+        assert seconds == fix.timestamp
+    key, delta = stream_protocol.FRAME_KEY, stream_protocol.FRAME_DELTA
+    assert frame_types == [key, delta, delta, delta, delta, key, delta, delta, delta, delta]
+
+
+def test_a_frame_split_across_reads_is_decoded_when_it_is_complete():
+    encoder = stream_protocol.BinaryEncoder()
+    decoder = stream_protocol.BinaryDecoder()
+    data = b''.join(encoder.encode([fix]) for fix in moving_fixes(3))
+    frames = []
+    for offset in range(len(data)):
+        frames.extend(decoder.feed(data[offset:offset + 1]))
+    assert [round(frame[2], 7) for frame in frames] == [35.0, 35.001, 35.002]
+
+
+def test_no_fix_and_keepalive_frames():
+    encoder = stream_protocol.BinaryEncoder()
+    decoder = stream_protocol.BinaryDecoder()
+    no_fix = position_fix.PositionFix(5, 2, 1, 'KF4WBK', False)
+    assert decoder.feed(encoder.encode([no_fix])) == [(stream_protocol.FRAME_NO_FIX, 5, None, None, None)]
+    assert decoder.feed(encoder.encode([], keepalive=True)) == [(stream_protocol.FRAME_KEEPALIVE, None, None, None, None)]
+    # nothing changed and no keepalive, nothing is sent
+    assert encoder.encode([]) == b''
+
+
+def test_a_dropped_delta_frame_leaves_the_decoder_on_a_stale_base():
+    encoder = stream_protocol.BinaryEncoder(keyframe_interval=16)
+    decoder = stream_protocol.BinaryDecoder()
+    fixes = moving_fixes(6)
+    frames = [encoder.encode([fix]) for fix in fixes]
+    decoded = [decoder.feed(frame)[0] for number, frame in enumerate(frames) if number != 2]
+    # the deltas after the dropped frame are applied to the fix before it
+    assert round(decoded[-1][2], 7) != round(fixes[-1].latitude, 7)
+
+
+def test_reset_sends_a_key_frame_next():
+    encoder = stream_protocol.BinaryEncoder(keyframe_interval=16)
+    fixes = moving_fixes(3)
+    encoder.encode(fixes[:2])
+    encoder.reset()
+    assert encoder.encode([fixes[2]])[0] == stream_protocol.FRAME_KEY
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Tests of the stream server on a unix socket, serve_once is called by the test so it decides when the clients are served
+
+import socket
+import struct
+
+import pytest
+
+import position_fix
+import stream_protocol
+import stream_server
+
+MESSAGE = struct.Struct('<I')
+
+
+def start_server(tmp_path, clients: int, max_queue: int = 8, encoder_factory=None) -> tuple:
+    path = str(tmp_path / 'stream.sock')
+    server = stream_server.StreamServer(max_queue=max_queue, encoder_factory=encoder_factory)
+    server.add_listener(stream_server.UNIX_PREFIX + path)
+    sockets = []
+    for _ in range(clients):
+        client_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        client_socket.connect(path)
+        sockets.append(client_socket)
+    while server.client_count < clients:
+        server.serve_once(0.1)
+    return server, sockets
+
+
+def drain(server, sockets) -> list:
+    """
+    serve until every queue is empty and read what each client got
+    """
+    received = [b''] * len(sockets)
+    for client_socket in sockets:
+        client_socket.setblocking(False)
+    while True:
+        server.serve_once(0.01)
+        for number, client_socket in enumerate(sockets):
+            try:
+                while True:
+                    data = client_socket.recv(65536)
+                    if not data:
+                        break
+                    received[number] += data
+            except BlockingIOError:
+                pass
+        if not server.queued:
+            return received
+
+
+def messages(data: bytes) -> list:
+    return [MESSAGE.unpack_from(data, offset)[0] for offset in range(0, len(data), MESSAGE.size)]
+
+
+def test_every_client_gets_every_message_in_order(tmp_path):
+    server, sockets = start_server(tmp_path, 3)
+    try:
+        for number in range(20):
+            assert server.broadcast(MESSAGE.pack(number)) == 3
+            server.serve_once(0)
+        for data in drain(server, sockets):
+            assert messages(data) == list(range(20))
+        assert server.dropped == 0
+    finally:
+        server.close()
+        for client_socket in sockets:
+            client_socket.close()
+
+
+def test_a_client_that_falls_behind_keeps_the_newest_messages(tmp_path):
+    server, sockets = start_server(tmp_path, 2, max_queue=8)
+    try:
+        # nothing is served while the messages are queued, so the queue of each client overflows
+        for number in range(20):
+            server.broadcast(MESSAGE.pack(number))
+        assert server.queued == 16
+        assert server.dropped == 24
+        for data in drain(server, sockets):
+            assert messages(data) == list(range(12, 20))
+    finally:
+        server.close()
+        for client_socket in sockets:
+            client_socket.close()
+
+
+def test_a_client_that_leaves_does_not_stop_the_others(tmp_path):
+    server, sockets = start_server(tmp_path, 2)
+    try:
+        sockets[0].close()
+        while server.client_count > 1:
+            server.serve_once(0.1)
+        assert server.broadcast(MESSAGE.pack(1)) == 1
+        assert messages(drain(server, sockets[1:])[0]) == [1]
+    finally:
+        server.close()
+        sockets[1].close()
+
+
+def test_listen_socket_rejects_an_unknown_address():
+    with pytest.raises(ValueError):
+        stream_server.listen_socket('pipe:/tmp/nothing')
+
+
+def test_a_binary_client_that_falls_behind_decodes_the_right_positions(tmp_path):
+    factory = stream_protocol.encoder_factory(stream_protocol.PROTOCOL_BINARY, None, keyframe_interval=16)
+    server, sockets = start_server(tmp_path, 1, max_queue=4, encoder_factory=factory)
+    fixes = [position_fix.PositionFix(3, 2, number, 'KF4WBK', True, 1700000000.0 + number, 35.0 + 0.001 * number, -79.0, 1700000000.0 + number)
+             for number in range(10)]
+    try:
+        # the client is not served while the fixes are published, so its queue overflows
+        for fix in fixes:
+            server.publish([fix])
+        assert server.dropped
+        decoder = stream_protocol.BinaryDecoder()
+        frames = decoder.feed(drain(server, sockets)[0])
+        assert frames
+        assert frames[0][0] == stream_protocol.FRAME_KEY
+        by_time = {fix.timestamp: fix for fix in fixes}
+        for _, source, latitude, longitude, seconds in frames:
+            assert source == 3
+            assert round(latitude, 7) == round(by_time[seconds].latitude, 7)
+            assert round(longitude, 7) == round(by_time[seconds].longitude, 7)
+        assert frames[-1][4] == fixes[-1].timestamp
+    finally:
+        server.close()
+        for client_socket in sockets:
+            client_socket.close()
+
+
+@pytest.mark.parametrize('slow_clients', [0, 1])
+def test_a_fast_client_gets_every_message_of_the_fan_out(slow_clients):
+    result = stream_server.measure_fan_out(clients=4, messages=2000, max_queue=64, slow_clients=slow_clients)
+    assert result['delivered'] == 4 * 2000
+    if slow_clients:
+        # only the client that never reads loses messages
+        assert 0 < result['dropped'] <= 2000
+    else:
+        assert result['dropped'] == 0
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Tests of the speed, heading and distance of a track and of the filter that drops gps jumps
+
+import pytest
+
+import position_fix
+import track_analytics
+
+# metres per degree of latitude
+METRES_PER_DEGREE = 111195.0
+
+
+def fix_at(number: int, latitude: float, longitude: float = -79.0, source: int = 1, valid: bool = True):
+    return position_fix.PositionFix(source, 2, number & 0xff, 'KF4WBK', valid, 1700000000.0 + number, latitude, longitude,
+                                     1700000000.0 + number)
+
+
+def northbound(count: int, speed: float = 10.0) -> list:
+    return [fix_at(number, 35.0 + number * speed / METRES_PER_DEGREE) for number in range(count)]
+
+
+def test_haversine_and_bearing():
+    assert track_analytics.haversine(35.0, -79.0, 36.0, -79.0) == pytest.approx(METRES_PER_DEGREE, rel=1e-3)
+    assert track_analytics.bearing(35.0, -79.0, 36.0, -79.0) == pytest.approx(0.0, abs=1e-6)
+    assert track_analytics.bearing(35.0, -79.0, 35.0, -78.0) == pytest.approx(90.0, abs=1.0)
+    assert track_analytics.bearing(35.0, -79.0, 34.0, -79.0) == pytest.approx(180.0, abs=1e-6)
+
+
+def test_a_steady_track_has_its_speed_heading_and_distance():
+    analytics = track_analytics.TrackAnalytics()
+    for fix in northbound(30):
+        assert analytics.update(fix)
+    state = analytics.state(1)
+    assert state.speed == pytest.approx(10.0, abs=1.0)
+    assert min(state.heading, 360.0 - state.heading) < 5.0
+    assert state.distance == pytest.approx(290.0, rel=0.1)
+    assert state.window_speed == pytest.approx(10.0, rel=0.05)
+    assert state.fixes == 30
+    assert state.rejected == 0
+
+
+def test_a_gps_jump_is_rejected():
+    analytics = track_analytics.TrackAnalytics()
+    fixes = northbound(20)
+    for fix in fixes:
+        analytics.update(fix)
+    distance = analytics.state(1).distance
+    # a kilometre off the track for one fix
+    assert not analytics.update(fix_at(20, fixes[-1].latitude + 1000 / METRES_PER_DEGREE))
+    state = analytics.state(1)
+    assert state.rejected == 1
+    assert state.distance == distance
+    assert analytics.update(fix_at(21, fixes[-1].latitude + 20 / METRES_PER_DEGREE))
+
+
+def test_the_filter_starts_again_after_jumps_in_a_row():
+    analytics = track_analytics.TrackAnalytics(max_rejects=3)
+    for fix in northbound(10):
+        analytics.update(fix)
+    distance = analytics.state(1).distance
+    moved = 36.0
+    results = [analytics.update(fix_at(10 + number, moved)) for number in range(3)]
+    assert results == [False, False, True]
+    assert analytics.resets == 1
+    state = analytics.state(1)
+    assert state.latitude == pytest.approx(moved)
+    # the gap is not travelled
+    assert state.distance == distance
+
+
+def test_a_late_fix_is_not_a_jump():
+    analytics = track_analytics.TrackAnalytics()
+    for fix in northbound(10):
+        analytics.update(fix)
+    assert not analytics.update(fix_at(3, 40.0))
+    assert analytics.state(1).rejected == 0
+
+
+def test_a_fix_without_a_position_and_forget():
+    analytics = track_analytics.TrackAnalytics()
+    assert not analytics.update(fix_at(0, 35.0, valid=False))
+    assert analytics.state(1) is None
+    analytics.update(fix_at(0, 35.0))
+    assert analytics.state(1).display_text == '0km/h 000 0.0km'
+    analytics.forget(1)
+    assert analytics.states() == []
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Tests of the track export, the position log is read with its rotated files and written as gpx, kml and geojson
+
+import gzip
+import json
+import xml.etree.ElementTree
+
+import pytest
+
+import track_export
+
+NEW_LINES = ['12:00:00 01:06:23 -79.0193500 35.9556300 KF4WBK\n',
+             '12:00:10 01:06:23 -79.0190000 35.9560000 KF4WBK\n',
+             '12:00:20 01:06:23 -79.1000000 35.8000000 N0CALL\n']
+# the lines written before the callsign was logged
+OLD_LINES = ['11:00:00 01:06:23 -79.0100000 35.9500000\n',
+             '11:00:05 01:06:23 -79.0110000 35.9510000\n']
+
+
+def write_log(tmp_path, name: str, lines: list) -> str:
+    file_name = str(tmp_path / name)
+    with open(file_name, 'w', encoding='utf-8') as file:
+        file.writelines(lines)
+    return file_name
+
+
+def test_both_forms_of_log_line_are_read(tmp_path):
+    file_name = write_log(tmp_path, 'position.log', OLD_LINES + NEW_LINES + ['12:00 cut short\n'])
+    statistics = track_export.ExportStatistics()
+    points = list(track_export.read_position_log([file_name], statistics))
+    assert [point.callsign for point in points] == [track_export.UNKNOWN_CALLSIGN] * 2 + ['KF4WBK', 'KF4WBK', 'N0CALL']
+    assert points[0].timestamp == track_export.parse_time('2023-06-01T11:00:00')
+    assert (points[0].latitude, points[0].longitude) == (35.95, -79.01)
+    assert statistics.lines == 6
+    assert statistics.skipped == 1
+
+
+def test_old_lines_take_the_log_callsign_or_the_one_callsign_selected(tmp_path):
+    file_name = write_log(tmp_path, 'position.log', OLD_LINES)
+    assert {point.callsign for point in track_export.PointPipeline(file_name, log_callsign='W1AW')} == {'W1AW'}
+    assert len(list(track_export.PointPipeline(file_name, callsigns=['KF4WBK']))) == 2
+    assert {point.callsign for point in track_export.PointPipeline(file_name)} == {track_export.UNKNOWN_CALLSIGN}
+
+
+def test_rotated_and_compressed_files_are_read_oldest_first(tmp_path):
+    file_name = write_log(tmp_path, 'position.log', NEW_LINES[2:])
+    write_log(tmp_path, 'position.log.1', NEW_LINES[1:2])
+    write_log(tmp_path, 'position.log.2', NEW_LINES[:1])
+    assert track_export.log_files(file_name) == [file_name + '.2', file_name + '.1', file_name]
+    with gzip.open(str(tmp_path / 'old.log.gz'), 'wt', encoding='utf-8') as file:
+        file.writelines(OLD_LINES)
+    points = list(track_export.read_position_log([str(tmp_path / 'old.log.gz')] + track_export.log_files(file_name)))
+    times = [point.timestamp for point in points]
+    assert len(points) == 5 and times == sorted(times)
+
+
+def test_select_by_callsign_and_time(tmp_path):
+    file_name = write_log(tmp_path, 'position.log', OLD_LINES + NEW_LINES)
+    pipeline = track_export.PointPipeline(file_name, callsigns=['KF4WBK'], start=track_export.parse_time('2023-06-01T12:00:05'))
+    assert [point.timestamp for point in pipeline] == [track_export.parse_time('2023-06-01T12:00:10')]
+    with pytest.raises(ValueError):
+        track_export.PointPipeline(file_name, sources=[1])
+
+
+@pytest.mark.parametrize('name', ['track.gpx', 'track.kml.gz'])
+def test_gpx_and_kml_have_a_track_for_each_callsign(tmp_path, name):
+    file_name = write_log(tmp_path, 'position.log', OLD_LINES + NEW_LINES)
+    output = str(tmp_path / name)
+    result = track_export.export(track_export.PointPipeline(file_name), output)
+    assert result['points'] == 5 and result['tracks'] == 3
+    opener = gzip.open if name.endswith('.gz') else open
+    with opener(output, 'rb') as file:
+        root = xml.etree.ElementTree.parse(file).getroot()
+    names = sorted(element.text for element in root.iter() if element.tag.endswith('}name'))
+    assert names == ['KF4WBK', 'N0CALL', track_export.UNKNOWN_CALLSIGN]
+
+
+def test_geojson_has_a_point_for_each_fix(tmp_path):
+    file_name = write_log(tmp_path, 'position.log', NEW_LINES)
+    output = str(tmp_path / 'track.geojson')
+    track_export.export(track_export.PointPipeline(file_name), output)
+    with open(output, encoding='utf-8') as file:
+        collection = json.load(file)
+    features = collection['features']
+    assert [feature['properties']['callsign'] for feature in features] == ['KF4WBK', 'KF4WBK', 'N0CALL']
+    assert features[0]['geometry']['coordinates'] == [-79.01935, 35.95563]
+    assert features[0]['properties']['time'] == '2023-06-01T12:00:00.000Z'
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Tests of the transmit scheduler, the acks wait for a quiet channel and a newer ack to a source replaces the older one
+
+import time
+
+import transmit_scheduler
+
+
+class QuietRadio:
+    """
+    A radio that records what is sent, the test says when the channel is busy
+    """
+
+    def __init__(self):
+        self.busy = False
+        self.sent = []
+
+    def channel_busy(self) -> bool:
+        return self.busy
+
+    def send(self, data: bytes, *, keep_listening: bool = False, destination: int = 255, node: int = 255,  # pylint: disable=R0913,W0613
+             identifier: int = 0, flags: int = 0) -> bool:  # pylint: disable=W0613
+        self.sent.append((destination, identifier, data))
+        return True
+
+
+def test_a_newer_ack_to_a_source_replaces_the_older_one():
+    radio = QuietRadio()
+    scheduler = transmit_scheduler.TransmitScheduler(radio)
+    scheduler.queue_ack(1, 2, 10)
+    scheduler.queue_ack(3, 2, 20)
+    scheduler.queue_ack(1, 2, 11)
+    assert scheduler.pending == 2
+    assert scheduler.transmit() == 2
+    assert sorted(radio.sent) == [(1, 11, transmit_scheduler.ACK_DATA), (3, 20, transmit_scheduler.ACK_DATA)]
+    assert scheduler.acks_collapsed == 1
+
+
+def test_a_collapsed_ack_keeps_its_place_and_its_age():
+    radio = QuietRadio()
+    scheduler = transmit_scheduler.TransmitScheduler(radio, max_defer=0.2)
+    scheduler.queue_ack(1, 2, 10)
+    time.sleep(0.02)
+    scheduler.queue_ack(3, 2, 20)
+    scheduler.queue_ack(1, 2, 11)
+    # the ack to source 1 is still the oldest, so the wait is measured from it
+    assert scheduler.wait_time(0.5) <= 0.2 - 0.02
+    assert scheduler.transmit() == 2
+    assert radio.sent == [(1, 11, transmit_scheduler.ACK_DATA), (3, 20, transmit_scheduler.ACK_DATA)]
+
+
+def test_acks_wait_for_a_quiet_channel():
+    radio = QuietRadio()
+    scheduler = transmit_scheduler.TransmitScheduler(radio, max_defer=10.0)
+    scheduler.queue_ack(1, 2, 10)
+    radio.busy = True
+    assert scheduler.transmit() == 0
+    assert scheduler.deferred == 1
+    radio.busy = False
+    assert scheduler.transmit() == 1
+
+
+def test_an_ack_that_waited_too_long_is_sent_anyway():
+    radio = QuietRadio()
+    scheduler = transmit_scheduler.TransmitScheduler(radio, max_defer=0.01)
+    scheduler.queue_ack(1, 2, 10)
+    radio.busy = True
+    time.sleep(0.02)
+    assert scheduler.wait_time(0.5) == 0.0
+    assert scheduler.transmit() == 1
+    assert scheduler.forced == 1
+
+
+def test_frames_go_after_the_acks_and_the_oldest_is_dropped():
+    radio = QuietRadio()
+    scheduler = transmit_scheduler.TransmitScheduler(radio, max_frames=2)
+    for number in range(3):
+        scheduler.queue_frame(bytes([number]), destination=9, node=2)
+    scheduler.queue_ack(1, 2, 10)
+    scheduler.transmit()
+    assert [data for _, _, data in radio.sent] == [transmit_scheduler.ACK_DATA, b'\x01', b'\x02']
+    assert scheduler.frames_dropped == 1
+
+
+def test_the_scheduler_does_not_send_an_ack_over_a_packet_that_is_arriving():
+    result = transmit_scheduler.measure_packet_loss(True, sources=3, count=20, interval=0.05, seed=1)
+    assert result['collisions'] == 0
+    assert result['delivered'] > 0
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Tests of the uplink, the batch frames, the spools and the order the batches reach a collector that was down
+
+import logging
+import threading
+import time
+
+import pytest
+
+import position_fix
+import position_table
+import uplink
+
+LOGGER = logging.getLogger('test')
+
+
+def make_fix(source: int, number: int, received: float = None):
+    received = time.time() if received is None else received
+    return position_fix.PositionFix(source, 2, number, f'CALL{source}', True, received, 35.9 + 0.0001 * number, -79.0, received)
+
+
+@pytest.fixture
+def collector():
+    running = uplink.Collector(LOGGER)
+    host, port = running.add_listener('tcp:127.0.0.1:0')
+    stop = threading.Event()
+    thread = threading.Thread(target=running.serve, args=(stop, 0.02))
+    thread.start()
+    running.address = f'tcp:{host}:{port}'
+    yield running
+    stop.set()
+    thread.join(5)
+
+
+def make_uplink(table, address: str, **kwargs):
+    settings = {'UplinkAddress': address, 'GatewayId': 'test', 'BatchSize': 4, 'BatchAge': 0.05, 'UplinkTimeout': 0.2,
+                'Retry': 0.05, 'MaxRetry': 0.1}
+    settings.update(kwargs)
+    return uplink.UplinkThread('uplink', table, threading.Event(), None, LOGGER, 0.05, **settings)
+
+
+def test_parse_address():
+    assert uplink.parse_address('udp:collector.local:5600') == (uplink.UDP_PREFIX, 'collector.local', 5600)
+    assert uplink.parse_address('tcp:::1:5600') == (uplink.TCP_PREFIX, '::1', 5600)
+    for address in ('collector.local:5600', 'tcp:collector.local', 'tcp::5600', 'udp:host:port'):
+        with pytest.raises(ValueError):
+            uplink.parse_address(address)
+
+
+def test_a_batch_survives_encode_and_decode():
+    fixes = [make_fix(1, number, 1700000000.0 + number) for number in range(5)]
+    frame = uplink.encode_batch('pi-1', 42, fixes)
+    gateway, sequence, decoded = uplink.decode_batch(frame)
+    assert (gateway, sequence) == ('pi-1', 42)
+    assert [fix.__getnewargs__() for fix in decoded] == [fix.__getnewargs__() for fix in fixes]
+    for bad in (frame[:5], b'XX' + frame[2:], frame[:uplink.HEADER.size] + b'not zlib'):
+        with pytest.raises(ValueError):
+            uplink.decode_batch(bad)
+
+
+def test_the_memory_spool_drops_the_oldest_when_full():
+    spool = uplink.MemorySpool(250)
+    for sequence in range(1, 5):
+        spool.put(uplink.Batch(sequence, bytes(100), 1000.0 + sequence, 3))
+    assert (len(spool), spool.dropped, spool.bytes) == (2, 2, 200)
+    assert spool.peek().sequence == 3
+    assert spool.last_sequence() == 4
+    # one batch bigger than the spool is still kept
+    spool.put(uplink.Batch(5, bytes(1000), 1005.0, 3))
+    assert [len(spool), spool.peek().sequence] == [1, 5]
+
+
+def test_the_disk_spool_is_kept_over_a_restart(tmp_path):
+    directory = str(tmp_path / 'spool')
+    spool = uplink.DiskSpool(directory, 250)
+    for sequence in range(1, 5):
+        spool.put(uplink.Batch(sequence, bytes([sequence]) * 100, 1000.5 + sequence, sequence + 10))
+    assert (len(spool), spool.dropped) == (2, 2)
+    restarted = uplink.DiskSpool(directory, 250)
+    assert (len(restarted), restarted.bytes, restarted.last_sequence()) == (2, 200, 4)
+    batch = restarted.peek()
+    assert (batch.sequence, batch.frame, batch.received, batch.fixes) == (3, bytes([3]) * 100, 1003.5, 13)
+    restarted.pop()
+    assert restarted.peek().sequence == 4
+    assert len(uplink.DiskSpool(directory, 250)) == 1
+
+
+def test_the_collector_drops_a_batch_it_has_seen():
+    receiver = uplink.Collector()
+    frame = uplink.encode_batch('pi-1', 7, [make_fix(1, 1)])
+    assert receiver.receive(frame) == uplink.HEADER.pack(uplink.MAGIC, 7)
+    assert receiver.receive(frame) == uplink.HEADER.pack(uplink.MAGIC, 7)
+    assert receiver.receive(uplink.encode_batch('pi-2', 7, [make_fix(1, 1)])) is not None
+    assert (receiver.batches, receiver.duplicates, len(receiver.fixes)) == (2, 1, 2)
+    receiver.silent = True
+    assert receiver.receive(uplink.encode_batch('pi-1', 8, [make_fix(1, 2)])) is None
+    assert receiver.receive(b'junk') is None
+
+
+@pytest.mark.parametrize('on_disk', [False, True])
+def test_the_spool_is_sent_in_order_when_the_collector_is_back(tmp_path, collector, on_disk):
+    spool_directory = str(tmp_path / 'spool') if on_disk else None
+    sender = make_uplink(position_table.PositionTable(), collector.address, SpoolDirectory=spool_directory)
+    sender.make_batch([make_fix(1, 0), make_fix(1, 1)])
+    sender.forward()
+    collector.silent = True
+    sender.make_batch([make_fix(1, 2)])
+    sender.forward()
+    assert (len(sender.spool), len(sender.outbox)) == (1, 0)
+    # a batch made while the spool is waiting goes after it
+    sender.make_batch([make_fix(1, 3)])
+    sender.forward()
+    assert len(sender.spool) == 2
+    if on_disk:
+        sender.sender.close()
+        sender = make_uplink(position_table.PositionTable(), collector.address, SpoolDirectory=spool_directory)
+        assert len(sender.spool) == 2
+    sender.make_batch([make_fix(1, 4)])
+    collector.silent = False
+    sender.forward(force=True)
+    sender.make_batch([make_fix(1, 5)])
+    sender.forward(force=True)
+    assert (len(sender.spool), len(sender.outbox)) == (0, 0)
+    assert [fix.identifier for fix in collector.fixes] == list(range(6))
+    assert sender.lag() == 0.0
+    sender.sender.close()
+
+
+def test_the_thread_forwards_every_fix_in_order(collector):
+    table = position_table.PositionTable()
+    sender = make_uplink(table, collector.address)
+    sender.start()
+    collector.silent = True
+    for number in range(30):
+        for source in (1, 2):
+            table.insert(make_fix(source, number))
+        if number == 15:
+            collector.silent = False
+        time.sleep(0.005)
+    deadline = time.time() + 10
+    while len(collector.fixes) < 60 and time.time() < deadline:
+        time.sleep(0.02)
+    sender.event.set()
+    sender.join(5)
+    for source in (1, 2):
+        assert [fix.identifier for fix in collector.fixes if fix.source == source] == list(range(30))
@@ -0,0 +1,452 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Ground speed, heading, distance travelled and a smoothed position for each transmitter.
+#
+# Each valid fix goes through a constant velocity kalman filter in metres east and north of the first fix of the source.
+# The x and y axes do not depend on each other, so the 4x4 filter is two 2x2 filters and is done with plain floats,
+# which is cheaper on the pi than numpy for one fix.  A fix whose distance from the prediction is beyond the gate is a gps
+# jump and is not used, after max_rejects of them in a row the filter starts again from the fix, the transmitter
+# really is somewhere else.  The distance is added up from the smoothed positions so gps jitter does not add to it.
+#
+# The recent fixes of each source are kept in a ring of arrays, and the distance, bearing and speed between them are
+# worked out in one batch when a state is asked for, with numpy when it is installed and with math when it is not.
+# The update is done by PositionTable.insert, so the display and bluetooth threads see the state of the fix they show.
+#
+# run it with python track_analytics.py to measure the cost of an update
+
+import argparse
+import math
+import threading
+import time
+from typing import Final
+
+# numpy is optional, without it the batches are done a point at a time
+try:
+    import numpy
+except ModuleNotFoundError:
+    numpy = None
+
+EARTH_RADIUS: Final[float] = 6371008.8
+# the chi square value for 2 degrees of freedom at 99.9 percent
+DEFAULT_GATE: Final[float] = 13.8
+# metres per second to kilometres per hour
+KMH: Final[float] = 3.6
+
+
+def haversine(latitude_1, longitude_1, latitude_2, longitude_2):
+    """
+    the great circle distance, the arguments are floats or numpy arrays of the same length
+
+    :param latitude_1: the latitude of the first points in degrees
+    :param longitude_1: the longitude of the first points in degrees
+    :param latitude_2: the latitude of the second points in degrees
+    :param longitude_2: the longitude of the second points in degrees
+    :return: the distance in metres, a float or an array
+    """
+    xp = numpy if numpy is not None and isinstance(latitude_1, numpy.ndarray) else math
+    phi_1 = xp.radians(latitude_1)
+    phi_2 = xp.radians(latitude_2)
+    half_phi = (phi_2 - phi_1) / 2
+    half_lambda = xp.radians(longitude_2 - longitude_1) / 2
+    a = xp.sin(half_phi) ** 2 + xp.cos(phi_1) * xp.cos(phi_2) * xp.sin(half_lambda) ** 2
+    return 2 * EARTH_RADIUS * (xp.arcsin if xp is numpy else xp.asin)(xp.sqrt(a))
+
+
+def bearing(latitude_1, longitude_1, latitude_2, longitude_2):
+    """
+    the initial bearing from the first points to the second, the arguments are floats or numpy arrays of the same length
+
+    :return: the bearing in degrees clockwise from north, 0 to 360
+    """
+    xp = numpy if numpy is not None and isinstance(latitude_1, numpy.ndarray) else math
+    phi_1 = xp.radians(latitude_1)
+    phi_2 = xp.radians(latitude_2)
+    delta_lambda = xp.radians(longitude_2 - longitude_1)
+    y = xp.sin(delta_lambda) * xp.cos(phi_2)
+    x = xp.cos(phi_1) * xp.sin(phi_2) - xp.sin(phi_1) * xp.cos(phi_2) * xp.cos(delta_lambda)
+    return (xp.degrees((xp.arctan2 if xp is numpy else xp.atan2)(y, x)) + 360.0) % 360.0
+
+
+def segment_statistics(times, latitudes, longitudes) -> tuple:
+    """
+    the distance, bearing and speed between each point of a track and the next, in one batch
+
+    :param times: the times in seconds, oldest first
+    :param latitudes: the latitudes in degrees
+    :param longitudes: the longitudes in degrees
+    :return: a tuple of the distances in metres, the bearings in degrees and the speeds in metres per second,
+             numpy arrays if numpy is installed, else lists, one shorter than the track
+    """
+    if numpy is not None:
+        times = numpy.asarray(times, dtype=float)
+        latitudes = numpy.asarray(latitudes, dtype=float)
+        longitudes = numpy.asarray(longitudes, dtype=float)
+        distances = haversine(latitudes[:-1], longitudes[:-1], latitudes[1:], longitudes[1:])
+        bearings = bearing(latitudes[:-1], longitudes[:-1], latitudes[1:], longitudes[1:])
+        elapsed = numpy.diff(times)
+        speeds = numpy.divide(distances, elapsed, out=numpy.zeros_like(distances), where=elapsed > 0)
+        return distances, bearings, speeds
+    distances = []
+    bearings = []
+    speeds = []
+    for index in range(1, len(times)):
+        distance = haversine(latitudes[index - 1], longitudes[index - 1], latitudes[index], longitudes[index])
+        elapsed = times[index] - times[index - 1]
+        distances.append(distance)
+        bearings.append(bearing(latitudes[index - 1], longitudes[index - 1], latitudes[index], longitudes[index]))
+        speeds.append(distance / elapsed if elapsed > 0 else 0.0)
+    return distances, bearings, speeds
+
+
+class KalmanFilter:  # pylint: disable=R0902
+    """
+    A constant velocity kalman filter of a position in metres east and north of a reference point
+    """
+
+    def __init__(self, latitude: float, longitude: float, timestamp: float, measurement_sigma: float = 5.0,
+                 acceleration_sigma: float = 1.0):
+        """
+        The init class for the filter, it starts at the first fix with no speed
+
+        :param latitude: the first latitude in degrees, it is the reference point
+        :param longitude: the first longitude in degrees
+        :param timestamp: the time of the first fix in seconds
+        :param measurement_sigma: the gps error in metres
+        :param acceleration_sigma: the acceleration the transmitter can have in metres per second squared
+        """
+        self.reference_latitude = latitude
+        self.reference_longitude = longitude
+        self.__metres_per_degree_y = math.radians(1.0) * EARTH_RADIUS
+        self.__metres_per_degree_x = self.__metres_per_degree_y * math.cos(math.radians(latitude))
+        self.measurement_variance = measurement_sigma ** 2
+        self.acceleration_variance = acceleration_sigma ** 2
+        self.timestamp = timestamp
+        # the state of each axis, position and velocity, and its covariance p00, p01, p11
+        self.x = [0.0, 0.0]
+        self.y = [0.0, 0.0]
+        self.px = [self.measurement_variance, 0.0, 100.0]
+        self.py = [self.measurement_variance, 0.0, 100.0]
+
+    def to_metres(self, latitude: float, longitude: float) -> tuple:
+        """
+        :return: the position in metres east and north of the reference point
+        """
+        return ((longitude - self.reference_longitude) * self.__metres_per_degree_x,
+                (latitude - self.reference_latitude) * self.__metres_per_degree_y)
+
+    def to_degrees(self, east: float, north: float) -> tuple:
+        """
+        :return: the latitude and longitude of a position in metres from the reference point
+        """
+        return (self.reference_latitude + north / self.__metres_per_degree_y,
+                self.reference_longitude + east / self.__metres_per_degree_x)
+
+    def __predict(self, state: list, covariance: list, dt: float) -> None:
+        """
+        move one axis forward dt seconds
+        """
+        q = self.acceleration_variance
+        p00, p01, p11 = covariance
+        state[0] += state[1] * dt
+        covariance[0] = p00 + 2 * dt * p01 + dt * dt * p11 + q * dt ** 4 / 4
+        covariance[1] = p01 + dt * p11 + q * dt ** 3 / 2
+        covariance[2] = p11 + q * dt * dt
+
+    def __correct(self, state: list, covariance: list, innovation: float, innovation_variance: float) -> None:
+        """
+        correct one axis with a measured position
+        """
+        p00, p01, p11 = covariance
+        gain_0 = p00 / innovation_variance
+        gain_1 = p01 / innovation_variance
+        state[0] += gain_0 * innovation
+        state[1] += gain_1 * innovation
+        covariance[0] = (1 - gain_0) * p00
+        covariance[1] = (1 - gain_0) * p01
+        covariance[2] = p11 - gain_1 * p01
+
+    def update(self, latitude: float, longitude: float, timestamp: float, gate: float = DEFAULT_GATE) -> bool:
+        """
+        add a measured position
+
+        :param latitude: the latitude in degrees
+        :param longitude: the longitude in degrees
+        :param timestamp: the time of the fix in seconds, not before the last fix
+        :param gate: the largest squared distance from the prediction in standard deviations, 0 takes every fix
+        :return: True if the fix was used, False if it was a jump
+        """
+        dt = max(timestamp - self.timestamp, 0.0)
+        east, north = self.to_metres(latitude, longitude)
+        x, y, px, py = list(self.x), list(self.y), list(self.px), list(self.py)
+        if dt:
+            self.__predict(x, px, dt)
+            self.__predict(y, py, dt)
+        innovation_x = east - x[0]
+        innovation_y = north - y[0]
+        variance_x = px[0] + self.measurement_variance
+        variance_y = py[0] + self.measurement_variance
+        if gate and innovation_x * innovation_x / variance_x + innovation_y * innovation_y / variance_y > gate:
+            return False
+        self.__correct(x, px, innovation_x, variance_x)
+        self.__correct(y, py, innovation_y, variance_y)
+        self.x, self.y, self.px, self.py = x, y, px, py
+        self.timestamp = timestamp
+        return True
+
+    @property
+    def position(self) -> tuple:
+        """
+        :return: the smoothed latitude and longitude in degrees
+        """
+        return self.to_degrees(self.x[0], self.y[0])
+
+    @property
+    def speed(self) -> float:
+        """
+        :return: the ground speed in metres per second
+        """
+        return math.hypot(self.x[1], self.y[1])
+
+    @property
+    def heading(self) -> float:
+        """
+        :return: the heading in degrees clockwise from north
+        """
+        return math.degrees(math.atan2(self.x[1], self.y[1])) % 360.0
+
+
+class TrackState(tuple):
+    """
+    The analytics of one source when it was asked for, read only so it can be shared between threads
+    """
+    __slots__ = ()
+
+    def __new__(cls, source: int, latitude: float, longitude: float, speed: float, heading: float, distance: float,  # pylint: disable=R0913
+                window_speed: float, fixes: int, rejected: int):
+        return tuple.__new__(cls, (source, latitude, longitude, speed, heading, distance, window_speed, fixes, rejected))
+
+    source = property(lambda self: self[0], doc='the address of the transmitter')
+    latitude = property(lambda self: self[1], doc='the smoothed latitude in degrees')
+    longitude = property(lambda self: self[2], doc='the smoothed longitude in degrees')
+    speed = property(lambda self: self[3], doc='the ground speed from the filter in metres per second')
+    heading = property(lambda self: self[4], doc='the heading from the filter in degrees clockwise from north')
+    distance = property(lambda self: self[5], doc='the distance travelled in metres')
+    window_speed = property(lambda self: self[6], doc='the mean speed over the recent fixes in metres per second')
+    fixes = property(lambda self: self[7], doc='the fixes used')
+    rejected = property(lambda self: self[8], doc='the fixes rejected as gps jumps')
+
+    @property
+    def display_text(self) -> str:
+        """
+        :return: a short line for the display, for example 43km/h 270 12.3km
+        """
+        return f'{self.speed * KMH:.0f}km/h {self.heading:03.0f} {self.distance / 1000:.1f}km'
+
+    @property
+    def bluetooth_text(self) -> str:
+        """
+        :return: the speed in km/h, heading in degrees and distance in metres for the phone, for example 43.2 270 12345
+        """
+        return f'{self.speed * KMH:.1f} {self.heading:.0f} {self.distance:.0f}'
+
+
+class SourceTrack:  # pylint: disable=R0902
+    """
+    The filter, the distance and the recent fixes of one source
+    """
+
+    def __init__(self, source: int, window: int):
+        """
+        The init class for the track
+
+        :param source: the source address
+        :param window: the number of recent fixes kept
+        """
+        self.source = source
+        self.window = window
+        self.filter = None
+        self.distance = 0.0
+        self.fixes = 0
+        self.rejected = 0
+        self.rejected_in_a_row = 0
+        self.count = 0
+        if numpy is not None:
+            self.recent = numpy.zeros((3, window))
+        else:
+            self.recent = [[0.0] * window for _ in range(3)]
+        self.state = None
+
+    def add_recent(self, timestamp: float, latitude: float, longitude: float) -> None:
+        """
+        put a fix in the ring of recent fixes
+        """
+        slot = self.count % self.window
+        self.recent[0][slot] = timestamp
+        self.recent[1][slot] = latitude
+        self.recent[2][slot] = longitude
+        self.count += 1
+
+    def ordered_recent(self) -> tuple:
+        """
+        :return: the times, latitudes and longitudes of the recent fixes, oldest first
+        """
+        length = min(self.count, self.window)
+        start = self.count % self.window if self.count > self.window else 0
+        if numpy is not None:
+            rows = numpy.roll(self.recent, -start, axis=1)[:, :length]
+            return rows[0], rows[1], rows[2]
+        return tuple((row[start:] + row[:start])[:length] for row in self.recent)
+
+
+class TrackAnalytics:
+    """
+    The tracks of every source, updated with each fix
+    """
+
+    def __init__(self, window: int = 32, gate: float = DEFAULT_GATE, max_rejects: int = 3, measurement_sigma: float = 5.0,  # pylint: disable=R0913
+                 acceleration_sigma: float = 1.0):
+        """
+        The init class for the analytics
+
+        :param window: the recent fixes kept for each source for the window speed
+        :param gate: the gate of the filter in squared standard deviations, 0 takes every fix
+        :param max_rejects: after this many jumps in a row the filter starts again at the new position
+        :param measurement_sigma: the gps error in metres
+        :param acceleration_sigma: the acceleration of the transmitter in metres per second squared
+        """
+        self.window = window
+        self.gate = gate
+        self.max_rejects = max_rejects
+        self.measurement_sigma = measurement_sigma
+        self.acceleration_sigma = acceleration_sigma
+        self.__lock = threading.Lock()
+        self.__tracks = {}
+        self.updates = 0
+        self.resets = 0
+
+    def update(self, fix) -> bool:
+        """
+        add a fix, a fix without a position is ignored
+
+        :param fix: the position_fix.PositionFix
+        :return: True if the fix was used by the filter
+        """
+        if not fix.valid:
+            return False
+        timestamp = fix.received if fix.timestamp is None else fix.timestamp
+        with self.__lock:
+            self.updates += 1
+            track = self.__tracks.get(fix.source)
+            if track is None:
+                track = self.__tracks[fix.source] = SourceTrack(fix.source, self.window)
+            track.state = None
+            if track.filter is None:
+                track.filter = KalmanFilter(fix.latitude, fix.longitude, timestamp, self.measurement_sigma, self.acceleration_sigma)
+                track.fixes += 1
+                track.add_recent(timestamp, fix.latitude, fix.longitude)
+                return True
+            if timestamp < track.filter.timestamp:
+                # a late packet, it is not a jump and the filter does not go back in time
+                return False
+            before = track.filter.position
+            if track.filter.update(fix.latitude, fix.longitude, timestamp, self.gate):
+                track.rejected_in_a_row = 0
+                track.distance += haversine(*before, *track.filter.position)
+            else:
+                track.rejected += 1
+                track.rejected_in_a_row += 1
+                if track.rejected_in_a_row < self.max_rejects:
+                    return False
+                # not a jump, the transmitter is somewhere else, start again there, the gap is not added to the distance
+                self.resets += 1
+                track.rejected_in_a_row = 0
+                track.count = 0
+                track.filter = KalmanFilter(fix.latitude, fix.longitude, timestamp, self.measurement_sigma, self.acceleration_sigma)
+            track.fixes += 1
+            track.add_recent(timestamp, fix.latitude, fix.longitude)
+            return True
+
+    def state(self, source: int):
+        """
+        :param source: the source address
+        :return: the TrackState of the source, or None if it has no valid fix
+        """
+        with self.__lock:
+            track = self.__tracks.get(source)
+            if track is None or track.filter is None:
+                return None
+            if track.state is None:
+                times, latitudes, longitudes = track.ordered_recent()
+                window_speed = 0.0
+                if len(times) > 1 and times[-1] > times[0]:
+                    distances = segment_statistics(times, latitudes, longitudes)[0]
+                    window_speed = float(sum(distances)) / float(times[-1] - times[0])
+                latitude, longitude = track.filter.position
+                track.state = TrackState(source, latitude, longitude, track.filter.speed, track.filter.heading, track.distance,
+                                         window_speed, track.fixes, track.rejected)
+            return track.state
+
+    def states(self) -> list:
+        """
+        :return: the TrackState of every source
+        """
+        with self.__lock:
+            sources = list(self.__tracks)
+        return [state for state in (self.state(source) for source in sources) if state is not None]
+
+    def forget(self, source: int) -> None:
+        """
+        :param source: the source address, for a source the position table evicted
+        :return: None
+        """
+        with self.__lock:
+            self.__tracks.pop(source, None)
+
+
+def measure_update_cost(sources: int = 36, count: int = 100) -> dict:
+    """
+    update the analytics with moving fixes from many sources, and ask for each state like the display does
+
+    :param sources: the number of transmitters
+    :param count: the fixes from each
+    :return: a dictionary with the microseconds for an update and for a state
+    """
+    import position_fix  # pylint: disable=C0415
+    fixes = [position_fix.PositionFix(source, 2, number & 0xff, 'KF4WBK', True, 1700000000.0 + number,
+                                      35.9 + 0.0001 * number + 0.01 * source, -79.0 - 0.0001 * number)
+             for number in range(count) for source in range(1, sources + 1)]
+    analytics = TrackAnalytics()
+    start = time.perf_counter()
+    for fix in fixes:
+        analytics.update(fix)
+    update_time = time.perf_counter() - start
+    analytics = TrackAnalytics()
+    start = time.perf_counter()
+    for fix in fixes:
+        analytics.update(fix)
+        analytics.state(fix.source)
+    both_time = time.perf_counter() - start
+    state = analytics.state(1)
+    return {'numpy': numpy is not None, 'fixes': len(fixes), 'update_microseconds': 1e6 * update_time / len(fixes),
+            'state_microseconds': 1e6 * (both_time - update_time) / len(fixes), 'speed': state.speed, 'heading': state.heading,
+            'distance': state.distance, 'rejected': state.rejected}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sources', type=int, default=36, help='the number of transmitters default = %(default)s')
+    parser.add_argument('--count', type=int, default=100, help='the fixes from each transmitter default = %(default)s')
+    arguments = parser.parse_args()
+    print(measure_update_cost(arguments.sources, arguments.count))
@@ -0,0 +1,426 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Export the recorded tracks as gpx, kml or geojson for mapping programs.
+#
+# The points are read one at a time from the text position log, with its rotated files oldest first, or from the
+# track store, and go through generators that select the callsigns and the time range, so the log is never in memory.
+# A position log line is time date longitude latitude, with the callsign after them in --log_format 2, the date of
+# each line is turned into seconds once a day.  The lines of --log_format 1, the default, have no callsign, they are
+# put in the track named by --log_callsign, or the one --callsign if only one is given, or unknown.
+# gpx and kml have one track for each callsign, so while the points are read the text of each track is written to a
+# temporary file, and the tracks are copied to the output at the end, memory does not grow with the log.
+# geojson is a FeatureCollection with a Point for each fix, written as it is read.
+# An output name that ends in .gz is written with gzip, and - writes to stdout.
+#
+# run it with python track_export.py --position_log /tmp/rfm_radio.log --output track.gpx.gz --callsign KF4WBK
+#             --start 2023-06-01T00:00:00 --end 2023-06-03
+
+import argparse
+import calendar
+import collections
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Final
+from xml.sax.saxutils import escape
+
+FORMAT_GPX: Final[str] = 'gpx'
+FORMAT_KML: Final[str] = 'kml'
+FORMAT_GEOJSON: Final[str] = 'geojson'
+FORMATS: Final[tuple] = (FORMAT_GPX, FORMAT_KML, FORMAT_GEOJSON)
+# the file extensions of each format
+EXTENSIONS: Final[dict] = {'.gpx': FORMAT_GPX, '.kml': FORMAT_KML, '.geojson': FORMAT_GEOJSON, '.json': FORMAT_GEOJSON}
+BUFFER_SIZE: Final[int] = 1 << 20
+# the track of the position log lines of --log_format 1, they have no callsign
+UNKNOWN_CALLSIGN: Final[str] = 'unknown'
+
+TrackPoint = collections.namedtuple('TrackPoint', ['timestamp', 'latitude', 'longitude', 'callsign', 'source'])
+
+
+class ExportStatistics:  # pylint: disable=R0903
+    """
+    The counts of an export
+    """
+
+    def __init__(self):
+        """
+        The init class for the counts
+        """
+        self.lines = 0
+        self.skipped = 0
+        self.points = 0
+        self.tracks = 0
+
+    def as_dict(self) -> dict:
+        """
+        :return: the counts as a dictionary
+        """
+        return {'lines': self.lines, 'skipped': self.skipped, 'points': self.points, 'tracks': self.tracks}
+
+
+def parse_time(text: str) -> float:
+    """
+    :param text: seconds since the epoch, or a utc time as 2023-06-01T12:30:00, 2023-06-01T12:30:00Z or 2023-06-01
+    :return: the seconds since the epoch
+    """
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    text = text.rstrip('Z')
+    for time_format in ('%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S', '%Y-%m-%d'):
+        try:
+            return float(calendar.timegm(time.strptime(text, time_format)))
+        except ValueError:
+            continue
+    raise argparse.ArgumentTypeError(f'{text} is not a time, use seconds since the epoch or 2023-06-01T12:30:00')
+
+
+def iso_time(timestamp: float) -> str:
+    """
+    :param timestamp: the seconds since the epoch
+    :return: the utc time as 2023-06-01T12:30:00.250Z
+    """
+    fix_time = time.gmtime(timestamp)
+    milliseconds = int(round((timestamp % 1) * 1000)) % 1000
+    return (f'{fix_time.tm_year:04d}-{fix_time.tm_mon:02d}-{fix_time.tm_mday:02d}T'
+            f'{fix_time.tm_hour:02d}:{fix_time.tm_min:02d}:{fix_time.tm_sec:02d}.{milliseconds:03d}Z')
+
+
+def log_files(file_name: str) -> list:
+    """
+    :param file_name: the position log file
+    :return: the file and its rotated files that exist, oldest first, file.3 file.2 file.1 file
+    """
+    rotated = []
+    number = 1
+    while os.path.exists(f'{file_name}.{number}'):
+        rotated.append(f'{file_name}.{number}')
+        number += 1
+    rotated.reverse()
+    return rotated + ([file_name] if os.path.exists(file_name) else [])
+
+
+def read_position_log(file_names: list, statistics: ExportStatistics = None, log_callsign: str = UNKNOWN_CALLSIGN):
+    """
+    read the points of text position logs, a line that cannot be read is counted and skipped
+
+    :param file_names: the log files in the order to read them, a name that ends in .gz is read with gzip
+    :param statistics: the counts, may be None
+    :param log_callsign: the callsign of the lines written without one, in position_fix.LOG_FORMAT_LEGACY
+    :return: yields TrackPoints, the source is None, it is not in the text log
+    """
+    statistics = statistics or ExportStatistics()
+    # DD:MM:YY -> the seconds at the start of the day
+    days = {}
+    for file_name in file_names:
+        if file_name.endswith('.gz'):
+            file = gzip.open(file_name, 'rt', encoding='utf-8', errors='replace')
+        else:
+            file = open(file_name, encoding='utf-8', errors='replace', buffering=BUFFER_SIZE)  # pylint: disable=R1732
+        with file:
+            for line in file:
+                statistics.lines += 1
+                parts = line.split(None, 4)
+                try:
+                    if len(parts) == 4:
+                        time_text, date_text, longitude, latitude = parts
+                        callsign = log_callsign
+                    else:
+                        time_text, date_text, longitude, latitude, callsign = parts
+                    day = days.get(date_text)
+                    if day is None:
+                        day_of_month, month, year = date_text.split(':')
+                        day = days[date_text] = calendar.timegm((2000 + int(year), int(month), int(day_of_month), 0, 0, 0))
+                    hours, minutes, seconds = time_text.split(':')
+                    yield TrackPoint(day + int(hours) * 3600 + int(minutes) * 60 + float(seconds), float(latitude), float(longitude),
+                                     callsign.rstrip(), None)
+                except ValueError:
+                    # a fix without a time, or a line cut short when the power went
+                    statistics.skipped += 1
+
+
+def read_track_store(directory: str, start: float = None, end: float = None, source: int = None, statistics: ExportStatistics = None):
+    """
+    read the points of the track store, only the blocks that can hold the time range are read
+
+    :param directory: the track store directory
+    :param start: the start of the time range in seconds since the epoch, None for the beginning
+    :param end: the end of the time range, None for the end
+    :param source: only read this source address, None for every source
+    :param statistics: the counts, may be None
+    :return: yields TrackPoints, the records without a valid position are skipped
+    """
+    import track_store  # pylint: disable=C0415
+    statistics = statistics or ExportStatistics()
+    reader = track_store.TrackReader(directory)
+    callsigns = reader.callsigns()
+    for record in reader.query(float('-inf') if start is None else start, float('inf') if end is None else end, source):
+        statistics.lines += 1
+        if not record.valid:
+            statistics.skipped += 1
+            continue
+        yield TrackPoint(record.timestamp, record.latitude, record.longitude, callsigns.get(record.source, str(record.source)), record.source)
+
+
+def select_points(points, callsigns: set = None, start: float = None, end: float = None):
+    """
+    :param points: the TrackPoints
+    :param callsigns: the callsigns to keep, None keeps every callsign
+    :param start: the first time kept in seconds since the epoch, None for no limit
+    :param end: the last time kept, None for no limit
+    :return: yields the TrackPoints that are selected
+    """
+    for point in points:
+        if callsigns is not None and point.callsign not in callsigns:
+            continue
+        if start is not None and point.timestamp < start:
+            continue
+        if end is not None and point.timestamp > end:
+            continue
+        yield point
+
+
+class TrackSpool:
+    """
+    A temporary file for each part of each track, so the tracks can be written one after another in one pass over the points
+    """
+
+    def __init__(self):
+        """
+        The init class for the spool
+        """
+        self.__files = {}
+
+    def write(self, key: tuple, text: str) -> None:
+        """
+        :param key: the track and part, for example (callsign, 'when')
+        :param text: the text to add
+        :return: None
+        """
+        file = self.__files.get(key)
+        if file is None:
+            file = self.__files[key] = tempfile.TemporaryFile('w+', encoding='utf-8', buffering=BUFFER_SIZE // 16)  # pylint: disable=R1732
+        file.write(text)
+
+    def tracks(self) -> list:
+        """
+        :return: the tracks in the spool, sorted
+        """
+        return sorted({key[0] for key in self.__files})
+
+    def copy(self, key: tuple, output) -> None:
+        """
+        :param key: the track and part
+        :param output: the output file
+        :return: None
+        """
+        file = self.__files.get(key)
+        if file is not None:
+            file.seek(0)
+            shutil.copyfileobj(file, output, BUFFER_SIZE)
+
+    def close(self) -> None:
+        """
+        :return: None
+        """
+        for file in self.__files.values():
+            file.close()
+        self.__files.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def write_gpx(points, output, statistics: ExportStatistics) -> None:
+    """
+    :param points: the TrackPoints
+    :param output: the text output file
+    :param statistics: the counts
+    :return: None
+    """
+    with TrackSpool() as spool:
+        for point in points:
+            statistics.points += 1
+            spool.write((point.callsign, 'points'), f'<trkpt lat="{point.latitude:.7f}" lon="{point.longitude:.7f}">'
+                                                    f'<time>{iso_time(point.timestamp)}</time></trkpt>\n')
+        output.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                     '<gpx version="1.1" creator="rfm69_sr" xmlns="http://www.topografix.com/GPX/1/1">\n')
+        for callsign in spool.tracks():
+            statistics.tracks += 1
+            output.write(f'<trk><name>{escape(callsign)}</name><trkseg>\n')
+            spool.copy((callsign, 'points'), output)
+            output.write('</trkseg></trk>\n')
+        output.write('</gpx>\n')
+
+
+def write_kml(points, output, statistics: ExportStatistics) -> None:
+    """
+    a gx:Track for each callsign, its times all come before its coordinates so they are spooled apart
+
+    :param points: the TrackPoints
+    :param output: the text output file
+    :param statistics: the counts
+    :return: None
+    """
+    with TrackSpool() as spool:
+        for point in points:
+            statistics.points += 1
+            spool.write((point.callsign, 'when'), f'<when>{iso_time(point.timestamp)}</when>\n')
+            spool.write((point.callsign, 'coord'), f'<gx:coord>{point.longitude:.7f} {point.latitude:.7f} 0</gx:coord>\n')
+        output.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                     '<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:gx="http://www.google.com/kml/ext/2.2">\n<Document>\n')
+        for callsign in spool.tracks():
+            statistics.tracks += 1
+            output.write(f'<Placemark><name>{escape(callsign)}</name><gx:Track>\n')
+            spool.copy((callsign, 'when'), output)
+            spool.copy((callsign, 'coord'), output)
+            output.write('</gx:Track></Placemark>\n')
+        output.write('</Document>\n</kml>\n')
+
+
+def write_geojson(points, output, statistics: ExportStatistics) -> None:
+    """
+    :param points: the TrackPoints
+    :param output: the text output file
+    :param statistics: the counts
+    :return: None
+    """
+    output.write('{"type":"FeatureCollection","features":[\n')
+    callsigns = {}
+    for point in points:
+        if statistics.points:
+            output.write(',\n')
+        statistics.points += 1
+        # the callsign is escaped once
+        callsign = callsigns.get(point.callsign)
+        if callsign is None:
+            callsign = callsigns[point.callsign] = json.dumps(point.callsign)
+        output.write(f'{{"type":"Feature","geometry":{{"type":"Point","coordinates":[{point.longitude:.7f},{point.latitude:.7f}]}},'
+                     f'"properties":{{"callsign":{callsign},"time":"{iso_time(point.timestamp)}"}}}}')
+    output.write('\n]}\n')
+    statistics.tracks = len(callsigns)
+
+
+WRITERS: Final[dict] = {FORMAT_GPX: write_gpx, FORMAT_KML: write_kml, FORMAT_GEOJSON: write_geojson}
+
+
+def format_for(file_name: str) -> str:
+    """
+    :param file_name: the output file name
+    :return: the format from its extension, a .gz on the end is left off
+    """
+    if file_name.endswith('.gz'):
+        file_name = file_name[:-3]
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension not in EXTENSIONS:
+        raise ValueError(f'the format of {file_name} is not known from its extension, give --format')
+    return EXTENSIONS[extension]
+
+
+def export(points, output_name: str, output_format: str = None, compress_level: int = 6) -> dict:
+    """
+    write points to a file
+
+    :param points: the TrackPoints, an iterator that is read once
+    :param output_name: the output file name, - for stdout, a name that ends in .gz is compressed
+    :param output_format: one of FORMATS, None takes it from the file name
+    :param compress_level: the gzip level, 1 is fastest
+    :return: a dictionary with the counts and the seconds taken
+    """
+    started = time.perf_counter()
+    statistics = getattr(points, 'statistics', None) or ExportStatistics()
+    output_format = output_format or format_for(output_name)
+    if output_name == '-':
+        WRITERS[output_format](points, sys.stdout, statistics)
+        sys.stdout.flush()
+    else:
+        if output_name.endswith('.gz'):
+            output = gzip.open(output_name, 'wt', encoding='utf-8', compresslevel=compress_level)
+        else:
+            output = open(output_name, 'w', encoding='utf-8', buffering=BUFFER_SIZE)  # pylint: disable=R1732
+        with output:
+            WRITERS[output_format](points, output, statistics)
+    return {**statistics.as_dict(), 'seconds': time.perf_counter() - started}
+
+
+class PointPipeline:
+    """
+    The points of the position log or the track store after the selection, with the counts of what was read
+    """
+
+    def __init__(self, position_log: str = None, track_directory: str = None, callsigns: list = None,  # pylint: disable=R0913
+                 sources: list = None, start: float = None, end: float = None, log_callsign: str = None):
+        """
+        The init class for the pipeline
+
+        :param position_log: the text position log, its rotated files are read too
+        :param track_directory: the track store directory, used if position_log is None
+        :param callsigns: the callsigns to keep, None keeps every callsign
+        :param sources: the source addresses to keep, only for the track store, None keeps every source
+        :param start: the first time kept in seconds since the epoch, None for no limit
+        :param end: the last time kept, None for no limit
+        :param log_callsign: the callsign of the position log lines without one, None is the callsign
+                             when only one is selected, else unknown
+        """
+        if (position_log is None) == (track_directory is None):
+            raise ValueError('give one of the position log and the track directory')
+        if sources and position_log is not None:
+            raise ValueError('the text position log does not have the source addresses, select by callsign')
+        self.statistics = ExportStatistics()
+        if position_log is not None:
+            if log_callsign is None:
+                log_callsign = callsigns[0] if callsigns and len(callsigns) == 1 else UNKNOWN_CALLSIGN
+            points = read_position_log(log_files(position_log), self.statistics, log_callsign)
+        elif sources is not None and len(sources) == 1:
+            points = read_track_store(track_directory, start, end, sources[0], self.statistics)
+        else:
+            points = read_track_store(track_directory, start, end, None, self.statistics)
+            if sources is not None:
+                points = (point for point in points if point.source in sources)
+        self.__points = select_points(points, None if callsigns is None else set(callsigns), start, end)
+
+    def __iter__(self):
+        return self.__points
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--position_log', type=str, default=None, help='the text position log to export default = %(default)s')
+    parser.add_argument('--track_directory', type=str, default=None, help='the track store to export default = %(default)s')
+    parser.add_argument('--output', type=str, required=True, help='the output file, .gz compresses it and - is stdout')
+    parser.add_argument('--format', type=str, default=None, choices=FORMATS,
+                        help='the format, from the output extension if not given default = %(default)s')
+    parser.add_argument('--callsign', type=str, action='append', default=None, help='a callsign to export, it can be repeated default = all')
+    parser.add_argument('--log_callsign', type=str, default=None,
+                        help='the track of the log lines without a callsign, None is the one --callsign or unknown default = %(default)s')
+    parser.add_argument('--source', type=int, action='append', default=None,
+                        help='a source address to export from the track store, it can be repeated default = all')
+    parser.add_argument('--start', type=parse_time, default=None, help='the first utc time, 2023-06-01T12:30:00 or seconds default = %(default)s')
+    parser.add_argument('--end', type=parse_time, default=None, help='the last utc time, 2023-06-03 or seconds default = %(default)s')
+    parser.add_argument('--compress_level', type=int, default=6, help='the gzip level from 1 to 9 default = %(default)s')
+    arguments = parser.parse_args()
+    if arguments.position_log is None and arguments.track_directory is None:
+        parser.error('give --position_log or --track_directory')
+    pipeline = PointPipeline(arguments.position_log, arguments.track_directory, arguments.callsign, arguments.source,
+                             arguments.start, arguments.end, arguments.log_callsign)
+    print(export(pipeline, arguments.output, arguments.format, arguments.compress_level), file=sys.stderr)
@@ -0,0 +1,461 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# An append only binary store for the position fixes, so a track can be searched by time without parsing the text log.
+#
+# The store is a directory of segment files, segment-000001.trk, segment-000002.trk ...  Each one holds up to
+# segment_records fixed width little endian records
+#       double  the utc time of the fix in seconds since the epoch
+#       int     the latitude in degrees * 10**7
+#       int     the longitude in degrees * 10**7
+#       byte    the source address of the transmitter
+#       byte    the flags, FLAG_VALID if the gps had a fix
+#       short   the packet identifier
+# Next to each segment is its time index, segment-000001.idx, with one entry of three doubles for every block of
+# block_records records, the earliest and latest time in the block and the latest time up to the end of the block.
+# The last one only goes up, so the first block of a time range is found with a binary search on the memory mapped
+# index, and only the blocks that can hold the range are read from the memory mapped segment.
+# The callsign of each source is kept in sources.json.
+#
+# numpy is optional, it is only needed for TrackReader.query_array.
+
+import bisect
+import collections
+import glob
+import json
+import mmap
+import os
+import struct
+import time
+from typing import Final
+
+try:
+    import numpy
+except ModuleNotFoundError:
+    numpy = None
+
+TRACK_RECORD: Final[struct.Struct] = struct.Struct('<diiBBH')
+INDEX_ENTRY: Final[struct.Struct] = struct.Struct('<ddd')
+COORDINATE_SCALE: Final[int] = 10 ** 7
+FLAG_VALID: Final[int] = 0x01
+SEGMENT_PATTERN: Final[str] = 'segment-*.trk'
+SOURCES_FILE: Final[str] = 'sources.json'
+
+# the numpy dtype with the same layout as TRACK_RECORD
+TRACK_DTYPE = None if numpy is None else numpy.dtype([('timestamp', '<f8'), ('latitude', '<i4'), ('longitude', '<i4'),
+                                                      ('source', 'u1'), ('flags', 'u1'), ('identifier', '<u2')])
+
+TrackRecord = collections.namedtuple('TrackRecord', ['timestamp', 'latitude', 'longitude', 'source', 'valid', 'identifier'])
+
+
+def segment_name(directory: str, number: int) -> str:
+    """
+    :param directory: the store directory
+    :param number: the segment number
+    :return: the name of the segment file, the index file has the same name ending in .idx
+    """
+    return os.path.join(directory, f'segment-{number:06d}.trk')
+
+
+def index_name(segment: str) -> str:
+    """
+    :param segment: the name of the segment file
+    :return: the name of its index file
+    """
+    return segment[:-len('.trk')] + '.idx'
+
+
+def pack_fix(fix) -> bytes:
+    """
+    :param fix: a position_fix.PositionFix
+    :return: the track record for the fix, the receive time is used if the fix has no time
+    """
+    timestamp = fix.received if fix.timestamp is None else fix.timestamp
+    if fix.valid:
+        return TRACK_RECORD.pack(timestamp, round(fix.latitude * COORDINATE_SCALE), round(fix.longitude * COORDINATE_SCALE),
+                                 fix.source & 0xff, FLAG_VALID, fix.identifier & 0xffff)
+    return TRACK_RECORD.pack(timestamp, 0, 0, fix.source & 0xff, 0, fix.identifier & 0xffff)
+
+
+def unpack_record(buffer, offset: int = 0) -> TrackRecord:
+    """
+    :param buffer: the buffer that holds the record
+    :param offset: the offset of the record in the buffer
+    :return: the record with the position in decimal degrees
+    """
+    timestamp, latitude, longitude, source, flags, identifier = TRACK_RECORD.unpack_from(buffer, offset)
+    return TrackRecord(timestamp, latitude / COORDINATE_SCALE, longitude / COORDINATE_SCALE, source, bool(flags & FLAG_VALID),
+                       identifier)
+
+
+class _IndexColumn:  # pylint: disable=R0903
+    """
+    One column of a memory mapped index as a sequence, so bisect can search it without copying it
+    """
+
+    def __init__(self, buffer, column: int):
+        self.buffer = buffer
+        self.column = column
+        self.length = len(buffer) // INDEX_ENTRY.size
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, item):
+        return INDEX_ENTRY.unpack_from(self.buffer, item * INDEX_ENTRY.size)[self.column]
+
+
+class TrackStore:  # pylint: disable=R0902
+    """
+    The writer for the track store, the records are buffered and written a block at a time or when flush is called
+    """
+
+    def __init__(self, directory: str, segment_records: int = 65536, block_records: int = 64, batch_age: float = 5.0):
+        """
+        The init class for the store, an existing store is appended to
+
+        :param directory: the store directory, it is made if it does not exist
+        :param segment_records: the number of records in a segment before a new one is started
+        :param block_records: the number of records for each index entry
+        :param batch_age: write the buffer when the oldest record in it is this many seconds old
+        """
+        if segment_records % block_records:
+            raise ValueError('the segment records must be a multiple of the block records')
+        self.directory = directory
+        self.segment_records = segment_records
+        self.block_records = block_records
+        self.batch_age = batch_age
+        self.records_written = 0
+        self.bytes_written = 0
+        self.__buffer = bytearray()
+        self.__oldest = None
+        self.__callsigns = {}
+        os.makedirs(directory, exist_ok=True)
+        sources_file = os.path.join(directory, SOURCES_FILE)
+        if os.path.exists(sources_file):
+            with open(sources_file, encoding='utf-8') as file:
+                self.__callsigns = {int(source): callsign for source, callsign in json.load(file).items()}
+        segments = sorted(glob.glob(os.path.join(directory, SEGMENT_PATTERN)))
+        self.__segment_number = int(os.path.basename(segments[-1])[len('segment-'):-len('.trk')]) if segments else 1
+        self.__segment = None
+        self.__index = None
+        self.__open_segment()
+        if self.__count >= self.segment_records:
+            self.__next_segment()
+
+    def __open_segment(self) -> None:
+        """
+        open the current segment and its index for append, a torn record left by a crash is cut off
+        and the index is rebuilt from the records so it always matches the segment
+
+        :return: None
+        """
+        name = segment_name(self.directory, self.__segment_number)
+        self.__segment = open(name, 'ab')  # pylint: disable=R1732
+        size = self.__segment.tell()
+        if size % TRACK_RECORD.size:
+            size -= size % TRACK_RECORD.size
+            self.__segment.truncate(size)
+        self.__count = size // TRACK_RECORD.size
+        # the earliest and latest time in the block being filled, and the latest time in the segment
+        self.__block_first = float('inf')
+        self.__block_last = float('-inf')
+        self.__running_last = float('-inf')
+        entries = []
+        with open(name, 'rb') as file:
+            for offset, record in enumerate(TRACK_RECORD.iter_unpack(file.read(size))):
+                self.__add_time(record[0])
+                if (offset + 1) % self.block_records == 0:
+                    entries.append(INDEX_ENTRY.pack(self.__block_first, self.__block_last, self.__running_last))
+                    self.__block_first = float('inf')
+                    self.__block_last = float('-inf')
+        with open(index_name(name), 'wb') as file:
+            file.write(b''.join(entries))
+        self.__index = open(index_name(name), 'ab')  # pylint: disable=R1732
+
+    def __next_segment(self) -> None:
+        """
+        close the full segment and start the next one
+
+        :return: None
+        """
+        self.__segment.close()
+        self.__index.close()
+        self.__segment_number += 1
+        self.__open_segment()
+
+    def __add_time(self, timestamp: float) -> None:
+        """
+        track the times in the current block
+
+        :param timestamp: the time of a record
+        :return: None
+        """
+        self.__block_first = min(self.__block_first, timestamp)
+        self.__block_last = max(self.__block_last, timestamp)
+        self.__running_last = max(self.__running_last, timestamp)
+
+    def append(self, fix) -> None:
+        """
+        add a fix to the store
+
+        :param fix: the position_fix.PositionFix
+        :return: None
+        """
+        if self.__callsigns.get(fix.source) != fix.callsign:
+            self.__callsigns[fix.source] = fix.callsign
+            self.__save_callsigns()
+        if self.__oldest is None:
+            self.__oldest = time.monotonic()
+        record = pack_fix(fix)
+        self.__buffer += record
+        self.__count += 1
+        self.__add_time(TRACK_RECORD.unpack_from(record)[0])
+        if self.__count % self.block_records == 0:
+            # the records must be in the segment before the index entry that points at them
+            self.flush()
+            self.__index.write(INDEX_ENTRY.pack(self.__block_first, self.__block_last, self.__running_last))
+            self.__index.flush()
+            self.__block_first = float('inf')
+            self.__block_last = float('-inf')
+            if self.__count >= self.segment_records:
+                self.__next_segment()
+        elif self.flush_due():
+            self.flush()
+
+    def __save_callsigns(self) -> None:
+        """
+        write the callsign of each source, the file is replaced so a reader never sees half of it
+
+        :return: None
+        """
+        sources_file = os.path.join(self.directory, SOURCES_FILE)
+        with open(sources_file + '.tmp', 'w', encoding='utf-8') as file:
+            json.dump({str(source): callsign for source, callsign in self.__callsigns.items()}, file)
+        os.replace(sources_file + '.tmp', sources_file)
+
+    def flush_due(self) -> bool:
+        """
+        :return: True if there is a record in the buffer older than the batch age
+        """
+        return self.__oldest is not None and time.monotonic() - self.__oldest >= self.batch_age
+
+    def time_to_flush(self) -> float:
+        """
+        :return: the time in seconds until the buffer is old enough to be written, None if the buffer is empty
+        """
+        if self.__oldest is None:
+            return None
+        return max(0.0, self.batch_age - (time.monotonic() - self.__oldest))
+
+    def flush(self) -> None:
+        """
+        write the buffered records to the segment
+
+        :return: None
+        """
+        if self.__buffer:
+            self.__segment.write(self.__buffer)
+            self.__segment.flush()
+            self.records_written += len(self.__buffer) // TRACK_RECORD.size
+            self.bytes_written += len(self.__buffer)
+            self.__buffer.clear()
+        self.__oldest = None
+
+    def close(self) -> None:
+        """
+        write the buffer and close the files
+
+        :return: None
+        """
+        if self.__segment is None:
+            return
+        self.flush()
+        self.__segment.close()
+        self.__index.close()
+        self.__segment = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class TrackReader:
+    """
+    The reader for the track store.  The segments are memory mapped for each query, so the whole store is never read in
+    and records written after the reader was made are seen by the next query.
+    """
+
+    def __init__(self, directory: str, block_records: int = 64):
+        """
+        The init class for the reader
+
+        :param directory: the store directory
+        :param block_records: the number of records for each index entry, it must match the writer
+        """
+        self.directory = directory
+        self.block_records = block_records
+
+    def callsigns(self) -> dict:
+        """
+        :return: a dictionary of the callsign of each source address
+        """
+        try:
+            with open(os.path.join(self.directory, SOURCES_FILE), encoding='utf-8') as file:
+                return {int(source): callsign for source, callsign in json.load(file).items()}
+        except FileNotFoundError:
+            return {}
+
+    def source_for(self, callsign: str) -> int:
+        """
+        :param callsign: the callsign of a transmitter
+        :return: the source address that last used the callsign, None if it is not in the store
+        """
+        return next((source for source, name in self.callsigns().items() if name == callsign), None)
+
+    def segments(self) -> list:
+        """
+        :return: the names of the segment files, oldest first
+        """
+        return sorted(glob.glob(os.path.join(self.directory, SEGMENT_PATTERN)))
+
+    def __block_ranges(self, segment: str, record_count: int, start: float, end: float):
+        """
+        find the blocks of a segment that can hold records in a time range
+
+        :param segment: the name of the segment file
+        :param record_count: the number of whole records in the segment
+        :param start: the start of the time range
+        :param end: the end of the time range
+        :return: yields tuples of the first and the end record number of each run of blocks to read
+        """
+        try:
+            with open(index_name(segment), 'rb') as file:
+                index = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(file.fileno()).st_size else b''
+        except FileNotFoundError:
+            index = b''
+        try:
+            indexed_blocks = min(len(index) // INDEX_ENTRY.size, record_count // self.block_records)
+            # every block before this one ends before the start of the range
+            block = bisect.bisect_left(_IndexColumn(index, 2), start, 0, indexed_blocks)
+            run_start = None
+            for block in range(block, indexed_blocks):
+                first, last, _ = INDEX_ENTRY.unpack_from(index, block * INDEX_ENTRY.size)
+                if first <= end and last >= start:
+                    if run_start is None:
+                        run_start = block * self.block_records
+                elif run_start is not None:
+                    yield run_start, block * self.block_records
+                    run_start = None
+            # the records after the last index entry are always read
+            tail = indexed_blocks * self.block_records
+            if run_start is not None:
+                yield run_start, record_count
+            elif tail < record_count:
+                yield tail, record_count
+        finally:
+            if isinstance(index, mmap.mmap):
+                index.close()
+
+    def query(self, start: float, end: float, source: int = None):
+        """
+        read the records in a time range
+
+        :param start: the start of the range in seconds since the epoch
+        :param end: the end of the range in seconds since the epoch, inclusive
+        :param source: only return the records from this source address, None for every source
+        :return: yields TrackRecords in the order they were written
+        """
+        for segment in self.segments():
+            with open(segment, 'rb') as file:
+                size = os.fstat(file.fileno()).st_size
+                record_count = size // TRACK_RECORD.size
+                if not record_count:
+                    continue
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as records:
+                    for first, stop in self.__block_ranges(segment, record_count, start, end):
+                        for offset in range(first * TRACK_RECORD.size, stop * TRACK_RECORD.size, TRACK_RECORD.size):
+                            timestamp = struct.unpack_from('<d', records, offset)[0]
+                            if start <= timestamp <= end:
+                                record = unpack_record(records, offset)
+                                if source is None or record.source == source:
+                                    yield record
+
+    def query_array(self, start: float, end: float, source: int = None):
+        """
+        read the records in a time range into a numpy array, only the blocks that can hold the range are copied
+
+        :param start: the start of the range in seconds since the epoch
+        :param end: the end of the range in seconds since the epoch, inclusive
+        :param source: only return the records from this source address, None for every source
+        :return: a numpy structured array with the TRACK_DTYPE fields, the position is still scaled by COORDINATE_SCALE
+        """
+        if numpy is None:
+            print('numpy not found, use the command')
+            print('pip3 install numpy [--break-system-packages]')
+            raise ModuleNotFoundError('numpy is needed for query_array')
+        parts = []
+        for segment in self.segments():
+            with open(segment, 'rb') as file:
+                size = os.fstat(file.fileno()).st_size
+                record_count = size // TRACK_RECORD.size
+                if not record_count:
+                    continue
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as records:
+                    parts.extend(self.__select(records, self.__block_ranges(segment, record_count, start, end),
+                                               record_count, start, end, source))
+        if not parts:
+            return numpy.empty(0, dtype=TRACK_DTYPE)
+        return numpy.concatenate(parts)
+
+    @staticmethod
+    def __select(records, block_ranges, record_count: int, start: float, end: float, source: int) -> list:
+        """
+        copy the records in a time range out of a memory mapped segment, the views of the map are gone on return
+        so the map can be closed
+
+        :param records: the memory mapped segment
+        :param block_ranges: the runs of records to look at
+        :param record_count: the number of whole records in the segment
+        :param start: the start of the range
+        :param end: the end of the range, inclusive
+        :param source: the source address or None for every source
+        :return: a list of numpy arrays
+        """
+        every_record = numpy.frombuffer(records, dtype=TRACK_DTYPE, count=record_count)
+        parts = []
+        for first, stop in block_ranges:
+            block = every_record[first:stop]
+            keep = (block['timestamp'] >= start) & (block['timestamp'] <= end)
+            if source is not None:
+                keep &= block['source'] == source
+            parts.append(block[keep])
+        return parts
+
+    def position_at(self, source: int, timestamp: float, window: float = 300.0) -> TrackRecord:
+        """
+        find where a transmitter was at a time, "where was KF4WBK at 14:05"
+
+        :param source: the source address, use source_for to look up a callsign
+        :param timestamp: the time in seconds since the epoch
+        :param window: how far in seconds from the time to look
+        :return: the valid record closest to the time, None if there is none in the window
+        """
+        best = None
+        for record in self.query(timestamp - window, timestamp + window, source):
+            if record.valid and (best is None or abs(record.timestamp - timestamp) < abs(best.timestamp - timestamp)):
+                best = record
+        return best
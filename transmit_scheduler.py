@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# The rfm69 is half duplex, while it sends an ack it is not listening, and a send that starts while a packet from another
+# transmitter is arriving destroys that packet.  So the receive loop does not send, it queues.
+# The scheduler keeps one ack for each source, a newer ack to the same source replaces the older one because the
+# transmitter has moved on, and a short queue of other frames.  The receive loop calls transmit after it has drained the
+# radio, and the queue is only sent while the channel is quiet.  If the channel stays busy for max_defer seconds the
+# oldest ack is sent anyway so the transmitter does not give up on it.
+#
+# run it with python transmit_scheduler.py --seeds 8 to compare the packet loss of sending at once and of the scheduler
+
+import argparse
+import collections
+import random
+import statistics
+import threading
+import time
+from typing import Final
+
+import packet_decoder
+import packet_dedup
+import radio_interrupt
+import radio_simulator
+
+ACK_DATA: Final[bytes] = b'a'
+ACK_FLAGS: Final[int] = 0x80
+
+
+class TransmitScheduler:  # pylint: disable=R0902
+    """
+    The queue of acks and frames waiting to be sent, only the thread that owns the radio calls transmit
+    """
+
+    def __init__(self, radio, max_frames: int = 16, max_defer: float = 0.1, carrier_sense: bool = True):
+        """
+        The init class for the scheduler
+
+        :param radio: the radio backend
+        :param max_frames: the most frames other than acks that are queued, the oldest is dropped
+        :param max_defer: the longest time in seconds an ack waits for the channel to be quiet
+        :param carrier_sense: if False the queue is sent without looking at the channel
+        """
+        self.radio = radio
+        self.max_defer = max_defer
+        self.carrier_sense = carrier_sense
+        self.__lock = threading.Lock()
+        # source -> (destination, identifier, queued time)
+        self.__acks = collections.OrderedDict()
+        self.__frames = collections.deque(maxlen=max_frames)
+        self.__started = time.monotonic()
+        self.acks_queued = 0
+        self.acks_collapsed = 0
+        self.acks_sent = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.deferred = 0
+        self.forced = 0
+        self.transmit_seconds = 0.0
+
+    @property
+    def pending(self) -> int:
+        """
+        :return: the number of acks and frames waiting
+        """
+        return len(self.__acks) + len(self.__frames)
+
+    def queue_ack(self, source: int, destination: int, identifier: int) -> None:
+        """
+        queue an ack, an ack already waiting for the source is replaced
+
+        :param source: the source address of the packet, the ack goes to it
+        :param destination: the destination address of the packet, this receiver
+        :param identifier: the identifier of the packet
+        :return: None
+        """
+        with self.__lock:
+            self.acks_queued += 1
+            queued = self.__acks.get(source)
+            if queued is None:
+                self.__acks[source] = (destination, identifier, time.monotonic())
+            else:
+                self.acks_collapsed += 1
+                # keep the time and the place of the older ack, the transmitter has been waiting since then,
+                # so the acks stay in the order of their age
+                self.__acks[source] = (destination, identifier, queued[2])
+
+    def queue_frame(self, data: bytes, destination: int, node: int, identifier: int = 0, flags: int = 0) -> None:
+        """
+        queue a frame, it is sent after the acks
+
+        :param data: the payload
+        :param destination: header byte 0
+        :param node: header byte 1
+        :param identifier: header byte 2
+        :param flags: header byte 3
+        :return: None
+        """
+        with self.__lock:
+            if len(self.__frames) == self.__frames.maxlen:
+                self.frames_dropped += 1
+            self.__frames.append((data, destination, node, identifier, flags))
+
+    def wait_time(self, timeout: float) -> float:
+        """
+        :param timeout: the time the receive loop would wait
+        :return: the time to wait for packets before the queue must be looked at again
+        """
+        with self.__lock:
+            if not self.__acks:
+                return timeout if not self.__frames else min(timeout, self.max_defer)
+            oldest = next(iter(self.__acks.values()))[2]
+        return max(0.0, min(timeout, oldest + self.max_defer - time.monotonic()))
+
+    def transmit(self) -> int:
+        """
+        send what is queued while the channel is quiet, this must be called from the thread that owns the radio
+
+        :return: the number of packets sent
+        """
+        sent = 0
+        while True:
+            with self.__lock:
+                if self.__acks:
+                    ack = next(iter(self.__acks.items()))
+                    frame = None
+                    queued = ack[1][2]
+                elif self.__frames:
+                    ack = None
+                    frame = self.__frames[0]
+                    queued = None
+                else:
+                    return sent
+            if self.carrier_sense and self.radio.channel_busy():
+                if queued is None or time.monotonic() - queued < self.max_defer:
+                    self.deferred += 1
+                    return sent
+                self.forced += 1
+            start = time.monotonic()
+            if ack is not None:
+                if not self.__send_ack(*ack):
+                    continue
+            else:
+                self.__send_frame(frame)
+            self.transmit_seconds += time.monotonic() - start
+            sent += 1
+
+    def __send_ack(self, source: int, ack: tuple) -> bool:
+        """
+        send the ack at the head of the queue
+
+        :param source: the source the ack goes to
+        :param ack: the destination, identifier and queued time of the ack
+        :return: False if a newer ack for the source was queued while the channel was checked, that one is sent instead
+        """
+        destination, identifier, _ = ack
+        with self.__lock:
+            if self.__acks.get(source, (None, None, None))[1] != identifier:
+                return False
+            del self.__acks[source]
+        self.radio.send(ACK_DATA, keep_listening=True, destination=source, node=destination, identifier=identifier, flags=ACK_FLAGS)
+        self.acks_sent += 1
+        return True
+
+    def __send_frame(self, frame: tuple) -> None:
+        """
+        send the frame at the head of the queue
+
+        :param frame: the data, destination, node, identifier and flags of the frame
+        :return: None
+        """
+        with self.__lock:
+            if self.__frames and self.__frames[0] is frame:
+                self.__frames.popleft()
+        data, destination, node, identifier, flags = frame
+        self.radio.send(data, keep_listening=True, destination=destination, node=node, identifier=identifier, flags=flags)
+        self.frames_sent += 1
+
+    def statistics(self) -> dict:
+        """
+        :return: a dictionary of the counters and the fraction of the time spent sending instead of receiving
+        """
+        elapsed = time.monotonic() - self.__started
+        return {'acks_queued': self.acks_queued, 'acks_collapsed': self.acks_collapsed, 'acks_sent': self.acks_sent,
+                'frames_sent': self.frames_sent, 'frames_dropped': self.frames_dropped, 'deferred': self.deferred,
+                'forced': self.forced, 'transmit_seconds': round(self.transmit_seconds, 6),
+                'receive_seconds': round(elapsed - self.transmit_seconds, 6),
+                'transmit_fraction': self.transmit_seconds / elapsed if elapsed else 0.0}
+
+
+def make_scheduler(radio, settings: dict) -> TransmitScheduler:
+    """
+    make the scheduler from the thread settings
+
+    :param radio: the radio backend
+    :param settings: the kwargs of the radio thread, AckMaxDefer and CarrierSense are used
+    :return: the TransmitScheduler
+    """
+    return TransmitScheduler(radio, max_defer=settings.get('AckMaxDefer', 0.1), carrier_sense=settings.get('CarrierSense', True))
+
+
+def measure_packet_loss(scheduled: bool = True, sources: int = 4, count: int = 100, interval: float = 0.05,  # pylint: disable=R0913,R0914
+                        air_time: float = 0.004, send_time: float = 0.004, ack_timeout: float = 0.05, retries: int = 2,
+                        seed: int = 0) -> dict:
+    """
+    transmitters send packets to the simulated radio at random times and resend when they do not see the ack,
+    the receiver either acks each packet at once or queues the acks in the scheduler
+
+    :param scheduled: True to use the scheduler, False to send the ack as soon as the packet is decoded
+    :param sources: the number of transmitters
+    :param count: the packets each transmitter sends
+    :param interval: the mean time between packets from one transmitter
+    :param air_time: the seconds a packet is on the air
+    :param send_time: the seconds an ack keeps the radio from receiving
+    :param ack_timeout: the time a transmitter waits for an ack before it resends
+    :param retries: the number of times a packet is resent
+    :param seed: the seed of the random times between packets, the threads still make each run a little different
+    :return: a dictionary with the loss rate
+    """
+    radio = radio_simulator.SimulatedRFM69(air_time, send_time)
+    interrupt = radio_interrupt.PayloadReadyInterrupt()
+    radio.attach_interrupt(interrupt)
+    stop_event = threading.Event()
+    waiter = radio_interrupt.PacketWaiter(radio, interrupt, stop_event)
+    radio.listen()
+    decoder = packet_decoder.PacketDecoder()
+    dedup = packet_dedup.PacketDeduplicator()
+    scheduler = TransmitScheduler(radio)
+
+    def receive_loop():
+        while not stop_event.is_set():
+            for packet in waiter.packets(scheduler.wait_time(0.5) if scheduled else 0.5):
+                if dedup.check_packet(packet) == packet_dedup.PACKET_DUPLICATE:
+                    if scheduled:
+                        scheduler.queue_ack(packet[1], packet[0], packet[2])
+                    else:
+                        radio.send(ACK_DATA, keep_listening=True, destination=packet[1], node=packet[0], identifier=packet[2],
+                                   flags=ACK_FLAGS)
+                    continue
+                fix = decoder.decode(packet)
+                if fix is None:
+                    # a packet the decoder rejected is not acked, the transmitter sends it again
+                    continue
+                if scheduled:
+                    scheduler.queue_ack(fix.source, fix.destination, fix.identifier)
+                else:
+                    radio.send(ACK_DATA, keep_listening=True, destination=fix.source, node=fix.destination, identifier=fix.identifier,
+                               flags=ACK_FLAGS)
+            if scheduled:
+                scheduler.transmit()
+
+    def transmitter(source: int, seed: int):
+        generator = random.Random(seed)
+        for identifier in range(count):
+            ack = bytes([source, 2, identifier & 0xff, ACK_FLAGS]) + ACK_DATA
+            for _ in range(retries + 1):
+                sent_before = len(radio.sent)
+                radio.inject(radio_simulator.make_packet(identifier, source))
+                deadline = time.monotonic() + ack_timeout
+                while time.monotonic() < deadline and ack not in radio.sent[sent_before:]:
+                    time.sleep(0.001)
+                if ack in radio.sent[sent_before:]:
+                    break
+            time.sleep(generator.expovariate(1 / interval))
+
+    receive_thread = threading.Thread(target=receive_loop, name='simulated receive')
+    receive_thread.start()
+    transmitters = [threading.Thread(target=transmitter, args=(source, seed * 1000 + source), name=f'transmitter {source}')
+                    for source in range(1, sources + 1)]
+    for thread in transmitters:
+        thread.start()
+    for thread in transmitters:
+        thread.join()
+    stop_event.set()
+    interrupt.fire()
+    receive_thread.join()
+    # every packet is different, so the packets decoded are the packets that got through
+    return {'scheduled': scheduled, 'packets': sources * count, 'delivered': decoder.decoded,
+            'loss_rate': 1 - decoder.decoded / (sources * count), 'on_air': radio.injected, 'collisions': radio.collisions,
+            'dropped': radio.dropped, 'acks_sent': len(radio.sent), 'duplicates': dedup.duplicates,
+            'scheduler': scheduler.statistics() if scheduled else None}
+
+
+def compare_packet_loss(seeds: int = 5, **settings) -> dict:
+    """
+    measure the loss of sending at once and of the scheduler with the same seeds, one run is too noisy to tell them apart,
+    so the mean and the standard deviation over the seeds are given, and the mean of the difference of each pair of runs
+
+    :param seeds: the number of seeds, each one is run with and without the scheduler
+    :param settings: the other arguments of measure_packet_loss
+    :return: a dictionary with the mean and the standard deviation of the loss rate and the ack collisions of each
+    """
+    runs = {False: [], True: []}
+    for seed in range(seeds):
+        for scheduled in (False, True):
+            runs[scheduled].append(measure_packet_loss(scheduled, seed=seed, **settings))
+
+    def spread(values: list) -> dict:
+        return {'mean': statistics.mean(values), 'stdev': statistics.stdev(values) if len(values) > 1 else 0.0}
+
+    result = {'seeds': seeds}
+    for scheduled, name in ((False, 'immediate'), (True, 'scheduled')):
+        result[name] = {'loss_rate': spread([run['loss_rate'] for run in runs[scheduled]]),
+                        'collisions': spread([run['collisions'] for run in runs[scheduled]])}
+    result['loss_rate_reduction'] = spread([immediate['loss_rate'] - scheduled['loss_rate']
+                                            for immediate, scheduled in zip(runs[False], runs[True])])
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sources', type=int, default=4, help='the number of transmitters default = %(default)s')
+    parser.add_argument('--count', type=int, default=100, help='the packets from each transmitter default = %(default)s')
+    parser.add_argument('--interval', type=float, default=0.05, help='the mean time between packets default = %(default)s')
+    parser.add_argument('--air_time', type=float, default=0.004, help='the time a packet is on the air default = %(default)s')
+    parser.add_argument('--send_time', type=float, default=0.004, help='the time to send an ack default = %(default)s')
+    parser.add_argument('--seeds', type=int, default=5, help='the runs of each, the mean and the spread are printed default = %(default)s')
+    arguments = parser.parse_args()
+    print(compare_packet_loss(arguments.seeds, sources=arguments.sources, count=arguments.count, interval=arguments.interval,
+                              air_time=arguments.air_time, send_time=arguments.send_time))
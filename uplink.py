@@ -0,0 +1,695 @@
+#!/usr/bin/env python
+# Copyright 2023 Ralph Carl Blach III
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation the rights to use, copy, modify, merge, publish, distribute,
+# sublicense, and/or sell copies of the Software, and to permit persons to whom the Software is furnished to do so,
+# subject to the following conditions:
+# The above copyright notice and this permission notice shall be included in all copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR
+# ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH
+# THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+# Forward the fixes to a central collector, so the fixes of every receiver end up in one place.
+#
+# The uplink thread is a sink like the position logging thread, it takes the changed fixes from the position table and
+# puts them in a batch, the batch is sent when it has batch_size fixes or its first fix is batch_age seconds old.
+# A batch is a frame, 2 bytes of MAGIC, the 8 byte sequence number and the zlib compressed json of the gateway id and
+# the fixes, each fix is the list of the arguments of PositionFix.  Over tcp each frame has a 4 byte length in front.
+# The collector answers each frame with MAGIC and the sequence number, a batch that is not answered within the timeout
+# is sent again later, so the collector drops a sequence number it has seen from the same gateway.
+#
+# While the collector answers, the batches are sent from memory.  When a send fails the uplink is down, the waiting
+# batches go to the spool, a directory with a file for each batch, and every batch after them goes there too until the
+# spool is empty again, so the batches reach the collector in order.  The spool is tried again after retry seconds,
+# doubling up to max_retry, and when it is bigger than spool_bytes the oldest batch is dropped and counted.  The spool
+# is kept over a restart.  Without a spool directory the spool is in memory.
+# The sequence numbers start at the time in milliseconds, so they go up over a restart.
+#
+# Collector is a stand in for the central collector, for tests and for a bench setup
+#
+# run it with python uplink.py --listen tcp:127.0.0.1:5600 to run the collector and print the fixes it gets
+
+import argparse
+import collections
+import glob
+import json
+import os
+import selectors
+import socket
+import struct
+import sys
+import threading
+import time
+import zlib
+from typing import Final
+
+import metrics
+import position_fix
+
+MAGIC: Final[bytes] = b'R6'
+HEADER: Final[struct.Struct] = struct.Struct('>2sQ')
+LENGTH: Final[struct.Struct] = struct.Struct('>I')
+UDP_PREFIX: Final[str] = 'udp:'
+TCP_PREFIX: Final[str] = 'tcp:'
+# a frame bigger than this is not read by the collector
+MAX_FRAME: Final[int] = 1 << 20
+SPOOL_PATTERN: Final[str] = 'batch-*.z'
+
+
+def parse_address(address: str) -> tuple:
+    """
+    :param address: udp:host:port or tcp:host:port
+    :return: a tuple of the prefix, the host and the port
+    :raises ValueError: if the address is not understood
+    """
+    for prefix in (UDP_PREFIX, TCP_PREFIX):
+        if address.startswith(prefix):
+            host, _, port = address[len(prefix):].rpartition(':')
+            if not host or not port.isdigit():
+                break
+            return prefix, host, int(port)
+    raise ValueError(f'the uplink address {address} is not udp:host:port or tcp:host:port')
+
+
+def encode_batch(gateway: str, sequence: int, fixes: list, level: int = 6) -> bytes:
+    """
+    :param gateway: the id of this receiver
+    :param sequence: the sequence number of the batch
+    :param fixes: the position_fix.PositionFix to send
+    :param level: the zlib level
+    :return: the frame
+    """
+    body = json.dumps({'gateway': gateway, 'fixes': [list(fix.__getnewargs__()) for fix in fixes]}, separators=(',', ':'))
+    return HEADER.pack(MAGIC, sequence) + zlib.compress(body.encode('utf-8'), level)
+
+
+def decode_batch(frame: bytes) -> tuple:
+    """
+    :param frame: a frame made by encode_batch
+    :return: a tuple of the gateway id, the sequence number and the list of position_fix.PositionFix
+    :raises ValueError: if the frame is not a batch
+    """
+    if len(frame) < HEADER.size:
+        raise ValueError('the frame is too short')
+    magic, sequence = HEADER.unpack_from(frame)
+    if magic != MAGIC:
+        raise ValueError('the frame does not start with the magic')
+    try:
+        body = json.loads(zlib.decompress(frame[HEADER.size:]))
+    except zlib.error as error:
+        raise ValueError(f'the frame does not decompress, error = {error}') from error
+    return body['gateway'], sequence, [position_fix.PositionFix(*fix) for fix in body['fixes']]
+
+
+class Batch:  # pylint: disable=R0903
+    """
+    A frame waiting to be sent, with the time its oldest fix was received
+    """
+    __slots__ = ['sequence', 'frame', 'received', 'fixes']
+
+    def __init__(self, sequence: int, frame: bytes, received: float, fixes: int):
+        """
+        The init class for the batch
+
+        :param sequence: the sequence number
+        :param frame: the frame
+        :param received: the time the oldest fix was received in seconds since the epoch
+        :param fixes: the number of fixes
+        """
+        self.sequence = sequence
+        self.frame = frame
+        self.received = received
+        self.fixes = fixes
+
+
+class MemorySpool:
+    """
+    The batches waiting while the uplink is down, in memory, the oldest is dropped when it is too big
+    """
+
+    def __init__(self, max_bytes: int):
+        """
+        The init class for the spool
+
+        :param max_bytes: the most bytes of frames kept
+        """
+        self.max_bytes = max_bytes
+        self.__batches = collections.deque()
+        self.bytes = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.__batches)
+
+    def put(self, batch: Batch) -> None:
+        """
+        :param batch: the batch to add at the end
+        :return: None
+        """
+        self.__batches.append(batch)
+        self.bytes += len(batch.frame)
+        while self.bytes > self.max_bytes and len(self.__batches) > 1:
+            self.pop()
+            self.dropped += 1
+
+    def peek(self) -> Batch:
+        """
+        :return: the oldest batch, or None
+        """
+        return self.__batches[0] if self.__batches else None
+
+    def pop(self) -> None:
+        """
+        remove the oldest batch
+
+        :return: None
+        """
+        self.bytes -= len(self.__batches.popleft().frame)
+
+    def last_sequence(self) -> int:
+        """
+        :return: the sequence number of the newest batch, or 0
+        """
+        return self.__batches[-1].sequence if self.__batches else 0
+
+
+class DiskSpool:
+    """
+    The batches waiting while the uplink is down, a file for each in a directory so they are kept over a restart.
+    The file name has the sequence number, the time the oldest fix was received and the number of fixes, batch-SEQUENCE-MILLISECONDS-FIXES.z
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        """
+        The init class for the spool, the batches already in the directory are kept
+
+        :param directory: the spool directory, it is made if it does not exist
+        :param max_bytes: the most bytes of frames kept
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.__files = collections.deque(sorted(glob.glob(os.path.join(directory, SPOOL_PATTERN))))
+        self.bytes = sum(os.path.getsize(name) for name in self.__files)
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.__files)
+
+    def put(self, batch: Batch) -> None:
+        """
+        write the batch to a temporary file, sync it and rename it, so a power cut never leaves half a batch
+
+        :param batch: the batch to add at the end
+        :return: None
+        """
+        name = os.path.join(self.directory, f'batch-{batch.sequence:020d}-{int(batch.received * 1000):015d}-{batch.fixes}.z')
+        with open(name + '.tmp', 'wb') as file:
+            file.write(batch.frame)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(name + '.tmp', name)
+        self.__files.append(name)
+        self.bytes += len(batch.frame)
+        while self.bytes > self.max_bytes and len(self.__files) > 1:
+            self.pop()
+            self.dropped += 1
+
+    def peek(self) -> Batch:
+        """
+        :return: the oldest batch, or None
+        """
+        while self.__files:
+            name = self.__files[0]
+            try:
+                with open(name, 'rb') as file:
+                    frame = file.read()
+            except FileNotFoundError:
+                self.__files.popleft()
+                continue
+            _, sequence, received, fixes = os.path.basename(name)[:-2].split('-')
+            return Batch(int(sequence), frame, int(received) / 1000, int(fixes))
+        return None
+
+    def pop(self) -> None:
+        """
+        remove the oldest batch
+
+        :return: None
+        """
+        name = self.__files.popleft()
+        try:
+            self.bytes -= os.path.getsize(name)
+            os.remove(name)
+        except FileNotFoundError:
+            pass
+
+    def last_sequence(self) -> int:
+        """
+        :return: the sequence number of the newest batch, or 0
+        """
+        return int(os.path.basename(self.__files[-1]).split('-')[1]) if self.__files else 0
+
+
+class UplinkSender:
+    """
+    Send a frame to the collector and wait for its answer, over udp or tcp
+    """
+
+    def __init__(self, address: str, timeout: float = 2.0):
+        """
+        The init class for the sender, nothing is connected until the first send
+
+        :param address: udp:host:port or tcp:host:port
+        :param timeout: the seconds to wait to connect and for the answer
+        """
+        self.protocol, self.host, self.port = parse_address(address)
+        self.timeout = timeout
+        self.__socket = None
+        self.__received = b''
+
+    def close(self) -> None:
+        """
+        :return: None
+        """
+        if self.__socket is not None:
+            self.__socket.close()
+            self.__socket = None
+        self.__received = b''
+
+    def send(self, sequence: int, frame: bytes) -> bool:
+        """
+        :param sequence: the sequence number of the frame
+        :param frame: the frame
+        :return: True if the collector answered, False if it did not and the socket was closed
+        """
+        try:
+            if self.__socket is None:
+                kind = socket.SOCK_DGRAM if self.protocol == UDP_PREFIX else socket.SOCK_STREAM
+                self.__socket = socket.socket(socket.AF_INET6 if ':' in self.host else socket.AF_INET, kind)
+                self.__socket.settimeout(self.timeout)
+                self.__socket.connect((self.host, self.port))
+            if self.protocol == UDP_PREFIX:
+                self.__socket.send(frame)
+            else:
+                self.__socket.sendall(LENGTH.pack(len(frame)) + frame)
+            deadline = time.monotonic() + self.timeout
+            while True:
+                answer = self.__read_answer(deadline)
+                if answer == HEADER.pack(MAGIC, sequence):
+                    return True
+                # an answer to an earlier try of another frame is skipped
+        except OSError:
+            self.close()
+            return False
+
+    def __read_answer(self, deadline: float) -> bytes:
+        """
+        :param deadline: the time.monotonic when to give up
+        :return: the answer
+        :raises OSError: if there is no answer by the deadline or the connection closed
+        """
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise socket.timeout('no answer from the collector')
+            self.__socket.settimeout(remaining)
+            if self.protocol == UDP_PREFIX:
+                return self.__socket.recv(64)
+            if len(self.__received) >= HEADER.size:
+                answer, self.__received = self.__received[:HEADER.size], self.__received[HEADER.size:]
+                return answer
+            data = self.__socket.recv(4096)
+            if not data:
+                raise ConnectionResetError('the collector closed the connection')
+            self.__received += data
+
+
+class UplinkThread(threading.Thread):  # pylint: disable=R0902
+    """
+    this is a thread class that forwards the fixes to the central collector in batches
+    """
+    __slots__ = ['args', 'kwargs', 'lock_location_class', 'event', 'sender', 'gateway', 'batch_size', 'batch_age', 'spool',
+                 'retry', 'max_retry', 'sequence', 'outbox', 'metrics']
+
+    def __init__(self, name: str, *args: list, **kwargs: dict):
+        """
+        this is the init class for the thread
+
+        :param name: The name of the thread
+        :param args: The args, it must be a tuple consisting of
+                                (position_table, event, network, log.log, args.sleep_time)
+        :param kwargs: a dictionary with the collector address, the batching and the spool
+                        example {'UplinkAddress': 'tcp:collector.local:5600', 'GatewayId': 'pi-1', 'BatchSize': 32, 'BatchAge': 2.0,
+                                 'UplinkTimeout': 2.0, 'SpoolDirectory': '/var/lib/rfm69/spool', 'SpoolBytes': 16777216,
+                                 'Retry': 5.0, 'MaxRetry': 60.0}
+                        if the spool directory is None the spool is in memory
+                        and an optional metrics.MetricsRegistry, example {'Metrics': registry}
+        """
+        super().__init__(name=name, args=args, kwargs=kwargs)
+        if args is None:
+            raise ValueError('Args cannot be None')
+        self.args = args
+        self.kwargs = kwargs
+        self.lock_location_class, self.event, self.network, self.logger, self.sleep_time_in_sec = self.args  # pylint: disable=W0632
+        self.sender = UplinkSender(self.kwargs['UplinkAddress'], self.kwargs.get('UplinkTimeout', 2.0))
+        self.gateway = self.kwargs.get('GatewayId') or socket.gethostname()
+        self.batch_size = self.kwargs.get('BatchSize', 32)
+        self.batch_age = self.kwargs.get('BatchAge', 2.0)
+        spool_directory = self.kwargs.get('SpoolDirectory')
+        spool_bytes = self.kwargs.get('SpoolBytes', 16 << 20)
+        self.spool = MemorySpool(spool_bytes) if spool_directory is None else DiskSpool(spool_directory, spool_bytes)
+        self.retry = self.kwargs.get('Retry', 5.0)
+        self.max_retry = self.kwargs.get('MaxRetry', 60.0)
+        self.sequence = max(int(time.time() * 1000), self.spool.last_sequence() + 1)
+        # the batches sent from memory while the uplink is up
+        self.outbox = collections.deque()
+        self.metrics = metrics.registry_from(self.kwargs)
+        self.__fixes_sent = self.metrics.counter('rfm69_uplink_fixes_total', 'The fixes the collector answered for')
+        self.__batches_sent = self.metrics.counter('rfm69_uplink_batches_total', 'The batches the collector answered for')
+        self.__failures = self.metrics.counter('rfm69_uplink_send_failures_total', 'The batches the collector did not answer')
+        # the latency of a batch is from receiving its oldest fix to the answer of the collector
+        self.__latency = self.metrics.histogram('rfm69_stage_latency_seconds', 'The time from receiving a packet to each stage', stage='uplink')
+        self.__down_until = 0.0
+        self.__backoff = self.retry
+        # for each source the count of its fixes and the received time of the last one forwarded
+        self.__counts = {}
+        self.__received = {}
+
+    def oldest_received(self) -> float:
+        """
+        :return: the time the oldest fix not yet answered for was received, None if every fix was answered for
+        """
+        oldest = self.spool.peek() if len(self.spool) else None
+        if oldest is not None:
+            return oldest.received
+        return self.outbox[0].received if self.outbox else None
+
+    def lag(self) -> float:
+        """
+        :return: the seconds since the oldest fix not yet answered for was received, 0 if there is none
+        """
+        oldest = self.oldest_received()
+        return 0.0 if oldest is None else max(time.time() - oldest, 0.0)
+
+    def catch_up(self, fixes: list) -> list:
+        """
+        changed_since gives the latest fix of each source, when a source sent more than one since the last pass the
+        valid fixes in between are taken from its history, so they are forwarded too
+
+        :param fixes: the fixes from changed_since
+        :return: the fixes to forward, oldest first for each source
+        """
+        forwarded = []
+        for fix in fixes:
+            count = self.lock_location_class.count(fix.source)
+            last_count = self.__counts.get(fix.source)
+            if last_count is not None and count - last_count > 1:
+                previous = self.__received.get(fix.source, 0.0)
+                history = self.lock_location_class.history(fix.source, count - last_count)
+                forwarded.extend(old_fix for old_fix in history if previous < old_fix.received < fix.received)
+                # a fix that came after the one from changed_since is taken on the next pass
+                count -= sum(1 for new_fix in history if new_fix.received > fix.received)
+            forwarded.append(fix)
+            self.__counts[fix.source] = count
+            self.__received[fix.source] = fix.received
+        return forwarded
+
+    def make_batch(self, fixes: list) -> None:
+        """
+        :param fixes: the fixes of the batch
+        :return: None
+        """
+        batch = Batch(self.sequence, encode_batch(self.gateway, self.sequence, fixes), min(fix.received for fix in fixes), len(fixes))
+        self.sequence += 1
+        if len(self.spool):
+            # the spool is sent first, a new batch goes after it so the order is kept
+            self.spool.put(batch)
+        else:
+            self.outbox.append(batch)
+
+    def send(self, batch: Batch) -> bool:
+        """
+        :param batch: the batch
+        :return: True if the collector answered
+        """
+        if not self.sender.send(batch.sequence, batch.frame):
+            self.__failures.inc()
+            return False
+        self.__batches_sent.inc()
+        self.__fixes_sent.inc(batch.fixes)
+        if self.metrics.enabled:
+            self.__latency.observe(time.time() - batch.received)
+        return True
+
+    def forward(self, force: bool = False) -> None:
+        """
+        send the spool and then the outbox, on a failure move the outbox to the spool and wait before trying again
+
+        :param force: try even if the uplink is waiting to try again
+        :return: None
+        """
+        if not force and time.monotonic() < self.__down_until:
+            self.spool_outbox()
+            return
+        while len(self.spool):
+            batch = self.spool.peek()
+            if batch is None:
+                break
+            if not self.send(batch):
+                self.uplink_down()
+                return
+            self.spool.pop()
+            if not len(self.spool):
+                self.logger.info('uplink spool sent, the collector is up again')
+        while self.outbox:
+            if not self.send(self.outbox[0]):
+                self.uplink_down()
+                return
+            self.outbox.popleft()
+        self.__backoff = self.retry
+
+    def uplink_down(self) -> None:
+        """
+        the collector did not answer, spool the outbox and wait before the next try, longer each time
+
+        :return: None
+        """
+        if self.__down_until == 0.0 or self.__backoff == self.retry:
+            self.logger.info('uplink %s:%s is down, spooling, %d batches waiting', self.sender.host, self.sender.port,
+                             len(self.spool) + len(self.outbox))
+        self.spool_outbox()
+        self.__down_until = time.monotonic() + self.__backoff
+        self.__backoff = min(self.__backoff * 2, self.max_retry)
+
+    def spool_outbox(self) -> None:
+        """
+        :return: None
+        """
+        while self.outbox:
+            try:
+                self.spool.put(self.outbox[0])
+            except OSError as error:
+                self.logger.warning('uplink spool write failed, error = %s', error)
+                return
+            self.outbox.popleft()
+
+    def run(self) -> None:
+        """
+        This overrides run on the threading class
+
+        :return: None
+        """
+        self.metrics.gauge('rfm69_uplink_queue_batches', 'The batches waiting for the collector', lambda: len(self.spool) + len(self.outbox))
+        self.metrics.gauge('rfm69_uplink_spool_bytes', 'The bytes in the uplink spool', lambda: self.spool.bytes)
+        self.metrics.gauge('rfm69_uplink_lag_seconds', 'The age of the oldest fix the collector has not answered for', self.lag)
+        self.metrics.counter('rfm69_uplink_dropped_batches_total', 'The batches dropped because the spool was full', lambda: self.spool.dropped)
+        loops = self.metrics.counter('rfm69_loop_iterations_total', 'The passes through the loop of each thread', thread='uplink')
+        if len(self.spool):
+            self.logger.info('uplink spool has %d batches from before', len(self.spool))
+        last_version = 0
+        pending = []
+        batch_started = 0.0
+        try:
+            while True:
+                stop = self.event.is_set() or self.lock_location_class.closed
+                loops.inc()
+                if not stop:
+                    timeout = self.sleep_time_in_sec
+                    if pending:
+                        timeout = min(timeout, max(batch_started + self.batch_age - time.monotonic(), 0.0))
+                    self.lock_location_class.wait_for_update(last_version, timeout)
+                last_version, fixes = self.lock_location_class.changed_since(last_version)
+                if fixes and not pending:
+                    batch_started = time.monotonic()
+                pending.extend(self.catch_up(fixes))
+                while len(pending) >= self.batch_size:
+                    self.make_batch(pending[:self.batch_size])
+                    del pending[:self.batch_size]
+                    batch_started = time.monotonic()
+                if pending and (stop or time.monotonic() - batch_started >= self.batch_age):
+                    self.make_batch(pending)
+                    pending = []
+                if self.outbox or len(self.spool):
+                    self.forward(force=stop)
+                if stop:
+                    return
+        finally:
+            self.spool_outbox()
+            self.sender.close()
+            if len(self.spool):
+                self.logger.info('uplink stopped with %d batches in the spool', len(self.spool))
+
+
+class Collector:
+    """
+    A stand in for the central collector, it answers every batch and drops the ones it has seen
+    """
+
+    def __init__(self, logger=None, on_batch=None):
+        """
+        The init class for the collector
+
+        :param logger: the logger, may be None
+        :param on_batch: called with the gateway, the sequence number and the fixes of each new batch, may be None
+        """
+        self.logger = logger
+        self.on_batch = on_batch
+        self.__selector = selectors.DefaultSelector()
+        self.__lock = threading.Lock()
+        # gateway -> the sequence numbers seen, only the recent ones are kept
+        self.__seen = {}
+        self.batches = 0
+        self.duplicates = 0
+        self.fixes = []
+        self.addresses = []
+        # set to True to stop answering, to test an uplink that is down
+        self.silent = False
+
+    def add_listener(self, address: str) -> tuple:
+        """
+        :param address: udp:host:port or tcp:host:port, port 0 picks a free port
+        :return: the address that is bound, (host, port)
+        """
+        protocol, host, port = parse_address(address)
+        kind = socket.SOCK_DGRAM if protocol == UDP_PREFIX else socket.SOCK_STREAM
+        listener = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, kind)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((host, port))
+        listener.setblocking(False)
+        if protocol == UDP_PREFIX:
+            self.__selector.register(listener, selectors.EVENT_READ, ('udp', None))
+        else:
+            listener.listen(5)
+            self.__selector.register(listener, selectors.EVENT_READ, ('listen', None))
+        bound = listener.getsockname()[:2]
+        self.addresses.append(f'{protocol}{bound[0]}:{bound[1]}')
+        return bound
+
+    def receive(self, frame: bytes) -> bytes:
+        """
+        :param frame: a frame from an uplink
+        :return: the answer, or None if the frame is not a batch or the collector is silent
+        """
+        if self.silent:
+            return None
+        try:
+            gateway, sequence, fixes = decode_batch(frame)
+        except (ValueError, KeyError, TypeError) as error:
+            if self.logger is not None:
+                self.logger.info('collector bad frame, error = %s', error)
+            return None
+        with self.__lock:
+            seen = self.__seen.setdefault(gateway, collections.OrderedDict())
+            if sequence in seen:
+                self.duplicates += 1
+            else:
+                seen[sequence] = True
+                while len(seen) > 4096:
+                    seen.popitem(last=False)
+                self.batches += 1
+                self.fixes.extend(fixes)
+                if self.on_batch is not None:
+                    self.on_batch(gateway, sequence, fixes)
+        return HEADER.pack(MAGIC, sequence)
+
+    def serve(self, stop_event: threading.Event, timeout: float = 0.2) -> None:
+        """
+        answer the uplinks until the event is set
+
+        :param stop_event: the event that ends the loop
+        :param timeout: the longest time in seconds between looks at the stop event
+        :return: None
+        """
+        try:
+            while not stop_event.is_set():
+                for key, _ in self.__selector.select(timeout):
+                    kind, buffer = key.data
+                    if kind == 'udp':
+                        frame, address = key.fileobj.recvfrom(65536)
+                        answer = self.receive(frame)
+                        if answer is not None:
+                            key.fileobj.sendto(answer, address)
+                    elif kind == 'listen':
+                        client, _ = key.fileobj.accept()
+                        client.setblocking(False)
+                        self.__selector.register(client, selectors.EVENT_READ, ('tcp', bytearray()))
+                    else:
+                        self.__read_client(key.fileobj, buffer)
+        finally:
+            for key in list(self.__selector.get_map().values()):
+                self.__selector.unregister(key.fileobj)
+                key.fileobj.close()
+            self.__selector.close()
+
+    def __read_client(self, client: socket.socket, buffer: bytearray) -> None:
+        """
+        read the length prefixed frames of a tcp uplink
+
+        :param client: the client socket
+        :param buffer: the bytes read that are not a whole frame yet
+        :return: None
+        """
+        try:
+            data = client.recv(65536)
+        except OSError:
+            data = b''
+        if not data:
+            self.__selector.unregister(client)
+            client.close()
+            return
+        buffer.extend(data)
+        while len(buffer) >= LENGTH.size:
+            length = LENGTH.unpack_from(buffer)[0]
+            if length > MAX_FRAME:
+                self.__selector.unregister(client)
+                client.close()
+                return
+            if len(buffer) < LENGTH.size + length:
+                break
+            frame = bytes(buffer[LENGTH.size:LENGTH.size + length])
+            del buffer[:LENGTH.size + length]
+            answer = self.receive(frame)
+            if answer is not None:
+                try:
+                    client.sendall(answer)
+                except OSError:
+                    pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--listen', type=str, action='append', default=None,
+                        help='an address to collect on, udp:host:port or tcp:host:port, it can be repeated default = tcp:127.0.0.1:5600')
+    arguments = parser.parse_args()
+    collector = Collector(on_batch=lambda gateway, sequence, fixes: print(gateway, sequence, *fixes, sep='\n    ', flush=True))
+    for listen_address in arguments.listen or ['tcp:127.0.0.1:5600']:
+        collector.add_listener(listen_address)
+    print('collecting on', ' '.join(collector.addresses), file=sys.stderr)
+    try:
+        collector.serve(threading.Event())
+    except KeyboardInterrupt:
+        pass